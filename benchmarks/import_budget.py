@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Import Budget - ETF Italia Project v10
+Benchmark opt-in del cold-start degli entry point CLI (budget in ms)
+
+LOGICA:
+- Budget per modulo in utils/import_timing.CLI_IMPORT_BUDGET_MS, misura in un
+  interprete pulito (`python -X importtime`), minimo su --repeat misure
+- Fuori dalla suite pytest: i tempi dipendono dalla macchina e dal carico; i test
+  verificano solo che le dipendenze pesanti restino differite (DEFERRED_IMPORTS)
+- Exit code 1 se un modulo supera il budget o importa dipendenze differite
+
+Uso:
+    python benchmarks/import_budget.py
+    python benchmarks/import_budget.py orchestration.sequence_runner --repeat 5 --json import_budget.json
+"""
+
+import sys
+import argparse
+import json
+from pathlib import Path
+
+# Aggiungi scripts al path
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT / 'scripts') not in sys.path:
+    sys.path.append(str(ROOT / 'scripts'))
+
+from utils.import_timing import check_import_budget, print_import_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Budget cold-start (ms) degli entry point CLI')
+    parser.add_argument('modules', nargs='*', help='Moduli da misurare (default: tutti i CLI con budget)')
+    parser.add_argument('--repeat', type=int, default=3, help='Misure per modulo (si usa il minimo)')
+    parser.add_argument('--json', dest='json_path', default=None, help='Salva risultati in JSON')
+    args = parser.parse_args()
+
+    results = check_import_budget(args.modules or None, repeat=args.repeat)
+    print_import_report(results)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0 if all(r['ok'] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
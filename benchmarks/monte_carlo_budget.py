@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Monte Carlo Budget - ETF Italia Project v10
+Benchmark opt-in del motore Monte Carlo multi-asset (budget in secondi)
+
+LOGICA:
+- simulate_portfolio_values + summarize_simulations su covarianza sintetica
+  (default 100k simulazioni × 8 asset, budget 1s), minimo su --repeat misure
+- Fuori dalla suite pytest: i tempi dipendono dalla macchina e dal carico; i test
+  verificano solo forma e coerenza dei risultati
+- Exit code 1 se il minimo supera il budget
+
+Uso:
+    python benchmarks/monte_carlo_budget.py
+    python benchmarks/monte_carlo_budget.py --simulations 200000 --budget 2 --json mc_budget.json
+"""
+
+import sys
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Aggiungi scripts al path
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT / 'scripts') not in sys.path:
+    sys.path.append(str(ROOT / 'scripts'))
+
+from risk.portfolio_monte_carlo import simulate_portfolio_values, summarize_simulations
+
+DEFAULT_SIMULATIONS = 100000
+DEFAULT_ASSETS = 8
+DEFAULT_BUDGET_S = 1.0
+
+
+def run_budget(num_simulations=DEFAULT_SIMULATIONS, n_assets=DEFAULT_ASSETS, repeat=3, budget_s=DEFAULT_BUDGET_S):
+    """Misura simulazione + riepilogo; ok se il minimo su repeat resta nel budget"""
+    rng = np.random.default_rng(0)
+    cov = np.cov(rng.normal(0, 0.01, (300, n_assets)), rowvar=False)
+    prices = np.full(n_assets, 100.0)
+    qty = np.ones(n_assets)
+
+    timings = []
+    for i in range(max(1, repeat)):
+        start = time.perf_counter()
+        values, dd = simulate_portfolio_values(prices, qty, cov, num_simulations=num_simulations, seed=3 + i)
+        summarize_simulations(float(prices @ qty), values, dd)
+        timings.append(time.perf_counter() - start)
+
+    best = min(timings)
+    return {
+        'simulations': num_simulations,
+        'assets': n_assets,
+        'timings_s': timings,
+        'best_s': best,
+        'budget_s': budget_s,
+        'ok': best < budget_s,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Budget (s) del Monte Carlo multi-asset')
+    parser.add_argument('--simulations', type=int, default=DEFAULT_SIMULATIONS, help='Numero di simulazioni')
+    parser.add_argument('--assets', type=int, default=DEFAULT_ASSETS, help='Numero di asset')
+    parser.add_argument('--repeat', type=int, default=3, help='Misure (si usa il minimo)')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET_S, help='Budget in secondi')
+    parser.add_argument('--json', dest='json_path', default=None, help='Salva risultati in JSON')
+    args = parser.parse_args()
+
+    result = run_budget(args.simulations, args.assets, repeat=args.repeat, budget_s=args.budget)
+    status = '✅' if result['ok'] else '❌'
+    print(f"{status} Monte Carlo {result['simulations']} sim × {result['assets']} asset: "
+          f"{result['best_s']:.3f}s (budget {result['budget_s']:.1f}s)")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 0 if result['ok'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Run Benchmarks - ETF Italia Project v10
+Benchmark della pipeline su DB sintetico (5 → 500 simboli, 5 → 30 anni)
+
+LOGICA:
+- Per ogni profilo (simboli × anni) crea un workspace sintetico (synthetic_db.py)
+  e misura in sequenza, sullo stesso DB, gli step reali della pipeline:
+  ingest_data (ultime sedute dal feed sintetico) → compute_signals →
+  health_check → BacktestEngine.run_simulation → calculate_kpi →
+  MonteCarloStressTest → execute_orders
+- Per step: wall/CPU del solo blocco misurato (setup escluso), esito, info
+  (righe, ordini, ...) e span perf_trace raccolti durante il blocco
+- Risultati in benchmarks/results/bench_<profilo>_<ts>.json con confronto
+  contro benchmarks/baselines/bench_<profilo>.json (ratio per step; regressione
+  oltre --threshold). --save-baseline aggiorna la baseline del profilo
+- Più profili in un solo lancio → tabella di scaling finale
+
+Uso:
+    python benchmarks/run_benchmarks.py --profile small
+    python benchmarks/run_benchmarks.py --profile small medium large --fail-on-regression
+    python benchmarks/run_benchmarks.py --symbols 100 --years 10 --stages compute_signals backtest
+"""
+
+import sys
+import argparse
+import json
+import platform
+import shutil
+import tempfile
+import time
+import traceback
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+# Aggiungi benchmarks e scripts al path
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+for _p in (str(BENCH_DIR), str(ROOT / 'scripts')):
+    if _p not in sys.path:
+        sys.path.append(_p)
+
+from synthetic_db import bench_workspace, build_synthetic_workspace
+from utils.perf_trace import get_tracer
+
+PROFILES = {
+    'tiny': (5, 2),
+    'small': (5, 5),
+    'medium': (50, 15),
+    'large': (500, 30),
+}
+STAGES = ('ingest', 'compute_signals', 'health_check', 'backtest', 'calculate_kpi', 'monte_carlo', 'execute_orders')
+RESULTS_DIR = BENCH_DIR / 'results'
+BASELINES_DIR = BENCH_DIR / 'baselines'
+DEFAULT_THRESHOLD = 1.25
+# Sotto questa durata il rumore domina: nessuna regressione segnalata
+MIN_COMPARABLE_S = 0.05
+
+
+def profile_name(n_symbols, years):
+    return f"{n_symbols}sym_{years}y"
+
+
+class StageContext:
+    """Stato condiviso tra gli step di un profilo (workspace, config, finestra backtest)"""
+
+    def __init__(self, workspace, args):
+        self.ws = workspace
+        self.args = args
+        with open(workspace['config_path'], 'r') as f:
+            self.config = json.load(f)
+        self.backtest_range = None
+        self._measured = None
+
+    @contextmanager
+    def measure(self):
+        """Blocco misurato dello step (uno solo per step)"""
+        tracer = get_tracer()
+        tracer.reset()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._measured = {
+                'wall_s': round(time.perf_counter() - wall_start, 4),
+                'cpu_s': round(time.process_time() - cpu_start, 4),
+                'spans': [
+                    {k: s[k] for k in ('path', 'calls', 'wall_ms', 'counters')}
+                    for s in tracer.to_dict()['spans']
+                ],
+            }
+
+
+# ==================== STEP ====================
+
+def stage_ingest(ctx):
+    import data.ingest_data as ingest_module
+
+    with patch.object(ingest_module, 'download_with_fallback', ctx.ws['feed']), ctx.measure():
+        ok = ingest_module.ingest_data(end_date_override=ctx.ws['end_date'])
+    return ok, {'rows_feed': ctx.ws['rows_feed'], 'symbols': len(ctx.ws['symbols'])}
+
+
+def stage_compute_signals(ctx):
+    from data.compute_signals import compute_signals
+
+    with ctx.measure():
+        ok = compute_signals(preset=ctx.args.signals_preset, recent_days=ctx.args.recent_days)
+    conn = duckdb.connect(ctx.ws['db_path'], read_only=True)
+    try:
+        n_signals = conn.execute("SELECT COUNT(*) FROM signals").fetchone()[0]
+    finally:
+        conn.close()
+    return ok, {'signals': int(n_signals)}
+
+
+def stage_health_check(ctx):
+    from quality.health_check import health_check
+
+    with ctx.measure():
+        report = health_check()
+    ok = isinstance(report, dict) and report.get('status') != 'ERROR'
+    return ok, {'overall_status': report.get('overall_status') if isinstance(report, dict) else None}
+
+
+def stage_backtest(ctx):
+    from backtest.backtest_engine import BacktestEngine
+
+    engine = BacktestEngine(ctx.ws['db_path'], ctx.ws['config_path'])
+    engine.connect()
+    try:
+        dates = [r[0] for r in engine.conn.execute(
+            "SELECT DISTINCT date FROM signals ORDER BY date DESC LIMIT ?", [int(ctx.args.backtest_days)]
+        ).fetchall()]
+        if not dates:
+            raise ValueError("Nessun segnale disponibile: compute_signals richiesto prima del backtest")
+        start_date, end_date = dates[-1], dates[0]
+        engine.initialize_portfolio(ctx.config['settings']['start_capital'], start_date=start_date)
+        with ctx.measure():
+            engine.run_simulation(start_date, end_date)
+        engine.create_portfolio_overview(start_date, end_date)
+        trades = engine.conn.execute("""
+        SELECT COUNT(*) FROM fiscal_ledger WHERE run_type = 'BACKTEST' AND type IN ('BUY', 'SELL')
+        """).fetchone()[0]
+    finally:
+        engine.close()
+    ctx.backtest_range = (start_date, end_date)
+    return True, {'days': len(dates), 'trades': int(trades), 'start': str(start_date), 'end': str(end_date)}
+
+
+def stage_calculate_kpi(ctx):
+    from backtest.backtest_runner import calculate_kpi
+
+    if ctx.backtest_range is None:
+        raise ValueError("calculate_kpi richiede lo step backtest")
+    conn = duckdb.connect(ctx.ws['db_path'])
+    try:
+        with ctx.measure():
+            kpi = calculate_kpi(conn, ctx.config, *ctx.backtest_range)
+    finally:
+        conn.close()
+    return kpi is not None, {}
+
+
+def stage_monte_carlo(ctx):
+    from analysis.monte_carlo_stress_test import MonteCarloStressTest
+
+    stress_test = MonteCarloStressTest(db_path=ctx.ws['db_path'], n_simulations=ctx.args.mc_sims)
+    try:
+        with ctx.measure():
+            df_returns = stress_test.extract_returns_from_ledger()
+            if len(df_returns) == 0:
+                raise ValueError("Nessun return disponibile (portfolio_overview vuota)")
+            stress_test.run_shuffle_test(
+                df_returns['daily_return'].values,
+                initial_equity=float(df_returns['equity'].iloc[0]),
+                method='stationary',
+            )
+            stress_test.analyze_results()
+    finally:
+        stress_test.disconnect()
+    return True, {'days': len(df_returns), 'simulations': ctx.args.mc_sims}
+
+
+def stage_execute_orders(ctx):
+    from trading.execute_orders import execute_orders
+
+    symbols = [etf['symbol'] for etf in ctx.config['universe']['core'] + ctx.config['universe']['satellite']]
+    symbols = symbols[:ctx.args.orders]
+    conn = duckdb.connect(ctx.ws['db_path'], read_only=True)
+    try:
+        as_of = conn.execute("SELECT MAX(date) FROM market_data").fetchone()[0]
+        prices = dict(conn.execute("""
+        SELECT symbol, close FROM market_data WHERE date = ? AND symbol IN (SELECT UNNEST(?::VARCHAR[]))
+        """, [as_of, symbols]).fetchall())
+    finally:
+        conn.close()
+
+    budget = ctx.config['settings']['start_capital'] * 0.9 / max(len(prices), 1)
+    orders = [
+        {'symbol': s, 'action': 'BUY', 'qty': max(1, int(budget / prices[s])), 'price': float(prices[s]),
+         'reason': 'BENCHMARK', 'recommendation': 'TRADE', 'signal_state': 'RISK_ON', 'risk_scalar': 1.0}
+        for s in symbols if s in prices
+    ]
+    orders_file = Path(ctx.ws['root']) / 'bench_orders.json'
+    with open(orders_file, 'w') as f:
+        json.dump({'run_id': 'benchmark_execute_orders', 'as_of_date': str(as_of), 'orders': orders}, f)
+
+    with ctx.measure():
+        ok = execute_orders(orders_file=str(orders_file), commit=True)
+    return ok, {'orders': len(orders)}
+
+
+STAGE_FUNCS = {
+    'ingest': stage_ingest,
+    'compute_signals': stage_compute_signals,
+    'health_check': stage_health_check,
+    'backtest': stage_backtest,
+    'calculate_kpi': stage_calculate_kpi,
+    'monte_carlo': stage_monte_carlo,
+    'execute_orders': stage_execute_orders,
+}
+
+
+# ==================== RUN ====================
+
+def environment_info():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'duckdb': duckdb.__version__,
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+    }
+
+
+def run_profile(n_symbols, years, args, workdir=None):
+    """Esegue tutti gli step richiesti su un workspace sintetico; restituisce il dict risultati"""
+    name = profile_name(n_symbols, years)
+    root = Path(workdir) / name if workdir else Path(tempfile.mkdtemp(prefix=f"etf_bench_{name}_"))
+    if root.exists() and workdir:
+        shutil.rmtree(root)
+    log_path = root.parent / f"{root.name}.log"
+    root.mkdir(parents=True, exist_ok=True)
+
+    results = {
+        'profile': name,
+        'n_symbols': n_symbols,
+        'years': years,
+        'seed': args.seed,
+        'params': {
+            'backtest_days': args.backtest_days,
+            'signals_preset': args.signals_preset,
+            'mc_sims': args.mc_sims,
+            'orders': args.orders,
+            'ingest_days': args.ingest_days,
+        },
+        'timestamp': datetime.now().isoformat(),
+        'environment': environment_info(),
+        'stages': {},
+    }
+
+    print(f"\n Profilo {name}: workspace {root}")
+    with open(log_path, 'w') as log:
+        wall_start = time.perf_counter()
+        ws = build_synthetic_workspace(root, n_symbols=n_symbols, years=years, seed=args.seed,
+                                       ingest_days=args.ingest_days, log=log)
+        results['generate_db'] = {
+            'wall_s': round(time.perf_counter() - wall_start, 4),
+            'rows': ws['rows_loaded'],
+            'start_date': str(ws['start_date']),
+            'end_date': str(ws['end_date']),
+        }
+        print(f"   generate_db: {results['generate_db']['wall_s']:.2f}s ({ws['rows_loaded']} righe)")
+
+        ctx = StageContext(ws, args)
+        with bench_workspace(root):
+            for stage in args.stages:
+                ctx._measured = None
+                entry = {'status': 'OK'}
+                try:
+                    out = sys.stdout if args.verbose else log
+                    with redirect_stdout(out):
+                        ok, info = STAGE_FUNCS[stage](ctx)
+                    entry['info'] = info
+                    if not ok:
+                        entry['status'] = 'FAILED'
+                except Exception as e:
+                    entry['status'] = 'ERROR'
+                    entry['error'] = f"{type(e).__name__}: {e}"
+                    log.write(traceback.format_exc())
+                if ctx._measured is not None:
+                    entry.update(ctx._measured)
+                results['stages'][stage] = entry
+                wall = entry.get('wall_s')
+                print(f"   {stage:<16} {entry['status']:<7} "
+                      f"{'-' if wall is None else f'{wall:.3f}s'}"
+                      f"{'  ' + entry['error'] if 'error' in entry else ''}")
+
+    results['log'] = str(log_path)
+    if not workdir and not args.keep:
+        shutil.rmtree(root, ignore_errors=True)
+    else:
+        results['workspace'] = str(root)
+    return results
+
+
+# ==================== BASELINE ====================
+
+def baseline_path(name):
+    return BASELINES_DIR / f"bench_{name}.json"
+
+
+def compare_to_baseline(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Ratio wall_s corrente/baseline per step; regressione se ratio > threshold"""
+    comparison = {}
+    for stage, entry in results['stages'].items():
+        base = (baseline or {}).get('stages', {}).get(stage)
+        if not base or base.get('wall_s') is None or entry.get('wall_s') is None:
+            comparison[stage] = {'baseline_s': None, 'ratio': None, 'regression': False}
+            continue
+        ratio = entry['wall_s'] / base['wall_s'] if base['wall_s'] > 0 else None
+        regression = (
+            ratio is not None
+            and ratio > threshold
+            and max(entry['wall_s'], base['wall_s']) >= MIN_COMPARABLE_S
+        )
+        comparison[stage] = {
+            'baseline_s': base['wall_s'],
+            'ratio': None if ratio is None else round(ratio, 3),
+            'regression': regression,
+        }
+    return comparison
+
+
+def print_scaling_table(all_results):
+    profiles = [r['profile'] for r in all_results]
+    print("\n SCALING (wall s)")
+    print(f"   {'stage':<16}" + ''.join(f"{p:>14}" for p in profiles))
+    for stage in STAGES:
+        if not any(stage in r['stages'] for r in all_results):
+            continue
+        cells = []
+        for r in all_results:
+            wall = r['stages'].get(stage, {}).get('wall_s')
+            cells.append(f"{'-' if wall is None else f'{wall:.3f}':>14}")
+        print(f"   {stage:<16}" + ''.join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pipeline ETF Italia su DB sintetico')
+    parser.add_argument('--profile', nargs='+', choices=sorted(PROFILES), default=None,
+                        help='Profili predefiniti (tiny, small, medium, large)')
+    parser.add_argument('--symbols', type=int, help='Numero simboli (profilo custom, con --years)')
+    parser.add_argument('--years', type=int, help='Anni di storico giornaliero (profilo custom)')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES),
+                        help='Sottoinsieme di step (ordine pipeline mantenuto)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--ingest-days', type=int, default=10, help='Sedute finali servite dal feed ingest')
+    parser.add_argument('--signals-preset', choices=['full', 'recent'], default='full')
+    parser.add_argument('--recent-days', type=int, default=365)
+    parser.add_argument('--backtest-days', type=int, default=252, help='Sedute simulate dal backtest')
+    parser.add_argument('--mc-sims', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=20, help='Ordini BUY per execute_orders')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'Ratio oltre cui uno step è in regressione (default {DEFAULT_THRESHOLD})')
+    parser.add_argument('--baseline', type=str, help='File baseline (default: baselines/bench_<profilo>.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='Salva i risultati come nuova baseline')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit code 1 se uno step regredisce')
+    parser.add_argument('--workdir', type=str, help='Directory workspace (default: temporanea, rimossa)')
+    parser.add_argument('--keep', action='store_true', help='Non rimuovere il workspace temporaneo')
+    parser.add_argument('--verbose', action='store_true', help='Output degli script a console (default: log)')
+    args = parser.parse_args()
+
+    args.stages = [s for s in STAGES if s in args.stages]
+    if args.symbols or args.years:
+        if not (args.symbols and args.years):
+            parser.error('--symbols e --years vanno indicati insieme')
+        sizes = [(args.symbols, args.years)]
+    else:
+        sizes = [PROFILES[p] for p in (args.profile or ['small'])]
+
+    print(" BENCHMARK - ETF Italia Project v10")
+    print("=" * 60)
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    all_results = []
+    regressions = []
+    for n_symbols, years in sizes:
+        results = run_profile(n_symbols, years, args, workdir=args.workdir)
+        name = results['profile']
+
+        base_file = Path(args.baseline) if args.baseline else baseline_path(name)
+        baseline = None
+        if base_file.exists():
+            with open(base_file, 'r') as f:
+                baseline = json.load(f)
+        results['baseline'] = str(base_file) if baseline else None
+        results['comparison'] = compare_to_baseline(results, baseline, args.threshold)
+
+        if baseline:
+            print(f"   vs baseline {base_file.name}:")
+            for stage, cmp in results['comparison'].items():
+                if cmp['ratio'] is None:
+                    continue
+                flag = ' REGRESSIONE' if cmp['regression'] else ''
+                print(f"     {stage:<16} {cmp['ratio']:.2f}x (baseline {cmp['baseline_s']:.3f}s){flag}")
+                if cmp['regression']:
+                    regressions.append(f"{name}/{stage}")
+
+        ts = datetime.now().strftime('%Y%m%d_%H%M%S')
+        result_file = RESULTS_DIR / f"bench_{name}_{ts}.json"
+        with open(result_file, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+        print(f"   Risultati: {result_file}")
+
+        if args.save_baseline:
+            BASELINES_DIR.mkdir(parents=True, exist_ok=True)
+            with open(baseline_path(name), 'w') as f:
+                json.dump(results, f, indent=2, default=str)
+            print(f"   Baseline aggiornata: {baseline_path(name)}")
+        all_results.append(results)
+
+    if len(all_results) > 1:
+        print_scaling_table(all_results)
+
+    failed = [f"{r['profile']}/{s}" for r in all_results for s, e in r['stages'].items() if e['status'] != 'OK']
+    if failed:
+        print(f"\n Step non riusciti: {failed}")
+    if regressions:
+        print(f"\n Regressioni oltre {args.threshold}x: {regressions}")
+    return 1 if (failed or (regressions and args.fail_on_regression)) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
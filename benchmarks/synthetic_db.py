@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Synthetic DB - ETF Italia Project v10
+Workspace sintetico deterministico per i benchmark (config + DuckDB con schema setup_db)
+
+LOGICA:
+- Workspace = root di progetto isolata: config/etf_universe.json, data/db/etf_data.duckdb,
+  data/reports/sessions; bench_workspace() sostituisce i singleton PathManager e
+  SessionManager così gli script della pipeline lavorano sul workspace senza modifiche
+- Config: copia di config/etf_universe.json con universo sintetico SYN0001.MI...
+  (80% core, 20% satellite, stessi campi del primo ETF core) + benchmark reale
+- Prezzi: random walk log-normale per simbolo (seed fisso), business day fino a end_date;
+  OHLC coerenti con i CHECK di market_data, nessuno spike >15% (quality gate ingest)
+- Le ultime ingest_days sedute NON sono caricate: restano nel feed sintetico
+  (SyntheticFeed) servito a ingest_data al posto dei provider di rete
+- trading_calendar esteso a tutto lo storico sintetico (setup_db parte dal 2010)
+"""
+
+import sys
+import copy
+import io
+import json
+from contextlib import contextmanager, redirect_stdout
+from datetime import date, timedelta
+from pathlib import Path
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+# Aggiungi scripts al path
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT / 'scripts') not in sys.path:
+    sys.path.append(str(ROOT / 'scripts'))
+
+import orchestration.session_manager as session_manager_module
+import utils.path_manager as path_manager_module
+from orchestration.session_manager import SessionManager
+from utils.latest_prices import refresh_latest_prices
+from utils.market_store import write_market_rows
+from utils.path_manager import PathManager
+from utils.universe_helper import get_default_venue
+
+DEFAULT_END_DATE = date(2024, 12, 31)
+DEFAULT_INGEST_DAYS = 10
+TRADING_DAYS_PER_YEAR = 252
+CORE_FRACTION = 0.8
+
+
+class BenchPathManager(PathManager):
+    """PathManager con root sul workspace del benchmark"""
+
+    def __init__(self, root):
+        super().__init__()
+        self.root = Path(root)
+
+
+@contextmanager
+def bench_workspace(root):
+    """Reindirizza PathManager/SessionManager sul workspace (ripristino all'uscita)"""
+    root = Path(root)
+    saved_pm = path_manager_module._path_manager
+    saved_sm = session_manager_module._session_manager
+    path_manager_module._path_manager = BenchPathManager(root)
+    session_manager_module._session_manager = SessionManager(
+        base_reports_dir=str(root / 'data' / 'reports' / 'sessions'),
+        script_name='health_check',
+    )
+    try:
+        yield path_manager_module._path_manager
+    finally:
+        path_manager_module._path_manager = saved_pm
+        session_manager_module._session_manager = saved_sm
+
+
+def synthetic_symbols(n_symbols):
+    return [f"SYN{i:04d}.MI" for i in range(1, n_symbols + 1)]
+
+
+def build_config(n_symbols, start_capital=None):
+    """Config con la struttura di etf_universe.json e universo sintetico"""
+    with open(ROOT / 'config' / 'etf_universe.json', 'r') as f:
+        config = json.load(f)
+
+    template = config['universe']['core'][0]
+    symbols = synthetic_symbols(n_symbols)
+    n_core = max(1, int(round(n_symbols * CORE_FRACTION)))
+    entries = []
+    for symbol in symbols:
+        etf = copy.deepcopy(template)
+        etf.update({
+            'symbol': symbol,
+            'name': f"Synthetic ETF {symbol}",
+            'weight_target': round(1.0 / n_symbols, 6),
+            'active_from': '1990-01-01',
+        })
+        entries.append(etf)
+
+    config['universe'] = {
+        'core': entries[:n_core],
+        'satellite': entries[n_core:],
+        'benchmark': config['universe']['benchmark'],
+    }
+    # Capitale proporzionale all'universo (20k per 5 simboli come in produzione)
+    config['settings']['start_capital'] = float(start_capital or 4000.0 * n_symbols)
+    config['initial_start_date'] = config['default_active_from'] = '1990-01-01'
+    return config
+
+
+def business_days(years, end_date=DEFAULT_END_DATE):
+    return pd.bdate_range(end=pd.Timestamp(end_date), periods=int(years * TRADING_DAYS_PER_YEAR))
+
+
+def synthetic_prices(symbols, dates, seed=42):
+    """DataFrame market_data (symbol, date, OHLC, volume) deterministico"""
+    rng = np.random.default_rng(seed)
+    n_dates = len(dates)
+    frames = []
+    for symbol in symbols:
+        drift = rng.uniform(-0.0001, 0.0006)
+        vol = rng.uniform(0.006, 0.016)
+        log_ret = np.clip(rng.normal(drift, vol, n_dates), -0.08, 0.08)
+        close = rng.uniform(20, 200) * np.exp(np.cumsum(log_ret))
+        spread = rng.uniform(0.001, 0.01, n_dates)
+        frames.append(pd.DataFrame({
+            'symbol': symbol,
+            'date': dates.date,
+            'high': close * (1 + spread),
+            'low': close * (1 - spread),
+            'close': close,
+            'adj_close': close,
+            'volume': rng.integers(10_000, 1_000_000, n_dates),
+            'source': 'BENCH',
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+class SyntheticFeed:
+    """Sostituto di ingest_data.download_with_fallback: serve le sedute non ancora caricate"""
+
+    def __init__(self, prices):
+        self._by_symbol = {
+            symbol: df.set_index(pd.DatetimeIndex(df['date']).rename('Date'))
+            for symbol, df in prices.groupby('symbol', sort=False)
+        }
+
+    def __call__(self, symbol, start_date, end_date):
+        df = self._by_symbol.get(symbol)
+        if df is None:
+            return None, 'NONE'
+        mask = (df.index.date >= start_date) & (df.index.date <= end_date)
+        sliced = df.loc[mask, ['high', 'low', 'close', 'adj_close', 'volume']]
+        if sliced.empty:
+            return None, 'NONE'
+        sliced = sliced.rename(columns={'high': 'High', 'low': 'Low', 'close': 'Close',
+                                        'adj_close': 'Adj Close', 'volume': 'Volume'})
+        sliced['Open'] = sliced['Close']
+        return sliced, 'BENCH'
+
+
+def build_synthetic_workspace(root, n_symbols=5, years=5, seed=42, end_date=DEFAULT_END_DATE,
+                              ingest_days=DEFAULT_INGEST_DAYS, log=None):
+    """Crea workspace (config + DB) e restituisce metadati e feed per l'ingest
+
+    Returns:
+        dict con config_path, db_path, symbols, start/end/ingest_from, rows, feed
+    """
+    root = Path(root)
+    (root / 'config').mkdir(parents=True, exist_ok=True)
+    (root / 'data' / 'db').mkdir(parents=True, exist_ok=True)
+
+    config = build_config(n_symbols)
+    config_path = root / 'config' / 'etf_universe.json'
+    with open(config_path, 'w') as f:
+        json.dump(config, f, indent=2)
+    holidays = ROOT / 'config' / 'market_holidays.json'
+    if holidays.exists():
+        (root / 'config' / 'market_holidays.json').write_bytes(holidays.read_bytes())
+
+    from setup.setup_db import setup_database
+
+    with bench_workspace(root) as pm, redirect_stdout(log or io.StringIO()):
+        if not setup_database():
+            raise RuntimeError(f"setup_db fallito su {pm.db_path}")
+
+    symbols = synthetic_symbols(n_symbols) + [b['symbol'] for b in config['universe']['benchmark']]
+    dates = business_days(years, end_date)
+    prices = synthetic_prices(symbols, dates, seed=seed)
+    ingest_from = dates[-ingest_days].date() if ingest_days else None
+    loaded = prices[prices['date'] < ingest_from] if ingest_from else prices
+
+    db_path = root / 'data' / 'db' / 'etf_data.duckdb'
+    conn = duckdb.connect(str(db_path))
+    try:
+        conn.register('bench_prices', loaded)
+        write_market_rows(conn, "SELECT symbol, date, high, low, close, adj_close, volume, source FROM bench_prices")
+        conn.unregister('bench_prices')
+        refresh_latest_prices(conn)
+        venues = sorted({'BIT', get_default_venue(config)})
+        for venue in venues:
+            conn.execute("""
+            INSERT OR IGNORE INTO trading_calendar (venue, date, is_open)
+            SELECT ?, d::DATE, EXTRACT(ISODOW FROM d) NOT IN (6, 7)
+            FROM generate_series(?::DATE, ?::DATE, INTERVAL '1 day') t(d)
+            """, [venue, dates[0].date(), end_date + timedelta(days=30)])
+        conn.commit()
+    finally:
+        conn.close()
+
+    return {
+        'root': str(root),
+        'config_path': str(config_path),
+        'db_path': str(db_path),
+        'symbols': symbols,
+        'start_date': dates[0].date(),
+        'end_date': dates[-1].date(),
+        'ingest_from': ingest_from,
+        'rows_loaded': int(len(loaded)),
+        'rows_feed': int(len(prices) - len(loaded)),
+        'feed': SyntheticFeed(prices[prices['date'] >= ingest_from] if ingest_from else prices.iloc[0:0]),
+    }
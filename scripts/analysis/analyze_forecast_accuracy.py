@@ -7,142 +7,164 @@ Analizza accuracy del forecast confrontando metriche previste vs realizzate per
 import sys
 import os
 from pathlib import Path
-from datetime import datetime, timedelta
-import pandas as pd
+from datetime import datetime
 import duckdb
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from utils.path_manager import get_path_manager
 
-def analyze_forecast_accuracy(run_type='BACKTEST', min_trades=1):
+# Trade completati (BUY + SELL matched) con volatilità realizzata e aggregati
+# per simbolo / exit reason in una sola query.
+# Volatilità realizzata (range high-low, stile Parkinson) via somme prefisse per
+# simbolo su market_data + ASOF join su entry/exit: nessuna query per trade.
+FORECAST_ACCURACY_SQL = """
+WITH buy_trades AS (
+    SELECT 
+        symbol,
+        date as entry_date,
+        qty,
+        price as entry_price,
+        entry_score,
+        expected_holding_days,
+        expected_exit_date,
+        run_id,
+        id as buy_id
+    FROM fiscal_ledger
+    WHERE type = 'BUY'
+    AND run_type = ?
+    AND entry_score IS NOT NULL
+),
+sell_trades AS (
+    SELECT 
+        symbol,
+        date as exit_date,
+        qty,
+        price as exit_price,
+        exit_reason,
+        actual_holding_days,
+        run_id,
+        id as sell_id
+    FROM fiscal_ledger
+    WHERE type = 'SELL'
+    AND run_type = ?
+),
+matched_trades AS (
+    SELECT 
+        b.symbol,
+        b.entry_date,
+        s.exit_date,
+        b.qty,
+        b.entry_price,
+        s.exit_price,
+        b.entry_score,
+        b.expected_holding_days,
+        b.expected_exit_date,
+        s.actual_holding_days,
+        s.exit_reason,
+        b.run_id,
+        -- Calcola metriche
+        (s.exit_price - b.entry_price) / b.entry_price as actual_return,
+        b.qty * b.entry_price as capital_invested,
+        (s.exit_price - b.entry_price) * b.qty as profit_loss
+    FROM buy_trades b
+    JOIN sell_trades s ON b.symbol = s.symbol 
+        AND s.exit_date > b.entry_date
+        AND b.run_id = s.run_id
+    WHERE b.qty = s.qty  -- Match esatto qty
+),
+range_prefix AS (
+    -- Somme prefisse del range relativo (solo righe con high/low valorizzati)
+    SELECT
+        symbol,
+        date,
+        SUM((high - low) / ((high + low) / 2)) OVER w as cum_range,
+        COUNT((high - low) / ((high + low) / 2)) OVER w as cum_count
+    FROM market_data
+    WHERE symbol IN (SELECT DISTINCT symbol FROM matched_trades)
+    WINDOW w AS (PARTITION BY symbol ORDER BY date ROWS UNBOUNDED PRECEDING)
+),
+trade_vol AS (
+    SELECT
+        t.*,
+        COALESCE(pe.cum_range, 0) - COALESCE(ps.cum_range, 0) as range_sum,
+        COALESCE(pe.cum_count, 0) - COALESCE(ps.cum_count, 0) as range_days
+    FROM matched_trades t
+    -- Prefisso fino a exit_date incluso
+    ASOF LEFT JOIN range_prefix pe ON pe.symbol = t.symbol AND pe.date <= t.exit_date
+    -- Prefisso fino a entry_date escluso
+    ASOF LEFT JOIN range_prefix ps ON ps.symbol = t.symbol AND ps.date < t.entry_date
+)
+SELECT
+    symbol,
+    entry_date,
+    exit_date,
+    qty,
+    entry_price,
+    exit_price,
+    entry_score,
+    expected_holding_days,
+    expected_exit_date,
+    actual_holding_days,
+    exit_reason,
+    run_id,
+    actual_return,
+    capital_invested,
+    profit_loss,
+    actual_holding_days - expected_holding_days as holding_error_days,
+    (actual_holding_days - expected_holding_days) / expected_holding_days * 100 as holding_error_pct,
+    COALESCE(NULLIF(range_sum / NULLIF(range_days, 0), 0) * SQRT(252), 0.15) as realized_volatility,
+    -- Aggregati per simbolo
+    COUNT(*) OVER (PARTITION BY symbol) as symbol_trades,
+    AVG(actual_return) OVER (PARTITION BY symbol) as symbol_avg_return,
+    AVG(actual_holding_days) OVER (PARTITION BY symbol) as symbol_avg_holding_days,
+    AVG(expected_holding_days) OVER (PARTITION BY symbol) as symbol_avg_expected_days,
+    AVG(CASE WHEN actual_return > 0 THEN 1.0 ELSE 0.0 END) OVER (PARTITION BY symbol) as symbol_win_rate,
+    -- Distribuzione exit reason
+    COUNT(*) OVER (PARTITION BY exit_reason) as exit_reason_count
+FROM trade_vol
+ORDER BY entry_date, symbol, exit_date
+"""
+
+
+def load_forecast_accuracy(conn, run_type='BACKTEST'):
     """
-    Analizza accuracy forecast per ogni trade completato
-    
-    Metriche analizzate:
-    - Durata prevista vs reale
-    - Capitale investito
-    - Resa (return) prevista vs reale
-    - Rischio (volatilità) stimato vs reale
-    - Exit reason (planned vs forced)
+    Trade completati con metriche forecast vs actual (una sola query)
+
+    Returns:
+        DataFrame: una riga per trade, con colonne aggregate per simbolo/exit reason
     """
-    
-    pm = get_path_manager()
-    db_path = str(pm.db_path)
-    conn = duckdb.connect(db_path)
-    
-    print("\n" + "=" * 80)
-    print("FORECAST ACCURACY ANALYSIS - Post-Cast Report")
-    print("=" * 80 + "\n")
-    
-    # Query trade completati (BUY + SELL matched)
-    trades_df = conn.execute("""
-    WITH buy_trades AS (
-        SELECT 
-            symbol,
-            date as entry_date,
-            qty,
-            price as entry_price,
-            entry_score,
-            expected_holding_days,
-            expected_exit_date,
-            run_id,
-            id as buy_id
-        FROM fiscal_ledger
-        WHERE type = 'BUY'
-        AND run_type = ?
-        AND entry_score IS NOT NULL
-    ),
-    sell_trades AS (
-        SELECT 
-            symbol,
-            date as exit_date,
-            qty,
-            price as exit_price,
-            exit_reason,
-            actual_holding_days,
-            run_id,
-            id as sell_id
-        FROM fiscal_ledger
-        WHERE type = 'SELL'
-        AND run_type = ?
-    ),
-    matched_trades AS (
-        SELECT 
-            b.symbol,
-            b.entry_date,
-            s.exit_date,
-            b.qty,
-            b.entry_price,
-            s.exit_price,
-            b.entry_score,
-            b.expected_holding_days,
-            b.expected_exit_date,
-            s.actual_holding_days,
-            s.exit_reason,
-            b.run_id,
-            -- Calcola metriche
-            (s.exit_price - b.entry_price) / b.entry_price as actual_return,
-            b.qty * b.entry_price as capital_invested,
-            (s.exit_price - b.entry_price) * b.qty as profit_loss
-        FROM buy_trades b
-        JOIN sell_trades s ON b.symbol = s.symbol 
-            AND s.exit_date > b.entry_date
-            AND b.run_id = s.run_id
-        WHERE b.qty = s.qty  -- Match esatto qty
-    )
-    SELECT * FROM matched_trades
-    ORDER BY entry_date
-    """, [run_type, run_type]).fetchdf()
-    
-    if len(trades_df) == 0:
-        print(f"⚠️  Nessun trade completato trovato per run_type={run_type}")
-        return None
-    
-    print(f"📊 Trovati {len(trades_df)} trade completati\n")
-    
-    # Calcola metriche aggregate
-    trades_df['holding_error_days'] = trades_df['actual_holding_days'] - trades_df['expected_holding_days']
-    trades_df['holding_error_pct'] = (trades_df['holding_error_days'] / trades_df['expected_holding_days']) * 100
-    
-    # Calcola volatilità realizzata per ogni trade
-    for idx, trade in trades_df.iterrows():
-        vol_data = conn.execute("""
-        SELECT AVG(
-            (high - low) / ((high + low) / 2)
-        ) * SQRT(252) as realized_vol
-        FROM market_data
-        WHERE symbol = ?
-        AND date BETWEEN ? AND ?
-        """, [trade['symbol'], trade['entry_date'], trade['exit_date']]).fetchone()
-        
-        trades_df.at[idx, 'realized_volatility'] = vol_data[0] if vol_data[0] else 0.15
+    return conn.execute(FORECAST_ACCURACY_SQL, [run_type, run_type]).fetchdf()
+
+
+def print_forecast_report(trades_df):
+    """Stampa report forecast vs actual dal DataFrame di load_forecast_accuracy"""
     
     # Report per trade
     print("=" * 80)
     print("DETTAGLIO TRADE (Forecast vs Actual)")
     print("=" * 80 + "\n")
     
-    for idx, trade in trades_df.iterrows():
-        print(f"Trade #{idx+1}: {trade['symbol']}")
+    for idx, trade in enumerate(trades_df.itertuples(index=False)):
+        print(f"Trade #{idx+1}: {trade.symbol}")
         print("-" * 80)
-        print(f"  📅 Entry: {trade['entry_date']} | Exit: {trade['exit_date']}")
-        print(f"  💰 Capitale: €{trade['capital_invested']:,.2f} | P&L: €{trade['profit_loss']:,.2f}")
-        print(f"  📈 Return: {trade['actual_return']*100:.2f}%")
-        print(f"  📊 Entry Score: {trade['entry_score']:.3f}")
+        print(f"  📅 Entry: {trade.entry_date} | Exit: {trade.exit_date}")
+        print(f"  💰 Capitale: €{trade.capital_invested:,.2f} | P&L: €{trade.profit_loss:,.2f}")
+        print(f"  📈 Return: {trade.actual_return*100:.2f}%")
+        print(f"  📊 Entry Score: {trade.entry_score:.3f}")
         print()
         print(f"  ⏱️  DURATA:")
-        print(f"     Prevista: {trade['expected_holding_days']:.0f} giorni")
-        print(f"     Reale:    {trade['actual_holding_days']:.0f} giorni")
-        print(f"     Errore:   {trade['holding_error_days']:.0f} giorni ({trade['holding_error_pct']:.1f}%)")
+        print(f"     Prevista: {trade.expected_holding_days:.0f} giorni")
+        print(f"     Reale:    {trade.actual_holding_days:.0f} giorni")
+        print(f"     Errore:   {trade.holding_error_days:.0f} giorni ({trade.holding_error_pct:.1f}%)")
         print()
         print(f"  🎯 EXIT:")
-        print(f"     Data prevista: {trade['expected_exit_date']}")
-        print(f"     Data reale:    {trade['exit_date']}")
-        print(f"     Motivo:        {trade['exit_reason']}")
+        print(f"     Data prevista: {trade.expected_exit_date}")
+        print(f"     Data reale:    {trade.exit_date}")
+        print(f"     Motivo:        {trade.exit_reason}")
         print()
         print(f"  📉 RISCHIO:")
-        print(f"     Volatilità realizzata: {trade['realized_volatility']*100:.2f}%")
+        print(f"     Volatilità realizzata: {trade.realized_volatility*100:.2f}%")
         print()
     
     # Summary statistiche
@@ -150,10 +172,14 @@ def analyze_forecast_accuracy(run_type='BACKTEST', min_trades=1):
     print("SUMMARY STATISTICHE")
     print("=" * 80 + "\n")
     
+    n_trades = len(trades_df)
+    n_win = int((trades_df['actual_return'] > 0).sum())
+    n_loss = int((trades_df['actual_return'] < 0).sum())
+    
     print(f"📊 PERFORMANCE:")
-    print(f"   Totale trade:        {len(trades_df)}")
-    print(f"   Trade vincenti:      {len(trades_df[trades_df['actual_return'] > 0])} ({len(trades_df[trades_df['actual_return'] > 0])/len(trades_df)*100:.1f}%)")
-    print(f"   Trade perdenti:      {len(trades_df[trades_df['actual_return'] < 0])} ({len(trades_df[trades_df['actual_return'] < 0])/len(trades_df)*100:.1f}%)")
+    print(f"   Totale trade:        {n_trades}")
+    print(f"   Trade vincenti:      {n_win} ({n_win/n_trades*100:.1f}%)")
+    print(f"   Trade perdenti:      {n_loss} ({n_loss/n_trades*100:.1f}%)")
     print(f"   Return medio:        {trades_df['actual_return'].mean()*100:.2f}%")
     print(f"   Return mediano:      {trades_df['actual_return'].median()*100:.2f}%")
     print(f"   Miglior trade:       {trades_df['actual_return'].max()*100:.2f}%")
@@ -169,9 +195,13 @@ def analyze_forecast_accuracy(run_type='BACKTEST', min_trades=1):
     print()
     
     print(f"🎯 EXIT REASON DISTRIBUTION:")
-    exit_reasons = trades_df['exit_reason'].value_counts()
-    for reason, count in exit_reasons.items():
-        print(f"   {reason}: {count} ({count/len(trades_df)*100:.1f}%)")
+    exit_reasons = (
+        trades_df[['exit_reason', 'exit_reason_count']]
+        .drop_duplicates('exit_reason')
+        .sort_values('exit_reason_count', ascending=False)
+    )
+    for reason, count in exit_reasons.itertuples(index=False):
+        print(f"   {reason}: {count} ({count/n_trades*100:.1f}%)")
     print()
     
     print(f"📉 RISCHIO:")
@@ -185,17 +215,50 @@ def analyze_forecast_accuracy(run_type='BACKTEST', min_trades=1):
     print("ANALISI PER SIMBOLO")
     print("=" * 80 + "\n")
     
-    for symbol in trades_df['symbol'].unique():
-        symbol_trades = trades_df[trades_df['symbol'] == symbol]
-        print(f"📌 {symbol}:")
-        print(f"   Trade:           {len(symbol_trades)}")
-        print(f"   Return medio:    {symbol_trades['actual_return'].mean()*100:.2f}%")
-        print(f"   Durata media:    {symbol_trades['actual_holding_days'].mean():.1f} giorni (prevista: {symbol_trades['expected_holding_days'].mean():.1f})")
-        print(f"   Win rate:        {len(symbol_trades[symbol_trades['actual_return'] > 0])/len(symbol_trades)*100:.1f}%")
+    for row in trades_df.drop_duplicates('symbol').itertuples(index=False):
+        print(f"📌 {row.symbol}:")
+        print(f"   Trade:           {row.symbol_trades}")
+        print(f"   Return medio:    {row.symbol_avg_return*100:.2f}%")
+        print(f"   Durata media:    {row.symbol_avg_holding_days:.1f} giorni (prevista: {row.symbol_avg_expected_days:.1f})")
+        print(f"   Win rate:        {row.symbol_win_rate*100:.1f}%")
         print()
+
+
+def analyze_forecast_accuracy(run_type='BACKTEST', min_trades=1):
+    """
+    Analizza accuracy forecast per ogni trade completato
+    
+    Metriche analizzate:
+    - Durata prevista vs reale
+    - Capitale investito
+    - Resa (return) prevista vs reale
+    - Rischio (volatilità) stimato vs reale
+    - Exit reason (planned vs forced)
+    """
+    
+    pm = get_path_manager()
+    db_path = str(pm.db_path)
+    conn = duckdb.connect(db_path, read_only=True)
+    
+    print("\n" + "=" * 80)
+    print("FORECAST ACCURACY ANALYSIS - Post-Cast Report")
+    print("=" * 80 + "\n")
+    
+    try:
+        trades_df = load_forecast_accuracy(conn, run_type)
+    finally:
+        conn.close()
+    
+    if len(trades_df) == 0 or len(trades_df) < min_trades:
+        print(f"⚠️  Trade completati insufficienti per run_type={run_type} ({len(trades_df)} < {max(min_trades, 1)})")
+        return None
+    
+    print(f"📊 Trovati {len(trades_df)} trade completati\n")
+    
+    print_forecast_report(trades_df)
     
     # Salva report
-    output_dir = pm.project_root / 'data' / 'reports'
+    output_dir = pm.root / 'data' / 'reports'
     output_dir.mkdir(parents=True, exist_ok=True)
     
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -204,7 +267,6 @@ def analyze_forecast_accuracy(run_type='BACKTEST', min_trades=1):
     
     print(f"💾 Report salvato: {csv_path}")
     
-    conn.close()
     return trades_df
 
 
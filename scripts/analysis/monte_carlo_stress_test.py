@@ -2,11 +2,17 @@
 Stress Test Monte Carlo (DIPF §9.3)
 Gate finale per validazione rischio coda prima di aumentare AUM reale.
 
-Implementa shuffle test semplice (1000 iterazioni) per validare:
+Implementa shuffle test (1000 iterazioni) per validare:
 - 5th percentile MaxDD < 25% (retail risk tolerance)
 - Distribuzione CAGR sotto permutazioni casuali
 - Worst-case scenarios e tail risk
 
+Metodi di ricampionamento (matrici di indici vettoriali, metriche in batch):
+- shuffle: permutazione i.i.d. (distrugge il clustering di volatilità)
+- stationary: stationary bootstrap (blocchi di lunghezza geometrica)
+- circular: circular block bootstrap (blocchi di lunghezza fissa)
+- regime: ricampionamento condizionato al regime (bull/bear/sideways) del giorno
+
 Conformità: DIPF §9.3, retail-grade risk assessment
 """
 
@@ -23,10 +29,91 @@ import json
 from decimal import Decimal
 
 from utils.path_manager import get_db_path, get_path_manager
+from utils.kpi_kernels import returns_kpis
 import sys
 sys.path.append(str(Path(__file__).parent.parent))
 from orchestration.session_manager import get_session_manager
 
+RESAMPLING_METHODS = ('shuffle', 'stationary', 'circular', 'regime')
+DEFAULT_BLOCK_SIZE = 20  # ~1 mese di trading: preserva il clustering di volatilità
+
+
+def permutation_indices(n_days: int, n_simulations: int, rng: np.random.Generator) -> np.ndarray:
+    """Matrice (simulazioni × giorni) di permutazioni i.i.d."""
+    return rng.random((n_simulations, n_days)).argsort(axis=1)
+
+
+def stationary_bootstrap_indices(
+    n_days: int,
+    n_simulations: int,
+    rng: np.random.Generator,
+    mean_block_size: float = DEFAULT_BLOCK_SIZE
+) -> np.ndarray:
+    """
+    Matrice indici per stationary bootstrap (Politis-Romano).
+
+    Ogni giorno apre un nuovo blocco con probabilità 1/mean_block_size,
+    altrimenti prosegue il blocco corrente (circolare sulla serie originale).
+    """
+    p_new = 1.0 / max(1.0, float(mean_block_size))
+    starts = rng.integers(0, n_days, size=(n_simulations, n_days))
+    new_block = rng.random((n_simulations, n_days)) < p_new
+    new_block[:, 0] = True
+
+    t = np.arange(n_days)
+    block_start = np.maximum.accumulate(np.where(new_block, t, 0), axis=1)
+    rows = np.arange(n_simulations)[:, None]
+    return (starts[rows, block_start] + (t - block_start)) % n_days
+
+
+def circular_block_bootstrap_indices(
+    n_days: int,
+    n_simulations: int,
+    rng: np.random.Generator,
+    block_size: int = DEFAULT_BLOCK_SIZE
+) -> np.ndarray:
+    """Matrice indici per circular block bootstrap (blocchi di lunghezza fissa)"""
+    block_size = max(1, min(int(block_size), n_days))
+    n_blocks = -(-n_days // block_size)
+    starts = rng.integers(0, n_days, size=(n_simulations, n_blocks))
+    t = np.arange(n_days)
+    return (starts[:, t // block_size] + t % block_size) % n_days
+
+
+def regime_bootstrap_indices(
+    regimes,
+    n_simulations: int,
+    rng: np.random.Generator,
+    mean_block_size: float = DEFAULT_BLOCK_SIZE
+) -> np.ndarray:
+    """
+    Matrice indici per ricampionamento condizionato al regime.
+
+    Mantiene la sequenza di regimi osservata: il giorno t riceve un return
+    estratto da un giorno con lo stesso regime. Come nello stationary bootstrap,
+    con probabilità 1 - 1/mean_block_size prosegue il blocco corrente se il
+    giorno successivo è nello stesso regime.
+    """
+    regimes = np.asarray(regimes)
+    n_days = len(regimes)
+    labels, codes = np.unique(regimes, return_inverse=True)
+    pools = [np.flatnonzero(codes == k) for k in range(len(labels))]
+    p_new = 1.0 / max(1.0, float(mean_block_size))
+
+    idx = np.empty((n_simulations, n_days), dtype=np.int64)
+    for t in range(n_days):
+        pool = pools[codes[t]]
+        fresh = pool[rng.integers(0, len(pool), size=n_simulations)]
+        if t == 0:
+            idx[:, t] = fresh
+            continue
+        nxt = idx[:, t - 1] + 1
+        nxt_ok = nxt < n_days
+        cont = nxt_ok & (codes[np.minimum(nxt, n_days - 1)] == codes[t])
+        cont &= rng.random(n_simulations) >= p_new
+        idx[:, t] = np.where(cont, nxt, fresh)
+    return idx
+
 
 class MonteCarloStressTest:
     """
@@ -50,6 +137,8 @@ class MonteCarloStressTest:
         self.n_simulations = n_simulations
         self.conn = None
         self.results = []
+        self.method = 'shuffle'
+        self.block_size = None
         
     def connect(self):
         """Connessione al database."""
@@ -136,81 +225,120 @@ class MonteCarloStressTest:
         Returns:
             Dict con metriche: cagr, max_dd, sharpe, sortino, calmar
         """
-        if len(returns) == 0:
-            return {
-                'cagr': 0.0,
-                'max_dd': 0.0,
-                'sharpe': 0.0,
-                'sortino': 0.0,
-                'calmar': 0.0,
-                'final_equity': initial_equity
-            }
-            
-        # Equity curve (include initial equity point for correct drawdown)
-        equity_curve = np.concatenate(
-            [[initial_equity], initial_equity * np.cumprod(1 + returns)]
-        )
-        final_equity = equity_curve[-1]
-        
-        # CAGR
-        n_days = len(returns)
-        years = n_days / 252.0
-        cagr = (final_equity / initial_equity) ** (1 / years) - 1.0 if years > 0 else 0.0
-        
-        # Max Drawdown
-        running_max = np.maximum.accumulate(equity_curve)
-        drawdown = (equity_curve - running_max) / running_max
-        max_dd = abs(drawdown.min())
-        
-        # Sharpe Ratio (annualized, risk-free = 0)
-        mean_return = returns.mean()
-        std_return = returns.std()
-        sharpe = (mean_return / std_return) * np.sqrt(252) if std_return > 0 else 0.0
-        
-        # Sortino Ratio (annualized, downside deviation)
-        downside_returns = returns[returns < 0]
-        downside_std = downside_returns.std() if len(downside_returns) > 0 else std_return
-        sortino = (mean_return / downside_std) * np.sqrt(252) if downside_std > 0 else 0.0
-        
-        # Calmar Ratio (CAGR / MaxDD)
-        calmar = cagr / max_dd if max_dd > 0 else 0.0
-        
-        return {
-            'cagr': float(cagr),
-            'max_dd': float(max_dd),
-            'sharpe': float(sharpe),
-            'sortino': float(sortino),
-            'calmar': float(calmar),
-            'final_equity': float(final_equity)
-        }
+        metrics = returns_kpis(np.asarray(returns, dtype=float), initial_equity=initial_equity)
+        metrics['max_dd'] = abs(metrics['max_dd'])
+        return metrics
         
+    def calculate_metrics_batch(self, returns_matrix: np.ndarray, initial_equity: float = 10000.0) -> Dict[str, np.ndarray]:
+        """
+        Calcola metriche per una matrice di simulazioni (vettoriale).
+
+        Stesse definizioni di calculate_metrics, applicate per riga.
+
+        Args:
+            returns_matrix: Array (simulazioni × giorni) di returns giornalieri
+            initial_equity: Equity iniziale
+
+        Returns:
+            Dict metrica -> array (simulazioni)
+        """
+        metrics = returns_kpis(np.asarray(returns_matrix, dtype=float), initial_equity=initial_equity)
+        metrics['max_dd'] = np.abs(metrics['max_dd'])
+        return metrics
+
+    def generate_indices(
+        self,
+        n_days: int,
+        rng: np.random.Generator,
+        method: str = 'shuffle',
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        regimes=None
+    ) -> np.ndarray:
+        """
+        Genera la matrice (simulazioni × giorni) di indici per il metodo richiesto.
+
+        Args:
+            n_days: Lunghezza serie returns
+            rng: Generatore numpy
+            method: 'shuffle', 'stationary', 'circular' o 'regime'
+            block_size: Lunghezza (media) blocchi per i metodi a blocchi
+            regimes: Etichette regime per giorno (obbligatorio per method='regime')
+        """
+        if method == 'shuffle':
+            return permutation_indices(n_days, self.n_simulations, rng)
+        if method == 'stationary':
+            return stationary_bootstrap_indices(n_days, self.n_simulations, rng, block_size)
+        if method == 'circular':
+            return circular_block_bootstrap_indices(n_days, self.n_simulations, rng, block_size)
+        if method == 'regime':
+            if regimes is None or len(regimes) != n_days:
+                raise ValueError("method='regime' richiede un regime per ogni giorno di returns")
+            return regime_bootstrap_indices(regimes, self.n_simulations, rng, block_size)
+        raise ValueError(f"Metodo ricampionamento non supportato: {method} (ammessi: {', '.join(RESAMPLING_METHODS)})")
+
+    def extract_regimes(self, dates, symbol: str = 'CSSPX.MI') -> np.ndarray:
+        """
+        Regime (bull/bear/sideways) per ogni data, dalla classificazione di
+        regime_adaptive_poc_real_data sul simbolo di riferimento.
+
+        Le date senza dato di mercato ereditano l'ultimo regime noto
+        ('sideways' prima del primo dato disponibile).
+        """
+        from analysis.regime_adaptive_poc_real_data import get_historical_data_with_regime
+
+        self.connect()
+        dates = pd.to_datetime(pd.Series(dates)).reset_index(drop=True)
+        if len(dates) == 0:
+            return np.array([], dtype=object)
+
+        df_regime = get_historical_data_with_regime(
+            self.conn, symbol,
+            dates.min().strftime('%Y-%m-%d'),
+            dates.max().strftime('%Y-%m-%d')
+        )
+        if df_regime is None:
+            return np.full(len(dates), 'sideways', dtype=object)
+
+        regime_dates = pd.to_datetime(df_regime['date']).values
+        pos = np.searchsorted(regime_dates, dates.values, side='right') - 1
+        labels = df_regime['regime'].to_numpy(dtype=object)
+        return np.where(pos >= 0, labels[np.clip(pos, 0, None)], 'sideways')
+
     def run_shuffle_test(
         self, 
         returns: np.ndarray,
         initial_equity: float = 10000.0,
-        seed: Optional[int] = 42
+        seed: Optional[int] = 42,
+        method: str = 'shuffle',
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        regimes=None
     ) -> List[Dict]:
         """
-        Esegue shuffle test Monte Carlo.
+        Esegue stress test Monte Carlo (shuffle o bootstrap a blocchi/regime).
         
         Args:
             returns: Array di returns giornalieri
             initial_equity: Equity iniziale
             seed: Random seed per riproducibilità
+            method: Metodo ricampionamento (vedi RESAMPLING_METHODS)
+            block_size: Lunghezza (media) blocchi per stationary/circular/regime
+            regimes: Etichette regime allineate a returns (solo method='regime')
             
         Returns:
             Lista di dict con metriche per ogni simulazione
         """
-        if seed is not None:
-            np.random.seed(seed)
-            
-        results = []
+        returns = np.asarray(returns, dtype=float)
+        rng = np.random.default_rng(seed)
+        self.method = method
+        self.block_size = block_size if method != 'shuffle' else None
         
         print(f"\n{'='*60}")
-        print(f"MONTE CARLO SHUFFLE TEST - {self.n_simulations} simulazioni")
+        print(f"MONTE CARLO STRESS TEST ({method}) - {self.n_simulations} simulazioni")
         print(f"{'='*60}")
         print(f"Returns originali: {len(returns)} giorni")
         print(f"Initial equity: €{initial_equity:,.2f}")
+        if self.block_size:
+            print(f"Block size: {block_size}")
         
         # Baseline (returns originali)
         baseline_metrics = self.calculate_metrics(returns, initial_equity)
@@ -220,19 +348,17 @@ class MonteCarloStressTest:
         print(f"  Sharpe: {baseline_metrics['sharpe']:.2f}")
         print(f"  Calmar: {baseline_metrics['calmar']:.2f}")
         
-        # Simulazioni shuffle
-        print(f"\nEsecuzione {self.n_simulations} simulazioni shuffle...")
-        for i in range(self.n_simulations):
-            if (i + 1) % 100 == 0:
-                print(f"  Simulazione {i+1}/{self.n_simulations}...")
-                
-            # Shuffle returns
-            shuffled_returns = np.random.permutation(returns)
-            
-            # Calcola metriche
-            metrics = self.calculate_metrics(shuffled_returns, initial_equity)
-            metrics['simulation_id'] = i + 1
-            results.append(metrics)
+        # Simulazioni: matrice indici → returns ricampionati → metriche in batch
+        print(f"\nEsecuzione {self.n_simulations} simulazioni {method}...")
+        indices = self.generate_indices(len(returns), rng, method, block_size, regimes)
+        batch = self.calculate_metrics_batch(returns[indices], initial_equity)
+        
+        keys = ('cagr', 'max_dd', 'sharpe', 'sortino', 'calmar', 'final_equity')
+        columns = [batch[k].tolist() for k in keys]
+        results = [
+            {**dict(zip(keys, values)), 'simulation_id': i + 1}
+            for i, values in enumerate(zip(*columns))
+        ]
             
         self.results = results
         return results
@@ -285,6 +411,8 @@ class MonteCarloStressTest:
         
         analysis = {
             'n_simulations': self.n_simulations,
+            'method': self.method,
+            'block_size': self.block_size,
             'cagr': {
                 'mean': float(np.mean(cagr_values)),
                 'std': float(np.std(cagr_values)),
@@ -327,7 +455,7 @@ class MonteCarloStressTest:
             analysis: Dict da analyze_results()
         """
         print(f"\n{'='*60}")
-        print(f"ANALISI RISULTATI MONTE CARLO")
+        print(f"ANALISI RISULTATI MONTE CARLO ({analysis.get('method', 'shuffle')})")
         print(f"{'='*60}")
         
         print(f"\nCAGR Distribution ({analysis['n_simulations']} simulazioni):")
@@ -405,6 +533,7 @@ class MonteCarloStressTest:
             use_session: Se True usa session manager (default), altrimenti path diretto
         """
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        sm = None
         
         if use_session and output_dir is None:
             # Usa session manager per struttura corretta
@@ -419,13 +548,27 @@ class MonteCarloStressTest:
             
         output_dir.mkdir(parents=True, exist_ok=True)
         
+        # Metriche per simulazione: Parquet scritto in background mentre si
+        # generano i report JSON/Markdown (voce nel manifest della sessione)
+        from orchestration.artifact_writer import MANIFEST_NAME, get_artifact_writer, write_artifact
+        writer = get_artifact_writer()
+        simulations_path = None
+        if self.results:
+            simulations_path = output_dir / f"monte_carlo_simulations_{timestamp}.parquet"
+            manifest_dir = sm.get_current_session_dir() if sm is not None else output_dir
+            writer.submit(write_artifact, simulations_path, list(self.results), 'parquet',
+                          'monte_carlo_simulations', manifest_dir / MANIFEST_NAME,
+                          {'method': self.method, 'block_size': self.block_size})
+        
         # JSON report
         report_data = {
             'timestamp': timestamp,
-            'test_type': 'monte_carlo_shuffle',
+            'test_type': f'monte_carlo_{self.method}',
             'n_simulations': self.n_simulations,
+            'block_size': self.block_size,
             'baseline': baseline_metrics,
-            'analysis': analysis
+            'analysis': analysis,
+            'simulations_file': simulations_path.name if simulations_path else None
         }
         
         json_path = output_dir / f"monte_carlo_stress_test_{timestamp}.json"
@@ -438,7 +581,9 @@ class MonteCarloStressTest:
         md_path = output_dir / f"monte_carlo_stress_test_{timestamp}.md"
         with open(md_path, 'w', encoding='utf-8') as f:
             f.write(f"# Stress Test Monte Carlo - {timestamp}\n\n")
-            f.write(f"**Test Type:** Monte Carlo Shuffle Test\n")
+            f.write(f"**Test Type:** Monte Carlo {self.method.capitalize()} Test\n")
+            if self.block_size:
+                f.write(f"**Block Size:** {self.block_size}\n")
             f.write(f"**Simulazioni:** {self.n_simulations}\n")
             f.write(f"**Conformità:** DIPF §9.3\n\n")
             
@@ -514,6 +659,10 @@ class MonteCarloStressTest:
             
         print(f"✅ Report Markdown salvato: {md_path}")
         
+        writer.flush()
+        if simulations_path is not None:
+            print(f"✅ Simulazioni salvate: {simulations_path}")
+        
         return json_path, md_path
 
 
@@ -523,6 +672,7 @@ def main():
     
     Usage:
         python stress_test_monte_carlo.py [--start-date YYYY-MM-DD] [--end-date YYYY-MM-DD] [--n-sims N]
+                                          [--method shuffle|stationary|circular|regime] [--block-size N]
     """
     import argparse
     
@@ -551,6 +701,24 @@ def main():
         default=42,
         help='Random seed per riproducibilità (default: 42)'
     )
+    parser.add_argument(
+        '--method',
+        choices=RESAMPLING_METHODS,
+        default='stationary',
+        help='Metodo ricampionamento (default: stationary, preserva il clustering di volatilità)'
+    )
+    parser.add_argument(
+        '--block-size',
+        type=int,
+        default=DEFAULT_BLOCK_SIZE,
+        help=f'Lunghezza (media) blocchi bootstrap in giorni (default: {DEFAULT_BLOCK_SIZE})'
+    )
+    parser.add_argument(
+        '--regime-symbol',
+        type=str,
+        default='CSSPX.MI',
+        help='Simbolo di riferimento per la classificazione regime (default: CSSPX.MI)'
+    )
     
     args = parser.parse_args()
     
@@ -560,6 +728,7 @@ def main():
     print(f"Conformità: DIPF §9.3")
     print(f"Simulazioni: {args.n_sims}")
     print(f"Random seed: {args.seed}")
+    print(f"Metodo: {args.method}")
     
     # Inizializza stress test
     stress_test = MonteCarloStressTest(n_simulations=args.n_sims)
@@ -585,11 +754,20 @@ def main():
         # Calcola baseline
         baseline_metrics = stress_test.calculate_metrics(returns, initial_equity)
         
-        # Esegui shuffle test
+        regimes = None
+        if args.method == 'regime':
+            regimes = stress_test.extract_regimes(df_returns['date'], symbol=args.regime_symbol)
+            labels, counts = np.unique(regimes, return_counts=True)
+            print(f"   Regimi ({args.regime_symbol}): " + ", ".join(f"{l}={c}" for l, c in zip(labels, counts)))
+        
+        # Esegui stress test
         results = stress_test.run_shuffle_test(
             returns=returns,
             initial_equity=initial_equity,
-            seed=args.seed
+            seed=args.seed,
+            method=args.method,
+            block_size=args.block_size,
+            regimes=regimes
         )
         
         # Analizza risultati
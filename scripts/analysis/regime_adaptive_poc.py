@@ -16,6 +16,7 @@ from typing import Dict, List, Tuple
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from utils.path_manager import get_path_manager
+from analysis.regime_simulator import classify_regimes, simulate_positions
 
 def classify_regime_simple(volatility: float, trend: float, volume_ratio: float) -> str:
     """
@@ -96,10 +97,7 @@ def get_market_regime_history(conn, symbol: str, start_date: str, end_date: str,
     ]).fetchdf()
     
     # Classifica regime
-    df['regime'] = df.apply(
-        lambda row: classify_regime_simple(row['volatility'], row['trend'], row['volume_ratio']),
-        axis=1
-    )
+    df['regime'] = classify_regimes(df['volatility'].to_numpy(), df['trend'].to_numpy(), bear_rule='and')
     
     return df
 
@@ -206,29 +204,13 @@ def simulate_strategy(conn, symbol: str, dates: List[str],
     if len(df) < 20:
         return -999
     
-    # Simula trade
-    returns = []
-    position = 0
-    entry_price = 0
-    
-    for idx, row in df.iterrows():
-        # Entry signal
-        if position == 0 and row['momentum_score'] >= score_entry_min:
-            position = 1
-            entry_price = row['adj_close']
-        
-        # Exit signal (stop-loss)
-        elif position == 1:
-            current_return = (row['adj_close'] - entry_price) / entry_price
-            if current_return <= stop_loss:
-                returns.append(current_return)
-                position = 0
-            # Hold position
-    
-    # Close final position
-    if position == 1 and len(df) > 0:
-        final_return = (df.iloc[-1]['adj_close'] - entry_price) / entry_price
-        returns.append(final_return)
+    # Simula trade (solo stop-loss, posizione aperta chiusa all'ultima barra)
+    prices = df['adj_close'].to_numpy(dtype=float)
+    entry_idx, exit_idx, _ = simulate_positions(
+        prices, df['momentum_score'].to_numpy(dtype=float) >= score_entry_min,
+        stop_loss=stop_loss, take_profit=None
+    )
+    returns = (prices[exit_idx] - prices[entry_idx]) / prices[entry_idx]
     
     if len(returns) == 0:
         return -999
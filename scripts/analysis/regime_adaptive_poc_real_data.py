@@ -15,6 +15,13 @@ import duckdb
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from utils.path_manager import get_path_manager
+from analysis.regime_simulator import (
+    build_trades,
+    classify_regimes,
+    momentum_scores,
+    regime_sizes,
+    simulate_positions,
+)
 
 
 def classify_regime_from_metrics(volatility: float, trend: float) -> str:
@@ -90,11 +97,8 @@ def get_historical_data_with_regime(conn, symbol: str, start_date: str, end_date
     if len(df) == 0:
         return None
     
-    # Classifica regime
-    df['regime'] = df.apply(
-        lambda row: classify_regime_from_metrics(row['volatility'], row['trend']),
-        axis=1
-    )
+    # Classifica regime (vettoriale)
+    df['regime'] = classify_regimes(df['volatility'].to_numpy(), df['trend'].to_numpy())
     
     return df
 
@@ -117,90 +121,15 @@ def simulate_strategy_on_real_data(df, score_entry_min=0.7, stop_loss=-0.15,
     if risk_scalar_by_regime is None:
         risk_scalar_by_regime = {'bull': 1.0, 'bear': 1.0, 'sideways': 1.0}
     
-    trades = []
-    position = None
+    # Momentum normalizzato a score 0-1, entry/exit trovate dal simulatore su array
+    prices = df['close'].to_numpy(dtype=float)
+    scores = momentum_scores(df['momentum'].to_numpy(dtype=float))
+    entry_idx, exit_idx, exit_reason = simulate_positions(
+        prices, scores >= score_entry_min, stop_loss=stop_loss, take_profit=0.15
+    )
+    sizes = regime_sizes(df['regime'].to_numpy(dtype=object), risk_scalar_by_regime)
     
-    for i in range(len(df)):
-        current = df.iloc[i]
-        
-        # Normalizza momentum a score 0-1
-        momentum_score = min(max(current['momentum'] * 5 + 0.5, 0), 1)
-        
-        # Entry signal
-        if position is None and momentum_score >= score_entry_min:
-            # Determina size basato su regime
-            regime = current['regime']
-            size = risk_scalar_by_regime.get(regime, 1.0)
-            
-            position = {
-                'entry_date': current['date'],
-                'entry_price': current['close'],
-                'entry_volatility': current['volatility'],
-                'entry_regime': regime,
-                'size': size,
-                'momentum_score': momentum_score
-            }
-        
-        # Exit signal
-        elif position is not None:
-            current_return = (current['close'] - position['entry_price']) / position['entry_price']
-            
-            # Stop-loss
-            if current_return <= stop_loss:
-                trade_return = current_return * position['size']
-                trades.append({
-                    'entry_date': position['entry_date'],
-                    'exit_date': current['date'],
-                    'entry_price': position['entry_price'],
-                    'exit_price': current['close'],
-                    'entry_regime': position['entry_regime'],
-                    'entry_volatility': position['entry_volatility'],
-                    'trade_return': trade_return,
-                    'raw_return': current_return,
-                    'exit_reason': 'STOP_LOSS',
-                    'size': position['size'],
-                    'holding_days': (current['date'] - position['entry_date']).days
-                })
-                position = None
-            
-            # Take-profit (+15%)
-            elif current_return >= 0.15:
-                trade_return = current_return * position['size']
-                trades.append({
-                    'entry_date': position['entry_date'],
-                    'exit_date': current['date'],
-                    'entry_price': position['entry_price'],
-                    'exit_price': current['close'],
-                    'entry_regime': position['entry_regime'],
-                    'entry_volatility': position['entry_volatility'],
-                    'trade_return': trade_return,
-                    'raw_return': current_return,
-                    'exit_reason': 'TAKE_PROFIT',
-                    'size': position['size'],
-                    'holding_days': (current['date'] - position['entry_date']).days
-                })
-                position = None
-    
-    # Close final position
-    if position is not None:
-        final = df.iloc[-1]
-        current_return = (final['close'] - position['entry_price']) / position['entry_price']
-        trade_return = current_return * position['size']
-        trades.append({
-            'entry_date': position['entry_date'],
-            'exit_date': final['date'],
-            'entry_price': position['entry_price'],
-            'exit_price': final['close'],
-            'entry_regime': position['entry_regime'],
-            'entry_volatility': position['entry_volatility'],
-            'trade_return': trade_return,
-            'raw_return': current_return,
-            'exit_reason': 'END_PERIOD',
-            'size': position['size'],
-            'holding_days': (final['date'] - position['entry_date']).days
-        })
-    
-    return pd.DataFrame(trades)
+    return build_trades(df, entry_idx, exit_idx, exit_reason, sizes)
 
 
 def run_poc_real_data(symbol='VWCE.MI', start_date='2020-01-01', end_date='2025-01-01'):
@@ -412,9 +341,29 @@ if __name__ == '__main__':
     parser.add_argument('--symbol', default='VWCE.MI', help='Simbolo ETF')
     parser.add_argument('--start', default='2020-01-01', help='Data inizio')
     parser.add_argument('--end', default='2025-01-01', help='Data fine')
+    parser.add_argument('--sweep', action='store_true',
+                        help='Sweep score_entry/stop_loss/risk_scalar su tutto l\'universo')
     
     args = parser.parse_args()
     
+    if args.sweep:
+        from analysis.regime_simulator import run_parameter_sweep, summarize_sweep
+        from risk.covariance_store import get_store_symbols
+        
+        conn = duckdb.connect(str(get_path_manager().db_path), read_only=True)
+        try:
+            sweep = run_parameter_sweep(conn, get_store_symbols(), args.start, args.end)
+        finally:
+            conn.close()
+        
+        if len(sweep) == 0:
+            print("\n❌ Sweep fallito - Dati insufficienti")
+            sys.exit(1)
+        
+        print("\n🔧 SWEEP FIXED vs ADAPTIVE (media sui simboli)")
+        print(summarize_sweep(sweep).to_string(index=False))
+        sys.exit(0)
+    
     results = run_poc_real_data(symbol=args.symbol, start_date=args.start, end_date=args.end)
     
     if results:
@@ -13,6 +13,7 @@ import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from utils.path_manager import get_path_manager
+from analysis.regime_simulator import simulate_positions
 
 
 def generate_synthetic_market_data(n_days=1000, seed=42):
@@ -93,67 +94,35 @@ def simulate_trading_strategy(market_data, score_entry_min=0.7, stop_loss=-0.15,
         Lista di trade con return
     """
     
-    trades = []
-    position = None
+    prices = market_data['price'].to_numpy(dtype=float)
+    volatility = market_data['volatility'].to_numpy(dtype=float)
     
-    for i in range(20, len(market_data)):
-        current = market_data.iloc[i]
-        
-        # Calcola momentum score (semplificato)
-        price_20d_ago = market_data.iloc[i-20]['price']
-        momentum = (current['price'] - price_20d_ago) / price_20d_ago
-        momentum_score = min(max(momentum * 10, 0), 1)  # Normalizza 0-1
-        
-        # Entry signal
-        if position is None and momentum_score >= score_entry_min:
-            # Determina size basato su volatility
-            if current['volatility'] > 0.20:
-                size = risk_scalar_high_vol  # Ridotto in alta vol
-            else:
-                size = 1.0
-            
-            position = {
-                'entry_date': current['date'],
-                'entry_price': current['price'],
-                'entry_volatility': current['volatility'],
-                'entry_regime': current['regime'],
-                'size': size,
-                'momentum_score': momentum_score
-            }
-        
-        # Exit signal (stop-loss o take-profit)
-        elif position is not None:
-            current_return = (current['price'] - position['entry_price']) / position['entry_price']
-            
-            # Stop-loss
-            if current_return <= stop_loss:
-                trade_return = current_return * position['size']
-                trades.append({
-                    'entry_date': position['entry_date'],
-                    'exit_date': current['date'],
-                    'entry_regime': position['entry_regime'],
-                    'entry_volatility': position['entry_volatility'],
-                    'trade_return': trade_return,
-                    'exit_reason': 'STOP_LOSS',
-                    'size': position['size']
-                })
-                position = None
-            
-            # Take-profit (semplificato: +10%)
-            elif current_return >= 0.10:
-                trade_return = current_return * position['size']
-                trades.append({
-                    'entry_date': position['entry_date'],
-                    'exit_date': current['date'],
-                    'entry_regime': position['entry_regime'],
-                    'entry_volatility': position['entry_volatility'],
-                    'trade_return': trade_return,
-                    'exit_reason': 'TAKE_PROFIT',
-                    'size': position['size']
-                })
-                position = None
-    
-    return pd.DataFrame(trades)
+    # Momentum 20 giorni normalizzato 0-1 (semplificato), segnale solo dalla barra 20
+    momentum = np.zeros(len(prices))
+    momentum[20:] = (prices[20:] - prices[:-20]) / prices[:-20]
+    entry_signal = np.clip(momentum * 10, 0, 1) >= score_entry_min
+    entry_signal[:20] = False
+    
+    # Exit: stop-loss o take-profit (semplificato: +10%), posizione aperta non chiusa
+    entry_idx, exit_idx, exit_reason = simulate_positions(
+        prices, entry_signal, stop_loss=stop_loss, take_profit=0.10, close_open=False
+    )
+    if len(entry_idx) == 0:
+        return pd.DataFrame()
+    
+    # Size ridotto in alta volatility
+    size = np.where(volatility[entry_idx] > 0.20, risk_scalar_high_vol, 1.0)
+    raw_return = (prices[exit_idx] - prices[entry_idx]) / prices[entry_idx]
+    
+    return pd.DataFrame({
+        'entry_date': market_data['date'].iloc[entry_idx].to_numpy(),
+        'exit_date': market_data['date'].iloc[exit_idx].to_numpy(),
+        'entry_regime': market_data['regime'].to_numpy()[entry_idx],
+        'entry_volatility': volatility[entry_idx],
+        'trade_return': raw_return * size,
+        'exit_reason': exit_reason,
+        'size': size
+    })
 
 
 def run_poc_synthetic():
@@ -15,6 +15,7 @@ import duckdb
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from utils.path_manager import get_path_manager
+from analysis.regime_simulator import classify_volatility_regimes
 
 
 def classify_regime_from_volatility(volatility: float) -> str:
@@ -132,7 +133,8 @@ def analyze_existing_backtest_by_regime(db_path: str, run_id: str = None):
         volatility = vol_result[0] if vol_result and vol_result[0] else 0.15
         
         trades_df.at[idx, 'entry_volatility'] = volatility
-        trades_df.at[idx, 'regime'] = classify_regime_from_volatility(volatility)
+    
+    trades_df['regime'] = classify_volatility_regimes(trades_df['entry_volatility'].to_numpy(dtype=float))
     
     print(f"✅ Volatility calcolata per {len(trades_df)} trade\n")
     
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Regime Simulator - ETF Italia Project v10
+Simulatore a macchina a stati delle posizioni su array NumPy per i POC regime-adaptive
+
+LOGICA:
+- Regimi classificati in blocco con np.select (niente df.apply riga per riga)
+- Event loop sugli eventi (entry/exit), non sulle barre:
+  * prossima entry trovata con un indice "next True" precalcolato (minimo cumulativo inverso)
+  * exit trovata con argmax sulla maschera stop-loss/take-profit dalla barra dopo l'entry
+- Stessa semantica di simulate_strategy_on_real_data: entry sulla barra del segnale,
+  exit valutata solo dalle barre successive, nessuna re-entry sulla barra di exit,
+  posizione aperta chiusa all'ultima barra (END_PERIOD)
+- Il percorso dei trade dipende solo da (score_entry_min, stop_loss): lo sweep lo calcola
+  una volta e applica tutti i set di risk_scalar_by_regime come vettori di size
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+REGIMES = ('bull', 'bear', 'sideways')
+
+EXIT_STOP_LOSS = 'STOP_LOSS'
+EXIT_TAKE_PROFIT = 'TAKE_PROFIT'
+EXIT_END_PERIOD = 'END_PERIOD'
+
+# Set di risk scalar confrontati dal POC (FIXED vs ADAPTIVE)
+DEFAULT_RISK_SCALARS = {
+    'FIXED': {'bull': 1.0, 'bear': 1.0, 'sideways': 1.0},
+    'ADAPTIVE': {'bull': 1.0, 'bear': 0.5, 'sideways': 0.8},
+}
+
+DEFAULT_SCORE_ENTRY_GRID = (0.5, 0.6, 0.7, 0.8)
+DEFAULT_STOP_LOSS_GRID = (-0.10, -0.15, -0.20)
+
+
+def classify_regimes(volatility, trend, bear_rule='or'):
+    """Classifica bull/bear/sideways per ogni barra (vettoriale)
+
+    Regole di classify_regime_from_metrics: bull se trend > 5% e vol < 20%,
+    bear se trend < -5% o vol > 25% (bear_rule='and' per la variante
+    classify_regime_simple che richiede entrambe le condizioni), altrimenti sideways.
+
+    Returns:
+        np.ndarray di stringhe (object)
+    """
+    volatility = np.asarray(volatility, dtype=float)
+    trend = np.asarray(trend, dtype=float)
+    bull = (trend > 0.05) & (volatility < 0.20)
+    if bear_rule == 'and':
+        bear = (trend < -0.05) & (volatility > 0.25)
+    else:
+        bear = (trend < -0.05) | (volatility > 0.25)
+    return np.select([bull, bear], ['bull', 'bear'], default='sideways').astype(object)
+
+
+def classify_volatility_regimes(volatility):
+    """Classifica low_vol/medium_vol/high_vol (soglie 15% / 25%, come poc_v2)"""
+    volatility = np.asarray(volatility, dtype=float)
+    return np.select(
+        [volatility < 0.15, volatility < 0.25],
+        ['low_vol', 'medium_vol'],
+        default='high_vol',
+    ).astype(object)
+
+
+def momentum_scores(momentum, scale=5.0, offset=0.5):
+    """Normalizza il momentum a score 0-1: clip(momentum * scale + offset, 0, 1)"""
+    return np.clip(np.asarray(momentum, dtype=float) * scale + offset, 0.0, 1.0)
+
+
+def _next_true_index(mask):
+    """Per ogni barra, indice del primo True a partire da essa (len(mask) se assente)"""
+    n = len(mask)
+    idx = np.where(mask, np.arange(n), n)
+    return np.minimum.accumulate(idx[::-1])[::-1]
+
+
+def simulate_positions(prices, entry_signal, stop_loss=-0.15, take_profit=0.15, close_open=True):
+    """Macchina a stati long-only su array: una posizione alla volta
+
+    Args:
+        prices: prezzi per barra (1-D)
+        entry_signal: maschera booleana delle barre con segnale di entry
+        stop_loss: exit se return <= stop_loss (None = disattivato)
+        take_profit: exit se return >= take_profit (None = disattivato)
+        close_open: chiude la posizione aperta all'ultima barra (END_PERIOD)
+
+    Returns:
+        tuple: (entry_idx, exit_idx, exit_reason) come np.ndarray
+    """
+    prices = np.asarray(prices, dtype=float)
+    n = len(prices)
+    next_entry = _next_true_index(np.asarray(entry_signal, dtype=bool))
+    sl = -np.inf if stop_loss is None else stop_loss
+    tp = np.inf if take_profit is None else take_profit
+
+    entries, exits, reasons = [], [], []
+    i = next_entry[0] if n else 0
+    while i < n:
+        forward = (prices[i + 1:] - prices[i]) / prices[i]
+        hit = (forward <= sl) | (forward >= tp)
+        if hit.any():
+            j = i + 1 + int(np.argmax(hit))
+            entries.append(i)
+            exits.append(j)
+            reasons.append(EXIT_STOP_LOSS if forward[j - i - 1] <= sl else EXIT_TAKE_PROFIT)
+            # Nessuna re-entry sulla barra di exit
+            i = next_entry[j + 1] if j + 1 < n else n
+        else:
+            if close_open:
+                entries.append(i)
+                exits.append(n - 1)
+                reasons.append(EXIT_END_PERIOD)
+            break
+
+    return np.array(entries, dtype=int), np.array(exits, dtype=int), np.array(reasons, dtype=object)
+
+
+def regime_sizes(regimes, risk_scalar_by_regime):
+    """Vettore di size per barra dal dict risk_scalar_by_regime (default 1.0)"""
+    regimes = np.asarray(regimes, dtype=object)
+    sizes = np.ones(len(regimes))
+    for regime, scalar in (risk_scalar_by_regime or {}).items():
+        sizes[regimes == regime] = scalar
+    return sizes
+
+
+def build_trades(df, entry_idx, exit_idx, exit_reason, sizes, price_col='close'):
+    """DataFrame dei trade con le colonne di simulate_strategy_on_real_data"""
+    columns = ['entry_date', 'exit_date', 'entry_price', 'exit_price', 'entry_regime',
+               'entry_volatility', 'trade_return', 'raw_return', 'exit_reason', 'size', 'holding_days']
+    if len(entry_idx) == 0:
+        return pd.DataFrame()
+
+    prices = df[price_col].to_numpy(dtype=float)
+    entry_dates = df['date'].iloc[entry_idx].to_numpy()
+    exit_dates = df['date'].iloc[exit_idx].to_numpy()
+    raw = (prices[exit_idx] - prices[entry_idx]) / prices[entry_idx]
+    size = np.asarray(sizes, dtype=float)[entry_idx]
+    holding = (pd.to_datetime(exit_dates) - pd.to_datetime(entry_dates)).days
+
+    trades = pd.DataFrame({
+        'entry_date': entry_dates,
+        'exit_date': exit_dates,
+        'entry_price': prices[entry_idx],
+        'exit_price': prices[exit_idx],
+        'entry_regime': df['regime'].to_numpy()[entry_idx],
+        'entry_volatility': df['volatility'].to_numpy(dtype=float)[entry_idx],
+        'trade_return': raw * size,
+        'raw_return': raw,
+        'exit_reason': exit_reason,
+        'size': size,
+        'holding_days': np.asarray(holding, dtype=int),
+    })
+    return trades[columns]
+
+
+def trade_stats(trade_returns):
+    """Statistiche del POC su un vettore di trade return (Sharpe come nel POC: mean/std × √252)"""
+    r = np.asarray(trade_returns, dtype=float)
+    n = len(r)
+    if n == 0:
+        return {'n_trades': 0, 'total_return': 0.0, 'avg_return': 0.0,
+                'win_rate': 0.0, 'sharpe': 0.0, 'worst_trade': 0.0}
+    std = r.std(ddof=1) if n > 1 else 0.0
+    return {
+        'n_trades': n,
+        'total_return': float(r.sum()),
+        'avg_return': float(r.mean()),
+        'win_rate': float((r > 0).mean()),
+        'sharpe': float(r.mean() / std * np.sqrt(252)) if std > 0 else 0.0,
+        'worst_trade': float(r.min()),
+    }
+
+
+def sweep_symbol(df, score_entry_grid=DEFAULT_SCORE_ENTRY_GRID, stop_loss_grid=DEFAULT_STOP_LOSS_GRID,
+                 risk_scalars=None, take_profit=0.15, price_col='close'):
+    """Sweep dei parametri su un simbolo
+
+    Il percorso dei trade si calcola una volta per (score_entry_min, stop_loss);
+    ogni set di risk_scalars riusa gli stessi indici cambiando solo le size.
+
+    Returns:
+        list di dict (una riga per combinazione)
+    """
+    risk_scalars = risk_scalars or DEFAULT_RISK_SCALARS
+    prices = df[price_col].to_numpy(dtype=float)
+    scores = momentum_scores(df['momentum'].to_numpy(dtype=float))
+    regimes = df['regime'].to_numpy(dtype=object)
+    size_by_set = {name: regime_sizes(regimes, scalars) for name, scalars in risk_scalars.items()}
+
+    rows = []
+    for score_entry_min, stop_loss in product(score_entry_grid, stop_loss_grid):
+        entry_idx, exit_idx, _ = simulate_positions(prices, scores >= score_entry_min, stop_loss, take_profit)
+        raw = (prices[exit_idx] - prices[entry_idx]) / prices[entry_idx] if len(entry_idx) else np.empty(0)
+        for name, sizes in size_by_set.items():
+            stats = trade_stats(raw * sizes[entry_idx])
+            rows.append({
+                'score_entry_min': score_entry_min,
+                'stop_loss': stop_loss,
+                'risk_scalars': name,
+                **stats,
+            })
+    return rows
+
+
+def load_universe_regime_data(conn, symbols, start_date, end_date):
+    """Dati storici con regime per più simboli in una sola query
+
+    Stesse metriche di get_historical_data_with_regime (vol 20g, trend 50g, momentum 20g).
+
+    Returns:
+        dict: simbolo → DataFrame (date, adj_close, close, volume, volatility, trend, momentum, regime)
+    """
+    extended_start = (datetime.strptime(start_date, '%Y-%m-%d') - timedelta(days=50)).strftime('%Y-%m-%d')
+
+    df = conn.execute("""
+    WITH daily_data AS (
+        SELECT
+            date,
+            symbol,
+            adj_close,
+            close,
+            volume,
+            STDDEV(adj_close) OVER w20 / AVG(adj_close) OVER w20 * SQRT(252) as volatility,
+            (adj_close - LAG(adj_close, 50) OVER w) / LAG(adj_close, 50) OVER w as trend_50d,
+            (adj_close - LAG(adj_close, 20) OVER w) / LAG(adj_close, 20) OVER w as momentum_20d
+        FROM market_data
+        WHERE symbol IN (SELECT UNNEST(?::VARCHAR[]))
+        AND date BETWEEN ? AND ?
+        WINDOW w AS (PARTITION BY symbol ORDER BY date),
+               w20 AS (PARTITION BY symbol ORDER BY date ROWS BETWEEN 20 PRECEDING AND CURRENT ROW)
+    )
+    SELECT
+        symbol,
+        date,
+        adj_close,
+        close,
+        volume,
+        COALESCE(volatility, 0.15) as volatility,
+        COALESCE(trend_50d, 0.0) as trend,
+        COALESCE(momentum_20d, 0.0) as momentum
+    FROM daily_data
+    WHERE date >= ?
+    ORDER BY symbol, date
+    """, [list(symbols), extended_start, end_date, start_date]).fetchdf()
+
+    if len(df) == 0:
+        return {}
+
+    df['regime'] = classify_regimes(df['volatility'].to_numpy(), df['trend'].to_numpy())
+    return {
+        symbol: group.drop(columns='symbol').reset_index(drop=True)
+        for symbol, group in df.groupby('symbol', sort=True)
+    }
+
+
+def run_parameter_sweep(conn, symbols, start_date, end_date, score_entry_grid=DEFAULT_SCORE_ENTRY_GRID,
+                        stop_loss_grid=DEFAULT_STOP_LOSS_GRID, risk_scalars=None, take_profit=0.15):
+    """Sweep adaptive vs fixed su tutti i simboli in un solo run
+
+    Returns:
+        DataFrame: una riga per (symbol, score_entry_min, stop_loss, risk_scalars)
+    """
+    data = load_universe_regime_data(conn, symbols, start_date, end_date)
+    rows = []
+    for symbol, df in data.items():
+        for row in sweep_symbol(df, score_entry_grid, stop_loss_grid, risk_scalars, take_profit):
+            rows.append({'symbol': symbol, **row})
+    return pd.DataFrame(rows)
+
+
+def summarize_sweep(results):
+    """Confronto per combinazione: Sharpe/return medi sui simboli per set di risk scalar"""
+    if results is None or len(results) == 0:
+        return pd.DataFrame()
+    return (
+        results.groupby(['score_entry_min', 'stop_loss', 'risk_scalars'])
+        .agg(symbols=('symbol', 'nunique'), n_trades=('n_trades', 'sum'),
+             avg_sharpe=('sharpe', 'mean'), avg_total_return=('total_return', 'mean'),
+             worst_trade=('worst_trade', 'min'))
+        .reset_index()
+        .sort_values('avg_sharpe', ascending=False)
+        .reset_index(drop=True)
+    )
+
+
+if __name__ == '__main__':
+    import argparse
+    import duckdb
+    from utils.path_manager import get_path_manager
+
+    parser = argparse.ArgumentParser(description='Sweep parametri regime-adaptive su tutto l\'universo')
+    parser.add_argument('--symbols', nargs='*', help='Simboli (default: universo senza benchmark)')
+    parser.add_argument('--start', default='2020-01-01', help='Data inizio')
+    parser.add_argument('--end', default='2025-01-01', help='Data fine')
+    parser.add_argument('--top', type=int, default=10, help='Combinazioni da mostrare')
+    args = parser.parse_args()
+
+    symbols = args.symbols
+    if not symbols:
+        from risk.covariance_store import get_store_symbols
+        symbols = get_store_symbols()
+
+    conn = duckdb.connect(str(get_path_manager().db_path), read_only=True)
+    try:
+        results = run_parameter_sweep(conn, symbols, args.start, args.end)
+    finally:
+        conn.close()
+
+    if len(results) == 0:
+        print("❌ Nessun dato trovato per i simboli richiesti")
+        sys.exit(1)
+
+    summary = summarize_sweep(results)
+    print("🔧 REGIME-ADAPTIVE PARAMETER SWEEP")
+    print("=" * 80)
+    print(f"Simboli: {results['symbol'].nunique()} | Combinazioni: {len(summary)}")
+    print(summary.head(args.top).to_string(index=False))
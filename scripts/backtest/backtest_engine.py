@@ -9,34 +9,35 @@ import sys
 import os
 import json
 import duckdb
-import pandas as pd
 from datetime import datetime, timedelta
 
 # Aggiungi root al path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Windows console robustness
-from utils.console_utils import setup_windows_console
-setup_windows_console()
-
 from orchestration.session_manager import get_session_manager
-from trading.execute_orders import check_cash_available, check_position_available
-from fiscal.tax_engine import calculate_tax
-from trading.strategy_engine_v2 import generate_orders_with_holding_period
 from utils.universe_helper import get_cost_model_for_symbol
+from utils.market_store import BASE_CURRENCY
+from utils.perf_trace import perf_step, span, traced
+from utils.sql_stats import instrument_connection
+
+# Nota startup: strategy_engine_v2, execute_orders, tax_engine e pandas sono
+# importati nei metodi che li usano (l'import del modulo resta leggero)
 
 class BacktestEngine:
     """Motore di backtest con simulazione reale"""
     
-    def __init__(self, db_path, config_path):
+    def __init__(self, db_path, config_path, sql_stats=None):
         self.db_path = db_path
         self.config_path = config_path
         self.conn = None
         self.config = None
+        self._fx = None
+        self._fx_dates = set()
+        self.sql_stats = sql_stats  # QueryStats opzionale (utils.sql_stats)
         
     def connect(self):
-        """Connette al database"""
-        self.conn = duckdb.connect(self.db_path)
+        """Connette al database (proxy statistiche SQL se sql_stats o ETF_ITA_SQL_STATS=1)"""
+        self.conn = instrument_connection(duckdb.connect(self.db_path), 'backtest_engine', stats=self.sql_stats)
         
         # Carica configurazione
         with open(self.config_path, 'r') as f:
@@ -86,6 +87,7 @@ class BacktestEngine:
         
         print(f"✅ Portfolio inizializzato con €{initial_capital:,.2f}")
         
+    @traced('run_simulation')
     def run_simulation(self, start_date, end_date):
         """Esegue simulazione event-driven giorno per giorno"""
         
@@ -117,9 +119,17 @@ class BacktestEngine:
         """, [start_date, end_date]).fetchall()
         
         trading_dates = [d[0] for d in trading_dates]
+        # Cambi EUR di tutto il periodo in un solo ASOF JOIN (conversione fill senza query per ordine)
+        self._fx_lookup(trading_dates)
         
         print(f"⚡ Esecuzione event-driven su {len(trading_dates)} giorni...")
         
+        from trading.strategy_engine_v2 import generate_orders_with_holding_period
+        from risk.trailing_stop_v2 import PositionPeakTracker
+
+        # Peak trailing stop in memoria per tutto il backtest (nessuna query per giorno)
+        peak_tracker = PositionPeakTracker(self.conn)
+
         executed_orders = []
         progress_interval = max(100, len(trading_dates) // 20)
         
@@ -129,56 +139,69 @@ class BacktestEngine:
                 print(f"  Processati {idx}/{len(trading_dates)} giorni...")
             
             # 3.1 Genera ordini con strategy_engine_v2 (holding period + portfolio construction)
-            result = generate_orders_with_holding_period(
-                self.conn,
-                self.config,
-                current_date=current_date,
-                run_type='BACKTEST',
-                run_id=None,  # Auto-generato
-                underlying_map={}  # Default: no overlap
-            )
-            
-            # 3.2 Esegui ordini SELL (PASS 1)
-            for order in result['orders_sell']:
-                success = self._execute_order(
-                    current_date,
-                    order['symbol'],
-                    order['action'],
-                    int(order['qty']),
-                    order['price'],
-                    decision_path=order['decision_path'],
-                    reason_code=order['reason_code'],
-                    run_id=result['run_id']
+            with span('generate_orders', days=1):
+                result = generate_orders_with_holding_period(
+                    self.conn,
+                    self.config,
+                    current_date=current_date,
+                    run_type='BACKTEST',
+                    run_id=None,  # Auto-generato
+                    underlying_map={},  # Default: no overlap
+                    peak_tracker=peak_tracker
                 )
-                if success:
-                    executed_orders.append((current_date, order['symbol'], order['action'], int(order['qty']), order['price']))
             
-            # 3.3 Esegui ordini BUY (PASS 2)
-            for order in result['orders_buy']:
-                success = self._execute_order(
-                    current_date,
-                    order['symbol'],
-                    order['action'],
-                    int(order['qty']),
-                    order['price'],
-                    decision_path=order['decision_path'],
-                    reason_code=order['reason_code'],
-                    run_id=result['run_id'],
-                    entry_score=order.get('entry_score'),
-                    expected_holding_days=order.get('expected_holding_days'),
-                    expected_exit_date=order.get('expected_exit_date')
-                )
-                if success:
-                    executed_orders.append((current_date, order['symbol'], order['action'], int(order['qty']), order['price']))
+            with span('execute_orders', orders=len(result['orders_sell']) + len(result['orders_buy'])):
+                # 3.2 Esegui ordini SELL (PASS 1)
+                for order in result['orders_sell']:
+                    success = self._execute_order(
+                        current_date,
+                        order['symbol'],
+                        order['action'],
+                        int(order['qty']),
+                        order['price'],
+                        decision_path=order['decision_path'],
+                        reason_code=order['reason_code'],
+                        run_id=result['run_id']
+                    )
+                    if success:
+                        executed_orders.append((current_date, order['symbol'], order['action'], int(order['qty']), order['price']))
+            
+                # 3.3 Esegui ordini BUY (PASS 2)
+                for order in result['orders_buy']:
+                    success = self._execute_order(
+                        current_date,
+                        order['symbol'],
+                        order['action'],
+                        int(order['qty']),
+                        order['price'],
+                        decision_path=order['decision_path'],
+                        reason_code=order['reason_code'],
+                        run_id=result['run_id'],
+                        entry_score=order.get('entry_score'),
+                        expected_holding_days=order.get('expected_holding_days'),
+                        expected_exit_date=order.get('expected_exit_date')
+                    )
+                    if success:
+                        executed_orders.append((current_date, order['symbol'], order['action'], int(order['qty']), order['price']))
         
         print(f"✅ Eseguiti {len(executed_orders)} ordini su {len(trading_dates)} giorni")
         
     def _execute_order(self, date, symbol, order_type, qty, price, decision_path='LEGACY', reason_code='LEGACY_ORDER', run_id=None, entry_score=None, expected_holding_days=None, expected_exit_date=None):
         """Esegue singolo ordine con logica fiscale condivisa con execute_orders"""
+        from trading.execute_orders import check_cash_available, check_position_available
+        from fiscal.tax_engine import calculate_tax
         
         if run_id is None:
             run_id = f"backtest_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
         
+        # 0. Prezzo in EUR al cambio as-of del giorno: cash, commissioni, tasse e PMC del
+        #    ledger sono qty * price in EUR (prezzo in valuta = price / exchange_rate_used)
+        trade_currency, exchange_rate, price_eur = self._fx_lookup([date]).convert(symbol, date, price)
+        if exchange_rate is None:
+            print(f"  ❌ {symbol} {order_type} {qty:.0f} @ {price:.2f} {trade_currency} - CAMBIO {trade_currency}/{BASE_CURRENCY} NON DISPONIBILE al {date}")
+            return False
+        price = price_eur
+        
         # 1. Calcola costi usando configurazione reale (non hard-coded)
         position_value = qty * price
         
@@ -245,8 +268,6 @@ class BacktestEngine:
             explanation = tax_result['explanation']
         
         # INSERT completo con tutti i parametri audit
-        trade_currency = self.config['settings']['currency']
-        exchange_rate = 1.0
         exec_mode = self.config.get('execution', {}).get('execution_price_mode', 'CLOSE_SAME_DAY_SLIPPAGE')
         
         next_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM fiscal_ledger").fetchone()[0]
@@ -263,7 +284,7 @@ class BacktestEngine:
         """, [
             next_id, date, order_type, symbol, qty, price, 
             commission + slippage, tax_amount,
-            pmc_snapshot, trade_currency, exchange_rate, price, 
+            pmc_snapshot, trade_currency, exchange_rate, price_eur, 
             run_id, 'BACKTEST',
             decision_path, reason_code, exec_mode,
             entry_score, expected_holding_days, expected_exit_date,
@@ -272,6 +293,16 @@ class BacktestEngine:
         
         return True
     
+    def _fx_lookup(self, dates):
+        """Cambi as-of di tutti gli strumenti alle date richieste (un ASOF JOIN per batch di date)"""
+        dates = set(dates)
+        if self._fx is None or not dates <= self._fx_dates:
+            from utils.market_store import FxLookup
+            self._fx_dates |= dates
+            self._fx = FxLookup.load(self.conn, dates=sorted(self._fx_dates),
+                                     default_currency=self.config['settings'].get('currency', BASE_CURRENCY))
+        return self._fx
+    
     def calculate_portfolio_value(self, date):
         """Calcola valore portfolio alla data specifica"""
         
@@ -296,7 +327,9 @@ class BacktestEngine:
         HAVING SUM(CASE WHEN fl.type = 'BUY' THEN fl.qty ELSE -fl.qty END) > 0
         """, [date, date]).fetchall()
         
-        market_value = sum(qty * price for symbol, qty, price in positions)
+        # Valore in EUR (close in valuta strumento × cambio as-of)
+        fx = self._fx_lookup([date])
+        market_value = sum(qty * fx.convert(symbol, date, price)[2] for symbol, qty, price in positions)
         
         # Cash disponibile
         cash = self.conn.execute("""
@@ -312,6 +345,7 @@ class BacktestEngine:
         
         return market_value + cash
     
+    @traced('portfolio_overview')
     def create_portfolio_overview(self, start_date, end_date):
         """Crea vista portfolio_overview basata su simulazione reale"""
         
@@ -322,7 +356,22 @@ class BacktestEngine:
         self.conn.execute("DROP TABLE IF EXISTS daily_portfolio")
         
         # Crea tabella persistente con posizioni cumulative corrette (no duplicati)
-        self.conn.execute("""
+        # market_value in EUR: close in valuta strumento × cambio as-of (ASOF JOIN su fx_rates)
+        from utils.market_store import eur_conversion_sql
+        valued_sql = eur_conversion_sql(self.conn, """
+            SELECT dp.date, dp.symbol, md.adj_close, md.volume, md.close, dp.cumulative_qty AS qty
+            FROM daily_positions dp
+            JOIN market_data md
+              ON md.symbol = dp.symbol
+             AND md.date = (
+                 SELECT MAX(md2.date)
+                 FROM market_data md2
+                 WHERE md2.symbol = dp.symbol
+                   AND md2.date <= dp.date
+             )
+            WHERE dp.cumulative_qty > 0
+        """, ['close'], default_currency=self.config['settings'].get('currency', BASE_CURRENCY))
+        self.conn.execute(f"""
         CREATE TABLE daily_portfolio AS
         WITH trading_dates AS (
             SELECT DISTINCT date 
@@ -351,26 +400,20 @@ class BacktestEngine:
             FROM trading_dates td
             CROSS JOIN (SELECT DISTINCT symbol FROM position_changes) symbols
             LEFT JOIN position_changes pc ON td.date = pc.date AND symbols.symbol = pc.symbol
+        ),
+        valued AS (
+            {valued_sql}
         )
         SELECT 
-            dp.date,
-            dp.symbol,
-            md.adj_close,
-            md.volume,
-            dp.cumulative_qty * md.close as market_value,
-            dp.cumulative_qty as qty,
+            date,
+            symbol,
+            adj_close,
+            volume,
+            qty * close_eur as market_value,
+            qty,
             0 as cash
-        FROM daily_positions dp
-        JOIN market_data md
-          ON md.symbol = dp.symbol
-         AND md.date = (
-             SELECT MAX(md2.date)
-             FROM market_data md2
-             WHERE md2.symbol = dp.symbol
-               AND md2.date <= dp.date
-         )
-        WHERE dp.cumulative_qty > 0
-        ORDER BY dp.date, dp.symbol
+        FROM valued
+        ORDER BY date, symbol
         """, [start_date, end_date])
         
         # Crea vista portfolio_overview basata su tabella persistente
@@ -382,6 +425,7 @@ class BacktestEngine:
         
         print("✅ portfolio_overview creato da dati reali")
     
+    @traced('calculate_kpi')
     def calculate_real_kpi(self, start_date, end_date):
         """Calcola KPI basati su simulazione reale"""
         
@@ -394,6 +438,7 @@ class BacktestEngine:
         ORDER BY date
         """, [start_date, end_date]).fetchall()
         trading_dates = [d[0] for d in trading_dates]
+        self._fx_lookup(trading_dates)
 
         for d in trading_dates:
             try:
@@ -402,48 +447,27 @@ class BacktestEngine:
             except Exception:
                 continue
         
-        if not portfolio_values:
-            return self._empty_kpi()
-        
-        df = pd.DataFrame(portfolio_values, columns=['date', 'portfolio_value'])
-        df['date'] = pd.to_datetime(df['date'])
-        df.set_index('date', inplace=True)
-        
-        # Calcola returns
-        df['daily_return'] = df['portfolio_value'].pct_change(fill_method=None)
-        df = df.dropna()
-        
-        if len(df) == 0:
+        # Servono almeno 2 punti (il primo è solo la base del primo return)
+        if len(portfolio_values) < 2:
             return self._empty_kpi()
         
-        # KPI reali
-        initial_value = df['portfolio_value'].iloc[0]
-        final_value = df['portfolio_value'].iloc[-1]
-        
-        days = (df.index[-1] - df.index[0]).days
-        cagr = (final_value / initial_value) ** (365.25 / days) - 1 if days > 0 else 0.0
-        
-        # Max drawdown
-        df['cummax'] = df['portfolio_value'].cummax()
-        df['drawdown'] = (df['portfolio_value'] - df['cummax']) / df['cummax']
-        max_dd = df['drawdown'].min()
-        
-        # Volatilità e Sharpe
-        vol = df['daily_return'].std() * (252 ** 0.5)
-        sharpe = cagr / vol if vol > 0 else 0.0
+        from utils.kpi_kernels import equity_kpis
+
+        dates = [d for d, _ in portfolio_values]
+        kpi = equity_kpis([v for _, v in portfolio_values], dates=dates, day_count=365.25)
         
         # Turnover reale
         turnover = self._calculate_turnover(start_date, end_date)
         
         return {
-            'cagr': cagr,
-            'max_dd': max_dd,
-            'vol': vol,
-            'sharpe': sharpe,
+            'cagr': kpi['cagr'],
+            'max_dd': kpi['max_dd'],
+            'vol': kpi['vol'],
+            'sharpe': kpi['sharpe'],
             'turnover': turnover,
-            'initial_value': initial_value,
-            'final_value': final_value,
-            'total_return': (final_value - initial_value) / initial_value
+            'initial_value': kpi['initial_value'],
+            'final_value': kpi['final_value'],
+            'total_return': kpi['total_return']
         }
     
     def _calculate_turnover(self, start_date, end_date):
@@ -745,27 +769,36 @@ def run_backtest_simulation():
         ORDER BY date, id
         """).fetchall()
         
+        # Liste complete (ordini, evoluzione) in Parquet scritto in background;
+        # orders.json/portfolio.json restano come intestazione con il puntatore al file
+        from orchestration.artifact_writer import MANIFEST_NAME, get_artifact_writer, write_artifact
+        writer = get_artifact_writer()
+        run_manifest = run_dir / MANIFEST_NAME
+
+        orders_file = pm.backtest_orders_path(preset, timestamp)
+        orders_rows = [
+            {
+                'symbol': o[0],
+                'type': o[1],
+                'qty': float(o[2]),
+                'price': float(o[3]),
+                'fees': float(o[4]),
+                'tax': float(o[5]),
+                'date': str(o[6]),
+                'notes': o[7]
+            }
+            for o in orders_executed
+        ]
         orders_data = {
             'backtest_id': run_id,
             'preset': preset,
             'period': {'start': str(start_date), 'end': str(end_date)},
             'total_orders': len(orders_executed),
-            'orders': [
-                {
-                    'symbol': o[0],
-                    'type': o[1],
-                    'qty': float(o[2]),
-                    'price': float(o[3]),
-                    'fees': float(o[4]),
-                    'tax': float(o[5]),
-                    'date': str(o[6]),
-                    'notes': o[7]
-                }
-                for o in orders_executed
-            ]
+            'orders_file': orders_file.with_suffix('.parquet').name,
         }
-        
-        orders_file = pm.backtest_orders_path(preset, timestamp)
+        if orders_rows:
+            writer.submit(write_artifact, orders_file.with_suffix('.parquet'), orders_rows, 'parquet',
+                          'backtest_orders', run_manifest)
         with open(orders_file, 'w') as f:
             json.dump(orders_data, f, indent=2)
         
@@ -789,20 +822,22 @@ def run_backtest_simulation():
         ORDER BY date, symbol
         """).fetchall()
         
+        portfolio_file = pm.backtest_portfolio_path(preset, timestamp)
         portfolio_data = {
             'backtest_id': run_id,
             'preset': preset,
             'period': {'start': str(start_date), 'end': str(end_date)},
-            'evolution': {}
+            'n_dates': len({row[0] for row in portfolio_evolution}),
+            'symbols': sorted({row[1] for row in portfolio_evolution}),
+            'evolution_file': portfolio_file.with_suffix('.parquet').name,
         }
-        
-        for date, symbol, position in portfolio_evolution:
-            date_str = str(date)
-            if date_str not in portfolio_data['evolution']:
-                portfolio_data['evolution'][date_str] = {}
-            portfolio_data['evolution'][date_str][symbol] = float(position)
-        
-        portfolio_file = pm.backtest_portfolio_path(preset, timestamp)
+        if portfolio_evolution:
+            evolution_rows = [
+                {'date': str(date), 'symbol': symbol, 'position': float(position)}
+                for date, symbol, position in portfolio_evolution
+            ]
+            writer.submit(write_artifact, portfolio_file.with_suffix('.parquet'), evolution_rows, 'parquet',
+                          'backtest_portfolio_evolution', run_manifest)
         with open(portfolio_file, 'w') as f:
             json.dump(portfolio_data, f, indent=2)
         
@@ -821,6 +856,7 @@ def run_backtest_simulation():
         trades_file = pm.backtest_trades_path(preset, timestamp)
         with open(trades_file, 'w') as f:
             json.dump(trades_summary, f, indent=2)
+        writer.flush()
         
         # 6. Report risultati
         print(f"\n📊 BACKTEST RESULTS (SIMULAZIONE REALE):")
@@ -835,8 +871,8 @@ def run_backtest_simulation():
         print(f"Turnover: {kpi['turnover']:.2%}")
         print(f"\n📁 Output salvati in: {run_dir}")
         print(f"   - kpi.json: {kpi_file.name}")
-        print(f"   - orders.json: {orders_file.name}")
-        print(f"   - portfolio.json: {portfolio_file.name}")
+        print(f"   - orders.json: {orders_file.name} (righe in {orders_data['orders_file']})")
+        print(f"   - portfolio.json: {portfolio_file.name} (righe in {portfolio_data['evolution_file']})")
         print(f"   - trades.json: {trades_file.name}")
         
         print(f"\n✅ Backtest con simulazione reale completato")
@@ -850,7 +886,12 @@ def run_backtest_simulation():
         engine.close()
 
 if __name__ == "__main__":
-    success = run_backtest_simulation()
+    # Windows console robustness
+    from utils.console_utils import setup_windows_console
+    setup_windows_console()
+
+    with perf_step('backtest_engine'):
+        success = run_backtest_simulation()
     sys.exit(0 if success else 1)
 
 
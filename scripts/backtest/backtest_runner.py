@@ -8,7 +8,6 @@ import sys
 import os
 import json
 import duckdb
-import pandas as pd
 
 from datetime import datetime, timedelta
 import argparse
@@ -18,6 +17,7 @@ import io
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.path_manager import get_path_manager
+from utils.db_snapshot import publish_after_write
 
 # Windows console robustness (avoid UnicodeEncodeError on cp1252)
 if hasattr(sys.stdout, "reconfigure"):
@@ -542,12 +542,6 @@ def run_all_backtests(recent_days=365):
         ok = backtest_runner(preset=preset, recent_days=recent_days, run_id_override=run_id)
         results.append((preset, ok))
         any_failed = any_failed or (not ok)
-        
-        # Delay tra preset per evitare file lock su Windows
-        if preset != preset_order[-1]:
-            print(f"\n⏳ Pausa 2s prima del prossimo preset...")
-            import time
-            time.sleep(2)
 
     print("\n" + "=" * 60)
     print("ALL MODE - SUMMARY")
@@ -632,7 +626,26 @@ def calculate_kpi(conn, config, start_date=None, end_date=None):
 
         benchmark_symbol = config['universe']['benchmark'][0]['symbol']
 
-        equity_data = conn.execute("""
+        # Valore posizioni in EUR (ledger in EUR): close in valuta strumento × cambio as-of
+        from utils.market_store import BASE_CURRENCY, eur_conversion_sql
+        valued_sql = eur_conversion_sql(conn, """
+            SELECT
+                p.date,
+                p.symbol,
+                p.qty,
+                (
+                    SELECT md2.close
+                    FROM market_data md2
+                    WHERE md2.symbol = p.symbol
+                      AND md2.date <= p.date
+                    ORDER BY md2.date DESC
+                    LIMIT 1
+                ) AS close
+            FROM positions p
+            WHERE p.qty > 0
+        """, ['close'], default_currency=(config.get('settings') or {}).get('currency') or BASE_CURRENCY)
+
+        equity_data = conn.execute(f"""
         WITH trading_dates AS (
             SELECT DISTINCT date
             FROM market_data
@@ -688,21 +701,9 @@ def calculate_kpi(conn, config, start_date=None, end_date=None):
             LEFT JOIN position_changes pc ON td.date = pc.date AND s.symbol = pc.symbol
         ),
         market_value AS (
-            SELECT
-                p.date,
-                SUM(
-                    p.qty * COALESCE((
-                        SELECT md2.close
-                        FROM market_data md2
-                        WHERE md2.symbol = p.symbol
-                          AND md2.date <= p.date
-                        ORDER BY md2.date DESC
-                        LIMIT 1
-                    ), 0)
-                ) AS market_value
-            FROM positions p
-            WHERE p.qty > 0
-            GROUP BY p.date
+            SELECT date, SUM(qty * COALESCE(close_eur, 0)) AS market_value
+            FROM ({valued_sql}) v
+            GROUP BY date
         )
         SELECT
             cs.date,
@@ -723,16 +724,7 @@ def calculate_kpi(conn, config, start_date=None, end_date=None):
                 'turnover': 0.0
             }
 
-        df = pd.DataFrame(equity_data, columns=['date', 'cash_balance', 'market_value', 'equity'])
-        df['date'] = pd.to_datetime(df['date'])
-        df.set_index('date', inplace=True)
-
-        df['daily_return'] = df['equity'].pct_change(fill_method=None)
-        
-        # Rimuovi primi return (NaN)
-        df = df.dropna()
-        
-        if len(df) == 0:
+        if len(equity_data) < 2:
             return {
                 'cagr': 0.0,
                 'max_dd': 0.0,
@@ -740,25 +732,13 @@ def calculate_kpi(conn, config, start_date=None, end_date=None):
                 'sharpe': 0.0,
                 'turnover': 0.0
             }
-        
-        # CAGR
-        days = (df.index[-1] - df.index[0]).days
-        if days > 0:
-            cagr = (df['equity'].iloc[-1] / df['equity'].iloc[0]) ** (365.25 / days) - 1
-        else:
-            cagr = 0.0
-        
-        # Max Drawdown
-        df['cummax'] = df['equity'].cummax()
-        df['drawdown'] = (df['equity'] - df['cummax']) / df['cummax']
-        max_dd = df['drawdown'].min()
-        
-        # Volatilità annualizzata (robusta a NaN/inf)
-        daily_ret = df['daily_return'].replace([float('inf'), float('-inf')], pd.NA).dropna().astype(float)
-        vol = float(daily_ret.std()) * (252 ** 0.5) if len(daily_ret) > 1 else 0.0
-        
-        # Sharpe Ratio
-        sharpe = (cagr / vol) if vol and vol > 0 else 0.0
+
+        from utils.kpi_kernels import equity_kpis
+
+        dates = [row[0] for row in equity_data]
+        equity = [float(row[3]) for row in equity_data]
+        kpi = equity_kpis(equity, dates=dates, day_count=365.25)
+        cagr, max_dd, vol, sharpe = kpi['cagr'], kpi['max_dd'], kpi['vol'], kpi['sharpe']
         
         # Turnover reale (approssimazione standard: traded_value / (2 * avg_equity))
         traded_value = conn.execute("""
@@ -768,7 +748,8 @@ def calculate_kpi(conn, config, start_date=None, end_date=None):
         AND type IN ('BUY', 'SELL')
         """).fetchone()[0]
 
-        avg_equity = float(df['equity'].mean()) if len(df) > 0 else 0.0
+        # Media dal secondo punto (stessa finestra dei KPI)
+        avg_equity = sum(equity[1:]) / (len(equity) - 1)
         turnover = (float(traded_value) / (2.0 * avg_equity)) if avg_equity > 0 else 0.0
         
         return {
@@ -816,17 +797,8 @@ def calculate_benchmark_kpi(conn, config, start_date=None, end_date=None):
                 'turnover': 0.0
             }
         
-        df = pd.DataFrame(benchmark_data, columns=['date', 'adj_close'])
-        df['date'] = pd.to_datetime(df['date'])
-        df.set_index('date', inplace=True)
-        
-        # Calcola returns giornalieri
-        df['daily_return'] = df['adj_close'].pct_change(fill_method=None)
-        
-        # Rimuovi primi return (NaN)
-        df = df.dropna()
-        
-        if len(df) == 0:
+        benchmark_data = [row for row in benchmark_data if row[1] is not None]
+        if len(benchmark_data) < 2:
             return {
                 'cagr': 0.0,
                 'max_dd': 0.0,
@@ -835,26 +807,11 @@ def calculate_benchmark_kpi(conn, config, start_date=None, end_date=None):
                 'turnover': 0.0
             }
         
-        # CAGR
-        days = (df.index[-1] - df.index[0]).days
-        if days > 0:
-            cagr = (df['adj_close'].iloc[-1] / df['adj_close'].iloc[0]) ** (365. / days) - 1
-        else:
-            cagr = 0.0
-        
-        # Max Drawdown
-        df['cummax'] = df['adj_close'].cummax()
-        df['drawdown'] = (df['adj_close'] - df['cummax']) / df['cummax']
-        max_dd = df['drawdown'].min()
-        
-        # Volatilità annualizzata
-        vol = df['daily_return'].std() * (252 ** 0.5)
-        
-        # Sharpe Ratio
-        if vol > 0:
-            sharpe = cagr / vol
-        else:
-            sharpe = 0.0
+        from utils.kpi_kernels import equity_kpis
+
+        dates = [row[0] for row in benchmark_data]
+        kpi = equity_kpis([float(row[1]) for row in benchmark_data], dates=dates, day_count=365.)
+        cagr, max_dd, vol, sharpe = kpi['cagr'], kpi['max_dd'], kpi['vol'], kpi['sharpe']
         
         # Turnover (stima)
         turnover = 0.10
@@ -1029,6 +986,7 @@ if __name__ == "__main__":
         success = backtest_runner(start_date=start_date, end_date=end_date, preset=args.preset, recent_days=args.recent_days)
     if success:
         print("\n✅ Backtest completato con successo")
+        publish_after_write('backtest_runner')
     else:
         print("\n❌ Backtest fallito")
         print("X Backtest runner fallito - sequenza interrotta")
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Bulk Load - ETF Italia Project v10
+Caricamento barre OHLCV in market_data condiviso da ingest_data ed extend_historical_data
+
+LOGICA:
+- to_staging_frame(): DataFrame del provider (indice Date, colonne Open/High/...) →
+  colonne di staging_data; date senza timezone (ora locale del mercato)
+- merge_bars(): DataFrame registrato in DuckDB senza copia (conn.register) e
+  caricato con un INSERT ... SELECT, poi un solo INSERT OR REPLACE in market_data
+  per tutti i simboli del blocco (nessun INSERT per riga; layout partizionato: uno per
+  partizione venue/anno, vedi utils/market_store.py); latest_prices dei
+  simboli del blocco e marker latest_prices_meta ricalcolati nella stessa chiamata
+  (refresh completo se il marker non era allineato prima del merge)
+- Backfill a finestre (backfill_history):
+  - storico più vecchio scaricato in finestre di window_days dalla data più vecchia
+    in DB verso target_start, un round = una finestra per ogni simbolo ancora aperto
+  - download del round in parallelo (ThreadPoolExecutor, I/O di rete), un merge per round
+  - watermark per simbolo (backfill_watermarks.backfilled_to = inizio dell'ultima
+    finestra caricata): un'esecuzione interrotta riprende dalla finestra successiva,
+    le finestre senza dati (prima dell'inception) non vengono richieste di nuovo
+"""
+
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import pandas as pd
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.latest_prices import latest_prices_in_sync, refresh_latest_prices
+from utils.market_store import write_market_rows
+
+BACKFILL_TABLE = 'backfill_watermarks'
+STAGING_COLUMNS = ['symbol', 'date', 'high', 'low', 'close', 'adj_close', 'volume', 'source']
+DEFAULT_WINDOW_DAYS = 5 * 365
+DEFAULT_MAX_WORKERS = 4
+
+_PROVIDER_COLUMNS = {
+    'Date': 'date',
+    'Open': 'open',
+    'High': 'high',
+    'Low': 'low',
+    'Close': 'close',
+    'Adj Close': 'adj_close',
+    'Volume': 'volume',
+}
+
+
+def to_staging_frame(df, symbol, source):
+    """Barre del provider (indice Date) → DataFrame con le colonne di staging_data"""
+    staging = df.reset_index().rename(columns=_PROVIDER_COLUMNS)
+    if 'adj_close' not in staging.columns:
+        staging['adj_close'] = staging['close']
+    dates = pd.to_datetime(staging['date'])
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    staging['date'] = dates.dt.normalize()
+    staging['symbol'] = symbol
+    staging['source'] = source
+    return staging[STAGING_COLUMNS]
+
+
+def merge_bars(conn, bars):
+    """Carica un blocco di barre (uno o più simboli) in staging_data e market_data
+
+    Args:
+        bars: DataFrame con STAGING_COLUMNS o lista di DataFrame
+    Returns:
+        int: righe caricate
+    """
+    if isinstance(bars, (list, tuple)):
+        bars = [b for b in bars if b is not None and not b.empty]
+        if not bars:
+            return 0
+        bars = pd.concat(bars, ignore_index=True)
+    if bars is None or bars.empty:
+        return 0
+    # Chiave (symbol, date) unica nel blocco (finestre sovrapposte, ri-download)
+    bars = bars.drop_duplicates(['symbol', 'date'], keep='last')
+    symbols = bars['symbol'].unique().tolist()
+
+    # Marker già disallineato (scrittura fuori da merge_bars): il refresh dei soli
+    # simboli del blocco non basterebbe a riallinearlo
+    in_sync = latest_prices_in_sync(conn)
+    conn.register('bulk_bars', bars)
+    try:
+        conn.execute("DELETE FROM staging_data WHERE list_contains(?::VARCHAR[], symbol)", [symbols])
+        conn.execute("""
+        INSERT INTO staging_data (symbol, date, high, low, close, adj_close, volume, source)
+        SELECT symbol, CAST(date AS DATE), high, low, close, adj_close, CAST(volume AS BIGINT), source
+        FROM bulk_bars
+        """)
+        write_market_rows(conn, """
+        SELECT symbol, date, high, low, close, adj_close, volume, source
+        FROM staging_data
+        WHERE list_contains(?::VARCHAR[], symbol)
+        """, [symbols])
+        refresh_latest_prices(conn, symbols if in_sync else None)
+    finally:
+        conn.unregister('bulk_bars')
+    return len(bars)
+
+
+def ensure_backfill_table(conn):
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {BACKFILL_TABLE} (
+        symbol VARCHAR PRIMARY KEY,
+        target_start DATE NOT NULL,
+        backfilled_to DATE NOT NULL,
+        rows_loaded BIGINT DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+
+def backfill_frontiers(conn, symbols, target_start):
+    """{symbol: data più vecchia già coperta} (min tra storico in DB e watermark)
+
+    Simboli senza storico esclusi (li carica ingest_data); frontiera <= target_start → completo.
+    """
+    ensure_backfill_table(conn)
+    rows = conn.execute(f"""
+    SELECT md.symbol, LEAST(md.oldest, COALESCE(w.backfilled_to, md.oldest)) AS frontier
+    FROM (
+        SELECT symbol, MIN(date) AS oldest
+        FROM market_data
+        WHERE list_contains(?::VARCHAR[], symbol)
+        GROUP BY symbol
+    ) md
+    LEFT JOIN {BACKFILL_TABLE} w ON w.symbol = md.symbol AND w.target_start <= ?
+    """, [list(symbols), target_start]).fetchall()
+    return {symbol: frontier for symbol, frontier in rows}
+
+
+def _save_watermarks(conn, marks, target_start):
+    """marks: {symbol: (inizio finestra, righe caricate)}"""
+    conn.executemany(f"""
+    INSERT INTO {BACKFILL_TABLE} (symbol, target_start, backfilled_to, rows_loaded)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (symbol) DO UPDATE SET
+        target_start = LEAST({BACKFILL_TABLE}.target_start, excluded.target_start),
+        backfilled_to = LEAST({BACKFILL_TABLE}.backfilled_to, excluded.backfilled_to),
+        rows_loaded = {BACKFILL_TABLE}.rows_loaded + excluded.rows_loaded,
+        updated_at = now()
+    """, [[symbol, target_start, start, n] for symbol, (start, n) in marks.items()])
+
+
+def backfill_history(conn, symbols, target_start, fetch, prepare=None, source='YF_HISTORICAL',
+                     window_days=DEFAULT_WINDOW_DAYS, max_workers=DEFAULT_MAX_WORKERS, log=print):
+    """Estende lo storico dei simboli fino a target_start (riprende dai watermark)
+
+    Args:
+        fetch: fetch(symbol, start, end) → DataFrame del provider (end esclusa) o None
+        prepare: prepare(symbol, df) → DataFrame del provider filtrato (quality gates), opzionale
+        source: valore della colonna source delle barre caricate
+    Returns:
+        dict: {symbol: righe caricate in questa esecuzione}
+    """
+    frontiers = backfill_frontiers(conn, symbols, target_start)
+    pending = {s: d for s, d in frontiers.items() if d > target_start}
+    loaded = {s: 0 for s in pending}
+    window = timedelta(days=window_days)
+
+    def _fetch(task):
+        symbol, start, end = task
+        try:
+            return symbol, fetch(symbol, start, end), None
+        except Exception as e:
+            return symbol, None, e
+
+    round_no = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending:
+            round_no += 1
+            tasks = [(s, max(target_start, end - window), end) for s, end in pending.items()]
+            starts = {s: start for s, start, _ in tasks}
+            frames, marks = [], {}
+            for symbol, hist, error in pool.map(_fetch, tasks):
+                if error is not None:
+                    # Finestra non avanzata: il simbolo riparte da qui alla prossima esecuzione
+                    log(f"   ❌ {symbol}: errore download ({error})")
+                    pending.pop(symbol)
+                    continue
+                if hist is not None and not hist.empty and prepare is not None:
+                    hist = prepare(symbol, hist)
+                n = 0 if hist is None else len(hist)
+                if n:
+                    frames.append(to_staging_frame(hist, symbol, source))
+                marks[symbol] = (starts[symbol], n)
+                loaded[symbol] += n
+
+            # Barre e watermark del round nella stessa transazione
+            conn.execute("BEGIN TRANSACTION")
+            try:
+                n_rows = merge_bars(conn, frames)
+                if marks:
+                    _save_watermarks(conn, marks, target_start)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            log(f"   Round {round_no}: {len(tasks)} finestre, {n_rows} record")
+
+            for symbol, (start, _) in marks.items():
+                if start <= target_start:
+                    pending.pop(symbol)
+                else:
+                    pending[symbol] = start
+    return loaded
@@ -22,6 +22,9 @@ import time
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.path_manager import get_path_manager
+from utils.perf_trace import perf_step, record, span
+from utils.sql_stats import instrument_connection
+from utils.db_snapshot import publish_after_write
 
 # Windows console robustness (avoid UnicodeEncodeError on cp1252)
 if hasattr(sys.stdout, "reconfigure"):
@@ -71,7 +74,8 @@ def compute_signals(start_date=None, end_date=None, preset=None, lookback_days=6
     with open(config_path, 'r') as f:
         config = json.load(f)
     
-    conn = duckdb.connect(db_path)
+    # Proxy statistiche SQL solo con ETF_ITA_SQL_STATS=1 (altrimenti connessione diretta)
+    conn = instrument_connection(duckdb.connect(db_path), 'compute_signals')
     
     try:
         # Inizia transazione
@@ -131,6 +135,11 @@ def compute_signals(start_date=None, end_date=None, preset=None, lookback_days=6
 
         # Pre-build Spy Guard cache (massive speedup on FULL/ALL)
         spy_guard_cache = _build_spy_guard_cache(conn, config)
+
+        # Storico dal market cube (aggiornato se il fingerprint è cambiato): evita di
+        # ricalcolare le window function di risk_metrics su tutto lo storico per simbolo
+        from utils.market_cube import load_market_cube
+        cube = load_market_cube(conn)
         
         # 3. Calcola segnali per ogni simbolo
         total_signals = 0
@@ -150,24 +159,41 @@ def compute_signals(start_date=None, end_date=None, preset=None, lookback_days=6
             local_start = start_date
             local_end = end_date
 
+            history = None
+            if cube is not None and symbol in cube:
+                with span('load_metrics_cube') as tracer:
+                    history = _metrics_from_cube(cube, symbol)
+                    tracer.count('rows_read', len(history))
+
             if preset == 'full':
-                min_max = conn.execute(
-                    "SELECT MIN(date) as min_date, MAX(date) as max_date FROM risk_metrics WHERE symbol = ?",
-                    [symbol],
-                ).fetchone()
+                if history is not None:
+                    min_max = (history['date'].min().date(), history['date'].max().date()) if len(history) else None
+                else:
+                    min_max = conn.execute(
+                        "SELECT MIN(date) as min_date, MAX(date) as max_date FROM risk_metrics WHERE symbol = ?",
+                        [symbol],
+                    ).fetchone()
                 if min_max:
                     local_start, local_end = min_max
             elif preset == 'recent':
-                max_date = conn.execute(
-                    "SELECT MAX(date) FROM risk_metrics WHERE symbol = ?",
-                    [symbol],
-                ).fetchone()[0]
+                if history is not None:
+                    max_date = history['date'].max().date() if len(history) else None
+                else:
+                    max_date = conn.execute(
+                        "SELECT MAX(date) FROM risk_metrics WHERE symbol = ?",
+                        [symbol],
+                    ).fetchone()[0]
                 if max_date is not None:
                     local_end = max_date
                     local_start = local_end - timedelta(days=int(recent_days))
 
             # Ottieni dati con metriche (default: finestra recente; oppure range esplicito)
-            if local_start is not None and local_end is not None:
+            if history is not None and local_start is not None and local_end is not None:
+                in_range = history['date'].between(pd.Timestamp(local_start), pd.Timestamp(local_end))
+                df = history[in_range].reset_index(drop=True)
+            elif history is not None:
+                df = history.tail(int(lookback_days)).reset_index(drop=True)
+            elif local_start is not None and local_end is not None:
                 metrics_query = """
                 SELECT 
                     date,
@@ -181,7 +207,9 @@ def compute_signals(start_date=None, end_date=None, preset=None, lookback_days=6
                   AND date BETWEEN ? AND ?
                 ORDER BY date ASC
                 """
-                df = conn.execute(metrics_query, [symbol, local_start, local_end]).fetchdf()
+                with span('load_metrics') as tracer:
+                    df = conn.execute(metrics_query, [symbol, local_start, local_end]).fetchdf()
+                    tracer.count('rows_read', len(df))
             else:
                 metrics_query = """
                 SELECT 
@@ -196,7 +224,9 @@ def compute_signals(start_date=None, end_date=None, preset=None, lookback_days=6
                 ORDER BY date DESC
                 LIMIT ?
                 """
-                df = conn.execute(metrics_query, [symbol, int(lookback_days)]).fetchdf()
+                with span('load_metrics') as tracer:
+                    df = conn.execute(metrics_query, [symbol, int(lookback_days)]).fetchdf()
+                    tracer.count('rows_read', len(df))
 
             if df.empty:
                 print(f"   ️ No data available for {symbol}")
@@ -213,6 +243,7 @@ def compute_signals(start_date=None, end_date=None, preset=None, lookback_days=6
 
             total_rows = len(df)
             loop_start_ts = time.time()
+            loop_start_cpu = time.process_time()
             last_heartbeat_ts = loop_start_ts
 
             for i, row in enumerate(df.itertuples(index=False), start=1):
@@ -316,6 +347,8 @@ def compute_signals(start_date=None, end_date=None, preset=None, lookback_days=6
                     'regime_filter': regime_filter
                 })
             
+            record('signal_loop', time.time() - loop_start_ts, time.process_time() - loop_start_cpu, rows=total_rows)
+            
             # Insert signals nel database con UPSERT
             if signals_data:
                 # Ottieni prossimo ID disponibile per evitare conflitti
@@ -339,6 +372,7 @@ def compute_signals(start_date=None, end_date=None, preset=None, lookback_days=6
                     ))
                 
                 # DuckDB richiede un target esplicito per DO UPDATE quando esistono più vincoli UNIQUE/PK
+                upsert_start_ts = time.perf_counter()
                 conn.executemany("""
                 INSERT INTO signals (id, date, symbol, signal_state, risk_scalar, explain_code, sma_200, volatility_20d, spy_guard, regime_filter, created_at)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
@@ -360,6 +394,7 @@ def compute_signals(start_date=None, end_date=None, preset=None, lookback_days=6
                     OR signals.spy_guard IS DISTINCT FROM excluded.spy_guard
                     OR signals.regime_filter IS DISTINCT FROM excluded.regime_filter
                 """, signals_to_insert)
+                record('upsert', time.perf_counter() - upsert_start_ts, rows_written=len(signals_to_insert))
                 
                 print(f"    {symbol}: {len(signals_data)} signals upserted")
                 total_signals += len(signals_data)
@@ -432,6 +467,29 @@ def compute_signals(start_date=None, end_date=None, preset=None, lookback_days=6
         conn.close()
 
 
+def _metrics_from_cube(cube, symbol):
+    """Colonne di risk_metrics per un simbolo ricavate dal market cube (date ASC)
+
+    drawdown_pct usa lo stesso high water mark della vista (massimo progressivo di
+    adj_close); le date in cui il simbolo non ha righe in market_data sono escluse.
+    """
+    col = cube.columns([symbol])[0]
+    series = {f: np.asarray(cube[f][:, col], dtype=float) for f in ('close', 'adj_close', 'sma_200', 'volatility_20d', 'returns')}
+    adj_close = series['adj_close']
+    present = ~(np.isnan(series['close']) & np.isnan(adj_close))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown_pct = adj_close / np.fmax.accumulate(adj_close) - 1
+
+    return pd.DataFrame({
+        'date': pd.DatetimeIndex(cube.dates[present]),
+        'adj_close': adj_close[present],
+        'sma_200': series['sma_200'][present],
+        'volatility_20d': series['volatility_20d'][present],
+        'drawdown_pct': drawdown_pct[present],
+        'daily_return': series['returns'][present],
+    })
+
+
 def _build_spy_guard_cache(conn, config):
     """Preload SPY guard series once (avoid per-row DB queries)."""
     if not config.get('risk_management', {}).get('spy_guard_enabled', False):
@@ -623,24 +681,26 @@ if __name__ == "__main__":
     start_date = _parse_date(args.start_date)
     end_date = _parse_date(args.end_date)
 
-    if args.all:
-        preset_order = ['full', 'recent', 'gfc', 'eurocrisis', 'covid', 'inflation2022']
-        preset_order = [p for p in preset_order if p in PRESET_PERIODS]
-        ok_all = True
-        for p in preset_order:
-            print("\n" + "=" * 60)
-            print(f"ALL MODE - preset={p}")
-            print("=" * 60)
-            ok_all = compute_signals(preset=p, lookback_days=args.lookback_days, recent_days=args.recent_days) and ok_all
-            # Small delay to ensure DB lock is released on Windows
-            time.sleep(0.5)
-        success = ok_all
-    else:
-        success = compute_signals(
-            start_date=start_date,
-            end_date=end_date,
-            preset=args.preset,
-            lookback_days=args.lookback_days,
-            recent_days=args.recent_days,
-        )
+    with perf_step('compute_signals'):
+        if args.all:
+            preset_order = ['full', 'recent', 'gfc', 'eurocrisis', 'covid', 'inflation2022']
+            preset_order = [p for p in preset_order if p in PRESET_PERIODS]
+            ok_all = True
+            for p in preset_order:
+                print("\n" + "=" * 60)
+                print(f"ALL MODE - preset={p}")
+                print("=" * 60)
+                with span(p):
+                    ok_all = compute_signals(preset=p, lookback_days=args.lookback_days, recent_days=args.recent_days) and ok_all
+            success = ok_all
+        else:
+            success = compute_signals(
+                start_date=start_date,
+                end_date=end_date,
+                preset=args.preset,
+                lookback_days=args.lookback_days,
+                recent_days=args.recent_days,
+            )
+    if success:
+        publish_after_write('compute_signals')
     sys.exit(0 if success else 1)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Data Sources - ETF Italia Project v10
+Client dei provider dati (Yahoo Finance, Stooq) con sessione HTTP condivisa e cache su disco
+
+LOGICA:
+- Una requests.Session per processo (pool di connessioni keep-alive, retry con backoff
+  su 429/5xx) al posto di una connessione nuova per ogni requests.get
+- Un yf.Ticker per simbolo riusato da tutte le chiamate del processo
+- Cache su disco (data/cache/http/{source}/{symbol}/{start}_{end}.csv.gz + .json):
+  chiave (source, symbol, range), TTL (default 12h) → run ripetute nello stesso
+  giorno non riscaricano gli stessi storici
+- Entry scaduta con ETag/Last-Modified: richiesta condizionale, 304 → corpo in cache
+- Range delta: Stooq interrogato con d1/d2 (solo le sedute richieste, es. dopo
+  MAX(date) in market_data) invece dello storico completo filtrato in locale
+- Offline (offline=True o ETF_DATA_OFFLINE=1): solo cache, nessuna richiesta di rete;
+  sessione e ticker iniettabili per i test con fixture registrate
+"""
+
+import sys
+import os
+import io
+import gzip
+import json
+import threading
+import time
+from datetime import date, datetime
+
+import pandas as pd
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_TTL_SECONDS = 12 * 3600
+STOOQ_URL = "https://stooq.com/q/d/l/"
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+
+def _safe_name(value):
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in str(value))
+
+
+def _iso(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else str(value)
+
+
+def _parse_ohlcv_csv(text, start_date=None, end_date=None):
+    """CSV Date,Open,High,Low,Close[,Adj Close],Volume → DataFrame (indice Date, range incluso)"""
+    df = pd.read_csv(io.StringIO(text))
+    if 'Date' not in df.columns or df.empty:
+        return None
+    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+    df = df.dropna(subset=['Date']).set_index('Date').sort_index()
+    df = df[[c for c in OHLCV_COLUMNS if c in df.columns]]
+    if 'Volume' in df.columns:
+        df['Volume'] = df['Volume'].fillna(0)
+    if start_date is not None:
+        df = df[df.index.date >= start_date]
+    if end_date is not None:
+        df = df[df.index.date <= end_date]
+    return df if not df.empty else None
+
+
+class ResponseCache:
+    """Cache su disco dei corpi di risposta (testo CSV gzip) con metadati JSON"""
+
+    def __init__(self, cache_dir, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.cache_dir = os.fspath(cache_dir)
+        self.ttl_seconds = ttl_seconds
+
+    def _paths(self, source, symbol, start_date, end_date):
+        base = os.path.join(self.cache_dir, _safe_name(source), _safe_name(symbol),
+                            f"{_iso(start_date)}_{_iso(end_date)}")
+        return base + '.csv.gz', base + '.json'
+
+    def get(self, source, symbol, start_date, end_date):
+        """(corpo, meta, fresca) oppure (None, None, False) se assente"""
+        body_path, meta_path = self._paths(source, symbol, start_date, end_date)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            with gzip.open(body_path, 'rt', encoding='utf-8') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None, None, False
+        fresh = time.time() - meta.get('fetched_at', 0) < self.ttl_seconds
+        return body, meta, fresh
+
+    def put(self, source, symbol, start_date, end_date, body, meta=None):
+        body_path, meta_path = self._paths(source, symbol, start_date, end_date)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        if body is not None:
+            with gzip.open(body_path + suffix, 'wt', encoding='utf-8') as f:
+                f.write(body)
+            os.replace(body_path + suffix, body_path)
+        meta = dict(meta or {}, fetched_at=time.time())
+        with open(meta_path + suffix, 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + suffix, meta_path)
+        return meta
+
+
+class DataSourceClient:
+    """Accesso ai provider con sessione condivisa, ticker riusati e cache su disco"""
+
+    def __init__(self, cache_dir=None, ttl_seconds=DEFAULT_TTL_SECONDS, session=None,
+                 ticker_factory=None, offline=None, rate_limit_seconds=0.5):
+        if cache_dir is None:
+            from utils.path_manager import get_path_manager
+            cache_dir = get_path_manager().http_cache_dir
+        self.cache = ResponseCache(cache_dir, ttl_seconds)
+        self.offline = os.environ.get('ETF_DATA_OFFLINE') == '1' if offline is None else offline
+        self.rate_limit_seconds = rate_limit_seconds
+        self._session = session
+        self._ticker_factory = ticker_factory
+        self._tickers = {}
+        self._lock = threading.Lock()
+        self.stats = {'network': 0, 'cache_hits': 0, 'not_modified': 0}
+
+    # ==================== SESSIONE / TICKER ====================
+
+    @property
+    def session(self):
+        """requests.Session con pool di connessioni e retry (creata al primo uso)"""
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                session = requests.Session()
+                retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                              allowed_methods=('GET',))
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers['User-Agent'] = 'etf-italia-project/10'
+                self._session = session
+            return self._session
+
+    def ticker(self, symbol):
+        """yf.Ticker del simbolo (uno per processo)"""
+        with self._lock:
+            ticker = self._tickers.get(symbol)
+            if ticker is None:
+                if self._ticker_factory is None:
+                    import yfinance as yf
+                    self._ticker_factory = yf.Ticker
+                ticker = self._tickers[symbol] = self._ticker_factory(symbol)
+            return ticker
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    # ==================== PROVIDER ====================
+
+    def yf_history(self, symbol, start_date, end_date):
+        """Storico Yahoo Finance [start_date, end_date) (indice Date senza timezone) o None"""
+        body, _, fresh = self.cache.get('yf', symbol, start_date, end_date)
+        if body is not None and (fresh or self.offline):
+            self._count('cache_hits')
+            return _parse_ohlcv_csv(body)
+        if self.offline:
+            return None
+
+        self._count('network')
+        hist = self.ticker(symbol).history(start=start_date, end=end_date)
+        if hist is None or hist.empty:
+            return None
+        hist = hist[[c for c in OHLCV_COLUMNS if c in hist.columns]].copy()
+        index = pd.DatetimeIndex(hist.index)
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        hist.index = index.normalize().rename('Date')
+        self.cache.put('yf', symbol, start_date, end_date, hist.to_csv(), {'rows': len(hist)})
+        return hist
+
+    def stooq_history(self, symbol, start_date, end_date):
+        """Storico Stooq [start_date, end_date] (solo il range richiesto) o None"""
+        body, meta, fresh = self.cache.get('stooq', symbol, start_date, end_date)
+        if body is not None and (fresh or self.offline):
+            self._count('cache_hits')
+            return _parse_ohlcv_csv(body, start_date, end_date)
+        if self.offline:
+            return None
+
+        # Converti simbolo per Stooq (es. XS2L.MI → xs2l.mi → xs2lmi)
+        stooq_symbol = symbol.lower().replace('.', '')
+        params = {'s': stooq_symbol, 'i': 'd',
+                  'd1': start_date.strftime('%Y%m%d'), 'd2': end_date.strftime('%Y%m%d')}
+        headers = {}
+        if meta:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        if self.rate_limit_seconds:
+            time.sleep(self.rate_limit_seconds)
+        self._count('network')
+        response = self.session.get(STOOQ_URL, params=params, headers=headers, timeout=30)
+
+        if response.status_code == 304 and body is not None:
+            self._count('not_modified')
+            self.cache.put('stooq', symbol, start_date, end_date, None, meta)
+            return _parse_ohlcv_csv(body, start_date, end_date)
+        if response.status_code != 200 or not response.text.strip():
+            return None
+
+        self.cache.put('stooq', symbol, start_date, end_date, response.text, {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        })
+        return _parse_ohlcv_csv(response.text, start_date, end_date)
+
+
+_client = None
+
+
+def get_data_source_client():
+    """Client singleton del processo"""
+    global _client
+    if _client is None:
+        _client = DataSourceClient()
+    return _client
@@ -7,21 +7,24 @@ Download e validazione dati di mercato da Yahoo Finance con quality gates
 import sys
 import os
 import json
-import yfinance as yf
 import pandas as pd
 import duckdb
-import requests
 
 from datetime import datetime, timedelta
 import hashlib
 import argparse
-import time
 from typing import Optional, Tuple, Dict, List
 
 # Aggiungi root al path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.path_manager import get_path_manager
+from utils.perf_trace import perf_step, span
+from utils.sql_stats import instrument_connection
+from utils.market_store import delete_market_rows, refresh_fx_rates, sync_instruments
+from utils.db_snapshot import publish_after_write
+from data.bulk_load import merge_bars, to_staging_frame
+from data.data_sources import get_data_source_client
 
 def get_config():
     """Carica configurazione"""
@@ -54,54 +57,13 @@ def download_investing_com_data(symbol: str, start_date, end_date) -> Optional[p
         return None
 
 def download_stooq_data(symbol: str, start_date, end_date) -> Optional[pd.DataFrame]:
-    """Download dati da Stooq.com come fallback"""
+    """Download dati da Stooq.com come fallback (solo il range richiesto, cache su disco)"""
     try:
-        # Converti simbolo per Stooq (es. XS2L.MI → xs2lmi)
-        stooq_symbol = symbol.lower().replace('.', '')
-        
-        # Stooq API - formato CSV con data range
-        url = f"https://stooq.com/q/l/?s={stooq_symbol}&i=d"
-        
         print(f"    Tentativo download Stooq per {symbol}...")
-        time.sleep(0.5)  # Rate limiting
-        response = requests.get(url, timeout=30)
-        
-        if response.status_code == 200 and response.text.strip():
-            # Parse CSV data
-            lines = response.text.strip().split('\n')
-            if len(lines) > 1:  # Header + data
-                data = []
-                for line in lines[1:]:  # Skip header
-                    parts = line.split(',')
-                    if len(parts) >= 6:
-                        try:
-                            date_str = parts[0]
-                            open_price = float(parts[1])
-                            high_price = float(parts[2])
-                            low_price = float(parts[3])
-                            close_price = float(parts[4])
-                            volume = int(parts[5]) if parts[5] else 0
-                            
-                            # Filtra per range date
-                            record_date = pd.to_datetime(date_str).date()
-                            if start_date <= record_date <= end_date:
-                                data.append({
-                                    'Date': pd.to_datetime(date_str),
-                                    'Open': open_price,
-                                    'High': high_price,
-                                    'Low': low_price,
-                                    'Close': close_price,
-                                    'Volume': volume
-                                })
-                        except (ValueError, IndexError):
-                            continue
-                
-                if data:
-                    df = pd.DataFrame(data)
-                    df.set_index('Date', inplace=True)
-                    df.sort_index(inplace=True)
-                    print(f"    Stooq: {len(df)} record scaricati (range filtrato)")
-                    return df
+        df = get_data_source_client().stooq_history(symbol, start_date, end_date)
+        if df is not None:
+            print(f"    Stooq: {len(df)} record scaricati (range filtrato)")
+            return df
         
         print(f"    Stooq: nessun dato disponibile")
         return None
@@ -192,9 +154,10 @@ def validate_data_quality(df, symbol: str) -> Tuple[Dict, pd.DataFrame]:
 
 def download_with_fallback(symbol: str, start_date, end_date) -> Tuple[Optional[pd.DataFrame], str]:
     """Download multi-source con fallback automatico: YF → Stooq → Investing.com → CSV"""
+    client = get_data_source_client()
     
     sources = [
-        ('YF', lambda: yf.Ticker(symbol).history(start=start_date, end=end_date + timedelta(days=1))),
+        ('YF', lambda: client.yf_history(symbol, start_date, end_date + timedelta(days=1))),
         ('Stooq', lambda: download_stooq_data(symbol, start_date, end_date)),
         ('Investing.com', lambda: download_investing_com_data(symbol, start_date, end_date)),
         ('CSV Manual', lambda: load_manual_csv_data(symbol, start_date, end_date))
@@ -254,7 +217,6 @@ def analyze_gaps(conn, symbol: str, start_date, end_date) -> Dict:
 
 def ingest_data(start_date_override=None, end_date_override=None, full_refresh=False, symbols_filter=None, initial_start_date_override=None):
     """Ingestione completa dati di mercato"""
-    
     config = get_config()
     # Initial start date (per nuovi simboli senza storico in DB)
     def _parse_date(s):
@@ -284,7 +246,8 @@ def ingest_data(start_date_override=None, end_date_override=None, full_refresh=F
     # Genera run_id
     run_id = f"ingest_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
-    conn = duckdb.connect(db_path)
+    # Proxy statistiche SQL solo con ETF_ITA_SQL_STATS=1: sql_calls degli span dalla connessione
+    conn = instrument_connection(duckdb.connect(db_path), 'ingest_data')
     
     try:
         print(f" Ingestion dati - Run ID: {run_id}")
@@ -324,6 +287,9 @@ def ingest_data(start_date_override=None, end_date_override=None, full_refresh=F
                 return True
 
         print(f" Simboli da processare: {symbols}")
+
+        # Anagrafica strumenti prima del caricamento: venue del simbolo → partizione di market_data
+        sync_instruments(conn, config)
         
         total_accepted = 0
         total_rejected = 0
@@ -333,14 +299,11 @@ def ingest_data(start_date_override=None, end_date_override=None, full_refresh=F
             print(f"\n Processando {symbol}...")
             
             try:
-                # Download dati yfinance
-                ticker = yf.Ticker(symbol)
-                
                 # Calcola range date
                 end_date = end_date_override or datetime.now().date()
 
                 if full_refresh:
-                    conn.execute("DELETE FROM market_data WHERE symbol = ?", [symbol])
+                    delete_market_rows(conn, [symbol])
                     conn.execute("DELETE FROM staging_data WHERE symbol = ?", [symbol])
                     last_date = None
                 else:
@@ -360,7 +323,9 @@ def ingest_data(start_date_override=None, end_date_override=None, full_refresh=F
                     continue
                 
                 # Download multi-source con fallback automatico
-                hist, source_used = download_with_fallback(symbol, start_date, end_date)
+                with span('download') as tracer:
+                    hist, source_used = download_with_fallback(symbol, start_date, end_date)
+                    tracer.count('rows_downloaded', 0 if hist is None else len(hist))
                 
                 if hist is None or hist.empty:
                     print(f"    Nessun dato disponibile da nessuna fonte")
@@ -406,50 +371,18 @@ def ingest_data(start_date_override=None, end_date_override=None, full_refresh=F
                                 all_rejection_reasons.append(f"Auto-recovery: used {alt_source} for {symbol}")
                                 break
                 
-                # Insert in staging table
+                # Insert in staging table + merge in market_data (bulk, data/bulk_load.py)
                 if not valid_df.empty:
-                    # Prepara dati per staging
-                    staging_df = valid_df.reset_index()
-                    staging_df['symbol'] = symbol
-                    staging_df['source'] = source_used
-                    
-                    # Rinomina colonne per DB
-                    staging_df = staging_df.rename(columns={
-                        'Date': 'date',
-                        'Open': 'open',
-                        'High': 'high', 
-                        'Low': 'low',
-                        'Close': 'close',
-                        'Volume': 'volume'
-                    })
-                    
-                    # Gestisci adj_close (potrebbe non esistere)
-                    if 'Adj Close' in staging_df.columns:
-                        staging_df = staging_df.rename(columns={'Adj Close': 'adj_close'})
-                    else:
-                        staging_df['adj_close'] = staging_df['close']  # fallback
-                    
-                    # Insert in staging
-                    conn.execute("DELETE FROM staging_data WHERE symbol = ?", [symbol])
-                    
-                    for _, row in staging_df.iterrows():
-                        conn.execute("""
-                        INSERT INTO staging_data 
-                        (symbol, date, high, low, close, adj_close, volume, source)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        """, [
-                            row['symbol'], row['date'], row['high'], 
-                            row['low'], row['close'], row['adj_close'], row['volume'], row['source']
-                        ])
-                    
-                    # Merge in market_data (solo dati validi)
-                    conn.execute("""
-                    INSERT OR REPLACE INTO market_data 
-                    (symbol, date, high, low, close, adj_close, volume, source)
-                    SELECT symbol, date, high, low, close, adj_close, volume, source
-                    FROM staging_data
-                    WHERE symbol = ?
-                    """, [symbol])
+                    staging_df = to_staging_frame(valid_df, symbol, source_used)
+                    # Barre, latest_prices e marker nella stessa transazione
+                    with span('db_write', rows_written=len(staging_df)):
+                        conn.execute("BEGIN TRANSACTION")
+                        try:
+                            merge_bars(conn, staging_df)
+                            conn.execute("COMMIT")
+                        except Exception:
+                            conn.execute("ROLLBACK")
+                            raise
                     
                     print(f"    {symbol}: {len(valid_df)} record inseriti in market_data")
                 
@@ -461,6 +394,18 @@ def ingest_data(start_date_override=None, end_date_override=None, full_refresh=F
                 all_rejection_reasons.append(f"{symbol}: {str(e)}")
                 continue
         
+        # Cambi FX giornalieri delle valute non-EUR (delta dopo MAX(date))
+        try:
+            fx_loaded = refresh_fx_rates(
+                conn, config, end_date_override or datetime.now().date(),
+                lambda pair, start, end: download_with_fallback(pair, start, end - timedelta(days=1))[0],
+                initial_start_date,
+            )
+            if any(fx_loaded.values()):
+                print(f" Cambi FX: {fx_loaded}")
+        except Exception as e:
+            print(f" WARN cambi FX non aggiornati: {e}")
+        
         # Audit record
         rejection_summary = "; ".join(all_rejection_reasons) if all_rejection_reasons else "No rejections"
         
@@ -484,6 +429,14 @@ def ingest_data(start_date_override=None, end_date_override=None, full_refresh=F
         
         conn.commit()
         
+        # Market cube: append delle sole date nuove (rebuild se lo storico è cambiato)
+        try:
+            from utils.market_cube import build_market_cube
+            cube = build_market_cube(conn)
+            print(f" Market cube: {cube['action']} ({cube['n_dates']} date × {cube['n_symbols']} simboli)")
+        except Exception as e:
+            print(f" WARN market cube non aggiornato: {e}")
+        
         # Post-ingestion quality metrics
         print(f"\n Ingestion completata!")
         print(f" Totali: {total_accepted} record accettati, {total_rejected} record respinti")
@@ -543,13 +496,14 @@ if __name__ == "__main__":
     if not symbols_filter:
         symbols_filter = None
 
-    success = ingest_data(
-        start_date_override=start_date_override,
-        end_date_override=end_date_override,
-        full_refresh=args.full_refresh,
-        symbols_filter=symbols_filter,
-        initial_start_date_override=args.initial_start_date,
-    )
+    with perf_step('ingest_data'):
+        success = ingest_data(
+            start_date_override=start_date_override,
+            end_date_override=end_date_override,
+            full_refresh=args.full_refresh,
+            symbols_filter=symbols_filter,
+            initial_start_date_override=args.initial_start_date,
+        )
 
     # Post-operability gate (se richiesto)
     run_gate = success and (args.post_operability_gate or (not args.no_post_operability_gate))
@@ -573,4 +527,8 @@ if __name__ == "__main__":
         except Exception as e:
             print(f"⚠️  Post-operability gate fallito (non bloccante): {e}")
 
+    # Snapshot per report/monitor dopo le scritture (ingest + gate calendario)
+    if success:
+        publish_after_write('ingest_data')
+
     sys.exit(0 if success else 1)
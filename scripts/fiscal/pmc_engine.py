@@ -16,7 +16,7 @@ Nota: Non gestisce lotti FIFO/Specific ID; è una scelta esplicita per semplicit
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple
 
 
 def _has_column(conn, table: str, col: str) -> bool:
@@ -73,32 +73,51 @@ def load_position_state(conn, symbol: str, run_type: str = "PRODUCTION") -> Posi
             [symbol],
         ).fetchall()
 
-    qty = 0.0
-    total_cost = 0.0
+    return _replay_position(symbol, ((typ, q, p, fees) for _id, _dt, typ, q, p, fees in rows))
 
-    for _id, _dt, typ, q, p, fees in rows:
-        q = float(q)
-        p = float(p)
-        fees = float(fees or 0.0)
 
+def load_position_states(conn, symbols, run_type: str = "PRODUCTION") -> Dict[str, PositionState]:
+    """Come load_position_state, ma per più simboli con una sola query."""
+
+    symbols = list(symbols)
+    if not symbols:
+        return {}
+
+    run_filter = "AND COALESCE(run_type, 'PRODUCTION') = ?" if _has_column(conn, 'fiscal_ledger', 'run_type') else ""
+    params = [symbols] + ([run_type] if run_filter else [])
+    rows = conn.execute(
+        f"""
+        SELECT symbol, type, qty, price, COALESCE(fees, 0) as fees
+        FROM fiscal_ledger
+        WHERE symbol IN (SELECT UNNEST(?::VARCHAR[]))
+          AND type IN ('BUY', 'SELL')
+          {run_filter}
+        ORDER BY symbol, date ASC, id ASC
+        """,
+        params,
+    ).fetchall()
+
+    by_symbol: Dict[str, list] = {s: [] for s in symbols}
+    for symbol, typ, q, p, fees in rows:
+        by_symbol[symbol].append((typ, q, p, fees))
+
+    return {s: _replay_position(s, by_symbol[s]) for s in symbols}
+
+
+def _replay_position(symbol: str, movements) -> PositionState:
+    """Applica in ordine i movimenti (type, qty, price, fees) a partire da posizione vuota."""
+
+    state = PositionState(symbol=symbol, qty=0.0, total_cost=0.0)
+
+    for typ, q, p, fees in movements:
         if typ == "BUY":
             # costo aumenta di controvalore + fees
-            total_cost += q * p + fees
-            qty += q
+            state = apply_buy(state, q, p, fees)
         elif typ == "SELL":
-            # riduce qty e rimuove costo proporzionale a PMC corrente
-            if qty <= 0:
-                # oversell storico: lascia invariato (sanity_check dovrebbe bloccare)
-                continue
-            q_sell = min(q, qty)
-            pmc = total_cost / qty if qty > 0 else 0.0
-            total_cost -= pmc * q_sell
-            qty -= q_sell
-            if qty <= 1e-12:
-                qty = 0.0
-                total_cost = 0.0
+            # oversell storico: lascia invariato (sanity_check dovrebbe bloccare)
+            state = apply_sell(state, q)
 
-    return PositionState(symbol=symbol, qty=qty, total_cost=total_cost)
+    return state
 
 
 def apply_buy(state: PositionState, qty: float, price: float, fees: float) -> PositionState:
@@ -112,6 +131,20 @@ def apply_buy(state: PositionState, qty: float, price: float, fees: float) -> Po
     )
 
 
+def apply_sell(state: PositionState, qty: float) -> PositionState:
+    """Riduce qty e rimuove costo proporzionale al PMC corrente."""
+    if state.qty <= 0:
+        return state
+    q_sell = min(float(qty), state.qty)
+    pmc = state.total_cost / state.qty
+    qty_left = state.qty - q_sell
+    total_cost = state.total_cost - pmc * q_sell
+    if qty_left <= 1e-12:
+        qty_left = 0.0
+        total_cost = 0.0
+    return PositionState(symbol=state.symbol, qty=qty_left, total_cost=total_cost)
+
+
 def estimate_sell_gain(
     state: PositionState,
     qty_to_sell: float,
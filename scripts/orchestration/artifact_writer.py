@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Artifact Writer - ETF Italia Project v10
+Scrittura asincrona dei report di sessione e formati compatti per i report tabellari
+
+LOGICA:
+- ArtifactWriter: coda + thread di background (daemon, avviato al primo submit);
+  lo step continua mentre i file vengono serializzati e scritti
+- flush() attende la coda (chiamato anche all'uscita del processo): gli errori di
+  scrittura vengono raccolti e stampati, non interrompono lo step
+- Formati tabellari (righe = lista di dict, dict di liste o DataFrame):
+  - ndjson.gz: una riga JSON per record, gzip (nessuna dipendenza)
+  - parquet: via DuckDB COPY con compressione ZSTD (pandas/duckdb importati lazy)
+- Scrittura atomica (file .tmp + os.replace): un lettore non vede mai file parziali
+- manifest.json accanto agli artifact: indice (tipo, file, formato, righe, colonne,
+  byte). Ogni aggiornamento passa dal thread dell'ArtifactWriter (anche dal percorso
+  sincrono, che attende l'esito) ed è protetto da un lock su file (manifest.json.lock)
+  contro gli step paralleli della sequenza; riscrittura via .tmp + os.replace
+"""
+
+import atexit
+import gzip
+import json
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+MANIFEST_NAME = 'manifest.json'
+TABULAR_FORMATS = ('ndjson.gz', 'parquet')
+
+
+def _sql_path(path):
+    return str(path).replace('\\', '/').replace("'", "''")
+
+
+def _atomic_target(path):
+    path = Path(path)
+    return path, path.with_name(f"{path.name}.{os.getpid()}.tmp")
+
+
+def write_json(path, data, indent=2):
+    """JSON atomico (indent=None → compatto)"""
+    path, tmp = _atomic_target(path)
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=indent, default=str)
+    os.replace(tmp, path)
+    return {'bytes': path.stat().st_size}
+
+
+def write_text(path, text):
+    path, tmp = _atomic_target(path)
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+    return {'bytes': path.stat().st_size}
+
+
+def _records(data):
+    """Righe come lista di dict (da lista di dict, dict di liste o DataFrame)"""
+    if hasattr(data, 'to_dict') and hasattr(data, 'columns'):
+        return data.to_dict(orient='records')
+    if isinstance(data, dict):
+        columns = list(data)
+        n = len(data[columns[0]]) if columns else 0
+        return [{c: data[c][i] for c in columns} for i in range(n)]
+    return list(data)
+
+
+def _columns(rows):
+    columns = []
+    for row in rows[:100]:
+        for key in row:
+            if key not in columns:
+                columns.append(key)
+    return columns
+
+
+def write_table(path, data, format_type='ndjson.gz'):
+    """Scrive righe tabellari in ndjson.gz o parquet (restituisce rows/columns/bytes)"""
+    path, tmp = _atomic_target(path)
+    if format_type == 'ndjson.gz':
+        rows = _records(data)
+        with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, default=str, separators=(',', ':')))
+                f.write('\n')
+        columns = _columns(rows)
+        n_rows = len(rows)
+    elif format_type == 'parquet':
+        import duckdb
+        import pandas as pd
+
+        df = data if hasattr(data, 'columns') else pd.DataFrame(_records(data))
+        con = duckdb.connect()
+        try:
+            con.register('artifact', df)
+            con.execute(f"COPY artifact TO '{_sql_path(tmp)}' (FORMAT PARQUET, COMPRESSION ZSTD)")
+        finally:
+            con.close()
+        columns = [str(c) for c in df.columns]
+        n_rows = len(df)
+    else:
+        raise ValueError(f"Formato tabellare non supportato: {format_type}")
+    os.replace(tmp, path)
+    return {'rows': n_rows, 'columns': columns, 'bytes': path.stat().st_size}
+
+
+def read_table(path):
+    """Legge un artifact tabellare: lista di dict (ndjson.gz) o DataFrame (parquet)"""
+    path = Path(path)
+    if path.name.endswith('.ndjson.gz'):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    if path.suffix == '.parquet':
+        import duckdb
+
+        con = duckdb.connect()
+        try:
+            return con.execute("SELECT * FROM read_parquet(?)", [str(path)]).fetchdf()
+        finally:
+            con.close()
+    raise ValueError(f"Formato artifact non riconosciuto: {path.name}")
+
+
+@contextmanager
+def file_lock(path):
+    """Lock esclusivo tra processi su <path>.lock (flock su POSIX, msvcrt su Windows)"""
+    lock_path = Path(f"{path}.lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, 'a+') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK rinuncia dopo ~10s: si riprova
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def update_manifest(manifest_path, entry):
+    """Aggiunge/sostituisce (per file) una voce nel manifest JSON (read-modify-write sotto lock)"""
+    manifest_path = Path(manifest_path)
+    with file_lock(manifest_path):
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            manifest = {'artifacts': []}
+        artifacts = [a for a in manifest.get('artifacts', []) if a.get('file') != entry['file']]
+        artifacts.append(entry)
+        manifest['artifacts'] = artifacts
+        manifest['updated_at'] = datetime.now().isoformat()
+        write_json(manifest_path, manifest)
+    return manifest
+
+
+def load_manifest(directory):
+    """Voci del manifest della directory (lista vuota se assente)"""
+    try:
+        with open(Path(directory) / MANIFEST_NAME, 'r') as f:
+            return json.load(f).get('artifacts', [])
+    except (OSError, json.JSONDecodeError):
+        return []
+
+
+def write_artifact(path, data, format_type, report_type=None, manifest_path=None, meta=None):
+    """Scrive un artifact nel formato dato e (se richiesto) lo registra nel manifest"""
+    path = Path(path)
+    if format_type in TABULAR_FORMATS:
+        info = write_table(path, data, format_type)
+    elif format_type == 'json':
+        info = write_json(path, data)
+    elif format_type == 'md':
+        info = write_text(path, data)
+    else:
+        raise ValueError(f"Formato non supportato: {format_type}")
+
+    if manifest_path is not None:
+        manifest_path = Path(manifest_path)
+        try:
+            rel = path.relative_to(manifest_path.parent).as_posix()
+        except ValueError:
+            rel = str(path)
+        get_artifact_writer().call(update_manifest, manifest_path, dict(
+            {'type': report_type, 'file': rel, 'format': format_type,
+             'created_at': datetime.now().isoformat()},
+            **info, **(meta or {}),
+        ))
+    return info
+
+
+class ArtifactWriter:
+    """Coda di scrittura servita da un thread di background"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.errors = []
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='artifact-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            fn, args, kwargs = self._queue.get()
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                self.errors.append(f"{args[0] if args else fn.__name__}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def submit(self, fn, *args, **kwargs):
+        self._start()
+        self._queue.put((fn, args, kwargs))
+
+    def call(self, fn, *args, **kwargs):
+        """Esegue fn nel thread di scrittura e ne attende l'esito (diretto se già nel thread)"""
+        if threading.current_thread() is self._thread:
+            return fn(*args, **kwargs)
+        done = threading.Event()
+        result = {}
+
+        def _task():
+            try:
+                result['value'] = fn(*args, **kwargs)
+            except BaseException as e:
+                result['error'] = e
+            finally:
+                done.set()
+
+        self.submit(_task)
+        done.wait()
+        if 'error' in result:
+            raise result['error']
+        return result.get('value')
+
+    def flush(self):
+        """Attende la scrittura di tutto ciò che è in coda (restituisce e azzera gli errori)"""
+        if self._thread is not None:
+            self._queue.join()
+        errors, self.errors = self.errors, []
+        for error in errors:
+            print(f"WARN artifact non scritto: {error}")
+        return errors
+
+    @property
+    def pending(self):
+        return self._queue.unfinished_tasks
+
+
+_artifact_writer = None
+
+
+def get_artifact_writer():
+    """Writer singleton del processo (flush automatico all'uscita)"""
+    global _artifact_writer
+    if _artifact_writer is None:
+        _artifact_writer = ArtifactWriter()
+        atexit.register(_artifact_writer.flush)
+    return _artifact_writer
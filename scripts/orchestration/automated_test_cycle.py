@@ -30,7 +30,7 @@ def automated_test_cycle():
     # Inizializza session manager
     session_manager = get_session_manager()
     
-    conn = duckdb.connect(db_path)
+    conn = duckdb.connect(db_path, read_only=True)
     
     try:
         print("🔍 Inizio ciclo test mirati...")
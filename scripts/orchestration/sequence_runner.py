@@ -1,29 +1,44 @@
 #!/usr/bin/env python3
 """
 Sequence Runner - ETF Italia Project v10
-Gestisce l'esecuzione sequenziale degli script nella stessa sessione
+Gestisce l'esecuzione degli script nella stessa sessione
+
+LOGICA:
+- Gli step sono nodi di un DAG (vedi orchestration/step_graph.py)
+- Gli step read-only senza dipendenze reciproche girano in parallelo
+- Gli step che scrivono sul DB girano da soli (un solo writer DuckDB)
+- Dopo ogni writer viene pubblicato uno snapshot read-only (utils/db_snapshot.py):
+  report e monitor lo leggono e possono girare mentre un writer è attivo
+- Step con input invariati dall'ultima sessione riuscita vengono saltati
+- Timing per step e critical path salvati nella sessione corrente
 """
 
 import sys
 import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
 import time
 import threading
 import queue
 
-# Ensure stdout/stderr are UTF-8 so Unicode output cannot crash on Windows.
-try:
-    from utils.console_utils import setup_windows_console
-
-    setup_windows_console()
-except Exception:
-    pass
-
 # Aggiungi root al path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from orchestration.session_manager import get_session_manager
+from orchestration.step_graph import (
+    build_dependencies,
+    critical_path,
+    compute_inputs_fingerprint,
+    get_step_io,
+    is_read_only,
+    load_sequence_state,
+    reads_snapshot,
+    save_sequence_state,
+    snapshot_publish_steps,
+)
+from utils.console_utils import setup_windows_console
+from utils.path_manager import get_path_manager
 
 # Mappatura degli script in sequenza ordinale
 SCRIPT_SEQUENCE = {
@@ -51,6 +66,31 @@ EXECUTION_ORDER = [
     'analyze_schema_drift'
 ]
 
+# Env impostata sui processi figli: evita che uno step rilanci la sequenza (ricorsione)
+SEQUENCE_CHILD_ENV = 'ETF_ITA_SEQUENCE_CHILD'
+
+# Numero massimo di step read-only in parallelo (override via env ETF_ITA_SEQUENCE_WORKERS)
+DEFAULT_MAX_WORKERS = 3
+
+_print_lock = threading.Lock()
+
+
+def _emit(line, label=None, end="\n"):
+    """Print thread-safe, con prefisso step quando gli step girano in parallelo"""
+    with _print_lock:
+        if label:
+            print(f"[{label}] {line}", end=end, flush=True)
+        else:
+            print(line, end=end, flush=True)
+
+
+def _default_max_workers():
+    try:
+        return max(1, int(os.environ.get('ETF_ITA_SEQUENCE_WORKERS', DEFAULT_MAX_WORKERS)))
+    except ValueError:
+        return DEFAULT_MAX_WORKERS
+
+
 def get_script_step(script_name):
     """Ritorna lo step numerico dello script nella sequenza"""
     for i, step in enumerate(EXECUTION_ORDER, 1):
@@ -59,7 +99,13 @@ def get_script_step(script_name):
     return None
 
 
-def _run_script_with_progress(script_path, root_dir):
+def _run_script_with_progress(script_path, root_dir, label=None, extra_env=None):
+    """Esegue uno script come sottoprocesso, inoltrando stdout/stderr.
+
+    Con label (esecuzione parallela) ogni riga è prefissata dal nome step e i
+    puntini di avanzamento sono disattivati per non mescolare l'output.
+    extra_env vale solo per il figlio: l'env del processo padre non cambia.
+    """
     q = queue.Queue()
 
     def _reader(pipe, stream_name):
@@ -78,6 +124,8 @@ def _run_script_with_progress(script_path, root_dir):
     # Make sure child Python also runs in UTF-8 mode.
     env.setdefault("PYTHONUTF8", "1")
     env.setdefault("PYTHONIOENCODING", "utf-8")
+    env[SEQUENCE_CHILD_ENV] = "1"
+    env.update(extra_env or {})
 
     proc = subprocess.Popen(
         [sys.executable, script_path],
@@ -105,12 +153,9 @@ def _run_script_with_progress(script_path, root_dir):
         try:
             stream_name, line = q.get(timeout=0.2)
             if dots_printed:
-                print("")
+                _emit("")
                 dots_printed = False
-            if stream_name == 'stderr':
-                print(line.rstrip("\n"))
-            else:
-                print(line.rstrip("\n"))
+            _emit(line.rstrip("\n"), label)
             last_output_ts = time.time()
             continue
         except queue.Empty:
@@ -120,36 +165,203 @@ def _run_script_with_progress(script_path, root_dir):
             break
 
         now = time.time()
-        if now - last_output_ts >= 1.0 and now - last_dot_ts >= 1.0:
-            print(".", end="", flush=True)
+        if label is None and now - last_output_ts >= 1.0 and now - last_dot_ts >= 1.0:
+            _emit(".", end="")
             dots_printed = True
             last_dot_ts = now
 
+    t_out.join(timeout=1.0)
+    t_err.join(timeout=1.0)
+
     while True:
         try:
             stream_name, line = q.get_nowait()
             if dots_printed:
-                print("")
+                _emit("")
                 dots_printed = False
-            if stream_name == 'stderr':
-                print(line.rstrip("\n"))
-            else:
-                print(line.rstrip("\n"))
+            _emit(line.rstrip("\n"), label)
         except queue.Empty:
             break
 
     if dots_printed:
-        print("")
+        _emit("")
 
     return proc.returncode
 
-def run_sequence_from(script_name, include_current: bool = False):
+
+def _resolve_step_script(step, scripts_root):
+    """Ritorna il path dello script principale per lo step (None se assente)"""
+    for script_file in SCRIPT_SEQUENCE[step]:
+        script_path = os.path.join(scripts_root, script_file)
+        if os.path.exists(script_path):
+            return script_path
+    return None
+
+
+def run_steps_dag(steps, run_step, max_workers=None, fingerprint=None, previous_state=None,
+                  snapshot_readers=False):
+    """Scheduler DAG degli step.
+
+    Args:
+        steps: lista ordinata di step (sottoinsieme di EXECUTION_ORDER)
+        run_step: callable(step, label) -> bool, esegue lo step
+        max_workers: massimo step read-only in parallelo (1 = sequenziale)
+        fingerprint: callable(step) -> str|None, fingerprint input (None = no skip)
+        previous_state: dict step -> {'fingerprint': ...} dell'ultima sessione riuscita
+        snapshot_readers: True se gli step snapshot_reader leggono uno snapshot pubblicato
+                          (possono sovrapporsi a un writer, mai a un altro writer)
+
+    Returns:
+        tuple: (success, report, state) dove state contiene i fingerprint
+               post-esecuzione degli step completati/saltati
+    """
+    max_workers = max(1, int(max_workers or _default_max_workers()))
+    previous_state = previous_state or {}
+    deps = build_dependencies(steps)
+    status = {step: 'pending' for step in steps}
+    timings = {}
+    state = {}
+    running = {}
+    failed = False
+    t0 = time.perf_counter()
+
+    def _fingerprint(step):
+        if fingerprint is None:
+            return None
+        try:
+            return fingerprint(step)
+        except Exception as e:
+            _emit(f"WARN: fingerprint {step} non disponibile: {e}")
+            return None
+
+    def _uses_snapshot(step):
+        return snapshot_readers and reads_snapshot(step)
+
+    def _start_ready(pool):
+        for step in steps:
+            if status[step] != 'pending':
+                continue
+            if any(status[d] not in ('done', 'skipped') for d in deps[step]):
+                continue
+            if not _uses_snapshot(step) and any(not is_read_only(s) for s in running.values()):
+                return
+            if len(running) >= max_workers:
+                return
+            if not is_read_only(step) and any(not _uses_snapshot(s) for s in running.values()):
+                # Il writer attende che i reader del DB principale terminino, senza farsi sorpassare
+                return
+
+            fp = _fingerprint(step)
+            if (fp is not None and not get_step_io(step)['gate']
+                    and previous_state.get(step, {}).get('fingerprint') == fp):
+                now = time.perf_counter() - t0
+                status[step] = 'skipped'
+                timings[step] = {'start_s': now, 'end_s': now}
+                state[step] = dict(previous_state[step])
+                _emit(f"\nSKIP: {step} (input invariati dall'ultima sessione riuscita)")
+                continue
+
+            label = step if max_workers > 1 else None
+            mode = 'read-only' if is_read_only(step) else 'writer'
+            _emit(f"\nSTEP {steps.index(step) + 1}/{len(steps)}: {step.upper()} ({mode})")
+            _emit("-" * 40)
+            status[step] = 'running'
+            timings[step] = {'start_s': time.perf_counter() - t0}
+            running[pool.submit(run_step, step, label)] = step
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            if not failed:
+                _start_ready(pool)
+            if not running:
+                break
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                timings[step]['end_s'] = time.perf_counter() - t0
+                try:
+                    ok = bool(future.result())
+                except Exception as e:
+                    _emit(f"ERROR: Errore eseguendo {step}: {e}")
+                    ok = False
+
+                if ok:
+                    status[step] = 'done'
+                    _emit(f"OK: {step} completato ({timings[step]['end_s'] - timings[step]['start_s']:.1f}s)")
+                    fp = _fingerprint(step)
+                    if fp is not None:
+                        state[step] = {'fingerprint': fp, 'completed_at': datetime.now().isoformat()}
+                else:
+                    status[step] = 'failed'
+                    failed = True
+                    _emit(f"ERROR: {step} fallito:")
+
+    for step in steps:
+        if status[step] == 'pending':
+            status[step] = 'not_run'
+
+    durations = {
+        step: t['end_s'] - t['start_s']
+        for step, t in timings.items()
+        if 'end_s' in t
+    }
+    path, path_s = critical_path(deps, durations)
+    wall_s = time.perf_counter() - t0
+    sum_s = sum(durations.values())
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'max_workers': max_workers,
+        'success': not failed,
+        'steps': {
+            step: {
+                'status': status[step],
+                'read_only': is_read_only(step),
+                'depends_on': deps[step],
+                'start_s': round(timings.get(step, {}).get('start_s', 0.0), 3),
+                'duration_s': round(durations.get(step, 0.0), 3),
+            }
+            for step in steps
+        },
+        'wall_time_s': round(wall_s, 3),
+        'sum_step_time_s': round(sum_s, 3),
+        'critical_path': path,
+        'critical_path_s': round(path_s, 3),
+        'parallel_speedup': round(sum_s / wall_s, 2) if wall_s > 0 else 1.0,
+    }
+    return not failed, report, state
+
+
+def print_dag_report(report):
+    """Stampa timing per step e critical path"""
+    print("\nTIMING SEQUENZA")
+    print("-" * 40)
+    for step, info in report['steps'].items():
+        print(f"  {step:<30} {info['status']:<8} {info['duration_s']:>8.2f}s")
+    print(f"  Wall time: {report['wall_time_s']:.2f}s | Somma step: {report['sum_step_time_s']:.2f}s "
+          f"| Speedup: {report['parallel_speedup']:.2f}x")
+    print(f"  Critical path ({report['critical_path_s']:.2f}s): {' -> '.join(report['critical_path'])}")
+
+
+def run_sequence_from(script_name, include_current: bool = False, max_workers=None, skip_unchanged: bool = True,
+                      sql_stats: bool = False):
     """Esegue la sequenza completa a partire dallo script specificato.
 
     Nota operativa:
     - Per evitare ricorsioni (uno script che richiama se stesso), di default parte *dopo* lo step indicato.
     - Usa include_current=True solo quando vuoi eseguire anche lo step corrente (es. runner esterno).
+    - Se chiamata da uno step lanciato dal runner, non fa nulla: la sequenza è già gestita dal padre.
+    - skip_unchanged=True salta gli step con input invariati dall'ultima sessione riuscita.
+    - sql_stats=True attiva il proxy statistiche SQL negli step (env dei soli figli) e a fine
+      sequenza salva la classifica unica delle query della sessione.
     """
+    if os.environ.get(SEQUENCE_CHILD_ENV):
+        return True
+
+    # Ensure stdout/stderr are UTF-8 so Unicode output cannot crash on Windows.
+    setup_windows_console()
+
     scripts_dir = os.path.dirname(__file__)
     root_dir = os.path.dirname(os.path.dirname(scripts_dir))
     scripts_root = os.path.join(root_dir, 'scripts')
@@ -167,45 +379,102 @@ def run_sequence_from(script_name, include_current: bool = False):
 
     print(f"\nSEQUENZA DA STEP {start_step}: {script_name}")
     print("=" * 60)
-    
-    # Esegui tutti gli script dallo step corrente in poi
+
+    steps = []
+    step_scripts = {}
     for step in EXECUTION_ORDER[start_step-1:]:
-        print(f"\nSTEP {EXECUTION_ORDER.index(step) + 1}: {step.upper()}")
-        print("-" * 40)
-        
-        # Trova lo script principale per questo step
-        script_files = SCRIPT_SEQUENCE[step]
-        main_script = None
-        
-        for script_file in script_files:
-            script_path = os.path.join(scripts_root, script_file)
-            if os.path.exists(script_path):
-                main_script = script_path
-                break
-        
+        main_script = _resolve_step_script(step, scripts_root)
         if not main_script:
             print(f"WARN: Nessuno script trovato per {step}")
             continue
-        
-        # Esegui lo script
+        steps.append(step)
+        step_scripts[step] = main_script
+
+    child_env = {}
+    if sql_stats:
+        from utils.sql_stats import SQL_STATS_ENV
+        child_env[SQL_STATS_ENV] = '1'
+
+    pm = get_path_manager()
+    db_path = str(pm.db_path)
+    config_path = str(pm.etf_universe_path)
+    state_path = pm.sequence_state_path
+    previous_state = load_sequence_state(state_path) if skip_unchanged else {}
+
+    # Snapshot read-only per report/monitor: solo l'env dei figli lo attiva,
+    # chi chiama run_sequence_from in-process continua a leggere il DB principale
+    snapshot_readers = False
+    publish_after = set()
+    if os.path.exists(db_path):
         try:
-            return_code = _run_script_with_progress(main_script, root_dir)
-            
-            if return_code != 0:
-                print(f"ERROR: {step} fallito:")
+            from utils.db_snapshot import SNAPSHOT_ENV, ensure_snapshot, reader_db_path
+            ensure_snapshot(db_path)
+            child_env[SNAPSHOT_ENV] = '1'
+            snapshot_readers = True
+            publish_after = snapshot_publish_steps(steps)
+        except Exception as e:
+            print(f"WARN: snapshot DB non disponibile, report sul DB principale: {e}")
+
+    def _run_step(step, label):
+        ok = _run_script_with_progress(step_scripts[step], root_dir, label=label, extra_env=child_env) == 0
+        if ok and step in publish_after:
+            try:
+                from utils.db_snapshot import publish_snapshot
+                publish_snapshot(db_path)
+            except Exception as e:
+                # Senza snapshot aggiornato i report successivi leggerebbero dati vecchi
+                _emit(f"ERROR: snapshot dopo {step} non pubblicato: {e}")
                 return False
-            
-            print(f"OK: {step} completato")
-            
+        return ok
+
+    def _fingerprint(step):
+        # I reader dello snapshot non aprono il DB principale mentre un writer è attivo
+        path = reader_db_path(db_path, mode='1') if snapshot_readers and reads_snapshot(step) else db_path
+        return compute_inputs_fingerprint(path, step, step_scripts[step], config_path)
+
+    success, report, state = run_steps_dag(
+        steps,
+        _run_step,
+        max_workers=max_workers,
+        fingerprint=_fingerprint if skip_unchanged else None,
+        previous_state=previous_state,
+        snapshot_readers=snapshot_readers,
+    )
+
+    if state:
+        merged = load_sequence_state(state_path)
+        merged.update(state)
+        try:
+            save_sequence_state(state_path, merged)
+        except OSError as e:
+            print(f"WARN: stato sequenza non salvato: {e}")
+
+    print_dag_report(report)
+    try:
+        report_file = get_session_manager().add_report_to_session('sequence_timing', report, 'json')
+        print(f"  Report timing: {report_file}")
+    except Exception as e:
+        print(f"WARN: report timing non salvato: {e}")
+
+    if sql_stats:
+        try:
+            from utils.sql_stats import summarize_session_sql_stats
+            summary = summarize_session_sql_stats()
+            summary_file = get_session_manager().add_report_to_session('sql_stats_summary', summary, 'json')
+            print(f"  Report SQL stats: {summary_file}")
         except Exception as e:
-            print(f"ERROR: Errore eseguendo {step}: {e}")
-            return False
-    
+            print(f"WARN: report SQL stats non salvato: {e}")
+
+    if not success:
+        return False
+
     print(f"\nSEQUENZA COMPLETATA (STEP {current_step}-{len(EXECUTION_ORDER)})")
     return True
 
 def run_single_script(script_name):
     """Esegue solo lo script specificato usando la sessione esistente"""
+    setup_windows_console()
+
     scripts_dir = os.path.dirname(__file__)
     root_dir = os.path.dirname(os.path.dirname(scripts_dir))
     scripts_root = os.path.join(root_dir, 'scripts')
@@ -242,3 +511,22 @@ def run_single_script(script_name):
         return False
 
 
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Sequence Runner ETF Italia Project')
+    parser.add_argument('--from', dest='from_step', default='health_check', help=f"Step di partenza: {EXECUTION_ORDER}")
+    parser.add_argument('--include-current', action='store_true', help='Esegue anche lo step di partenza')
+    parser.add_argument('--max-workers', type=int, default=None, help='Step read-only in parallelo (1 = sequenziale)')
+    parser.add_argument('--no-skip', action='store_true', help='Esegue tutti gli step anche con input invariati')
+    parser.add_argument('--sql-stats', action='store_true', help='Statistiche query DuckDB per step (report nella sessione)')
+    args = parser.parse_args()
+
+    ok = run_sequence_from(
+        args.from_step,
+        include_current=args.include_current,
+        max_workers=args.max_workers,
+        skip_unchanged=not args.no_skip,
+        sql_stats=args.sql_stats,
+    )
+    sys.exit(0 if ok else 1)
@@ -6,25 +6,75 @@ Gestione centralizzata delle sessioni con logica ordinale
 LOGICA:
 - health_check (01) → Crea nuova sessione
 - altri script → Usano sessione esistente
-- Ogni report ha timestamp unico nella stessa sessione
+- Ogni report ha timestamp unico nella stessa sessione (suffisso _N se il nome è già usato)
+- Risoluzione sottocartelle in cache (nessun listing di directory per report)
+- Report tabellari grandi (ordini, evoluzione portafoglio, simulazioni MC) come
+  ndjson.gz/parquet indicizzati in manifest.json; scrittura opzionale in background
+  (orchestration/artifact_writer.py), flush_artifacts() per attenderla
 """
 
 import os
+import sys
 import json
 from datetime import datetime
 from pathlib import Path
 
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from orchestration.artifact_writer import TABULAR_FORMATS, MANIFEST_NAME, get_artifact_writer, write_artifact
+
+# Mappa report type → sottocartella logica
+REPORT_SUBDIRS = {
+    'health_checks': 'health_checks',
+    'strategy': 'strategy',
+    'automated_test_cycle': 'automated',
+    'automated': 'automated',
+    'stress_test': 'stress_tests',
+    'stress_tests': 'stress_tests',
+    'guardrails': 'guardrails',
+    'risk_management': 'risk',
+    'risk': 'risk',
+    'backtest': 'backtests',
+    'backtests': 'backtests',
+    'performance': 'performance',
+    'tests': 'tests',
+    'analysis': 'analysis'
+}
+
 class SessionManager:
     def __init__(self, base_reports_dir=None, script_name=None, force_new_session=False):
         if base_reports_dir is None:
             base_reports_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'reports', 'sessions')
         
         self.base_reports_dir = Path(base_reports_dir)
-        self.current_session = None
+        self._current_session = None
+        self._initialized = False
         self.script_name = script_name
         self.force_new_session = force_new_session
         self.subdir_mapping = self._default_subdir_mapping()
+        self._subdir_cache = {}
+        self._reserved_paths = set()
         
+        # Inizializzazione lazy: current_session.json e cartelle vengono toccati
+        # solo al primo utilizzo (import e costruzione non fanno I/O)
+
+    @property
+    def current_session(self):
+        """Sessione corrente (carica/crea al primo accesso)"""
+        self._ensure_initialized()
+        return self._current_session
+
+    @current_session.setter
+    def current_session(self, value):
+        self._current_session = value
+
+    def _ensure_initialized(self):
+        """Esegue una sola volta la logica di caricamento/creazione sessione"""
+        if self._initialized:
+            return
+        self._initialized = True
+
         # Logica: health_check o force_new_session crea nuova sessione, altri usano esistente
         self._load_or_create_session()
 
@@ -37,17 +87,20 @@ class SessionManager:
         if self.script_name == 'health_check' or self.force_new_session:
             # Primo script o richiesta esplicita: crea nuova sessione
             self.create_session()
-        else:
-            # Altri script: carica sessione esistente
-            self._load_latest_session()
+        elif self._load_latest_session():
+            # Sessione esistente già registrata in current_session.json: nessuna riscrittura
+            return
         
-        # Salva la sessione corrente
+        # Salva la sessione corrente (scrittura atomica: più step possono girare in parallelo)
         session_file = self.base_reports_dir.parent / 'current_session.json'
-        with open(session_file, 'w') as f:
+        session_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = session_file.with_name(f"{session_file.name}.{os.getpid()}.tmp")
+        with open(tmp_file, 'w') as f:
             json.dump({
-                'current_session': self.current_session,
+                'current_session': self._current_session,
                 'created_at': datetime.now().isoformat()
             }, f, indent=2)
+        os.replace(tmp_file, session_file)
 
     def _default_subdir_mapping(self):
         """Mapping logico -> cartelle con prefisso ordinale (template corrente)."""
@@ -76,20 +129,22 @@ class SessionManager:
             (session_dir / prefixed_name).mkdir(parents=True, exist_ok=True)
     
     def _load_latest_session(self):
-        """Carica l'ultima sessione esistente"""
+        """Carica l'ultima sessione esistente (True se letta da current_session.json)"""
         session_file = self.base_reports_dir.parent / 'current_session.json'
         
         if session_file.exists():
             try:
                 with open(session_file, 'r') as f:
                     session_data = json.load(f)
-                    self.current_session = session_data['current_session']
-                return
+                    self._current_session = session_data['current_session']
+                if self._current_session:
+                    return True
             except:
                 pass
         
         # Fallback: crea nuova sessione se non esiste
         self.create_session()
+        return False
         
     def create_session(self, test_mode=False):
         """Crea una nuova sessione con timestamp"""
@@ -116,7 +171,9 @@ class SessionManager:
         for subdir_name in subdirs.keys():
             (session_dir / subdir_name).mkdir(parents=True, exist_ok=True)
         
-        self.current_session = timestamp
+        self._current_session = timestamp
+        self._initialized = True
+        self._subdir_cache = {}
         self.subdir_mapping = subdirs  # Salva mapping per uso futuro
         self.test_mode = test_mode
         return timestamp, session_dir
@@ -129,7 +186,14 @@ class SessionManager:
         return self.base_reports_dir / self.current_session
     
     def get_subdir_path(self, subdir_name):
-        """Restituisce il path per una sottocartella specifica"""
+        """Restituisce il path per una sottocartella specifica (risolto una volta per sessione)"""
+        key = (self.current_session, subdir_name)
+        cached = self._subdir_cache.get(key)
+        if cached is None:
+            cached = self._subdir_cache[key] = self._resolve_subdir_path(subdir_name)
+        return cached
+
+    def _resolve_subdir_path(self, subdir_name):
         session_dir = self.get_current_session_dir()
         
         # Se abbiamo il mapping, usalo per trovare il nome con prefisso
@@ -146,52 +210,55 @@ class SessionManager:
         # Ultimate fallback: usa nome originale
         return session_dir / subdir_name
     
-    def add_report_to_session(self, report_type, report_data, format_type='json'):
-        """Aggiunge un report alla sessione corrente"""
+    def _report_path(self, subdir, report_type, format_type):
+        """Path libero {report_type}_{timestamp}[_N].{ext} (anche rispetto alle scritture in coda)"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        stem = f"{report_type}_{timestamp}"
+        filepath = subdir / f"{stem}.{format_type}"
+        n = 1
+        while filepath in self._reserved_paths or filepath.exists():
+            filepath = subdir / f"{stem}_{n}.{format_type}"
+            n += 1
+        self._reserved_paths.add(filepath)
+        return filepath
+
+    def add_report_to_session(self, report_type, report_data, format_type='json', background=False, meta=None):
+        """Aggiunge un report alla sessione corrente
+
+        Args:
+            format_type: 'json' | 'md' | 'ndjson.gz' | 'parquet' (tabellari: lista di dict,
+                dict di liste o DataFrame, registrati in manifest.json della sessione)
+            background: True → scrittura nel thread dell'ArtifactWriter (path restituito subito)
+            meta: campi extra per la voce di manifest
+        """
         if not self.current_session:
             self.create_session()
         
-        # Mappa report type → sottocartella corretta (COMPLETO)
-        subdir_mapping = {
-            'health_checks': 'health_checks',
-            'strategy': 'strategy',
-            'automated_test_cycle': 'automated',
-            'automated': 'automated',
-            'stress_test': 'stress_tests',
-            'stress_tests': 'stress_tests',
-            'guardrails': 'guardrails',
-            'risk_management': 'risk',
-            'risk': 'risk',
-            'backtest': 'backtests',
-            'backtests': 'backtests',
-            'performance': 'performance',
-            'tests': 'tests',
-            'analysis': 'analysis'
-        }
-        
-        subdir_name = subdir_mapping.get(report_type, 'analysis')
+        subdir_name = REPORT_SUBDIRS.get(report_type, 'analysis')
         subdir = self.get_subdir_path(subdir_name)
         
         # Assicura che la cartella esista
         subdir.mkdir(parents=True, exist_ok=True)
-        
-        if format_type == 'json':
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"{report_type}_{timestamp}.json"
-            filepath = subdir / filename
-            
-            with open(filepath, 'w') as f:
-                json.dump(report_data, f, indent=2)
-        
-        elif format_type == 'md':
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"{report_type}_{timestamp}.md"
-            filepath = subdir / filename
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(report_data)
+
+        filepath = self._report_path(subdir, report_type, format_type)
+        manifest_path = self.get_current_session_dir() / MANIFEST_NAME if format_type in TABULAR_FORMATS else None
+        args = (filepath, report_data, format_type, report_type, manifest_path, meta)
+        if background:
+            get_artifact_writer().submit(write_artifact, *args)
+        else:
+            write_artifact(*args)
         
         return filepath
+
+    def add_artifact_to_session(self, report_type, rows, format_type='ndjson.gz', background=True, meta=None):
+        """Report tabellare compatto (ndjson.gz/parquet) indicizzato nel manifest della sessione"""
+        if format_type not in TABULAR_FORMATS:
+            raise ValueError(f"Formato tabellare non supportato: {format_type}")
+        return self.add_report_to_session(report_type, rows, format_type, background=background, meta=meta)
+
+    def flush_artifacts(self):
+        """Attende le scritture in background (restituisce gli errori)"""
+        return get_artifact_writer().flush()
     
     def create_backtest_dir(self, run_id):
         """Crea i file del backtest direttamente nella cartella backtests"""
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Step Graph - ETF Italia Project v10
+Grafo delle dipendenze tra gli step della sequenza (letture/scritture DB dichiarate)
+
+LOGICA:
+- Ogni step dichiara le tabelle che legge e quelle che scrive
+- Uno step dipende da uno step precedente se c'è conflitto (W→R, R→W, W→W)
+- Gli step che scrivono sono esclusivi: DuckDB ammette un solo processo writer
+  (vincolo applicato dallo scheduler in sequence_runner)
+- Gli step senza scritture possono girare in parallelo (connessione read-only)
+- Gli step snapshot_reader leggono lo snapshot pubblicato (utils/db_snapshot.py):
+  con snapshot attivo possono girare insieme a un writer; lo snapshot si
+  ripubblica solo dopo i writer che toccano tabelle lette da un reader successivo
+- Il fingerprint degli input permette di saltare step con input invariati
+  (tabelle lette, config, script dello step e moduli del repo che importa,
+  anche lazy e transitivamente: una modifica a un helper non viene saltata)
+"""
+
+import ast
+import hashlib
+import json
+import os
+from datetime import date
+from pathlib import Path
+
+SCRIPTS_ROOT = Path(__file__).resolve().parents[1]
+
+# Dichiarazione I/O per step (tabelle DuckDB)
+#   gate: lo step condiziona tutti i successivi (se fallisce, la sequenza si ferma)
+#   calendar_sensitive: l'output dipende dalla data corrente (CURRENT_DATE, preset rolling)
+#   snapshot_reader: apre reader_db_path() (snapshot read-only), non il DB principale
+STEP_IO = {
+    'health_check': {
+        'reads': ('market_data', 'trading_calendar', 'fiscal_ledger', 'ingestion_audit'),
+        'writes': (),
+        'gate': True,
+    },
+    'automated_test_cycle': {
+        'reads': ('market_data', 'signals'),
+        'writes': (),
+    },
+    'check_guardrails': {
+        'reads': ('risk_metrics', 'signals', 'market_data', 'fiscal_ledger'),
+        'writes': (),
+        'calendar_sensitive': True,
+        'snapshot_reader': True,
+    },
+    'risk_management': {
+        'reads': ('market_data', 'risk_metrics', 'signals'),
+        'writes': ('signals', 'signal_overlay'),
+    },
+    'portfolio_risk_monitor': {
+        # market_cube (market_data), equity_series (fiscal_ledger), covarianza Monte Carlo (risk_metrics)
+        'reads': ('fiscal_ledger', 'market_data', 'risk_metrics'),
+        'writes': (),
+        'snapshot_reader': True,
+    },
+    'strategy_engine': {
+        'reads': ('signals', 'risk_metrics', 'market_data', 'fiscal_ledger'),
+        'writes': (),
+        'calendar_sensitive': True,
+    },
+    'backtest_runner': {
+        'reads': ('market_data', 'signals', 'risk_metrics', 'trading_calendar'),
+        'writes': ('fiscal_ledger', 'orders', 'signals', 'trade_journal'),
+        'calendar_sensitive': True,
+    },
+    'performance_report_generator': {
+        'reads': ('fiscal_ledger', 'market_data'),
+        'writes': (),
+        'snapshot_reader': True,
+    },
+    'analyze_schema_drift': {
+        'reads': ('information_schema',),
+        'writes': (),
+    },
+}
+
+
+def get_step_io(step):
+    """Ritorna la dichiarazione I/O di uno step (default conservativo: writer esclusivo)"""
+    spec = STEP_IO.get(step)
+    if spec is None:
+        return {'reads': (), 'writes': ('*',), 'gate': False, 'calendar_sensitive': False, 'snapshot_reader': False}
+    return {
+        'reads': tuple(spec.get('reads', ())),
+        'writes': tuple(spec.get('writes', ())),
+        'gate': bool(spec.get('gate', False)),
+        'calendar_sensitive': bool(spec.get('calendar_sensitive', False)),
+        'snapshot_reader': bool(spec.get('snapshot_reader', False)),
+    }
+
+
+def is_read_only(step):
+    """True se lo step non scrive sul DB (eseguibile in parallelo)"""
+    return not get_step_io(step)['writes']
+
+
+def reads_snapshot(step):
+    """True se lo step read-only legge lo snapshot pubblicato invece del DB principale"""
+    io = get_step_io(step)
+    return io['snapshot_reader'] and not io['writes']
+
+
+def snapshot_publish_steps(steps):
+    """Writer dopo cui ripubblicare lo snapshot (ordine dichiarato)
+
+    Serve solo se un reader dello snapshot successivo legge una tabella scritta
+    dallo step; uno step non dichiarato ('*') conta se esiste almeno un reader dopo.
+    """
+    publish = set()
+    for i, step in enumerate(steps):
+        writes = set(get_step_io(step)['writes'])
+        if not writes:
+            continue
+        later_reads = set()
+        later_readers = False
+        for later in steps[i + 1:]:
+            if reads_snapshot(later):
+                later_readers = True
+                later_reads.update(get_step_io(later)['reads'])
+        if writes & later_reads or ('*' in writes and later_readers):
+            publish.add(step)
+    return publish
+
+
+def build_dependencies(steps):
+    """Costruisce il DAG delle dipendenze dati rispettando l'ordine dichiarato
+
+    Nota: il vincolo "un solo writer DuckDB alla volta" non è un arco del DAG,
+    viene applicato dallo scheduler (gli step che scrivono girano da soli).
+
+    Args:
+        steps: lista ordinata di step (es. EXECUTION_ORDER)
+
+    Returns:
+        dict: step -> lista di step precedenti da cui dipende
+    """
+    deps = {}
+    for i, step in enumerate(steps):
+        io = get_step_io(step)
+        reads = set(io['reads'])
+        writes = set(io['writes'])
+        step_deps = []
+
+        for prev in steps[:i]:
+            prev_io = get_step_io(prev)
+            prev_reads = set(prev_io['reads'])
+            prev_writes = set(prev_io['writes'])
+
+            conflict = (
+                prev_io['gate']
+                or '*' in writes or '*' in prev_writes
+                or bool(prev_writes & (reads | writes))
+                or bool(writes & prev_reads)
+            )
+            if conflict:
+                step_deps.append(prev)
+
+        deps[step] = step_deps
+    return deps
+
+
+def critical_path(deps, durations):
+    """Calcola il critical path (percorso più lungo pesato sulle durate)
+
+    Args:
+        deps: dict step -> dipendenze (come da build_dependencies)
+        durations: dict step -> durata in secondi (step assenti = 0)
+
+    Returns:
+        tuple: (lista step del critical path, durata totale in secondi)
+    """
+    finish = {}
+    best_prev = {}
+
+    def _finish(step):
+        if step in finish:
+            return finish[step]
+        prev_best = None
+        prev_finish = 0.0
+        for dep in deps.get(step, []):
+            f = _finish(dep)
+            if prev_best is None or f > prev_finish:
+                prev_best, prev_finish = dep, f
+        best_prev[step] = prev_best
+        finish[step] = prev_finish + float(durations.get(step, 0.0) or 0.0)
+        return finish[step]
+
+    if not deps:
+        return [], 0.0
+
+    for step in deps:
+        _finish(step)
+
+    end = max(finish, key=lambda s: finish[s])
+    path = []
+    cursor = end
+    while cursor is not None:
+        path.append(cursor)
+        cursor = best_prev.get(cursor)
+    path.reverse()
+    return path, finish[end]
+
+
+def _table_fingerprint(conn, table):
+    """Fingerprint di una tabella/vista: COUNT + XOR degli hash di riga"""
+    try:
+        row = conn.execute(f"SELECT COUNT(*), bit_xor(hash(t)) FROM {table} t").fetchone()
+        return f"{row[0]}:{row[1]}"
+    except Exception:
+        return 'missing'
+
+
+_IMPORTS_CACHE = {}
+
+
+def _module_file(name, scripts_root):
+    """File .py del repo per un nome di modulo (None se esterno/stdlib)"""
+    base = Path(scripts_root).joinpath(*name.split('.'))
+    for candidate in (base.with_suffix('.py'), base / '__init__.py'):
+        if candidate.is_file():
+            return candidate.resolve()
+    return None
+
+
+def _direct_imports(path, scripts_root):
+    """Moduli del repo importati da un file (anche dentro funzioni), cache per mtime/size"""
+    st = os.stat(path)
+    key = (str(path), st.st_mtime_ns, st.st_size, str(scripts_root))
+    if key not in _IMPORTS_CACHE:
+        try:
+            with open(path, 'rb') as f:
+                tree = ast.parse(f.read(), filename=str(path))
+        except (SyntaxError, ValueError):
+            tree = None
+        names = set()
+        for node in ast.walk(tree) if tree is not None else ():
+            if isinstance(node, ast.Import):
+                names.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names.add(node.module)
+                # from pkg import modulo
+                names.update(f"{node.module}.{alias.name}" for alias in node.names)
+        files = {_module_file(name, scripts_root) for name in names}
+        _IMPORTS_CACHE[key] = sorted(str(f) for f in files if f is not None)
+    return _IMPORTS_CACHE[key]
+
+
+def local_import_closure(script_path, scripts_root=None):
+    """File del repo raggiungibili dagli import dello script (transitivo, script escluso)"""
+    scripts_root = scripts_root or SCRIPTS_ROOT
+    script_path = Path(script_path).resolve()
+    seen = set()
+    stack = [script_path]
+    while stack:
+        for module in _direct_imports(stack.pop(), scripts_root):
+            if module not in seen and Path(module) != script_path:
+                seen.add(module)
+                stack.append(Path(module))
+    return sorted(seen)
+
+
+def compute_inputs_fingerprint(db_path, step, script_path=None, config_path=None, scripts_root=None):
+    """Fingerprint degli input di uno step: tabelle lette, sorgente script e moduli importati, config
+
+    Usa una connessione read-only: è sicuro chiamarlo mentre girano altri reader.
+    """
+    io = get_step_io(step)
+    parts = {'step': step}
+
+    if io['calendar_sensitive']:
+        parts['date'] = date.today().isoformat()
+
+    tables = [t for t in io['reads'] if t != 'information_schema']
+    if io['reads'] and db_path and os.path.exists(db_path):
+        import duckdb
+
+        conn = duckdb.connect(str(db_path), read_only=True)
+        try:
+            parts['tables'] = {t: _table_fingerprint(conn, t) for t in sorted(tables)}
+            if 'information_schema' in io['reads']:
+                parts['catalog'] = conn.execute("""
+                SELECT string_agg(table_name || '.' || column_name || ':' || data_type, ',' ORDER BY table_name, column_name)
+                FROM information_schema.columns
+                """).fetchone()[0]
+        finally:
+            conn.close()
+
+    for key, path in (('script', script_path), ('config', config_path)):
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                parts[key] = hashlib.md5(f.read()).hexdigest()
+
+    if script_path and os.path.exists(script_path):
+        modules = {}
+        scripts_root = scripts_root or SCRIPTS_ROOT
+        for module in local_import_closure(script_path, scripts_root):
+            with open(module, 'rb') as f:
+                modules[os.path.relpath(module, scripts_root)] = hashlib.md5(f.read()).hexdigest()
+        parts['modules'] = modules
+
+    return hashlib.md5(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def load_sequence_state(state_path):
+    """Carica lo stato dell'ultima esecuzione riuscita per step"""
+    try:
+        with open(state_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_sequence_state(state_path, state):
+    """Salva lo stato sequenza in modo atomico"""
+    os.makedirs(os.path.dirname(str(state_path)), exist_ok=True)
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
@@ -10,6 +10,7 @@ import sys
 import os
 from pathlib import Path
 from datetime import datetime
+from typing import Optional
 
 # Aggiungi root al path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -18,9 +19,11 @@ import duckdb
 from utils.path_manager import get_path_manager
 from orchestration.session_manager import get_session_manager
 from utils.calendar_healing import CalendarHealing
+from utils.universe_helper import get_default_venue
+from utils.market_store import market_data_source
 
 
-def clean_zombie_prices(conn, symbols, dry_run=False, venue: str = 'BIT'):
+def clean_zombie_prices(conn, symbols, dry_run=False, venue: Optional[str] = None):
     """
     Flagga zombie prices nel trading_calendar (venue-level) senza rimuovere dati.
     
@@ -33,6 +36,7 @@ def clean_zombie_prices(conn, symbols, dry_run=False, venue: str = 'BIT'):
     Returns:
         Dict con statistiche pulizia
     """
+    venue = venue or get_default_venue()
     print("\n🧟 ZOMBIE PRICES (CALENDAR FLAGGING)")
     print("=" * 60)
 
@@ -150,7 +154,7 @@ def clean_zombie_prices(conn, symbols, dry_run=False, venue: str = 'BIT'):
     }
 
 
-def clean_large_gaps(conn, symbols, dry_run=False, venue: str = 'BIT'):
+def clean_large_gaps(conn, symbols, dry_run=False, venue: Optional[str] = None):
     """
     Identifica e flagga "earthquake days" (venue-level): giorni open in trading_calendar
     senza alcun dato per l'intero universo simboli.
@@ -164,6 +168,7 @@ def clean_large_gaps(conn, symbols, dry_run=False, venue: str = 'BIT'):
     Returns:
         Dict con statistiche gaps
     """
+    venue = venue or get_default_venue()
     print("\n📊 LARGE GAPS (EARTHQUAKE DAYS) - CALENDAR FLAGGING")
     print("=" * 60)
 
@@ -206,7 +211,7 @@ def clean_large_gaps(conn, symbols, dry_run=False, venue: str = 'BIT'):
     FROM trading_calendar tc
     LEFT JOIN (
         SELECT DISTINCT date
-        FROM market_data
+        FROM {market_data_source(conn, venue=venue)}
         WHERE symbol IN ({placeholders})
     ) md ON md.date = tc.date
     WHERE tc.venue = ?
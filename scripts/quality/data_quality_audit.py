@@ -12,14 +12,6 @@ from datetime import datetime
 
 from utils.path_manager import get_path_manager
 
-# Best-effort Windows console UTF-8 safety.
-try:
-    from utils.console_utils import setup_windows_console
-
-    setup_windows_console()
-except Exception:
-    pass
-
 # Aggiungi root al path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -240,4 +232,12 @@ def calculate_certification_score(records, unique_dates, coverage_pct, zero_issu
     return max(0, int(score))
 
 if __name__ == "__main__":
+    # Best-effort Windows console UTF-8 safety.
+    try:
+        from utils.console_utils import setup_windows_console
+
+        setup_windows_console()
+    except Exception:
+        pass
+
     audit_data_quality()
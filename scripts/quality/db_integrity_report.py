@@ -32,6 +32,7 @@ import argparse
 import duckdb
 
 from utils.path_manager import get_path_manager
+from utils.db_snapshot import connect_reader, reader_db_path
 from utils.universe_helper import get_universe_symbols
 
 
@@ -93,7 +94,7 @@ def main():
     args = ap.parse_args()
 
     pm = get_path_manager()
-    db_path = str(pm.db_path)
+    db_path = reader_db_path()  # snapshot read-only se disponibile (utils/db_snapshot.py)
     config_path = str(pm.etf_universe_path)
 
     with open(config_path, "r", encoding="utf-8") as f:
@@ -105,7 +106,7 @@ def main():
     n_symbols = max(1, len(symbols))
     min_required = max(1, int((args.coverage_threshold * n_symbols) + 0.9999))  # ceil
 
-    conn = duckdb.connect(db_path)
+    conn, db_path = connect_reader(db_path, connect=duckdb.connect)
 
     # 1) Dates
     max_market_date = None
@@ -8,8 +8,6 @@ import sys
 import os
 import json
 import duckdb
-import pandas as pd
-import subprocess
 from datetime import datetime, timedelta
 
 # Aggiungi root al path
@@ -17,6 +15,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.path_manager import get_path_manager
 from orchestration.session_manager import get_session_manager
+from utils.universe_helper import get_default_venue
+from utils.market_store import market_data_source
+from quality.schema_contract_gate import catalog_snapshot
 
 def health_check():
     """Health check completo del sistema"""
@@ -64,8 +65,9 @@ def health_check():
         required_tables = ['market_data', 'staging_data', 'fiscal_ledger', 'ingestion_audit', 
                          'trading_calendar', 'risk_metrics', 'portfolio_summary']
         
-        tables_query = "SELECT table_name FROM information_schema.tables WHERE table_schema = 'main'"
-        existing_tables = [row[0] for row in conn.execute(tables_query).fetchall()]
+        # Tabelle e viste da un solo snapshot del catalogo (vedi schema_contract_gate)
+        catalog = catalog_snapshot(conn)
+        existing_tables = set(catalog['tables']) | set(catalog['views'])
         
         missing_tables = [t for t in required_tables if t not in existing_tables]
         
@@ -78,8 +80,7 @@ def health_check():
         
         # Verifica viste
         required_views = ['risk_metrics', 'portfolio_summary']
-        views_query = "SELECT table_name FROM information_schema.views WHERE table_schema = 'main'"
-        existing_views = [row[0] for row in conn.execute(views_query).fetchall()]
+        existing_views = set(catalog['views'])
         
         missing_views = [v for v in required_views if v not in existing_views]
         if missing_views:
@@ -214,15 +215,16 @@ def health_check():
         print(f"\n TRADING CALENDAR COHERENCE")
         print("-" * 40)
         
-        # Verifica coerenza calendar vs market data (solo fino a oggi)
-        coherence_check = conn.execute("""
+        # Verifica coerenza calendar vs market data della stessa venue (solo fino a oggi)
+        venue = get_default_venue(config)
+        coherence_check = conn.execute(f"""
         WITH calendar_days AS (
             SELECT date FROM trading_calendar 
-            WHERE venue = 'BIT' AND is_open = TRUE
+            WHERE venue = ? AND is_open = TRUE
             AND date <= CURRENT_DATE
         ),
         market_days AS (
-            SELECT DISTINCT date FROM market_data
+            SELECT DISTINCT date FROM {market_data_source(conn, venue=venue)}
             WHERE date <= CURRENT_DATE
         ),
         missing_data AS (
@@ -231,7 +233,7 @@ def health_check():
             WHERE m.date IS NULL
         )
         SELECT COUNT(*) as total_missing FROM missing_data
-        """).fetchone()[0]
+        """, [venue]).fetchone()[0]
         
         if coherence_check > 0:
             health_report['warnings'].append(f"Calendar coherence issues: {coherence_check} missing days")
@@ -561,107 +563,15 @@ def get_status_emoji(status):
         return ''
 
 def run_complete_sequence():
-    """Esegue la sequenza completa dopo health_check"""
-    scripts_dir = os.path.dirname(__file__)
-    root_dir = os.path.dirname(os.path.dirname(scripts_dir))
-
-    def _script_path(*parts):
-        return os.path.join(root_dir, 'scripts', *parts)
-
-    def _run_step(step_name, script_path):
-        if not os.path.exists(script_path):
-            print(f"❌ {step_name} fallito: script non trovato: {script_path}")
-            return False
-
-        env = os.environ.copy()
-        env.setdefault("PYTHONUTF8", "1")
-        env.setdefault("PYTHONIOENCODING", "utf-8")
-
-        result = subprocess.run(
-            [sys.executable, script_path],
-            capture_output=True,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
-            cwd=root_dir,
-            env=env,
-        )
+    """Esegue la sequenza completa dopo health_check (DAG con step read-only in parallelo)"""
+    from orchestration.sequence_runner import run_sequence_from
 
-        if result.returncode != 0:
-            print(f"❌ {step_name} fallito:")
-            print(result.stderr)
-            return False
-
-        print(f"✅ {step_name} completato")
-        return True
-    
     print("\n🔄 INIZIO SEQUENZA COMPLETA")
     print("=" * 60)
-    
-    # 2. Automated Test Cycle
-    print("\n🔍 STEP 2: Automated Test Cycle")
-    print("-" * 40)
-
-    automated_script = _script_path('orchestration', 'automated_test_cycle.py')
-    if not _run_step('Automated Test Cycle', automated_script):
-        return False
-    
-    # 3. Guardrails
-    print("\n🛡️ STEP 3: Guardrails")
-    print("-" * 40)
-
-    guardrails_script = _script_path('risk', 'check_guardrails.py')
-    if not _run_step('Guardrails', guardrails_script):
-        return False
-    
-    # 4. Risk Management
-    print("\n⚡ STEP 4: Risk Management")
-    print("-" * 40)
-
-    risk_script = _script_path('risk', 'enhanced_risk_management.py')
-    if not _run_step('Risk Management', risk_script):
-        return False
-    
-    # 5. Stress Tests
-    print("\n💪 STEP 5: Stress Tests")
-    print("-" * 40)
 
-    stress_script = _script_path('reports', 'portfolio_risk_monitor.py')
-    if not _run_step('Stress Tests', stress_script):
+    if not run_sequence_from('health_check'):
         return False
-    
-    # 6. Strategy Engine
-    print("\n🎯 STEP 6: Strategy Engine")
-    print("-" * 40)
 
-    strategy_script = _script_path('trading', 'strategy_engine.py')
-    if not _run_step('Strategy Engine', strategy_script):
-        return False
-    
-    # 7. Backtests
-    print("\n📊 STEP 7: Backtests")
-    print("-" * 40)
-
-    backtest_script = _script_path('backtest', 'backtest_runner.py')
-    if not _run_step('Backtests', backtest_script):
-        return False
-    
-    # 8. Performance Report
-    print("\n📈 STEP 8: Performance Report")
-    print("-" * 40)
-
-    performance_script = _script_path('reports', 'performance_report_generator.py')
-    if not _run_step('Performance Report', performance_script):
-        return False
-    
-    # 9. Analysis
-    print("\n🔬 STEP 9: Analysis")
-    print("-" * 40)
-
-    analysis_script = _script_path('quality', 'schema_contract_gate.py')
-    if not _run_step('Analysis', analysis_script):
-        return False
-    
     print("\n🎉 SEQUENZA COMPLETA TERMINATA CON SUCCESSO")
     return True
 
@@ -36,6 +36,7 @@ if str(PROJECT_ROOT) not in sys.path:
 from scripts.utils.path_manager import get_path_manager
 from scripts.utils.calendar_healing import CalendarHealing
 from scripts.utils.universe_helper import (
+    get_default_venue,
     load_universe_config,
     get_universe_symbol_meta,
 )
@@ -55,14 +56,7 @@ def _date_to_str(d: object) -> str:
 
 def resolve_venue(cfg: dict) -> str:
     # Priority: env -> cfg.settings.venue -> cfg.venue -> default
-    env_v = os.getenv("ETF_VENUE")
-    if env_v:
-        return env_v
-    if isinstance(cfg.get("settings"), dict) and cfg["settings"].get("venue"):
-        return str(cfg["settings"]["venue"])
-    if cfg.get("venue"):
-        return str(cfg["venue"])
-    return "XMIL"
+    return str(get_default_venue(cfg))
 
 
 def assess_operability(
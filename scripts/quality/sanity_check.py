@@ -26,7 +26,8 @@ if str(PROJECT_ROOT) not in sys.path:
 
 from scripts.utils.path_manager import get_path_manager
 from scripts.utils.calendar_healing import CalendarHealing
-from scripts.utils.universe_helper import load_universe_config, get_universe_meta
+from scripts.utils.universe_helper import load_universe_config, get_universe_meta, get_default_venue
+from scripts.utils.latest_prices import latest_prices_source
 
 
 def _parse_date(s: str) -> date:
@@ -34,7 +35,7 @@ def _parse_date(s: str) -> date:
 
 
 def _resolve_venue(config: dict) -> str:
-    return os.getenv("ETF_VENUE") or (config.get("settings", {}) or {}).get("venue") or config.get("venue") or "XMIL"
+    return get_default_venue(config)
 
 
 def _operability_assess(
@@ -305,7 +306,7 @@ def sanity_check(conn: duckdb.DuckDBPyConnection) -> bool:
     # 9. Portfolio value consistency
     print("9️⃣ Verifica consistenza valore portafoglio...")
     portfolio_result = conn.execute(
-        """
+        f"""
         WITH current_positions AS (
             SELECT symbol,
                    SUM(CASE WHEN type='BUY' THEN qty ELSE -qty END) AS qty,
@@ -316,9 +317,8 @@ def sanity_check(conn: duckdb.DuckDBPyConnection) -> bool:
             HAVING SUM(CASE WHEN type='BUY' THEN qty ELSE -qty END) != 0
         ),
         current_prices AS (
-            SELECT md.symbol, md.close AS current_price
-            FROM market_data md
-            WHERE md.date = (SELECT MAX(date) FROM market_data)
+            SELECT lp.symbol, lp.close AS current_price
+            FROM {latest_prices_source(conn)} lp
         )
         SELECT SUM(cp.qty * cp2.current_price) AS market_value,
                SUM(cp.qty * cp.avg_price) AS cost_basis
@@ -2,18 +2,30 @@
 """
 Schema Contract Gate - ETF Italia Project v10.8
 Validazione formale bloccante dello schema database vs contract
+
+LOGICA:
+- Una query di catalogo (duckdb_columns() + duckdb_constraints()) → snapshot di tabelle,
+  viste e primary key, confrontato con il contract compilato (tipi per famiglia)
+- Esito in cache (data/cache/schema_contract_gate.json) con chiave
+  hash contract + hash DDL del catalogo (duckdb_tables/duckdb_views.sql):
+  gate ripetuti nella stessa sessione costano una query di una riga finché il DDL non cambia
+- market_data partizionata (utils/market_store.py): la vista vale come tabella del contract,
+  partizioni e registro non sono tabelle extra
 """
 
 import sys
 import os
 import json
+import hashlib
 import duckdb
+from datetime import datetime
 from pathlib import Path
 
 # Aggiungi root al path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.path_manager import get_path_manager
+from utils.market_store import MARKET_TABLE, PARTITIONS_TABLE, is_partition_table
 
 
 def load_schema_contract():
@@ -33,106 +45,214 @@ def load_schema_contract():
         return None, f"Errore lettura contract: {e}"
 
 
-def validate_database_schema(db_path, contract):
+# Famiglie di tipi equivalenti (DuckDB può restituire VARCHAR invece di TEXT, INTEGER invece di BIGINT, etc.)
+TYPE_FAMILIES = {
+    'TEXT': 'VARCHAR', 'STRING': 'VARCHAR', 'VARCHAR': 'VARCHAR',
+    'BIGINT': 'INTEGER', 'INT': 'INTEGER', 'INTEGER': 'INTEGER',
+    'DOUBLE': 'DOUBLE', 'FLOAT': 'DOUBLE', 'REAL': 'DOUBLE',
+    'TIMESTAMP': 'TIMESTAMP', 'DATETIME': 'TIMESTAMP',
+}
+
+# Impronta DDL del catalogo: cambia solo con CREATE/ALTER/DROP di tabelle e viste
+CATALOG_FINGERPRINT_QUERY = """
+SELECT md5(COALESCE(string_agg(kind || ':' || name || ':' || sql, chr(10) ORDER BY kind, name), ''))
+FROM (
+    SELECT 'T' AS kind, table_name AS name, sql FROM duckdb_tables()
+    WHERE database_name = current_database() AND schema_name = 'main'
+    UNION ALL
+    SELECT 'V', view_name, sql FROM duckdb_views()
+    WHERE database_name = current_database() AND schema_name = 'main' AND NOT internal
+)
+"""
+
+# Colonne (tabelle e viste) e vincoli in una sola query di catalogo
+CATALOG_SNAPSHOT_QUERY = """
+SELECT 'column' AS kind, c.table_name, c.column_name AS name, c.data_type AS detail,
+       v.view_name IS NOT NULL AS is_view
+FROM duckdb_columns() c
+LEFT JOIN duckdb_views() v ON v.view_oid = c.table_oid
+WHERE c.database_name = current_database() AND c.schema_name = 'main'
+UNION ALL
+SELECT 'constraint', table_name, array_to_string(constraint_column_names, ','), constraint_type, false
+FROM duckdb_constraints()
+WHERE database_name = current_database() AND schema_name = 'main'
+"""
+
+
+def _type_family(type_name):
+    type_name = (type_name or '').upper()
+    return TYPE_FAMILIES.get(type_name, type_name)
+
+
+def catalog_fingerprint(conn):
+    """Hash del DDL di tabelle e viste (una query, una riga)"""
+    return conn.execute(CATALOG_FINGERPRINT_QUERY).fetchone()[0]
+
+
+def catalog_snapshot(conn):
     """
-    Valida schema database vs contract
+    Snapshot del catalogo da duckdb_columns()/duckdb_constraints()
     
     Returns:
-        tuple: (valid: bool, errors: list, warnings: list)
+        dict: tables/views {nome: {colonna: tipo}}, primary_keys {tabella: [colonne]}
+    """
+    snapshot = {'tables': {}, 'views': {}, 'primary_keys': {}}
+    for kind, table_name, name, detail, is_view in conn.execute(CATALOG_SNAPSHOT_QUERY).fetchall():
+        if kind == 'column':
+            snapshot['views' if is_view else 'tables'].setdefault(table_name, {})[name] = detail
+        elif detail == 'PRIMARY KEY':
+            snapshot['primary_keys'][table_name] = name.split(',')
+    return snapshot
+
+
+def contract_fingerprint(contract):
+    return hashlib.md5(json.dumps(contract, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def compile_contract(contract):
+    """Contract → tipi normalizzati per famiglia, PK e colonne garantite delle viste"""
+    tables, primary_keys = {}, {}
+    for table_name, table_spec in contract.get('tables', {}).items():
+        columns = table_spec.get('columns', {})
+        tables[table_name] = {
+            col_name: (col_spec.get('type', '').upper(), _type_family(col_spec.get('type')))
+            for col_name, col_spec in columns.items()
+        }
+        pk = [col_name for col_name, col_spec in columns.items() if col_spec.get('pk')]
+        if pk:
+            primary_keys[table_name] = pk
+    views = {name: list(spec.get('guaranteed_columns', [])) for name, spec in contract.get('views', {}).items()}
+    return {'tables': tables, 'primary_keys': primary_keys, 'views': views}
+
+
+def validate_snapshot(snapshot, compiled):
     """
+    Confronta snapshot del catalogo e contract compilato (nessuna query)
     
+    Returns:
+        tuple: (valid: bool, errors: list, warnings: list)
+    """
     errors = []
     warnings = []
+    actual_tables = dict(snapshot['tables'])
+    # market_data partizionata: la vista sostituisce la tabella (PK sulle partizioni)
+    partitioned_market = MARKET_TABLE in snapshot['views'] and PARTITIONS_TABLE in actual_tables
+    if partitioned_market:
+        actual_tables[MARKET_TABLE] = snapshot['views'][MARKET_TABLE]
     
-    try:
-        conn = duckdb.connect(str(db_path), read_only=True)
-        
-        # 1. Verifica tabelle richieste
-        actual_tables = conn.execute("SHOW TABLES").fetchall()
-        actual_table_names = set(t[0] for t in actual_tables)
-        
-        required_tables = set(contract.get('tables', {}).keys())
-        
-        # Tabelle mancanti
-        missing_tables = required_tables - actual_table_names
-        if missing_tables:
-            errors.append(f"Tabelle mancanti: {', '.join(sorted(missing_tables))}")
-        
-        # Tabelle extra (warning, non errore)
-        extra_tables = actual_table_names - required_tables
-        if extra_tables:
-            warnings.append(f"Tabelle extra non nel contract: {', '.join(sorted(extra_tables))}")
+    # 1. Tabelle richieste / extra (warning, non errore)
+    missing_tables = set(compiled['tables']) - set(actual_tables)
+    if missing_tables:
+        errors.append(f"Tabelle mancanti: {', '.join(sorted(missing_tables))}")
+    extra_tables = {t for t in set(actual_tables) - set(compiled['tables']) if not is_partition_table(t)}
+    if extra_tables:
+        warnings.append(f"Tabelle extra non nel contract: {', '.join(sorted(extra_tables))}")
+    
+    # 2. Colonne e tipi per tabella
+    for table_name, required_columns in compiled['tables'].items():
+        if table_name not in actual_tables:
+            continue  # Già segnalato come mancante
+        actual_columns = actual_tables[table_name]
         
-        # 2. Verifica colonne per ogni tabella
-        for table_name, table_spec in contract.get('tables', {}).items():
-            if table_name not in actual_table_names:
-                continue  # Già segnalato come mancante
-            
-            # Ottieni colonne attuali
-            actual_columns = conn.execute(f"DESCRIBE {table_name}").fetchall()
-            actual_col_dict = {col[0]: col[1] for col in actual_columns}
-            
-            required_columns = table_spec.get('columns', {})
-            
-            # Colonne mancanti
-            missing_cols = set(required_columns.keys()) - set(actual_col_dict.keys())
-            if missing_cols:
-                errors.append(f"Tabella {table_name}: colonne mancanti {', '.join(sorted(missing_cols))}")
-            
-            # Verifica tipi colonne
-            for col_name, col_spec in required_columns.items():
-                if col_name not in actual_col_dict:
-                    continue  # Già segnalato come mancante
-                
-                expected_type = col_spec.get('type', '').upper()
-                actual_type = actual_col_dict[col_name].upper()
-                
-                # Normalizza tipi per confronto
-                # DuckDB può restituire VARCHAR invece di TEXT, INTEGER invece di BIGINT, etc.
-                type_aliases = {
-                    'TEXT': ['VARCHAR', 'STRING'],
-                    'VARCHAR': ['TEXT', 'STRING'],
-                    'BIGINT': ['INTEGER', 'INT'],
-                    'INTEGER': ['BIGINT', 'INT'],
-                    'DOUBLE': ['FLOAT', 'REAL'],
-                    'TIMESTAMP': ['DATETIME']
-                }
-                
-                types_match = False
-                if expected_type == actual_type:
-                    types_match = True
-                elif expected_type in type_aliases:
-                    if actual_type in type_aliases[expected_type] or actual_type == expected_type:
-                        types_match = True
-                
-                if not types_match:
-                    # Verifica se è un tipo compatibile
-                    compatible = False
-                    for base_type, aliases in type_aliases.items():
-                        if expected_type in [base_type] + aliases and actual_type in [base_type] + aliases:
-                            compatible = True
-                            break
-                    
-                    if not compatible:
-                        errors.append(f"Tabella {table_name}.{col_name}: tipo mismatch (expected {expected_type}, got {actual_type})")
+        missing_cols = set(required_columns) - set(actual_columns)
+        if missing_cols:
+            errors.append(f"Tabella {table_name}: colonne mancanti {', '.join(sorted(missing_cols))}")
         
-        # 3. Verifica indici (opzionale, solo warning)
-        for table_name, table_spec in contract.get('tables', {}).items():
-            if table_name not in actual_table_names:
+        for col_name, (expected_type, expected_family) in required_columns.items():
+            if col_name not in actual_columns:
                 continue
-            
-            required_indexes = table_spec.get('indexes', [])
-            if required_indexes:
-                # DuckDB non ha un modo semplice per listare indici, skip per ora
-                pass
+            actual_type = actual_columns[col_name].upper()
+            if expected_type != actual_type and expected_family != _type_family(actual_type):
+                errors.append(f"Tabella {table_name}.{col_name}: tipo mismatch (expected {expected_type}, got {actual_type})")
         
-        conn.close()
+        # Primary key (warning: vincolo non modificabile senza ricreare la tabella)
+        expected_pk = compiled['primary_keys'].get(table_name)
+        if partitioned_market and table_name == MARKET_TABLE:
+            expected_pk = None
+        if expected_pk and sorted(snapshot['primary_keys'].get(table_name, [])) != sorted(expected_pk):
+            warnings.append(f"Tabella {table_name}: primary key attesa ({', '.join(expected_pk)})")
+    
+    # 3. Viste del contract (warning, come health_check)
+    for view_name, guaranteed in compiled['views'].items():
+        actual_columns = snapshot['views'].get(view_name, actual_tables.get(view_name))
+        if actual_columns is None:
+            warnings.append(f"Vista mancante: {view_name}")
+            continue
+        missing_cols = [c for c in guaranteed if c not in actual_columns]
+        if missing_cols:
+            warnings.append(f"Vista {view_name}: colonne garantite mancanti {', '.join(missing_cols)}")
+    
+    return len(errors) == 0, errors, warnings
+
+
+def _load_gate_cache(cache_path):
+    try:
+        with open(cache_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_gate_cache(cache_path, cache):
+    cache_path = Path(cache_path)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, cache_path)
+
+
+def check_database_schema(db_path, contract, cache_path=None, use_cache=True):
+    """
+    Valida schema database vs contract con esito in cache per impronta del catalogo
+    
+    Il risultato è riusato finché DDL del database e contract non cambiano:
+    gate ripetuti costano una query di una riga.
+    
+    Returns:
+        dict: valid, errors, warnings, cached, catalog_hash
+    """
+    if cache_path is None:
+        cache_path = get_path_manager().schema_gate_cache_path
+    db_key = str(Path(db_path).resolve())
+    
+    conn = duckdb.connect(str(db_path), read_only=True)
+    try:
+        catalog_hash = catalog_fingerprint(conn)
+        cache_key = f"{contract_fingerprint(contract)}:{catalog_hash}"
         
-        return len(errors) == 0, errors, warnings
+        cache = _load_gate_cache(cache_path) if use_cache else {}
+        entry = cache.get(db_key)
+        if entry and entry.get('key') == cache_key:
+            return {'valid': entry['valid'], 'errors': entry['errors'], 'warnings': entry['warnings'],
+                    'cached': True, 'catalog_hash': catalog_hash}
         
+        valid, errors, warnings = validate_snapshot(catalog_snapshot(conn), compile_contract(contract))
+    finally:
+        conn.close()
+    
+    if use_cache:
+        cache[db_key] = {'key': cache_key, 'valid': valid, 'errors': errors, 'warnings': warnings,
+                         'checked_at': datetime.now().isoformat()}
+        try:
+            _save_gate_cache(cache_path, cache)
+        except OSError:
+            pass
+    return {'valid': valid, 'errors': errors, 'warnings': warnings, 'cached': False, 'catalog_hash': catalog_hash}
+
+
+def validate_database_schema(db_path, contract, cache_path=None, use_cache=True):
+    """
+    Valida schema database vs contract
+    
+    Returns:
+        tuple: (valid: bool, errors: list, warnings: list)
+    """
+    try:
+        result = check_database_schema(db_path, contract, cache_path=cache_path, use_cache=use_cache)
+        return result['valid'], result['errors'], result['warnings']
     except Exception as e:
-        errors.append(f"Errore validazione: {e}")
-        return False, errors, warnings
+        return False, [f"Errore validazione: {e}"], []
 
 
 def schema_contract_gate(db_path=None, strict=True):
@@ -173,8 +293,14 @@ def schema_contract_gate(db_path=None, strict=True):
     print(f"\n🔍 Validating database schema...")
     print(f"   Database: {Path(db_path).name}")
     
-    # Valida schema
-    valid, errors, warnings = validate_database_schema(db_path, contract)
+    # Valida schema (esito in cache se DDL e contract non sono cambiati)
+    try:
+        result = check_database_schema(db_path, contract)
+    except Exception as e:
+        result = {'valid': False, 'errors': [f"Errore validazione: {e}"], 'warnings': [], 'cached': False}
+    errors, warnings = result['errors'], result['warnings']
+    if result['cached']:
+        print(f"   Catalogo invariato ({result['catalog_hash'][:12]}): esito dalla cache")
     
     # Report risultati
     print("\n" + "=" * 60)
@@ -10,7 +10,6 @@ import json
 import duckdb
 
 from datetime import datetime, timedelta
-import pandas as pd
 
 # Aggiungi path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -18,13 +17,16 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.path_manager import get_path_manager
 from utils.console_utils import setup_windows_console
 from orchestration.session_manager import get_session_manager
+from utils.perf_trace import perf_step
+from utils.latest_prices import latest_prices_source
+from utils.db_snapshot import connect_reader, reader_db_path
 
-# Windows console robustness
-setup_windows_console()
-
-def generate_performance_report(db_path, output_dir=None):
+def generate_performance_report(db_path, output_dir=None, run_type=None):
     """
     Genera report performance completo
+    
+    Equity, cash e rischio dalla serie giornaliera condivisa (utils/equity_series.py);
+    run_type None = tutto il fiscal_ledger
     """
     
     print("📊 PERFORMANCE REPORT GENERATOR")
@@ -34,12 +36,12 @@ def generate_performance_report(db_path, output_dir=None):
         print("❌ Database non trovato")
         return False
     
-    conn = duckdb.connect(db_path)
+    conn, db_path = connect_reader(db_path, connect=duckdb.connect)
     
     try:
         # 1. Portfolio overview
         print("1️⃣ Analisi portafoglio attuale...")
-        portfolio_query = """
+        portfolio_query = f"""
         WITH current_positions AS (
             SELECT 
                 symbol,
@@ -51,9 +53,8 @@ def generate_performance_report(db_path, output_dir=None):
             HAVING SUM(CASE WHEN type = 'BUY' THEN qty ELSE -qty END) != 0
         ),
         current_prices AS (
-            SELECT md.symbol, md.close as current_price, md.adj_close as adj_price
-            FROM market_data md
-            WHERE md.date = (SELECT MAX(date) FROM market_data)
+            SELECT lp.symbol, lp.close as current_price, lp.adj_close as adj_price
+            FROM {latest_prices_source(conn)} lp
         ),
         portfolio_summary AS (
             SELECT 
@@ -82,61 +83,21 @@ def generate_performance_report(db_path, output_dir=None):
         
         portfolio_data = conn.execute(portfolio_query).fetchdf()
         
-        # 2. Cash balance
-        print("2️⃣ Calcolo cash balance...")
-        cash_balance = conn.execute("""
-        SELECT COALESCE(SUM(CASE 
-            WHEN type = 'DEPOSIT' THEN qty * price - fees - tax_paid
-            WHEN type = 'SELL' THEN qty * price - fees - tax_paid
-            WHEN type = 'BUY' THEN -(qty * price + fees)
-            WHEN type = 'INTEREST' THEN qty
-            ELSE 0 
-        END), 0) as cash_balance
-        FROM fiscal_ledger
-        """).fetchone()[0]
+        # 2-3. Serie giornaliera equity/cash/posizioni (cache per run, somme cumulative)
+        print("2️⃣ Serie equity/cash dal ledger...")
+        from utils.equity_series import load_equity_series, series_summary
+        series = load_equity_series(conn, run_type=run_type)
+        summary = series_summary(series)
         
-        # 3. Performance metrics
         print("3️⃣ Calcolo metriche performance...")
-        
-        # Query semplificata per performance metrics
-        perf_query = """
-        WITH daily_portfolio_value AS (
-            SELECT 
-                md.date,
-                COALESCE(SUM(CASE 
-                    WHEN fl.type = 'DEPOSIT' THEN fl.qty * fl.price - fl.fees - fl.tax_paid
-                    WHEN fl.type = 'SELL' THEN fl.qty * fl.price - fl.fees - fl.tax_paid
-                    WHEN fl.type = 'BUY' THEN -(fl.qty * fl.price + fl.fees)
-                    WHEN fl.type = 'INTEREST' THEN fl.qty
-                    ELSE 0 
-                END), 0) as cash_balance
-            FROM market_data md
-            LEFT JOIN fiscal_ledger fl ON md.date >= fl.date AND md.symbol = fl.symbol
-            WHERE md.date >= (SELECT MIN(date) FROM fiscal_ledger WHERE type = 'DEPOSIT')
-            GROUP BY md.date
-        ),
-        portfolio_total AS (
-            SELECT 
-                date,
-                cash_balance as total_value
-            FROM daily_portfolio_value
-        )
-        SELECT 
-            COUNT(*) as trading_days,
-            MIN(total_value) as start_value,
-            MAX(total_value) as end_value,
-            (MAX(total_value) / MIN(total_value) - 1) as total_return
-        FROM portfolio_total
-        """
-        
-        perf_data = conn.execute(perf_query).fetchone()
-        
-        if perf_data:
-            trading_days, start_value, end_value, total_return = perf_data
-            
-            # Calcoli derivati
-            total_return = (end_value / start_value - 1) if start_value > 0 else 0
-            annual_return = total_return * (252 / trading_days) if trading_days > 0 else 0
+        if summary:
+            trading_days = summary['trading_days']
+            start_value = summary['start_value']
+            end_value = summary['end_value']
+            cash_balance = summary['cash_balance']
+            stock_value = summary['market_value']
+            total_return = summary['total_return']
+            annual_return = summary['annual_return']
             
             # 4. Tax summary
             print("4️⃣ Riepilogo fiscale...")
@@ -156,33 +117,10 @@ def generate_performance_report(db_path, output_dir=None):
             profitable_trades = 0  # Non calcolabile senza tracking trade-by-trade
             losing_trades = 0
             
-            # 5. Risk metrics (semplificati)
+            # 5. Risk metrics (dalla stessa serie: returns al netto dei depositi)
             print("5️⃣ Calcolo metriche rischio...")
-            risk_data = conn.execute("""
-            WITH daily_returns AS (
-                SELECT 
-                    md.date,
-                    (md.adj_close / LAG(md.adj_close) OVER (PARTITION BY md.symbol ORDER BY md.date) - 1) as daily_return
-                FROM market_data md
-                WHERE md.symbol IN (SELECT DISTINCT symbol FROM fiscal_ledger WHERE type IN ('BUY', 'SELL'))
-                AND md.date >= (SELECT MIN(date) FROM fiscal_ledger WHERE type = 'DEPOSIT')
-                ORDER BY md.symbol, md.date
-            ),
-            portfolio_returns AS (
-                SELECT 
-                    date,
-                    AVG(daily_return) as portfolio_return
-                FROM daily_returns
-                WHERE daily_return IS NOT NULL
-                GROUP BY date
-            )
-            SELECT 
-                STDDEV(portfolio_return) * SQRT(252) as portfolio_volatility,
-                MIN(portfolio_return) as worst_daily_return
-            FROM portfolio_returns
-            """).fetchone()
-            
-            portfolio_volatility, worst_daily_ret = risk_data
+            portfolio_volatility = summary['volatility']
+            worst_daily_ret = summary['worst_daily_return']
             
             # 5.5 Emotional Gap (TL-3.2)
             print("💭 Calcolo Emotional Gap (PnL puro vs reale)...")
@@ -208,8 +146,8 @@ def generate_performance_report(db_path, output_dir=None):
             report = {
                 'timestamp': datetime.now().isoformat(),
                 'portfolio_summary': {
-                    'total_value': float(end_value + cash_balance) if end_value else cash_balance,
-                    'stock_value': float(end_value) if end_value else 0,
+                    'total_value': float(end_value),
+                    'stock_value': float(stock_value),
                     'cash_balance': float(cash_balance),
                     'positions_count': len(portfolio_data),
                     'positions': portfolio_data.to_dict('records') if not portfolio_data.empty else []
@@ -219,17 +157,17 @@ def generate_performance_report(db_path, output_dir=None):
                     'annual_return_pct': float(annual_return * 100),
                     'annual_volatility_pct': float(portfolio_volatility * 100) if portfolio_volatility else 0,
                     'sharpe_ratio': float(annual_return / (portfolio_volatility if portfolio_volatility else 0.01)) if portfolio_volatility else 0,
-                    'max_drawdown_pct': 0.0,  # Semplificato
+                    'max_drawdown_pct': float(summary['max_drawdown'] * 100),
                     'trading_days': int(trading_days),
                     'start_value': float(start_value) if start_value else 0,
                     'end_value': float(end_value) if end_value else 0,
-                    'best_daily_return_pct': 0.0,  # Semplificato
+                    'best_daily_return_pct': float(summary['best_daily_return'] * 100),
                     'worst_daily_return_pct': float(worst_daily_ret * 100) if worst_daily_ret else 0
                 },
                 'risk_metrics': {
                     'portfolio_volatility_pct': float(portfolio_volatility * 100) if portfolio_volatility else 0,
                     'worst_daily_return_pct': float(worst_daily_ret * 100) if worst_daily_ret else 0,
-                    'var_5_daily_pct': 0.0  # Semplificato
+                    'var_5_daily_pct': float(summary['var_5_daily'] * 100)
                 },
                 'tax_summary': {
                     'total_realized_pnl': float(total_realized_pnl) if total_realized_pnl else 0,
@@ -295,10 +233,14 @@ def generate_performance_report(db_path, output_dir=None):
         conn.close()
 
 def main():
+    # Windows console robustness
+    setup_windows_console()
+
     pm = get_path_manager()
-    db_path = str(pm.db_path)
+    db_path = reader_db_path()  # snapshot read-only se disponibile (utils/db_snapshot.py)
     
-    success = generate_performance_report(db_path)
+    with perf_step('performance_report_generator'):
+        success = generate_performance_report(db_path)
     
     if success:
         print("\n✅ Performance report generated successfully")
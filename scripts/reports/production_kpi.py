@@ -15,6 +15,17 @@ from pathlib import Path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.path_manager import get_path_manager
+from utils.db_snapshot import connect_reader, reader_db_path
+from trading.orders_store import latest_orders_file, summarize_order_file, summarize_orders_history
+from utils.equity_series import load_equity_series, series_summary
+
+
+def _portfolio_snapshot(conn, run_type='PRODUCTION'):
+    """(valore posizioni, cash) all'ultima data della serie equity del run_type"""
+    summary = series_summary(load_equity_series(conn, run_type=run_type))
+    if summary is None:
+        return 0.0, 0.0
+    return summary['market_value'], summary['cash_balance']
 
 def calculate_forecast_kpi(orders_file, db_path):
     """
@@ -29,61 +40,24 @@ def calculate_forecast_kpi(orders_file, db_path):
     - Costi stimati totali
     """
     
-    # Carica ordini
-    with open(orders_file, 'r') as f:
-        orders_data = json.load(f)
-    
-    orders = orders_data.get('orders', [])
+    # Aggregati ordini (una query colonnare sul sidecar Parquet, fallback JSON)
+    stats = summarize_order_file(orders_file)
     
     # Connetti al DB per ottenere portfolio attuale
-    conn = duckdb.connect(db_path)
-    
-    # Portfolio value attuale
-    portfolio_value = conn.execute("""
-    WITH current_positions AS (
-        SELECT 
-            symbol,
-            SUM(CASE WHEN type = 'BUY' THEN qty ELSE -qty END) as qty
-        FROM fiscal_ledger 
-        WHERE type IN ('BUY', 'SELL') AND run_type = 'PRODUCTION'
-        GROUP BY symbol
-        HAVING SUM(CASE WHEN type = 'BUY' THEN qty ELSE -qty END) > 0
-    ),
-    current_prices AS (
-        SELECT md.symbol, md.close as current_price
-        FROM market_data md
-        WHERE md.date = (SELECT MAX(date) FROM market_data)
-    )
-    SELECT COALESCE(SUM(cp.qty * cp2.current_price), 0) as market_value
-    FROM current_positions cp
-    JOIN current_prices cp2 ON cp.symbol = cp2.symbol
-    """).fetchone()[0]
+    conn, db_path = connect_reader(db_path, connect=duckdb.connect)
     
-    # Cash disponibile
-    cash_balance = conn.execute("""
-    SELECT COALESCE(SUM(CASE 
-        WHEN type = 'DEPOSIT' THEN qty * price - fees - tax_paid
-        WHEN type = 'SELL' THEN qty * price - fees - tax_paid
-        WHEN type = 'BUY' THEN -(qty * price + fees)
-        ELSE 0 
-    END), 0) as cash_balance
-    FROM fiscal_ledger
-    WHERE run_type = 'PRODUCTION'
-    """).fetchone()[0]
+    # Portfolio value e cash attuali (serie equity condivisa, cache per run)
+    portfolio_value, cash_balance = _portfolio_snapshot(conn)
     
     conn.close()
     
     # Calcola metriche forecast
-    buy_orders = [o for o in orders if o['action'] == 'BUY']
-    sell_orders = [o for o in orders if o['action'] == 'SELL']
-    hold_orders = [o for o in orders if o['action'] == 'HOLD']
+    total_buy_value = stats['total_buy_value']
+    total_sell_value = stats['total_sell_value']
+    total_costs = stats['total_costs']
     
-    total_buy_value = sum(o['qty'] * o['price'] for o in buy_orders)
-    total_sell_value = sum(o['qty'] * o['price'] for o in sell_orders)
-    total_costs = sum(o.get('fees_est', 0) + o.get('tax_friction_est', 0) for o in orders)
-    
-    avg_momentum = sum(o.get('momentum_score', 0) for o in orders) / len(orders) if orders else 0
-    avg_trade_score = sum(o.get('trade_score', 0) for o in orders) / len(orders) if orders else 0
+    avg_momentum = stats['avg_momentum_score']
+    avg_trade_score = stats['avg_trade_score']
     
     # Esposizione stimata post-execution
     estimated_exposure = portfolio_value + total_buy_value - total_sell_value
@@ -99,10 +73,10 @@ def calculate_forecast_kpi(orders_file, db_path):
             'total_value': float(portfolio_value + cash_balance)
         },
         'orders_summary': {
-            'total_orders': len(orders),
-            'buy_orders': len(buy_orders),
-            'sell_orders': len(sell_orders),
-            'hold_orders': len(hold_orders)
+            'total_orders': stats['total_orders'],
+            'buy_orders': stats['buy_orders'],
+            'sell_orders': stats['sell_orders'],
+            'hold_orders': stats['hold_orders']
         },
         'capital_impact': {
             'total_buy_value': float(total_buy_value),
@@ -137,14 +111,12 @@ def calculate_postcast_kpi(orders_file, db_path):
     - Variazione esposizione
     """
     
-    # Carica ordini originali
-    with open(orders_file, 'r') as f:
-        orders_data = json.load(f)
-    
-    orders_proposed = orders_data.get('orders', [])
+    # Aggregati ordini originali
+    stats = summarize_order_file(orders_file)
+    proposed_count = stats['buy_orders'] + stats['sell_orders']
     
     # Connetti al DB
-    conn = duckdb.connect(db_path)
+    conn, db_path = connect_reader(db_path, connect=duckdb.connect)
     
     # Ottieni ordini eseguiti (ultimi N record dal ledger)
     executed_orders = conn.execute("""
@@ -156,56 +128,22 @@ def calculate_postcast_kpi(orders_file, db_path):
     AND type IN ('BUY', 'SELL')
     ORDER BY date DESC, id DESC
     LIMIT ?
-    """, [len([o for o in orders_proposed if o['action'] in ['BUY', 'SELL']])]).fetchall()
+    """, [proposed_count]).fetchall()
     
-    # Portfolio value post-execution
-    portfolio_value = conn.execute("""
-    WITH current_positions AS (
-        SELECT 
-            symbol,
-            SUM(CASE WHEN type = 'BUY' THEN qty ELSE -qty END) as qty
-        FROM fiscal_ledger 
-        WHERE type IN ('BUY', 'SELL') AND run_type = 'PRODUCTION'
-        GROUP BY symbol
-        HAVING SUM(CASE WHEN type = 'BUY' THEN qty ELSE -qty END) > 0
-    ),
-    current_prices AS (
-        SELECT md.symbol, md.close as current_price
-        FROM market_data md
-        WHERE md.date = (SELECT MAX(date) FROM market_data)
-    )
-    SELECT COALESCE(SUM(cp.qty * cp2.current_price), 0) as market_value
-    FROM current_positions cp
-    JOIN current_prices cp2 ON cp.symbol = cp2.symbol
-    """).fetchone()[0]
-    
-    # Cash post-execution
-    cash_balance = conn.execute("""
-    SELECT COALESCE(SUM(CASE 
-        WHEN type = 'DEPOSIT' THEN qty * price - fees - tax_paid
-        WHEN type = 'SELL' THEN qty * price - fees - tax_paid
-        WHEN type = 'BUY' THEN -(qty * price + fees)
-        ELSE 0 
-    END), 0) as cash_balance
-    FROM fiscal_ledger
-    WHERE run_type = 'PRODUCTION'
-    """).fetchone()[0]
+    # Portfolio value e cash post-execution (serie ricalcolata: il ledger è cambiato)
+    portfolio_value, cash_balance = _portfolio_snapshot(conn)
     
     conn.close()
     
     # Confronta proposti vs eseguiti
     executed_count = len(executed_orders)
-    proposed_count = len([o for o in orders_proposed if o['action'] in ['BUY', 'SELL']])
     
     # Calcola slippage e costi
     total_fees_actual = sum(o[4] for o in executed_orders)
     total_tax_actual = sum(o[5] for o in executed_orders)
     total_costs_actual = total_fees_actual + total_tax_actual
     
-    total_costs_estimated = sum(
-        o.get('fees_est', 0) + o.get('tax_friction_est', 0) 
-        for o in orders_proposed if o['action'] in ['BUY', 'SELL']
-    )
+    total_costs_estimated = stats['trade_costs']
     
     kpi = {
         'timestamp': datetime.now().isoformat(),
@@ -266,17 +204,29 @@ def save_production_kpi(kpi_data, kpi_type='forecast'):
     return kpi_file
 
 
+def calculate_orders_history_kpi(orders_dir, start_date=None, end_date=None):
+    """
+    KPI storici per run su un periodo (indice run + una query sui sidecar Parquet)
+    
+    Returns:
+        list di dict per run ordinati per as_of_date
+    """
+    history = summarize_orders_history(orders_dir, start_date, end_date)
+    for run in history:
+        run['net_capital_change'] = float(run.get('total_sell_value', 0) - run.get('total_buy_value', 0))
+    return history
+
+
 if __name__ == '__main__':
     # Test con ultimo file orders
     pm = get_path_manager()
-    db_path = str(pm.db_path)
+    db_path = reader_db_path()  # snapshot read-only se disponibile (utils/db_snapshot.py)
     
     # Trova ultimo file orders in production
     orders_dir = pm.root / 'data' / 'production' / 'orders'
     if orders_dir.exists():
-        orders_files = sorted(orders_dir.glob('orders_*.json'))
-        if orders_files:
-            latest_orders = orders_files[-1]
+        latest_orders = latest_orders_file(orders_dir)
+        if latest_orders:
             
             print("📊 PRODUCTION KPI CALCULATOR")
             print("=" * 60)
@@ -15,6 +15,8 @@ from datetime import datetime, timedelta
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.path_manager import get_path_manager
+from utils.latest_prices import latest_prices_source
+from utils.db_snapshot import connect_reader, reader_db_path
 
 from orchestration.session_manager import get_session_manager
 from orchestration.sequence_runner import run_sequence_from
@@ -28,7 +30,7 @@ def check_guardrails():
     pm = get_path_manager()
     config_path = str(pm.etf_universe_path)
     pm = get_path_manager()
-    db_path = str(pm.db_path)
+    db_path = reader_db_path()  # snapshot read-only se disponibile (utils/db_snapshot.py)
     
     # Inizializza session manager
     session_manager = get_session_manager(script_name='check_guardrails')
@@ -37,7 +39,7 @@ def check_guardrails():
     with open(config_path, 'r') as f:
         config = json.load(f)
     
-    conn = duckdb.connect(db_path)
+    conn, db_path = connect_reader(db_path, connect=duckdb.connect)
     
     try:
         guardrails_status = {
@@ -155,11 +157,10 @@ def check_guardrails():
         print(f"\n Position Concentration Check:")
         
         # Usa prezzi di chiusura correnti per valorizzazione coerente
-        positions = conn.execute("""
+        positions = conn.execute(f"""
         WITH current_prices AS (
             SELECT symbol, close as current_price
-            FROM market_data 
-            WHERE date = (SELECT MAX(date) FROM market_data)
+            FROM {latest_prices_source(conn)} lp
         ),
         position_summary AS (
             SELECT 
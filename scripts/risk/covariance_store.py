@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+Covariance Store - ETF Italia Project v10
+Matrici di covarianza/correlazione (N×N) per tutto l'universo: stato corrente + breve coda
+
+LOGICA:
+- Rendimenti daily_return da risk_metrics caricati con una query (matrice date × simboli)
+- Due stimatori calcolati con NumPy sulla matrice:
+  - ewma: RiskMetrics a media zero (lambda 0.94), normalizzato sui pesi effettivi
+  - window: campionaria su finestra fissa (60 e 252 giorni), coppie complete
+- Tabella covariance_store in formato lungo (date, method, param, symbol_a, symbol_b)
+  con solo le ultime TAIL_DATES date per metodo (i consumer leggono l'ultima)
+- Filtro min_periods applicato in lettura (lo store conserva anche le stime iniziali)
+- Aggiornamento incrementale: ewma riparte dallo stato dell'ultima data salvata e
+  legge solo i rendimenti nuovi; window calcola le sole date nuove della coda
+  (un prodotto matriciale per data sulla sua finestra)
+- Inserimento via DataFrame registrato; righe per aggiornamento ≤ TAIL_DATES × N²
+- Cambio universo (simboli diversi): ricostruzione del metodo (ewma ripercorre la
+  storia in memoria N×N, salvando solo la coda)
+"""
+
+import sys
+import os
+
+import numpy as np
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TRADING_DAYS = 252
+DEFAULT_EWMA_LAMBDA = 0.94
+DEFAULT_WINDOW = 60          # Volatilità corrente (vol targeting)
+CORRELATION_WINDOW = 252     # Correlazione di lungo periodo (guardrails diversificazione)
+MIN_PERIODS = 20
+TAIL_DATES = 5               # Date conservate per metodo (ultima = stato EWMA)
+
+# Stimatori mantenuti nello store: (method, param)
+DEFAULT_METHODS = (
+    ('ewma', DEFAULT_EWMA_LAMBDA),
+    ('window', DEFAULT_WINDOW),
+    ('window', CORRELATION_WINDOW),
+)
+
+COVARIANCE_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS covariance_store (
+    date DATE NOT NULL,
+    method VARCHAR NOT NULL CHECK (method IN ('ewma', 'window')),
+    param DOUBLE NOT NULL,
+    symbol_a VARCHAR NOT NULL,
+    symbol_b VARCHAR NOT NULL,
+    cov DOUBLE,
+    corr DOUBLE,
+    n_obs INTEGER NOT NULL,
+    PRIMARY KEY (date, method, param, symbol_a, symbol_b)
+)
+"""
+
+
+def ensure_covariance_table(conn):
+    """Crea la tabella covariance_store se assente"""
+    conn.execute(COVARIANCE_TABLE_DDL)
+
+
+def get_store_symbols(config=None):
+    """Simboli dell'universo (senza benchmark) da etf_universe.json"""
+    from utils.path_manager import get_path_manager
+    from utils.universe_helper import get_universe_symbols, load_universe_config
+
+    if config is None:
+        config = load_universe_config(get_path_manager().etf_universe_path)
+    return get_universe_symbols(config, include_benchmark=False)
+
+
+def load_returns_matrix(conn, symbols, since=None, keep_all=False):
+    """Matrice rendimenti giornalieri (date × simboli, NaN dove mancante)
+
+    Args:
+        since: solo le date > since (None = tutta la storia)
+        keep_all: True mantiene tutte le colonne di symbols anche senza dati nel periodo
+
+    Returns:
+        tuple: (dates, symbols presenti, matrice T × N)
+    """
+    rows = conn.execute("""
+    SELECT date, symbol, daily_return
+    FROM risk_metrics
+    WHERE symbol IN (SELECT UNNEST(?::VARCHAR[])) AND daily_return IS NOT NULL
+      AND (?::DATE IS NULL OR date > ?::DATE)
+    ORDER BY date
+    """, [list(symbols), since, since]).fetchall()
+
+    seen = {r[1] for r in rows}
+    present = list(symbols) if keep_all else [s for s in symbols if s in seen]
+    if not rows:
+        return [], present, np.empty((0, len(present)))
+
+    col_index = {s: j for j, s in enumerate(present)}
+    dates = sorted({r[0] for r in rows})
+    row_index = {d: i for i, d in enumerate(dates)}
+
+    matrix = np.full((len(dates), len(present)), np.nan)
+    matrix[[row_index[r[0]] for r in rows], [col_index[r[1]] for r in rows]] = [float(r[2]) for r in rows]
+    return dates, present, matrix
+
+
+def _returns_symbols(conn, symbols):
+    """Simboli con almeno un rendimento (ordine di symbols)"""
+    seen = {r[0] for r in conn.execute("""
+    SELECT DISTINCT symbol FROM risk_metrics
+    WHERE symbol IN (SELECT UNNEST(?::VARCHAR[])) AND daily_return IS NOT NULL
+    """, [list(symbols)]).fetchall()}
+    return [s for s in symbols if s in seen]
+
+
+def _nth_last_date(conn, symbols, n):
+    """Data che precede le ultime n date con rendimenti (None se la storia è più corta)"""
+    rows = conn.execute("""
+    SELECT DISTINCT date FROM risk_metrics
+    WHERE symbol IN (SELECT UNNEST(?::VARCHAR[])) AND daily_return IS NOT NULL
+    ORDER BY date DESC
+    LIMIT 1 OFFSET ?
+    """, [list(symbols), int(n)]).fetchone()
+    return rows[0] if rows else None
+
+
+def ewma_covariance(returns, lam=DEFAULT_EWMA_LAMBDA, min_periods=MIN_PERIODS, state=None, tail=None):
+    """Covarianza EWMA a media zero per ogni data (coppie osservate)
+
+    Ogni elemento (i, j) si aggiorna solo nei giorni in cui entrambi i rendimenti
+    sono presenti; la stima è normalizzata per la somma dei pesi 1 - λ^n.
+
+    Args:
+        returns: matrice T × N (NaN ammessi)
+        state: (cov, n_obs) all'ultima data già calcolata, per proseguire la ricorsione
+        tail: se valorizzato restituisce solo le ultime `tail` date (memoria tail × N × N)
+
+    Returns:
+        tuple: (cov T × N × N, n_obs T × N × N); cov NaN se n_obs < min_periods
+    """
+    returns = np.asarray(returns, dtype=float)
+    n_days, n_assets = returns.shape
+    first_kept = 0 if tail is None else max(0, n_days - int(tail))
+
+    if state is None:
+        weighted = np.zeros((n_assets, n_assets))
+        n_obs = np.zeros((n_assets, n_assets), dtype=np.int64)
+    else:
+        prev_cov, prev_n = state
+        n_obs = np.asarray(prev_n, dtype=np.int64).copy()
+        weighted = np.nan_to_num(np.asarray(prev_cov, dtype=float)) * (1.0 - lam ** n_obs)
+
+    covs = np.empty((n_days - first_kept, n_assets, n_assets))
+    counts = np.empty((n_days - first_kept, n_assets, n_assets), dtype=np.int64)
+    observed = ~np.isnan(returns)
+    clean = np.where(observed, returns, 0.0)
+
+    for t in range(n_days):
+        mask = np.outer(observed[t], observed[t])
+        weighted = np.where(mask, lam * weighted + (1.0 - lam) * np.outer(clean[t], clean[t]), weighted)
+        n_obs = n_obs + mask
+        if t < first_kept:
+            continue
+        with np.errstate(divide='ignore', invalid='ignore'):
+            covs[t - first_kept] = np.where(n_obs >= min_periods, weighted / (1.0 - lam ** n_obs), np.nan)
+        counts[t - first_kept] = n_obs
+
+    return covs, counts
+
+
+def rolling_window_covariance(returns, window=DEFAULT_WINDOW, min_periods=MIN_PERIODS):
+    """Covarianza campionaria su finestra fissa (coppie complete) per ogni data
+
+    Somme cumulate di x_i, x_i², x_i·x_j mascherate per coppia: nessun loop sulle date.
+
+    Returns:
+        tuple: (cov T × N × N, n_obs T × N × N); cov NaN se n_obs < min_periods
+    """
+    returns = np.asarray(returns, dtype=float)
+    n_days, n_assets = returns.shape
+    observed = (~np.isnan(returns)).astype(float)
+    clean = np.where(observed > 0, returns, 0.0)
+
+    def _windowed(x):
+        csum = np.cumsum(x, axis=0)
+        out = csum.copy()
+        out[window:] -= csum[:-window]
+        return out
+
+    pair_n = _windowed(observed[:, :, None] * observed[:, None, :])
+    sum_i = _windowed(clean[:, :, None] * observed[:, None, :])   # Σ x_i dove anche j presente
+    sum_ij = _windowed(clean[:, :, None] * clean[:, None, :])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = (sum_ij - sum_i * np.swapaxes(sum_i, 1, 2) / pair_n) / (pair_n - 1)
+    counts = np.rint(pair_n).astype(np.int64)
+    cov = np.where(counts >= max(min_periods, 2), cov, np.nan)
+    return cov, counts
+
+
+def window_covariance_tail(returns, window=DEFAULT_WINDOW, tail=1, min_periods=MIN_PERIODS):
+    """Come rolling_window_covariance ma solo per le ultime `tail` date
+
+    Ogni data è un prodotto matriciale sulla sua finestra (W × N): memoria tail × N × N
+    invece di T × N × N.
+    """
+    returns = np.asarray(returns, dtype=float)
+    n_days, n_assets = returns.shape
+    first = max(0, n_days - int(tail))
+    observed = (~np.isnan(returns)).astype(float)
+    clean = np.where(observed > 0, returns, 0.0)
+
+    covs = np.empty((n_days - first, n_assets, n_assets))
+    counts = np.empty((n_days - first, n_assets, n_assets), dtype=np.int64)
+    for k, t in enumerate(range(first, n_days)):
+        lo = max(0, t - int(window) + 1)
+        o, x = observed[lo:t + 1], clean[lo:t + 1]
+        pair_n = o.T @ o
+        sum_i = x.T @ o
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = (x.T @ x - sum_i * sum_i.T / pair_n) / (pair_n - 1)
+        counts[k] = np.rint(pair_n).astype(np.int64)
+        covs[k] = np.where(counts[k] >= max(min_periods, 2), cov, np.nan)
+    return covs, counts
+
+
+def covariance_to_correlation(cov):
+    """Correlazione da covarianza (ultimi due assi), NaN dove la varianza è nulla"""
+    cov = np.asarray(cov, dtype=float)
+    std = np.sqrt(np.clip(np.diagonal(cov, axis1=-2, axis2=-1), 0.0, None))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = cov / (std[..., :, None] * std[..., None, :])
+    return np.where(std[..., :, None] * std[..., None, :] > 0, np.clip(corr, -1.0, 1.0), np.nan)
+
+
+def _insert_matrices(conn, method, param, dates, symbols, covs, counts):
+    """Inserimento bulk delle coppie per ogni data (DataFrame registrato, nessuna lista Python)"""
+    import pandas as pd
+
+    n = len(symbols)
+    if not len(dates):
+        return 0
+    corr = covariance_to_correlation(covs)
+    sym = np.array(symbols, dtype=object)
+    rows = pd.DataFrame({
+        'date': np.repeat(np.array(dates, dtype='datetime64[D]'), n * n),
+        'symbol_a': np.tile(np.repeat(sym, n), len(dates)),
+        'symbol_b': np.tile(np.tile(sym, n), len(dates)),
+        'cov': covs.reshape(-1),
+        'corr': corr.reshape(-1),
+        'n_obs': counts.reshape(-1).astype(np.int32),
+    })
+    conn.register('covariance_rows', rows)
+    try:
+        conn.execute("""
+        INSERT INTO covariance_store
+        SELECT date::DATE, ?, ?, symbol_a, symbol_b,
+               CASE WHEN isnan(cov) THEN NULL ELSE cov END,
+               CASE WHEN isnan(corr) THEN NULL ELSE corr END,
+               n_obs
+        FROM covariance_rows
+        """, [method, float(param)])
+    finally:
+        conn.unregister('covariance_rows')
+    return len(dates)
+
+
+def _prune_tail(conn, method, param, keep_dates):
+    """Mantiene solo le ultime keep_dates date del metodo"""
+    conn.execute("""
+    DELETE FROM covariance_store
+    WHERE method = ? AND param = ? AND date < (
+        SELECT MIN(date) FROM (
+            SELECT DISTINCT date FROM covariance_store WHERE method = ? AND param = ?
+            ORDER BY date DESC LIMIT ?
+        )
+    )
+    """, [method, float(param), method, float(param), int(keep_dates)])
+
+
+def _stored_state(conn, method, param, symbols):
+    """Stato (cov, n_obs) all'ultima data salvata, None se assente o universo diverso"""
+    last = conn.execute("""
+    SELECT MAX(date) FROM covariance_store WHERE method = ? AND param = ?
+    """, [method, float(param)]).fetchone()[0]
+    if last is None:
+        return None
+
+    stored = {r[0] for r in conn.execute("""
+    SELECT DISTINCT symbol_a FROM covariance_store WHERE date = ? AND method = ? AND param = ?
+    """, [last, method, float(param)]).fetchall()}
+    if stored != set(symbols):
+        return None
+
+    return load_covariance(conn, method=method, param=param, as_of=last, symbols=symbols, min_periods=0)
+
+
+def update_covariance_store(conn, symbols=None, methods=DEFAULT_METHODS, rebuild=False, tail_dates=TAIL_DATES):
+    """Aggiorna lo store con le date nuove (incrementale) per ogni metodo
+
+    Righe scritte per metodo: al massimo tail_dates × N² (anche in ricostruzione).
+
+    Args:
+        conn: connessione DuckDB in scrittura
+        symbols: simboli da includere (default: universo senza benchmark)
+        methods: tuple (method, param) da mantenere
+        rebuild: se True cancella e ricalcola tutto
+        tail_dates: date conservate per metodo (l'ultima è lo stato EWMA)
+
+    Returns:
+        dict: "method_param" -> numero di date inserite
+    """
+    ensure_covariance_table(conn)
+    symbols = list(symbols) if symbols is not None else get_store_symbols()
+    present = _returns_symbols(conn, symbols)
+    inserted = {}
+
+    for method, param in methods:
+        if method not in ('ewma', 'window'):
+            raise ValueError(f"Metodo covarianza non supportato: {method}")
+        key = f'{method}_{param:g}'
+        state = None if rebuild else _stored_state(conn, method, param, present)
+        if state is None:
+            # Primo calcolo, rebuild o universo cambiato: ricostruzione (solo la coda viene salvata)
+            conn.execute("DELETE FROM covariance_store WHERE method = ? AND param = ?", [method, float(param)])
+        last = state['date'] if state is not None else None
+
+        if method == 'ewma':
+            # Ricorsione dallo stato salvato sui soli rendimenti nuovi
+            dates, _, returns = load_returns_matrix(conn, present, since=last, keep_all=True)
+            if not dates:
+                inserted[key] = 0
+                continue
+            covs, counts = ewma_covariance(
+                returns, lam=param, min_periods=1, tail=tail_dates,
+                state=(state['cov'], state['n_obs']) if state is not None else None,
+            )
+        else:
+            since = _nth_last_date(conn, present, int(param) + tail_dates - 1)
+            dates, _, returns = load_returns_matrix(conn, present, since=since, keep_all=True)
+            new_count = sum(1 for d in dates if last is None or d > last)
+            if not new_count:
+                inserted[key] = 0
+                continue
+            covs, counts = window_covariance_tail(returns, window=int(param), tail=min(new_count, tail_dates),
+                                                  min_periods=2)
+
+        kept = dates[len(dates) - len(covs):]
+        inserted[key] = _insert_matrices(conn, method, param, kept, present, covs, counts)
+        _prune_tail(conn, method, param, tail_dates)
+
+    return inserted
+
+
+def load_covariance(conn, method='ewma', param=None, as_of=None, symbols=None, min_periods=MIN_PERIODS):
+    """Legge la matrice N×N all'ultima data <= as_of
+
+    Le coppie con meno di min_periods osservazioni sono NaN.
+
+    Returns:
+        dict: date, symbols, cov, corr, n_obs (np.ndarray) oppure None se assente
+    """
+    if param is None:
+        param = DEFAULT_EWMA_LAMBDA if method == 'ewma' else DEFAULT_WINDOW
+
+    date_row = conn.execute("""
+    SELECT MAX(date) FROM covariance_store
+    WHERE method = ? AND param = ? AND (? IS NULL OR date <= ?)
+    """, [method, float(param), as_of, as_of]).fetchone()
+    if date_row is None or date_row[0] is None:
+        return None
+    cov_date = date_row[0]
+
+    rows = conn.execute("""
+    SELECT symbol_a, symbol_b, cov, corr, n_obs
+    FROM covariance_store
+    WHERE date = ? AND method = ? AND param = ?
+    ORDER BY symbol_a, symbol_b
+    """, [cov_date, method, float(param)]).fetchall()
+
+    stored = sorted({r[0] for r in rows})
+    order = [s for s in (symbols or stored) if s in stored]
+    index = {s: i for i, s in enumerate(order)}
+    n = len(order)
+
+    cov = np.full((n, n), np.nan)
+    corr = np.full((n, n), np.nan)
+    n_obs = np.zeros((n, n), dtype=np.int64)
+    for a, b, c, r, k in rows:
+        if a in index and b in index:
+            i, j = index[a], index[b]
+            cov[i, j] = np.nan if c is None else c
+            corr[i, j] = np.nan if r is None else r
+            n_obs[i, j] = k
+
+    insufficient = n_obs < min_periods
+    cov[insufficient] = np.nan
+    corr[insufficient] = np.nan
+
+    return {'date': cov_date, 'symbols': order, 'cov': cov, 'corr': corr, 'n_obs': n_obs}
+
+
+def risk_contributions(weights, cov):
+    """Contributo percentuale al rischio: w_i (Σw)_i / wᵀΣw (somma = 1)"""
+    weights = np.asarray(weights, dtype=float)
+    cov = np.nan_to_num(np.asarray(cov, dtype=float))
+    marginal = cov @ weights
+    total = float(weights @ marginal)
+    if total <= 0:
+        return np.zeros_like(weights)
+    return weights * marginal / total
+
+
+def risk_parity_weights(cov, budgets=None, tol=1e-10, max_iter=100):
+    """Pesi equal-risk-contribution (o budget di rischio) via Newton
+
+    Minimizza ½ yᵀΣy - Σ b_i ln y_i (y > 0); i pesi sono y normalizzato.
+    Fallback inverse-vol se Σ non è utilizzabile.
+    """
+    cov = np.nan_to_num(np.asarray(cov, dtype=float))
+    n = cov.shape[0]
+    if n == 0:
+        return np.zeros(0)
+    budgets = np.full(n, 1.0 / n) if budgets is None else np.asarray(budgets, dtype=float) / np.sum(budgets)
+
+    vol = np.sqrt(np.clip(np.diag(cov), 0.0, None))
+    if np.any(vol <= 0):
+        return np.full(n, 1.0 / n)
+
+    y = budgets / vol
+    for _ in range(max_iter):
+        grad = cov @ y - budgets / y
+        if np.max(np.abs(grad)) < tol:
+            break
+        hess = cov + np.diag(budgets / y ** 2)
+        try:
+            step = np.linalg.solve(hess, grad)
+        except np.linalg.LinAlgError:
+            break
+        # Backtracking per restare nel dominio y > 0
+        alpha = 1.0
+        while np.any(y - alpha * step <= 0) and alpha > 1e-8:
+            alpha *= 0.5
+        y = y - alpha * step
+
+    return y / y.sum()
+
+
+def annualized_vols(cov):
+    """Volatilità annualizzate dalla diagonale di una covarianza giornaliera"""
+    return np.sqrt(np.clip(np.diag(np.nan_to_num(cov)), 0.0, None) * TRADING_DAYS)
+
+
+if __name__ == '__main__':
+    import argparse
+    import duckdb
+    from utils.path_manager import get_path_manager
+
+    parser = argparse.ArgumentParser(description='Aggiorna covariance_store (incrementale)')
+    parser.add_argument('--rebuild', action='store_true', help='Ricalcola tutte le date')
+    args = parser.parse_args()
+
+    conn = duckdb.connect(str(get_path_manager().db_path))
+    try:
+        result = update_covariance_store(conn, rebuild=args.rebuild)
+        for key, count in result.items():
+            print(f"✅ covariance_store [{key}]: {count} date inserite")
+    finally:
+        conn.close()
@@ -2,6 +2,8 @@
 """
 Diversification Guardrails - ETF Italia Project v10
 P2.1: Cap correlazione media ponderata e diversification breaker
+
+Matrici di covarianza/correlazione lette da covariance_store (tutto l'universo)
 """
 
 import sys
@@ -15,6 +17,43 @@ from datetime import datetime
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.path_manager import get_path_manager
+from risk.covariance_store import (
+    CORRELATION_WINDOW,
+    annualized_vols,
+    load_covariance,
+    risk_contributions,
+    risk_parity_weights,
+    update_covariance_store,
+)
+
+
+def _portfolio_weights(conn, symbols):
+    """Pesi a valore di mercato delle posizioni aperte (equal weight se nessuna posizione)"""
+    rows = conn.execute("""
+    WITH positions AS (
+        SELECT symbol, SUM(CASE WHEN type = 'BUY' THEN qty ELSE -qty END) AS qty
+        FROM fiscal_ledger
+        WHERE type IN ('BUY', 'SELL') AND symbol IN (SELECT UNNEST(?::VARCHAR[]))
+        GROUP BY symbol
+        HAVING SUM(CASE WHEN type = 'BUY' THEN qty ELSE -qty END) > 0
+    ),
+    prices AS (
+        SELECT symbol, close
+        FROM market_data
+        WHERE symbol IN (SELECT symbol FROM positions)
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY date DESC) = 1
+    )
+    SELECT p.symbol, p.qty * pr.close
+    FROM positions p
+    JOIN prices pr ON p.symbol = pr.symbol
+    """, [list(symbols)]).fetchall()
+
+    values = dict(rows)
+    weights = np.array([float(values.get(s) or 0.0) for s in symbols])
+    if weights.sum() <= 0:
+        return np.full(len(symbols), 1.0 / len(symbols))
+    return weights / weights.sum()
+
 
 def calculate_diversification_metrics():
     """Calcola metriche di diversificazione e guardrails"""
@@ -27,102 +66,51 @@ def calculate_diversification_metrics():
     print("=" * 50)
     
     try:
-        # Test 1: Calcolo correlazione portfolio
+        # Test 1: Matrice correlazione universo (covariance_store, aggiornamento incrementale)
         print("1️⃣ Calcolo correlazione media ponderata...")
         
-        # Ottieni dati returns recenti per correlazione
-        returns_data = conn.execute("""
-        WITH daily_returns AS (
-            SELECT 
-                symbol,
-                date,
-                (close / LAG(close) OVER (PARTITION BY symbol ORDER BY date) - 1) as daily_return
-            FROM market_data 
-            WHERE symbol IN ('CSSPX.MI', 'XS2L.MI')
-            AND close IS NOT NULL
-        ),
-        filtered_returns AS (
-            SELECT symbol, date, daily_return
-            FROM daily_returns
-            WHERE daily_return IS NOT NULL
-            AND date >= CURRENT_DATE - INTERVAL '252 days'  -- Ultimo anno
-        )
-        SELECT 
-            symbol,
-            AVG(daily_return) as avg_return,
-            STDDEV(daily_return) as volatility,
-            COUNT(*) as days
-        FROM filtered_returns
-        GROUP BY symbol
-        """).fetchall()
+        update_covariance_store(conn)
+        store = load_covariance(conn, method='window', param=CORRELATION_WINDOW)
         
-        if len(returns_data) < 2:
+        if store is None or len(store['symbols']) < 2:
             print("   ⚠️ Dati insufficienti per calcolo correlazione")
             return False
         
-        # Calcolo correlazione matrice
-        correlation_matrix = conn.execute("""
-        WITH daily_returns AS (
-            SELECT 
-                symbol,
-                date,
-                (close / LAG(close) OVER (PARTITION BY symbol ORDER BY date) - 1) as daily_return
-            FROM market_data 
-            WHERE symbol IN ('CSSPX.MI', 'XS2L.MI')
-            AND close IS NOT NULL
-        ),
-        filtered_returns AS (
-            SELECT symbol, date, daily_return
-            FROM daily_returns
-            WHERE daily_return IS NOT NULL
-            AND date >= CURRENT_DATE - INTERVAL '252 days'  -- Ultimo anno
-        ),
-        pivot_returns AS (
-            SELECT 
-                date,
-                MAX(CASE WHEN symbol = 'CSSPX.MI' THEN daily_return END) as csspx_return,
-                MAX(CASE WHEN symbol = 'XS2L.MI' THEN daily_return END) as xs2l_return
-            FROM filtered_returns
-            GROUP BY date
-            HAVING csspx_return IS NOT NULL AND xs2l_return IS NOT NULL
-        )
-        SELECT 
-            CORR(csspx_return, xs2l_return) as correlation,
-            COUNT(*) as observations
-        FROM pivot_returns
-        """).fetchone()
-        
-        correlation, obs = correlation_matrix
-        print(f"   📊 Correlazione CSSPX-XS2L: {correlation:.4f} ({obs} osservazioni)")
-        
-        # Test 2: Calcolo contribution-to-risk
-        print("2️⃣ Calcolo contribution-to-risk...")
+        symbols = store['symbols']
+        cov = store['cov']
+        corr = store['corr']
+        valid = ~np.isnan(np.diag(cov))
+        symbols = [s for s, ok in zip(symbols, valid) if ok]
+        cov = np.nan_to_num(cov[np.ix_(valid, valid)])
+        corr = np.nan_to_num(corr[np.ix_(valid, valid)])
+        obs = int(store['n_obs'][np.ix_(valid, valid)].min()) if symbols else 0
         
-        # Simula pesi portfolio (es. 50/50)
-        weights = {'CSSPX.MI': 0.5, 'XS2L.MI': 0.5}
+        if len(symbols) < 2:
+            print("   ⚠️ Dati insufficienti per calcolo correlazione")
+            return False
         
-        # Ottieni volatilità individuali
-        volatilities = {}
-        for symbol, avg_ret, vol, days in returns_data:
-            volatilities[symbol] = vol
+        # Pesi portfolio: posizioni correnti, altrimenti equal weight sull'universo
+        weights_vec = _portfolio_weights(conn, symbols)
+        weights = {s: float(w) for s, w in zip(symbols, weights_vec)}
         
-        # Calcolo contribution-to-risk
-        total_portfolio_vol = 0
-        contributions = {}
+        # Correlazione media ponderata (coppie i != j, peso w_i·w_j)
+        pair_w = np.outer(weights_vec, weights_vec)
+        np.fill_diagonal(pair_w, 0.0)
+        correlation = float((pair_w * corr).sum() / pair_w.sum()) if pair_w.sum() > 0 else 0.0
         
-        for symbol, weight in weights.items():
-            if symbol in volatilities:
-                contribution = weight * volatilities[symbol]
-                contributions[symbol] = contribution
-                total_portfolio_vol += contribution
+        print(f"   📊 Correlazione media ponderata: {correlation:.4f} ({len(symbols)} simboli, {obs} osservazioni, {store['date']})")
+        
+        # Test 2: Calcolo contribution-to-risk (w_i (Σw)_i / wᵀΣw)
+        print("2️⃣ Calcolo contribution-to-risk...")
         
-        # Normalizza contributions
-        for symbol in contributions:
-            contributions[symbol] = contributions[symbol] / total_portfolio_vol if total_portfolio_vol > 0 else 0
+        volatilities = dict(zip(symbols, annualized_vols(cov).tolist()))
+        contributions = dict(zip(symbols, risk_contributions(weights_vec, cov).tolist()))
+        parity = dict(zip(symbols, risk_parity_weights(cov).tolist()))
         
         print(f"   📈 Contribution-to-risk:")
         for symbol, contrib in contributions.items():
-            print(f"      {symbol}: {contrib:.1%} (peso {weights[symbol]:.1%})")
+            if weights[symbol] > 0:
+                print(f"      {symbol}: {contrib:.1%} (peso {weights[symbol]:.1%}, risk parity {parity[symbol]:.1%})")
         
         # Test 3: Verifica diversification breaker
         print("3️⃣ Verifica diversification breaker...")
@@ -157,19 +145,25 @@ def calculate_diversification_metrics():
         # Test 4: Varianza spiegata
         print("4️⃣ Analisi varianza spiegata...")
         
-        # Calcolo varianza spiegata (semplificato)
-        if len(returns_data) == 2:
-            # Con 2 asset, la varianza spiegata dal primo asset è correlazione²
-            explained_variance = correlation ** 2
-            print(f"   📊 Varianza spiegata da CSSPX: {explained_variance:.1%}")
-            
-            if explained_variance > 0.5:  # 50% threshold
-                diversification_violations.append({
-                    'type': 'HIGH_VARIANCE_CONCENTRATION',
-                    'value': explained_variance,
-                    'threshold': 0.5,
-                    'description': f'Varianza spiegata {explained_variance:.1%} > 50%'
-                })
+        # R² di ogni asset spiegato dagli altri: 1 - 1/(C⁻¹)_ii (con 2 asset = correlazione²)
+        try:
+            inv_diag = np.diag(np.linalg.pinv(corr))
+            with np.errstate(divide='ignore'):
+                r_squared = np.nan_to_num(np.clip(1.0 - 1.0 / inv_diag, 0.0, 1.0))
+        except np.linalg.LinAlgError:
+            r_squared = np.zeros(len(symbols))
+        explained_idx = int(np.argmax(r_squared))
+        explained_variance = float(r_squared[explained_idx])
+        print(f"   📊 Varianza spiegata max ({symbols[explained_idx]}): {explained_variance:.1%}")
+        
+        if explained_variance > 0.5:  # 50% threshold
+            diversification_violations.append({
+                'type': 'HIGH_VARIANCE_CONCENTRATION',
+                'symbol': symbols[explained_idx],
+                'value': explained_variance,
+                'threshold': 0.5,
+                'description': f'Varianza spiegata {symbols[explained_idx]} {explained_variance:.1%} > 50%'
+            })
         
         # Test 5: Audit log
         print("5️⃣ Generazione audit log...")
@@ -178,12 +172,17 @@ def calculate_diversification_metrics():
             'timestamp': datetime.now().isoformat(),
             'test_p2_1_diversification_guardrails': {
                 'correlation_matrix': {
-                    'csspx_xs2l': correlation,
+                    'date': str(store['date']),
+                    'method': f'window_{CORRELATION_WINDOW}d',
+                    'symbols': symbols,
+                    'matrix': np.round(corr, 4).tolist(),
+                    'weighted_avg_correlation': correlation,
                     'observations': obs
                 },
                 'volatilities': volatilities,
                 'weights': weights,
                 'contribution_to_risk': contributions,
+                'risk_parity_weights': parity,
                 'guardrails': {
                     'correlation_threshold': CORRELATION_THRESHOLD,
                     'concentration_threshold': CONCENTRATION_THRESHOLD,
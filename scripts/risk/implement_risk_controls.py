@@ -16,6 +16,7 @@ from decimal import Decimal
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.path_manager import get_path_manager
+from utils.latest_prices import latest_price_map, latest_prices_source
 
 def load_config():
     """Carica configurazione universe"""
@@ -30,12 +31,13 @@ def calculate_current_weights(conn, portfolio_value):
         return {}
     
     # Positions value con prezzi correnti
-    positions_result = conn.execute("""
+    positions_result = conn.execute(f"""
         SELECT 
             fl.symbol,
             SUM(CASE WHEN type = 'BUY' THEN qty ELSE -qty END) as qty,
-            (SELECT close FROM market_data m WHERE m.symbol = fl.symbol ORDER BY date DESC LIMIT 1) as current_price
+            ANY_VALUE(lp.close) as current_price
         FROM fiscal_ledger fl
+        LEFT JOIN {latest_prices_source(conn)} lp ON lp.symbol = fl.symbol
         WHERE type IN ('BUY', 'SELL')
         GROUP BY fl.symbol
         HAVING SUM(CASE WHEN type = 'BUY' THEN qty ELSE -qty END) != 0
@@ -61,12 +63,13 @@ def calculate_portfolio_value(conn):
     cash = cash_result[0] or 0
     
     # Positions value
-    positions_result = conn.execute("""
+    positions_result = conn.execute(f"""
         SELECT 
             fl.symbol,
             SUM(CASE WHEN type = 'BUY' THEN qty ELSE -qty END) as qty,
-            (SELECT close FROM market_data m WHERE m.symbol = fl.symbol ORDER BY date DESC LIMIT 1) as current_price
+            ANY_VALUE(lp.close) as current_price
         FROM fiscal_ledger fl
+        LEFT JOIN {latest_prices_source(conn)} lp ON lp.symbol = fl.symbol
         WHERE type IN ('BUY', 'SELL')
         GROUP BY fl.symbol
         HAVING SUM(CASE WHEN type = 'BUY' THEN qty ELSE -qty END) != 0
@@ -179,7 +182,15 @@ def check_stop_loss_trailing_stop(config, symbol, current_price, positions_dict)
     return None, None
 
 def make_volatility_targeting_idempotent(conn, config):
-    """Rende volatility targeting idempotente"""
+    """Rende volatility targeting idempotente
+
+    L'overlay di enhanced_risk_management viene tolto prima del ricalcolo e
+    riapplicato dopo sui nuovi valori base: stessi tag, nessun doppio cap.
+    """
+    from risk.signal_overlay import clear_signal_overlay, refresh_signal_overlay
+
+    clear_signal_overlay(conn)
+
     # Reset risk_scalars a valori base prima di ricalcolare
     conn.execute("""
         UPDATE signals 
@@ -208,28 +219,27 @@ def make_volatility_targeting_idempotent(conn, config):
         WHERE s.symbol = rm.symbol 
         AND s.date = rm.date
     """, [risk_floor, target_vol, target_vol])
+
+    _, applied = refresh_signal_overlay(conn, config)
     
     print("   ✅ Volatility targeting resettato e ricalcolato (idempotente)")
+    print(f"   ✅ Signal overlay riapplicato: {applied['capped']} signals con cap")
 
 def integrate_diversification(conn, config):
     """Integra diversificazione operativa"""
     # Calcola pesi reali correnti
-    current_weights_query = """
-        SELECT 
-            fl.symbol,
-            SUM(CASE WHEN type = 'BUY' THEN qty ELSE -qty END) * 
-            (SELECT close FROM market_data m WHERE m.symbol = fl.symbol ORDER BY date DESC LIMIT 1) / 
-            (
-                SELECT SUM(
-                    CASE WHEN type = 'BUY' THEN qty ELSE -qty END * 
-                    (SELECT close FROM market_data m2 WHERE m2.symbol = fl2.symbol ORDER BY date DESC LIMIT 1)
-                )
-                FROM fiscal_ledger fl2
-                WHERE type IN ('BUY', 'SELL')
-            ) as weight
-        FROM fiscal_ledger fl
-        WHERE type IN ('BUY', 'SELL')
-        GROUP BY fl.symbol
+    current_weights_query = f"""
+        WITH position_values AS (
+            SELECT 
+                fl.symbol,
+                SUM(CASE WHEN type = 'BUY' THEN qty ELSE -qty END) * ANY_VALUE(lp.close) as market_value
+            FROM fiscal_ledger fl
+            LEFT JOIN {latest_prices_source(conn)} lp ON lp.symbol = fl.symbol
+            WHERE type IN ('BUY', 'SELL')
+            GROUP BY fl.symbol
+        )
+        SELECT symbol, market_value / SUM(market_value) OVER () as weight
+        FROM position_values
     """
     
     current_weights = conn.execute(current_weights_query).fetchall()
@@ -311,9 +321,7 @@ def test_risk_controls():
         # Test stop-loss su posizione corrente
         test_symbol = 'XS2L.MI'
         if test_symbol in positions_dict:
-            current_price = conn.execute("""
-                SELECT close FROM market_data WHERE symbol = ? ORDER BY date DESC LIMIT 1
-            """, [test_symbol]).fetchone()[0]
+            current_price = latest_price_map(conn, [test_symbol]).get(test_symbol)
             
             action, reason = check_stop_loss_trailing_stop(config, test_symbol, current_price, positions_dict)
             
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Portfolio Monte Carlo - ETF Italia Project v10
+Motore Monte Carlo vettoriale multi-asset per lo stress test del portafoglio attuale
+
+LOGICA:
+- Posizioni, ultimo prezzo e rendimenti caricati con 3 query (nessuna query nel loop);
+  con un MarketCube prezzi e rendimenti arrivano dagli array memory-mapped
+- Matrice di covarianza stimata dai daily_return di risk_metrics (finestra lookback)
+- Shock correlati via Cholesky, generati in batch (simulazioni × step × asset)
+- Rendimenti log-normali (GBM a drift zero): E[prezzo finale] = prezzo attuale
+- VaR/CVaR, percentili e drawdown di percorso calcolati in un solo passaggio
+"""
+
+import numpy as np
+
+TRADING_DAYS = 252
+
+# Percentili riportati nel report (valore finale portafoglio)
+REPORT_PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+
+def load_portfolio_inputs(conn, lookback_days=TRADING_DAYS, cube=None):
+    """Carica posizioni aperte, ultimo adj_close e matrice rendimenti (date × simboli)
+
+    Args:
+        cube: MarketCube opzionale (utils.market_cube); usato se contiene tutti i simboli
+
+    Returns:
+        dict: symbols, qty, prices (np.ndarray), returns (T × N, NaN se mancante)
+              oppure None se non ci sono posizioni
+    """
+    positions = conn.execute("""
+    SELECT
+        symbol,
+        SUM(CASE WHEN type = 'BUY' THEN qty ELSE -qty END) as qty
+    FROM fiscal_ledger
+    WHERE type IN ('BUY', 'SELL')
+    GROUP BY symbol
+    HAVING SUM(CASE WHEN type = 'BUY' THEN qty ELSE -qty END) != 0
+    ORDER BY symbol
+    """).fetchall()
+
+    if not positions:
+        return None
+
+    symbols = [p[0] for p in positions]
+    qty = np.array([float(p[1]) for p in positions])
+
+    if cube is not None and all(s in cube for s in symbols):
+        return _inputs_from_cube(cube, symbols, qty, lookback_days)
+
+    latest = dict(conn.execute("""
+    SELECT symbol, adj_close
+    FROM market_data
+    WHERE symbol IN (SELECT UNNEST(?::VARCHAR[])) AND adj_close IS NOT NULL
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY date DESC) = 1
+    """, [symbols]).fetchall())
+
+    keep = [i for i, s in enumerate(symbols) if latest.get(s) is not None]
+    symbols = [symbols[i] for i in keep]
+    qty = qty[keep]
+    prices = np.array([float(latest[s]) for s in symbols])
+
+    rows = conn.execute("""
+    SELECT date, symbol, daily_return
+    FROM risk_metrics
+    WHERE symbol IN (SELECT UNNEST(?::VARCHAR[])) AND daily_return IS NOT NULL
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY date DESC) <= ?
+    """, [symbols, int(lookback_days)]).fetchall()
+
+    returns = _pivot_returns(rows, symbols)
+
+    return {
+        'symbols': symbols,
+        'qty': qty,
+        'prices': prices,
+        'returns': returns,
+    }
+
+
+def _inputs_from_cube(cube, symbols, qty, lookback_days):
+    """Come load_portfolio_inputs, ma su array del market cube (nessuna query prezzi)"""
+    _, last_prices = cube.latest('adj_close', symbols)
+    keep = np.flatnonzero(~np.isnan(last_prices))
+    symbols = [symbols[i] for i in keep]
+
+    _, _, returns = cube.matrix('returns', symbols)
+    returns = np.array(returns)
+    # Ultimi lookback_days rendimenti validi per simbolo (come ROW_NUMBER per simbolo)
+    valid = ~np.isnan(returns)
+    from_end = np.cumsum(valid[::-1], axis=0)[::-1]
+    selected = valid & (from_end <= int(lookback_days))
+    returns = np.where(selected, returns, np.nan)[selected.any(axis=1)]
+
+    return {
+        'symbols': symbols,
+        'qty': qty[keep],
+        'prices': last_prices[keep],
+        'returns': returns,
+    }
+
+
+def _pivot_returns(rows, symbols):
+    """Pivot (date, symbol, return) → matrice T × N allineata per data (NaN dove mancante)"""
+    if not rows:
+        return np.empty((0, len(symbols)))
+
+    col_index = {s: j for j, s in enumerate(symbols)}
+    dates = np.array([r[0] for r in rows])
+    unique_dates, row_idx = np.unique(dates, return_inverse=True)
+    col_idx = np.array([col_index[r[1]] for r in rows])
+
+    matrix = np.full((len(unique_dates), len(symbols)), np.nan)
+    matrix[row_idx, col_idx] = np.array([float(r[2]) for r in rows])
+    return matrix
+
+
+def estimate_covariance(returns, min_obs=20):
+    """Covarianza giornaliera dei rendimenti (righe complete, fallback diagonale)
+
+    Args:
+        returns: matrice T × N di rendimenti giornalieri (NaN ammessi)
+        min_obs: osservazioni minime per stimare la covarianza piena
+
+    Returns:
+        np.ndarray: matrice N × N semidefinita positiva
+    """
+    returns = np.asarray(returns, dtype=float)
+    n_assets = returns.shape[1] if returns.ndim == 2 else 0
+    if n_assets == 0:
+        return np.zeros((0, 0))
+
+    complete = returns[~np.isnan(returns).any(axis=1)]
+    if len(complete) >= max(min_obs, 2):
+        cov = np.cov(complete, rowvar=False, ddof=1).reshape(n_assets, n_assets)
+    else:
+        # Storico congiunto insufficiente: solo varianze per asset (nessuna correlazione)
+        var = np.array([
+            np.nanvar(returns[:, j], ddof=1) if np.sum(~np.isnan(returns[:, j])) > 1 else 0.0
+            for j in range(n_assets)
+        ])
+        cov = np.diag(var)
+
+    return np.nan_to_num(cov)
+
+
+def cholesky_factor(cov):
+    """Fattore di Cholesky robusto (jitter diagonale, fallback autovalori)"""
+    n = cov.shape[0]
+    if n == 0:
+        return cov
+    scale = max(float(np.max(np.diag(cov))), 1e-12)
+    for jitter in (0.0, 1e-12, 1e-10, 1e-8):
+        try:
+            return np.linalg.cholesky(cov + np.eye(n) * jitter * scale)
+        except np.linalg.LinAlgError:
+            continue
+    # Matrice non definita positiva (es. asset costanti): proiezione sugli autovalori >= 0
+    eigval, eigvec = np.linalg.eigh(cov)
+    return eigvec * np.sqrt(np.clip(eigval, 0.0, None))
+
+
+def simulate_portfolio_values(prices, qty, cov, num_simulations=10000, time_horizon_days=TRADING_DAYS,
+                              path_steps=12, seed=None, batch_size=50000):
+    """Simula valori finali e drawdown di percorso del portafoglio
+
+    Args:
+        prices: prezzi correnti (N)
+        qty: quantità per asset (N)
+        cov: covarianza giornaliera dei rendimenti (N × N)
+        path_steps: step intermedi per il drawdown di percorso (1 = solo valore finale)
+        seed: seed per riproducibilità
+        batch_size: simulazioni per batch (limita la memoria)
+
+    Returns:
+        tuple: (valori finali (S), max drawdown di percorso (S))
+    """
+    prices = np.asarray(prices, dtype=float)
+    qty = np.asarray(qty, dtype=float)
+    rng = np.random.default_rng(seed)
+    steps = max(1, int(path_steps))
+    dt = time_horizon_days / steps
+
+    # Log-rendimenti per step: N(-0.5 σ² dt, Σ dt)
+    chol = cholesky_factor(np.asarray(cov, dtype=float) * dt)
+    drift = -0.5 * np.diag(cov) * dt
+    holdings = qty * prices
+
+    final_values = np.empty(num_simulations)
+    path_max_dd = np.empty(num_simulations)
+    start_value = holdings.sum()
+
+    for start in range(0, num_simulations, batch_size):
+        n = min(batch_size, num_simulations - start)
+        shocks = rng.standard_normal((n, steps, len(prices))) @ chol.T + drift
+        growth = np.exp(np.cumsum(shocks, axis=1))
+        values = growth @ holdings  # (n, steps)
+
+        running_peak = np.maximum.accumulate(np.maximum(values, start_value), axis=1)
+        drawdowns = 1.0 - values / running_peak
+
+        final_values[start:start + n] = values[:, -1]
+        path_max_dd[start:start + n] = drawdowns.max(axis=1)
+
+    return final_values, path_max_dd
+
+
+def summarize_simulations(current_value, final_values, path_max_dd=None, confidence=0.95):
+    """VaR/CVaR, percentili e statistiche di sintesi in un solo passaggio"""
+    final_values = np.asarray(final_values, dtype=float)
+    ordered = np.sort(final_values)
+    n = len(ordered)
+
+    def _tail(conf):
+        k = max(1, int(np.floor(n * (1.0 - conf))))
+        var_threshold = np.percentile(final_values, (1.0 - conf) * 100)
+        return current_value - var_threshold, current_value - ordered[:k].mean()
+
+    var_95, cvar_95 = _tail(confidence)
+    var_99, cvar_99 = _tail(0.99)
+    percentiles = np.percentile(final_values, REPORT_PERCENTILES)
+    mean_value = float(final_values.mean())
+
+    stats = {
+        'current_portfolio_value': float(current_value),
+        'mean_final_value': mean_value,
+        'std_final_value': float(final_values.std()),
+        'percentile_5': float(percentiles[REPORT_PERCENTILES.index(5)]),
+        'percentile_95': float(percentiles[REPORT_PERCENTILES.index(95)]),
+        'percentiles': {f"p{p}": float(v) for p, v in zip(REPORT_PERCENTILES, percentiles)},
+        'worst_case': float(ordered[0]),
+        'best_case': float(ordered[-1]),
+        'var_95': float(var_95),
+        'cvar_95': float(cvar_95),
+        'var_99': float(var_99),
+        'cvar_99': float(cvar_99),
+        'max_drawdown_estimate': float((current_value - ordered[0]) / current_value) if current_value else 0.0,
+        'volatility_estimate': float(final_values.std() / mean_value) if mean_value else 0.0,
+    }
+
+    if path_max_dd is not None and len(path_max_dd):
+        stats['path_max_dd_p50'] = float(np.percentile(path_max_dd, 50))
+        stats['path_max_dd_p95'] = float(np.percentile(path_max_dd, 95))
+
+    return stats
+
+
+def run_portfolio_monte_carlo(conn, num_simulations=10000, time_horizon_days=TRADING_DAYS,
+                              lookback_days=TRADING_DAYS, path_steps=12, seed=None, cube=None):
+    """Pipeline completa: carica input, stima covarianza, simula, riassume
+
+    Returns:
+        dict: statistiche (None se non ci sono posizioni valorizzabili)
+    """
+    inputs = load_portfolio_inputs(conn, lookback_days=lookback_days, cube=cube)
+    if inputs is None or not inputs['symbols']:
+        return None
+
+    cov = estimate_covariance(inputs['returns'])
+    final_values, path_max_dd = simulate_portfolio_values(
+        inputs['prices'], inputs['qty'], cov,
+        num_simulations=num_simulations,
+        time_horizon_days=time_horizon_days,
+        path_steps=path_steps,
+        seed=seed,
+    )
+
+    current_value = float(np.dot(inputs['qty'], inputs['prices']))
+    stats = summarize_simulations(current_value, final_values, path_max_dd)
+
+    vol = np.sqrt(np.clip(np.diag(cov), 0.0, None))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = cov / np.outer(vol, vol)
+    corr = np.nan_to_num(corr)
+    np.fill_diagonal(corr, 1.0)
+
+    stats.update({
+        'num_simulations': int(num_simulations),
+        'time_horizon_days': int(time_horizon_days),
+        'positions_analyzed': len(inputs['symbols']),
+        'symbols': inputs['symbols'],
+        'annualized_vol_by_symbol': {s: float(v * np.sqrt(TRADING_DAYS)) for s, v in zip(inputs['symbols'], vol)},
+        'correlation_matrix': corr.round(4).tolist(),
+        'return_observations': int(inputs['returns'].shape[0]),
+    })
+    return stats
+
+
+def print_stress_summary(stats):
+    """Stampa sintesi stress test"""
+    print(f"💰 Current Portfolio Value: €{stats['current_portfolio_value']:,.2f}")
+    print(f"📊 Expected Final Value: €{stats['mean_final_value']:,.2f}")
+    print(f"⚠️  5th Percentile: €{stats['percentile_5']:,.2f}")
+    print(f"📈 95th Percentile: €{stats['percentile_95']:,.2f}")
+    print(f"🔻 Worst Case: €{stats['worst_case']:,.2f}")
+    print(f"📉 VaR 95%: €{stats['var_95']:,.2f}")
+    print(f"⚡ CVaR 95%: €{stats['cvar_95']:,.2f}")
+    print(f"📉 Max DD Estimate: {stats['max_drawdown_estimate']:.1%}")
+    if 'path_max_dd_p95' in stats:
+        print(f"📉 Path Max DD (95° pct): {stats['path_max_dd_p95']:.1%}")
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Signal Overlay - ETF Italia Project v10
+Aggiustamenti post-processing dei signals calcolati in batch e applicati con un solo UPDATE
+
+LOGICA:
+- Una query con finestre per simbolo su tutto lo storico (non solo MAX(date)) →
+  DataFrame (date, symbol) con tutti gli aggiustamenti di enhanced_risk_management:
+  - aggressive vol: volatility_20d oltre warning/critical → cap dello scalar (config)
+  - zombie price: 3 sedute stesso prezzo con volume 0 negli ultimi 30 giorni → cap 0
+  - volatilità sintetica: >50% sedute a volume 0 negli ultimi 10 giorni → override
+    di volatility_20d/drawdown_pct (nell'overlay, la vista risk_metrics non si tocca)
+  - drawdown guard: drawdown_pct < -10% / -15% → cap 0.2 / 0.0
+- Tabella signal_overlay: aggiustamenti + valori base del signal (risk_scalar,
+  explain_code) prima dell'overlay
+- apply_signal_overlay() in una transazione: ripristino dei valori base dell'overlay
+  precedente (solo righe ancora con il valore applicato: i signals ricalcolati da
+  compute_signals restano), nuova tabella, UPDATE signals ... FROM signal_overlay.
+  Rieseguire è idempotente, una condizione rientrata torna al valore base
+- strategy_engine_v2 legge la volatilità effettiva con LEFT JOIN signal_overlay
+"""
+
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+OVERLAY_TABLE = 'signal_overlay'
+
+# Simboli soggetti ai guardrail (storicamente cablati in enhanced_risk_management)
+DEFAULT_OVERLAY_SYMBOLS = ('CSSPX.MI', 'XS2L.MI')
+DEFAULT_DD_GUARD_SYMBOLS = ('XS2L.MI',)
+
+DEFAULTS = {
+    'volatility_warning': 0.15,
+    'volatility_critical': 0.20,
+    'aggressive_scalar_warning': 0.3,
+    'aggressive_scalar_critical': 0.1,
+    'synthetic_volatility_zombie': 0.25,
+    'zombie_price_detection': True,
+    'dd_guard_warning': -0.10,
+    'dd_guard_critical': -0.15,
+    'dd_guard_scalar_warning': 0.2,
+    'dd_guard_scalar_critical': 0.0,
+}
+
+ZOMBIE_WINDOW_DAYS = 30
+SYNTHETIC_WINDOW_DAYS = 10
+SYNTHETIC_ZERO_VOLUME_SHARE = 0.5
+SYNTHETIC_DRAWDOWN_FLOOR = -0.05
+
+# Parametri: simboli (lista), volatilità sintetica zombie
+OVERLAY_INPUTS_QUERY = f"""
+WITH base AS (
+    SELECT
+        md.symbol,
+        md.date,
+        md.adj_close,
+        md.volume,
+        rm.volatility_20d,
+        rm.drawdown_pct,
+        LAG(md.adj_close, 1) OVER w AS prev1_close,
+        LAG(md.adj_close, 2) OVER w AS prev2_close,
+        LAG(md.adj_close, 3) OVER w AS prev3_close,
+        LAG(md.volume, 1) OVER w AS prev1_volume,
+        LAG(md.volume, 2) OVER w AS prev2_volume
+    FROM market_data md
+    LEFT JOIN risk_metrics rm ON rm.symbol = md.symbol AND rm.date = md.date
+    WHERE list_contains(?::VARCHAR[], md.symbol)
+    WINDOW w AS (PARTITION BY md.symbol ORDER BY md.date)
+),
+flags AS (
+    SELECT
+        *,
+        COALESCE(adj_close = prev1_close AND prev1_close = prev2_close AND prev2_close = prev3_close
+                 AND volume = 0, FALSE) AS zombie_3d,
+        CASE WHEN volume = 0 AND prev1_volume = 0 AND prev2_volume = 0 THEN ? ELSE volatility_20d END AS adjusted_vol
+    FROM base
+),
+windows AS (
+    SELECT
+        symbol,
+        date,
+        volatility_20d,
+        drawdown_pct,
+        BOOL_OR(zombie_3d) OVER (
+            PARTITION BY symbol ORDER BY date
+            RANGE BETWEEN INTERVAL {ZOMBIE_WINDOW_DAYS} DAYS PRECEDING AND CURRENT ROW
+        ) AS zombie_guard,
+        AVG(CASE WHEN volume = 0 THEN 1.0 ELSE 0.0 END) OVER w10 AS zero_volume_share,
+        AVG(adjusted_vol) OVER w10 AS synthetic_vol
+    FROM flags
+    WINDOW w10 AS (
+        PARTITION BY symbol ORDER BY date
+        RANGE BETWEEN INTERVAL {SYNTHETIC_WINDOW_DAYS} DAYS PRECEDING AND CURRENT ROW
+    )
+)
+SELECT s.date, s.symbol, w.volatility_20d, w.drawdown_pct, w.zombie_guard, w.zero_volume_share, w.synthetic_vol
+FROM signals s
+JOIN windows w ON w.symbol = s.symbol AND w.date = s.date
+ORDER BY s.date, s.symbol
+"""
+
+OVERLAY_COLUMNS = [
+    'date', 'symbol', 'risk_scalar_cap', 'volatility_override', 'drawdown_override',
+    'explain_prefix', 'explain_suffix', 'overlay_code',
+]
+
+
+def overlay_params(config):
+    """Soglie dell'overlay da config['risk_management'] (default = valori storici)"""
+    rm_cfg = (config or {}).get('risk_management', {})
+    params = {k: rm_cfg.get(k, v) for k, v in DEFAULTS.items()}
+    params['symbols'] = list(rm_cfg.get('overlay_symbols', DEFAULT_OVERLAY_SYMBOLS))
+    params['dd_guard_symbols'] = list(rm_cfg.get('dd_guard_symbols', DEFAULT_DD_GUARD_SYMBOLS))
+    return params
+
+
+def _empty_overlay():
+    return pd.DataFrame({c: pd.Series(dtype='object') for c in OVERLAY_COLUMNS})
+
+
+def compute_signal_overlay(conn, config=None):
+    """DataFrame degli aggiustamenti per (date, symbol) su tutto lo storico dei signals
+
+    Colonne: risk_scalar_cap (NULL = nessun cap), volatility_override, drawdown_override,
+    explain_prefix/explain_suffix (tag attorno all'explain_code base), overlay_code (audit).
+    Solo righe con almeno un aggiustamento.
+    """
+    params = overlay_params(config)
+    symbols = sorted(set(params['symbols']) | set(params['dd_guard_symbols']))
+    if not symbols:
+        return _empty_overlay()
+
+    df = conn.execute(OVERLAY_INPUTS_QUERY, [symbols, params['synthetic_volatility_zombie']]).fetchdf()
+    if df.empty:
+        return _empty_overlay()
+
+    vol = df['volatility_20d'].to_numpy(dtype=float, na_value=np.nan)
+    dd = df['drawdown_pct'].to_numpy(dtype=float, na_value=np.nan)
+    in_scope = df['symbol'].isin(params['symbols']).to_numpy()
+    in_dd_scope = df['symbol'].isin(params['dd_guard_symbols']).to_numpy()
+
+    # 1. Aggressive volatility (NaN = regime NORMAL)
+    vol_critical = in_scope & (vol > params['volatility_critical'])
+    vol_warning = in_scope & ~vol_critical & (vol > params['volatility_warning'])
+    aggressive_cap = np.select([vol_critical, vol_warning],
+                               [params['aggressive_scalar_critical'], params['aggressive_scalar_warning']], np.nan)
+
+    # 2. Zombie price guard
+    zombie = in_scope & df['zombie_guard'].fillna(False).to_numpy(dtype=bool)
+    if not params['zombie_price_detection']:
+        zombie[:] = False
+    zombie_cap = np.where(zombie, 0.0, np.nan)
+
+    # 3. Volatilità sintetica (override, nessun cap)
+    synthetic = in_scope & (df['zero_volume_share'].to_numpy(dtype=float, na_value=0.0) > SYNTHETIC_ZERO_VOLUME_SHARE)
+    synthetic_vol = df['synthetic_vol'].to_numpy(dtype=float, na_value=np.nan)
+    volatility_override = np.where(synthetic, synthetic_vol, np.nan)
+    drawdown_override = np.where(synthetic, np.fmin(dd, SYNTHETIC_DRAWDOWN_FLOOR), np.nan)
+
+    # 4. Drawdown guard
+    dd_critical = in_dd_scope & (dd < params['dd_guard_critical'])
+    dd_warning = in_dd_scope & ~dd_critical & (dd < params['dd_guard_warning'])
+    dd_cap = np.select([dd_critical, dd_warning],
+                       [params['dd_guard_scalar_critical'], params['dd_guard_scalar_warning']], np.nan)
+
+    # Cap più restrittivo (fmin ignora i NaN: NaN solo se nessun guardrail è attivo)
+    risk_scalar_cap = np.fmin.reduce(np.vstack([aggressive_cap, zombie_cap, dd_cap]), axis=0)
+    capped = ~np.isnan(risk_scalar_cap)
+
+    root = df['symbol'].str.split('.').str[0].str.upper()
+    dd_tag = pd.Series(np.select([dd_critical, dd_warning], ['CRITICAL', 'WARNING'], ''), index=df.index)
+    dd_suffix = ('_' + root + '_' + dd_tag + '_DD_GUARD').where(dd_tag != '', '')
+    explain_suffix = pd.Series(np.where(vol_critical | vol_warning, '_AGGRESSIVE_VOL', ''), index=df.index) + dd_suffix
+    explain_prefix = pd.Series(np.where(zombie, 'ZOMBIE_PRICE_GUARD_', ''), index=df.index)
+
+    vol_tag = pd.Series(np.select([vol_critical, vol_warning], ['AGGRESSIVE_VOL_CRITICAL', 'AGGRESSIVE_VOL_WARNING'], ''),
+                        index=df.index)
+    codes = pd.concat([
+        vol_tag,
+        pd.Series(np.where(zombie, 'ZOMBIE_PRICE_GUARD', ''), index=df.index),
+        pd.Series(np.where(synthetic, 'SYNTHETIC_VOL', ''), index=df.index),
+        ('DD_GUARD_' + dd_tag).where(dd_tag != '', ''),
+    ], axis=1)
+    overlay_code = codes.apply(lambda r: '|'.join(c for c in r if c), axis=1)
+
+    overlay = pd.DataFrame({
+        'date': df['date'],
+        'symbol': df['symbol'],
+        'risk_scalar_cap': risk_scalar_cap,
+        'volatility_override': volatility_override,
+        'drawdown_override': drawdown_override,
+        'explain_prefix': explain_prefix,
+        'explain_suffix': explain_suffix,
+        'overlay_code': overlay_code,
+    })
+    active = capped | synthetic
+    return overlay[active].reset_index(drop=True)
+
+
+def ensure_overlay_table(conn):
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {OVERLAY_TABLE} (
+        date DATE NOT NULL,
+        symbol VARCHAR NOT NULL,
+        risk_scalar_cap DOUBLE,
+        volatility_override DOUBLE,
+        drawdown_override DOUBLE,
+        explain_prefix VARCHAR,
+        explain_suffix VARCHAR,
+        overlay_code VARCHAR,
+        base_risk_scalar DOUBLE,
+        base_explain_code VARCHAR,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+
+# Righe dei signals che portano ancora il valore applicato dall'overlay
+_APPLIED_MATCH = """
+s.date = o.date AND s.symbol = o.symbol
+AND o.risk_scalar_cap IS NOT NULL
+AND s.risk_scalar IS NOT DISTINCT FROM LEAST(o.base_risk_scalar, o.risk_scalar_cap)
+AND s.explain_code IS NOT DISTINCT FROM o.explain_prefix || COALESCE(o.base_explain_code, '') || o.explain_suffix
+"""
+
+
+def _restore_base(conn):
+    conn.execute(f"""
+    UPDATE signals s
+    SET risk_scalar = o.base_risk_scalar,
+        explain_code = o.base_explain_code
+    FROM {OVERLAY_TABLE} o
+    WHERE {_APPLIED_MATCH}
+    """)
+
+
+def apply_signal_overlay(conn, overlay):
+    """Sostituisce l'overlay corrente con quello dato (DataFrame di compute_signal_overlay)
+
+    Tre statement set-based in una transazione: ripristino base, nuova tabella, UPDATE.
+
+    Returns:
+        dict: rows (righe overlay), capped (signals con scalar/explain modificati)
+    """
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        ensure_overlay_table(conn)
+        _restore_base(conn)
+
+        conn.register('overlay_new', overlay[OVERLAY_COLUMNS] if len(overlay) else _empty_overlay())
+        conn.execute(f"DELETE FROM {OVERLAY_TABLE}")
+        conn.execute(f"""
+        INSERT INTO {OVERLAY_TABLE} (date, symbol, risk_scalar_cap, volatility_override, drawdown_override,
+                                     explain_prefix, explain_suffix, overlay_code, base_risk_scalar, base_explain_code)
+        SELECT n.date::DATE, n.symbol, n.risk_scalar_cap::DOUBLE, n.volatility_override::DOUBLE,
+               n.drawdown_override::DOUBLE, n.explain_prefix, n.explain_suffix, n.overlay_code,
+               s.risk_scalar, s.explain_code
+        FROM overlay_new n
+        JOIN signals s ON s.date = n.date::DATE AND s.symbol = n.symbol
+        """)
+        conn.unregister('overlay_new')
+
+        conn.execute(f"""
+        UPDATE signals s
+        SET risk_scalar = LEAST(o.base_risk_scalar, o.risk_scalar_cap),
+            explain_code = o.explain_prefix || COALESCE(o.base_explain_code, '') || o.explain_suffix
+        FROM {OVERLAY_TABLE} o
+        WHERE s.date = o.date AND s.symbol = o.symbol AND o.risk_scalar_cap IS NOT NULL
+        """)
+        rows, capped = conn.execute(f"""
+        SELECT COUNT(*), COUNT(*) FILTER (WHERE risk_scalar_cap IS NOT NULL) FROM {OVERLAY_TABLE}
+        """).fetchone()
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return {'rows': int(rows), 'capped': int(capped)}
+
+
+def clear_signal_overlay(conn):
+    """Riporta i signals ai valori base e svuota l'overlay"""
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        ensure_overlay_table(conn)
+        _restore_base(conn)
+        conn.execute(f"DELETE FROM {OVERLAY_TABLE}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def refresh_signal_overlay(conn, config=None):
+    """Ricalcola e applica l'overlay (restituisce DataFrame overlay e conteggi)"""
+    overlay = compute_signal_overlay(conn, config)
+    return overlay, apply_signal_overlay(conn, overlay)
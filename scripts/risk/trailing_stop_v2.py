@@ -118,6 +118,168 @@ def update_position_peak(conn, symbol: str, current_price: float, current_date:
         )
 
 
+class PositionPeakTracker:
+    """Peak per posizione aperta mantenuto come running max (update O(1) per barra).
+
+    - Chiave: simbolo + entry_date della posizione (come get_current_positions)
+    - Seed una sola volta per posizione: MAX(close) da entry_date con una query
+      batch per tutte le posizioni nuove (più il peak attivo in position_peaks
+      se persist=True)
+    - Ogni barra successiva aggiorna il massimo in memoria senza query
+    - persist=True (produzione) scrive in position_peaks solo i peak cambiati
+
+    Nota: il running max avanza solo sulle barre osservate; nel backtest il
+    motore osserva tutte le posizioni ad ogni data di segnale.
+    """
+
+    def __init__(self, conn=None, persist: bool = False):
+        self.conn = conn
+        self.persist = persist
+        self._peaks = {}
+        self._dirty = set()
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._peaks
+
+    def get(self, symbol: str):
+        """Stato corrente del peak (dict) o None"""
+        return self._peaks.get(symbol)
+
+    def peak_price(self, symbol: str):
+        state = self._peaks.get(symbol)
+        return state["peak_price"] if state else None
+
+    def seed(self, positions: dict, as_of: date):
+        """Inizializza i peak delle posizioni non ancora tracciate.
+
+        Args:
+            positions: {symbol: {'entry_date', 'entry_price', ...}}
+            as_of: data corrente (inclusa nel MAX(close))
+        """
+        missing = [
+            symbol for symbol, pos in positions.items()
+            if symbol not in self._peaks or self._peaks[symbol]["entry_date"] != pos["entry_date"]
+        ]
+        if not missing:
+            return
+
+        market_peaks = {}
+        stored_peaks = {}
+        if self.conn is not None:
+            rows = self.conn.execute(
+                """
+                WITH p AS (
+                    SELECT UNNEST(?::VARCHAR[]) AS symbol, UNNEST(?::DATE[]) AS entry_date
+                )
+                SELECT p.symbol, m.close, m.date
+                FROM p
+                JOIN market_data m ON m.symbol = p.symbol AND m.date BETWEEN p.entry_date AND ?
+                WHERE m.close IS NOT NULL AND m.close > 0
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY p.symbol ORDER BY m.close DESC, m.date) = 1
+                """,
+                [missing, [positions[s]["entry_date"] for s in missing], as_of],
+            ).fetchall()
+            market_peaks = {symbol: (float(close), peak_date) for symbol, close, peak_date in rows}
+
+            if self.persist:
+                create_position_peaks_table(self.conn)
+                rows = self.conn.execute(
+                    """
+                    SELECT symbol, entry_date, peak_price, peak_date
+                    FROM position_peaks
+                    WHERE is_active = TRUE AND symbol IN (SELECT UNNEST(?::VARCHAR[]))
+                    """,
+                    [missing],
+                ).fetchall()
+                stored_peaks = {
+                    symbol: (float(peak), peak_date, entry_date)
+                    for symbol, entry_date, peak, peak_date in rows if peak is not None
+                }
+
+        for symbol in missing:
+            pos = positions[symbol]
+            peak_price, peak_date = market_peaks.get(symbol, (None, None))
+            stored = stored_peaks.get(symbol)
+            in_store = stored is not None and stored[2] == pos["entry_date"]
+            if in_store and (peak_price is None or stored[0] > peak_price):
+                peak_price, peak_date = stored[0], stored[1]
+
+            self._peaks[symbol] = {
+                "entry_date": pos["entry_date"],
+                "entry_price": float(pos["entry_price"]) if pos.get("entry_price") else None,
+                "peak_price": peak_price,
+                "peak_date": peak_date,
+                "stored": in_store,
+            }
+            if self.persist:
+                self._dirty.add(symbol)
+
+    def update(self, symbol: str, price: float, current_date: date):
+        """Aggiorna il running max con il prezzo della barra (O(1))"""
+        state = self._peaks.get(symbol)
+        if state is None or price is None:
+            return None
+        if state["peak_price"] is None or price > state["peak_price"]:
+            state["peak_price"] = float(price)
+            state["peak_date"] = current_date
+            if self.persist:
+                self._dirty.add(symbol)
+        return state["peak_price"]
+
+    def prune(self, open_symbols):
+        """Rimuove le posizioni chiuse (il peak riparte da zero alla riapertura)"""
+        for symbol in set(self._peaks) - set(open_symbols):
+            del self._peaks[symbol]
+            self._dirty.discard(symbol)
+
+    def observe(self, positions: dict, prices: dict, current_date: date):
+        """Seed delle posizioni nuove, prune delle chiuse e update della barra corrente"""
+        self.prune(positions.keys())
+        self.seed(positions, current_date)
+        for symbol in positions:
+            self.update(symbol, prices.get(symbol), current_date)
+        if self.persist:
+            self.flush()
+
+    def flush(self):
+        """Scrive in position_peaks i peak cambiati (solo persist=True)"""
+        if not self.persist or self.conn is None or not self._dirty:
+            return
+        create_position_peaks_table(self.conn)
+
+        for symbol in sorted(self._dirty):
+            state = self._peaks[symbol]
+            if state["peak_price"] is None:
+                continue
+            if state["stored"]:
+                self.conn.execute(
+                    """
+                    UPDATE position_peaks
+                    SET peak_price = ?, peak_date = ?
+                    WHERE symbol = ? AND entry_date = ? AND is_active = TRUE
+                    """,
+                    [state["peak_price"], state["peak_date"], symbol, state["entry_date"]],
+                )
+            else:
+                # Nuova posizione: disattiva eventuali peak precedenti del simbolo
+                self.conn.execute(
+                    "UPDATE position_peaks SET is_active = FALSE WHERE symbol = ? AND is_active = TRUE",
+                    [symbol],
+                )
+                entry_price = state["entry_price"] or state["peak_price"]
+                self.conn.execute(
+                    """
+                    INSERT INTO position_peaks (symbol, entry_date, entry_price, peak_price, peak_date, is_active)
+                    VALUES (?, ?, ?, ?, ?, TRUE)
+                    """,
+                    [symbol, state["entry_date"], entry_price,
+                     max(entry_price, state["peak_price"]),
+                     state["peak_date"] if state["peak_price"] >= entry_price else state["entry_date"]],
+                )
+                state["stored"] = True
+        self._dirty.clear()
+
+
 def check_trailing_stop_v2(conn, config: dict, symbol: str, current_price: float):
     rm = (config or {}).get("risk_management", {})
     cfg = rm.get("trailing_stop_v2", {})
@@ -150,37 +312,90 @@ def check_trailing_stop_v2(conn, config: dict, symbol: str, current_price: float
     return None, None
 
 
-def sync_position_peaks_from_ledger(conn):
-    """Crea/aggiorna position_peaks per posizioni aperte (net_qty > 0)."""
-    create_position_peaks_table(conn)
+def sync_position_peaks_from_ledger(conn, run_type: str = None):
+    """Ricostruisce position_peaks per le posizioni aperte (net_qty > 0) con una query.
 
-    open_positions = conn.execute(
-        """
-        SELECT
-            symbol,
-            SUM(CASE WHEN type = 'BUY' THEN qty ELSE -qty END) AS net_qty,
-            MIN(CASE WHEN type = 'BUY' THEN date ELSE NULL END) AS entry_date,
-            AVG(CASE WHEN type = 'BUY' THEN price ELSE NULL END) AS entry_price
-        FROM fiscal_ledger
-        WHERE type IN ('BUY', 'SELL')
-        GROUP BY symbol
-        HAVING net_qty > 0
-        """
-    ).fetchall()
+    Peak = massimo tra entry_price, MAX(close) da entry_date e peak attivo già
+    salvato per la stessa entry_date. Le posizioni chiuse vengono disattivate.
+    """
+    create_position_peaks_table(conn)
 
-    for symbol, net_qty, entry_date, entry_price in open_positions:
-        if entry_date is None or entry_price is None:
-            continue
-        if _get_active_peak(conn, symbol) is None:
-            initialize_position_peak(conn, symbol, entry_date, float(entry_price))
+    run_filter = "AND run_type = ?" if run_type else ""
+    params = [run_type] if run_type else []
 
-    # Disattiva peaks per simboli senza posizione
-    active_symbols = {row[0] for row in open_positions}
     conn.execute(
-        """
-        UPDATE position_peaks
-        SET is_active = FALSE
-        WHERE is_active = TRUE
-          AND symbol NOT IN (SELECT DISTINCT symbol FROM fiscal_ledger WHERE type IN ('BUY','SELL'))
-        """
+        f"""
+        CREATE OR REPLACE TEMP TABLE _position_peaks_rebuild AS
+        WITH positions AS (
+            SELECT
+                symbol,
+                SUM(CASE WHEN type = 'BUY' THEN qty ELSE -qty END) AS net_qty,
+                MIN(CASE WHEN type = 'BUY' THEN date ELSE NULL END) AS entry_date,
+                AVG(CASE WHEN type = 'BUY' THEN price ELSE NULL END) AS entry_price
+            FROM fiscal_ledger
+            WHERE type IN ('BUY', 'SELL') {run_filter}
+            GROUP BY symbol
+            HAVING net_qty > 0
+        ),
+        candidates AS (
+            SELECT p.symbol, p.entry_date, p.entry_price, p.entry_price AS peak_price, p.entry_date AS peak_date
+            FROM positions p
+            WHERE p.entry_date IS NOT NULL AND p.entry_price IS NOT NULL
+            UNION ALL
+            SELECT p.symbol, p.entry_date, p.entry_price, m.close, m.date
+            FROM positions p
+            JOIN market_data m ON m.symbol = p.symbol AND m.date >= p.entry_date
+            WHERE p.entry_price IS NOT NULL AND m.close IS NOT NULL
+            UNION ALL
+            SELECT p.symbol, p.entry_date, p.entry_price, pp.peak_price, pp.peak_date
+            FROM positions p
+            JOIN position_peaks pp
+              ON pp.symbol = p.symbol AND pp.entry_date = p.entry_date AND pp.is_active = TRUE
+            WHERE p.entry_price IS NOT NULL AND pp.peak_price IS NOT NULL
+        )
+        SELECT symbol, entry_date, entry_price, peak_price, peak_date
+        FROM candidates
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY peak_price DESC, peak_date) = 1
+        """,
+        params,
     )
+
+    try:
+        # Aggiorna in place i peak attivi della stessa posizione
+        conn.execute(
+            """
+            UPDATE position_peaks
+            SET peak_price = r.peak_price, peak_date = r.peak_date
+            FROM _position_peaks_rebuild r
+            WHERE position_peaks.is_active = TRUE
+              AND position_peaks.symbol = r.symbol
+              AND position_peaks.entry_date = r.entry_date
+            """
+        )
+
+        # Disattiva peaks di posizioni chiuse o riaperte con nuova entry_date
+        conn.execute(
+            """
+            UPDATE position_peaks
+            SET is_active = FALSE
+            WHERE is_active = TRUE
+              AND NOT EXISTS (
+                  SELECT 1 FROM _position_peaks_rebuild r
+                  WHERE r.symbol = position_peaks.symbol AND r.entry_date = position_peaks.entry_date
+              )
+            """
+        )
+
+        conn.execute(
+            """
+            INSERT INTO position_peaks (symbol, entry_date, entry_price, peak_price, peak_date, is_active)
+            SELECT r.symbol, r.entry_date, r.entry_price, r.peak_price, r.peak_date, TRUE
+            FROM _position_peaks_rebuild r
+            WHERE NOT EXISTS (
+                SELECT 1 FROM position_peaks pp
+                WHERE pp.symbol = r.symbol AND pp.entry_date = r.entry_date AND pp.is_active = TRUE
+            )
+            """
+        )
+    finally:
+        conn.execute("DROP TABLE IF EXISTS _position_peaks_rebuild")
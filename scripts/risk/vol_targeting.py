@@ -2,11 +2,14 @@
 """
 Vol Targeting - ETF Italia Project v10
 P2.2: Vol targeting più stringente in presenza di drawdown storico estremo
+
+Volatilità corrente letta da covariance_store (finestra 60 giorni, tutto l'universo)
 """
 
 import sys
 import os
 import duckdb
+import numpy as np
 
 from datetime import datetime
 
@@ -14,6 +17,13 @@ from datetime import datetime
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.path_manager import get_path_manager
+from risk.covariance_store import (
+    DEFAULT_WINDOW,
+    annualized_vols,
+    get_store_symbols,
+    load_covariance,
+    update_covariance_store,
+)
 
 def calculate_vol_targeting():
     """Calcola vol targeting dinamico basato su drawdown storico"""
@@ -26,6 +36,8 @@ def calculate_vol_targeting():
     print("=" * 50)
     
     try:
+        symbols = get_store_symbols()
+        
         # Test 1: Analisi drawdown storico per simbolo
         print("1️⃣ Analisi drawdown storico...")
         
@@ -38,7 +50,7 @@ def calculate_vol_targeting():
                 MAX(close) OVER (PARTITION BY symbol ORDER BY date ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) as peak,
                 (close / MAX(close) OVER (PARTITION BY symbol ORDER BY date ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) - 1) as drawdown_pct
             FROM market_data 
-            WHERE symbol IN ('CSSPX.MI', 'XS2L.MI')
+            WHERE symbol IN (SELECT UNNEST(?::VARCHAR[]))
             AND date >= '2020-01-01'
         )
         SELECT 
@@ -50,7 +62,7 @@ def calculate_vol_targeting():
         FROM drawdown_calc
         GROUP BY symbol
         ORDER BY max_drawdown ASC
-        """).fetchall()
+        """, [symbols]).fetchall()
         
         print(f"   📉 Analisi drawdown storico:")
         for symbol, max_dd, days_10, days_20, total in drawdown_analysis:
@@ -59,35 +71,15 @@ def calculate_vol_targeting():
         # Test 2: Calcolo volatilità corrente
         print("2️⃣ Calcolo volatilità corrente...")
         
-        current_vol = conn.execute("""
-        WITH daily_returns AS (
-            SELECT 
-                symbol,
-                date,
-                (close / LAG(close) OVER (PARTITION BY symbol ORDER BY date) - 1) as daily_return
-            FROM market_data 
-            WHERE symbol IN ('CSSPX.MI', 'XS2L.MI')
-            AND close IS NOT NULL
-        ),
-        filtered_returns AS (
-            SELECT symbol, date, daily_return
-            FROM daily_returns
-            WHERE daily_return IS NOT NULL
-        ),
-        recent_returns AS (
-            SELECT symbol, daily_return
-            FROM filtered_returns
-            WHERE symbol IN ('CSSPX.MI', 'XS2L.MI')
-            ORDER BY date DESC
-            LIMIT 60  -- Ultimi 60 giorni
-        )
-        SELECT 
-            symbol,
-            STDDEV(daily_return) * SQRT(252) as annual_vol,
-            COUNT(*) as observations
-        FROM recent_returns
-        GROUP BY symbol
-        """).fetchall()
+        update_covariance_store(conn, symbols=symbols)
+        store = load_covariance(conn, method='window', param=DEFAULT_WINDOW, symbols=symbols)
+        
+        current_vol = []
+        if store is not None:
+            vols = annualized_vols(store['cov'])
+            for i, symbol in enumerate(store['symbols']):
+                if not np.isnan(store['cov'][i, i]):
+                    current_vol.append((symbol, float(vols[i]), int(store['n_obs'][i, i])))
         
         print(f"   📊 Volatilità corrente (60 giorni):")
         for symbol, vol, obs in current_vol:
@@ -102,18 +94,13 @@ def calculate_vol_targeting():
         # Aggiustamenti basati su drawdown storico
         vol_targets = {}
         risk_adjustments = {}
+        current_vol_by_symbol = {symbol: vol for symbol, vol, _ in current_vol}
         
         for row in drawdown_analysis:
             symbol, max_dd, days_10, days_20, total = row
-            # Trova volatilità corrente
-            current_vol_data = None
-            for vol_data in current_vol:
-                if vol_data[0] == symbol:
-                    current_vol_data = vol_data
-                    break
+            symbol_current_vol = current_vol_by_symbol.get(symbol)
             
-            if current_vol_data:
-                symbol_current_vol = current_vol_data[1]
+            if symbol_current_vol is not None:
                 
                 # Aggiustamento basato su drawdown storico
                 vol_adjustment = 1.0
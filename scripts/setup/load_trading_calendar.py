@@ -15,10 +15,12 @@ from datetime import datetime, date
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.path_manager import get_path_manager
+from utils.universe_helper import get_default_venue
 
-def load_trading_calendar(venue='BIT', csv_file=None):
+def load_trading_calendar(venue=None, csv_file=None):
     """Carica calendario trading da CSV o genera base"""
     
+    venue = venue or get_default_venue()
     pm = get_path_manager()
     db_path = str(pm.db_path)
     
@@ -189,7 +191,7 @@ def load_trading_calendar(venue='BIT', csv_file=None):
 
 def main():
     parser = argparse.ArgumentParser(description='Load Trading Calendar')
-    parser.add_argument('--venue', default='XMIL', help='Venue code (default: XMIL)')
+    parser.add_argument('--venue', default=None, help='Venue code (default: ETF_VENUE o venue di configurazione, XMIL)')
     parser.add_argument('--csv', help='CSV file path (optional)')
     
     args = parser.parse_args()
@@ -15,6 +15,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import PathManager
 from utils.path_manager import get_path_manager
+from utils.latest_prices import refresh_latest_prices
+from utils.market_store import ensure_fx_table, partition_market_data, sync_instruments
+from utils.universe_helper import get_default_venue
 
 def setup_database():
     """Setup completo del database"""
@@ -39,23 +42,8 @@ def setup_database():
         # 1. Creazione tabelle principali
         print("Creazione tabelle...")
         
-        # Tabella market_data (master data)
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS market_data (
-            symbol VARCHAR NOT NULL,
-            date DATE NOT NULL,
-            adj_close DOUBLE CHECK (adj_close > 0),
-            close DOUBLE CHECK (close > 0),
-            high DOUBLE CHECK (high >= 0),
-            low DOUBLE CHECK (low >= 0),
-            volume BIGINT CHECK (volume >= 0),
-            source VARCHAR DEFAULT 'YF',
-            PRIMARY KEY (symbol, date),
-            CHECK (high >= low),
-            CHECK (high >= close),
-            CHECK (low <= close)
-        )
-        """)
+        # market_data (master data): partizioni venue/anno dietro la vista market_data,
+        # create/migrate dopo l'anagrafica strumenti (vedi sotto e utils/market_store.py)
         
         # Tabella staging_data (transito)
         conn.execute("""
@@ -269,14 +257,36 @@ def setup_database():
         )
         """)
         
+        # Tabella covariance_store (matrici N×N, ultime date per metodo, vedi risk/covariance_store.py)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS covariance_store (
+            date DATE NOT NULL,
+            method VARCHAR NOT NULL CHECK (method IN ('ewma', 'window')),
+            param DOUBLE NOT NULL,
+            symbol_a VARCHAR NOT NULL,
+            symbol_b VARCHAR NOT NULL,
+            cov DOUBLE,
+            corr DOUBLE,
+            n_obs INTEGER NOT NULL,
+            PRIMARY KEY (date, method, param, symbol_a, symbol_b)
+        )
+        """)
+        
+        # Anagrafica strumenti (venue/valuta), market_data partizionata per venue/anno
+        # (migrazione della tabella legacy) e cambi FX giornalieri (vedi utils/market_store.py)
+        sync_instruments(conn, config)
+        partition_market_data(conn, get_default_venue(config))
+        ensure_fx_table(conn)
+        
+        # Tabella latest_prices (ultimo prezzo per simbolo, vedi utils/latest_prices.py)
+        refresh_latest_prices(conn)
+        
         print("Tabelle create")
         
         # 2. Creazione indici
         print("Creazione indici...")
         
         indici = [
-            "CREATE INDEX IF NOT EXISTS idx_market_data_symbol_date ON market_data(symbol, date)",
-            "CREATE INDEX IF NOT EXISTS idx_market_data_date ON market_data(date)",
             "CREATE INDEX IF NOT EXISTS idx_fiscal_ledger_date ON fiscal_ledger(date)",
             "CREATE INDEX IF NOT EXISTS idx_fiscal_ledger_symbol ON fiscal_ledger(symbol)",
             "CREATE INDEX IF NOT EXISTS idx_fiscal_ledger_type ON fiscal_ledger(type)",
@@ -444,7 +454,7 @@ def setup_database():
         else:
             print(" Deposito iniziale già presente - skip")
         
-        # 5. Setup trading calendar base (BIT)
+        # 5. Setup trading calendar base (venue di default, vedi universe_helper)
         print(" Setup trading calendar base...")
         
         # Inserisci giorni feriali Italiani come aperti (semplificato)
@@ -456,11 +466,11 @@ def setup_database():
         
         conn.execute(f"""
         INSERT OR IGNORE INTO trading_calendar (venue, date, is_open)
-        SELECT 'BIT', 
+        SELECT ?, 
                generate_series::date, 
                EXTRACT(ISODOW FROM generate_series::date) NOT IN (6, 7) as is_open
         FROM generate_series('{start_date}'::DATE, '{end_date}'::DATE, INTERVAL '1 day')
-        """)
+        """, [get_default_venue(config)])
         
         print(" Trading calendar base creato")
         
@@ -2,14 +2,24 @@
 """
 Portfolio Construction & Holding Period Logic - ETF Italia Project v10
 Implementa ranking candidati, allocation logic e holding period dinamico
+
+LOGICA:
+- Funzioni scalari (calculate_*) = riferimento per singolo simbolo
+- Percorso array (evaluate_candidates e calculate_*_batch): score, holding days e qty di
+  tutti i candidati in una chiamata numpy, stesse formule e stesso ordine delle
+  operazioni → risultati identici alle funzioni scalari
+- Overlap underlying: set degli underlying in portafoglio, O(candidati + posizioni)
+  invece di O(candidati × posizioni)
 """
 
 import sys
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Iterable
 import json
 
+import numpy as np
+
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
 
@@ -213,30 +223,22 @@ def rank_candidates(
     Returns:
         Lista di tuple (symbol, score) ordinata per score decrescente
     """
-    ranked = []
-    
-    for symbol in candidates:
-        signal = signals_data.get(symbol, {})
-        
-        momentum_score = signal.get('momentum_score', 0.0)
-        risk_scalar = signal.get('risk_scalar', 0.0)
-        volatility = signal.get('volatility', 0.15)
-        ter = signal.get('ter', 0.001)
-        slippage_bps = signal.get('slippage_bps', 5)
-        
-        score = calculate_candidate_score(
-            momentum_score,
-            risk_scalar,
-            volatility,
-            ter,
-            slippage_bps,
-            symbol,
-            current_positions,
-            underlying_map,
+    # Score di tutti i candidati in una chiamata (percorso array)
+    arrays = candidate_arrays(candidates, signals_data)
+    scores = calculate_candidate_scores(
+        arrays['momentum_score'],
+        arrays['risk_scalar'],
+        arrays['volatility'],
+        arrays['ter'],
+        arrays['slippage_bps'],
+        calculate_overlap_penalty_batch(
+            [underlying_map.get(symbol, symbol) for symbol in candidates],
+            [underlying_map.get(symbol, symbol) for symbol in current_positions],
             config
-        )
-        
-        ranked.append((symbol, score))
+        ),
+        config
+    )
+    ranked = list(zip(candidates, scores.tolist()))
     
     # Ordina per score decrescente
     ranked.sort(key=lambda x: x[1], reverse=True)
@@ -244,6 +246,157 @@ def rank_candidates(
     return ranked
 
 
+# ==================== PERCORSO ARRAY ====================
+
+def _ranking_weights(config: dict) -> Tuple[float, float, float, float, float]:
+    weights = config.get('ranking_weights', {})
+    return (
+        weights.get('momentum', 0.45),
+        weights.get('risk_scalar', 0.25),
+        weights.get('volatility', 0.20),
+        weights.get('cost_penalty', 0.05),
+        weights.get('overlap_penalty', 0.05),
+    )
+
+
+def candidate_arrays(candidates: List[str], signals_data: Dict[str, dict]) -> Dict[str, np.ndarray]:
+    """Array di input per i candidati (stessi default di rank_candidates)"""
+    signals = [signals_data.get(symbol, {}) for symbol in candidates]
+    return {
+        'momentum_score': np.array([s.get('momentum_score', 0.0) for s in signals], dtype=float),
+        'risk_scalar': np.array([s.get('risk_scalar', 0.0) for s in signals], dtype=float),
+        'volatility': np.array([s.get('volatility', 0.15) for s in signals], dtype=float),
+        'ter': np.array([s.get('ter', 0.001) for s in signals], dtype=float),
+        'slippage_bps': np.array([s.get('slippage_bps', 5) for s in signals], dtype=float),
+    }
+
+
+def calculate_cost_penalty_batch(ter, slippage_bps) -> np.ndarray:
+    """calculate_cost_penalty su array"""
+    total_cost_pct = np.asarray(ter, dtype=float) + (np.asarray(slippage_bps, dtype=float) * 2 / 10000)
+    return np.maximum(0.0, np.minimum(1.0, total_cost_pct / 0.01))
+
+
+def calculate_overlap_penalty_batch(
+    underlyings: Iterable[str],
+    held_underlyings: Iterable[str],
+    config: dict
+) -> np.ndarray:
+    """calculate_overlap_penalty su array: 1.0 se l'underlying è già in portafoglio
+
+    Args:
+        underlyings: Underlying dei candidati (underlying_map.get(symbol, symbol))
+        held_underlyings: Underlying delle posizioni aperte
+    """
+    underlyings = list(underlyings)
+    if not config.get('execution', {}).get('forbid_overlap_underlying', True):
+        return np.zeros(len(underlyings))
+    held = set(held_underlyings)
+    return np.fromiter((1.0 if u in held else 0.0 for u in underlyings), dtype=float, count=len(underlyings))
+
+
+def calculate_candidate_scores(
+    momentum_score,
+    risk_scalar,
+    volatility,
+    ter,
+    slippage_bps,
+    overlap_penalty,
+    config: dict
+) -> np.ndarray:
+    """calculate_candidate_score su array (overlap_penalty già calcolata)"""
+    w_momentum, w_risk, w_vol, w_cost, w_overlap = _ranking_weights(config)
+    vol_normalized = np.maximum(0, np.minimum(1, 1 - (np.asarray(volatility, dtype=float) / 0.30)))
+    cost_penalty = calculate_cost_penalty_batch(ter, slippage_bps)
+    score = (
+        np.asarray(momentum_score, dtype=float) * w_momentum +
+        np.asarray(risk_scalar, dtype=float) * w_risk +
+        vol_normalized * w_vol -
+        cost_penalty * w_cost -
+        np.asarray(overlap_penalty, dtype=float) * w_overlap
+    )
+    return np.maximum(0.0, np.minimum(1.0, score))
+
+
+def calculate_expected_holding_days_batch(
+    risk_scalar,
+    volatility,
+    momentum_score,
+    signal_state,
+    config: dict
+) -> np.ndarray:
+    """calculate_expected_holding_days su array (signal_state stringa o array di stati)"""
+    holding_cfg = config.get('holding_period', {})
+    base_days = holding_cfg.get('base_holding_days', 15)
+    min_days = holding_cfg.get('min_holding_days', 5)
+    max_days = holding_cfg.get('max_holding_days', 30)
+
+    risk_scalar = np.asarray(risk_scalar, dtype=float)
+    volatility = np.asarray(volatility, dtype=float)
+    momentum_score = np.asarray(momentum_score, dtype=float)
+    state = np.broadcast_to(np.asarray(signal_state, dtype=object), risk_scalar.shape)
+
+    risk_adj = np.where(
+        state == 'RISK_OFF', 1.5,
+        np.where((state == 'NEUTRAL') | (state == 'HOLD'), 1.2 - 0.2 * risk_scalar, 1.0 - 0.3 * risk_scalar)
+    )
+    vol_adj = np.select([volatility >= 0.25, volatility >= 0.18], [0.60, 0.80], 1.00)
+    momentum_adj = np.select(
+        [momentum_score >= 0.85, momentum_score >= 0.70, momentum_score >= 0.55], [0.70, 0.85, 1.00], 1.20
+    )
+
+    holding_days = base_days * risk_adj * vol_adj * momentum_adj
+    return np.trunc(np.maximum(min_days, np.minimum(max_days, holding_days))).astype(np.int64)
+
+
+def calculate_qty_batch(
+    price,
+    available_cash: float,
+    portfolio_value: float,
+    risk_scalar,
+    config: dict
+) -> np.ndarray:
+    """calculate_qty su array (stesso cash disponibile per tutti i candidati)"""
+    max_open_positions = config.get('portfolio_construction', {}).get('max_open_positions', 3)
+    price = np.asarray(price, dtype=float)
+    target_value = portfolio_value * ((1.0 / max_open_positions) * np.asarray(risk_scalar, dtype=float))
+    qty = np.trunc(target_value / price)
+    qty = np.where(qty * price > available_cash, np.trunc(available_cash / price), qty)
+    return np.maximum(0, qty).astype(np.int64)
+
+
+def evaluate_candidates(
+    momentum_score,
+    risk_scalar,
+    volatility,
+    ter,
+    slippage_bps,
+    underlyings: Iterable[str],
+    held_underlyings: Iterable[str],
+    config: dict,
+    signal_state='RISK_ON',
+    price=None,
+    available_cash: float = 0.0,
+    portfolio_value: float = 0.0
+) -> Dict[str, np.ndarray]:
+    """Score, holding days e qty di tutti i candidati in una chiamata
+
+    Returns:
+        dict: score, overlap_penalty, holding_days, qty (qty solo se price è indicato)
+    """
+    overlap_penalty = calculate_overlap_penalty_batch(underlyings, held_underlyings, config)
+    result = {
+        'score': calculate_candidate_scores(momentum_score, risk_scalar, volatility, ter, slippage_bps,
+                                            overlap_penalty, config),
+        'overlap_penalty': overlap_penalty,
+        'holding_days': calculate_expected_holding_days_batch(risk_scalar, volatility, momentum_score,
+                                                              signal_state, config),
+    }
+    if price is not None:
+        result['qty'] = calculate_qty_batch(price, available_cash, portfolio_value, risk_scalar, config)
+    return result
+
+
 def get_current_positions(conn, run_type: str = 'BACKTEST') -> Dict[str, dict]:
     """
     Ottiene posizioni aperte correnti dal fiscal_ledger
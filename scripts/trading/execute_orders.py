@@ -16,11 +16,20 @@ from decimal import Decimal, ROUND_HALF_UP
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.path_manager import get_path_manager
-from utils.universe_helper import get_universe_symbols
+from utils.perf_trace import perf_step, span
+from utils.sql_stats import instrument_connection
+from utils.universe_helper import get_universe_symbols, get_default_venue
+from utils.market_store import BASE_CURRENCY, FxLookup
 from utils.asof_date import compute_asof_date
 from fiscal.tax_engine import calculate_tax, create_tax_loss_carryforward, update_zainetto_usage
 
-from fiscal.pmc_engine import load_position_state, apply_buy, estimate_sell_gain
+from fiscal.pmc_engine import (
+    PositionState,
+    apply_buy,
+    apply_sell,
+    estimate_sell_gain,
+    load_position_states,
+)
 from utils.universe_helper import get_cost_model_for_symbol, get_execution_model_for_symbol
 
 
@@ -97,6 +106,100 @@ def check_position_available(conn, symbol, required_qty, run_type=None):
     available_qty = position_check[0] if position_check and position_check[0] else 0
     return available_qty >= required_qty, available_qty
 
+def load_ledger_snapshot(conn, run_type=None):
+    """Cash e posizioni nette dal fiscal_ledger con una sola query
+
+    Stesse regole di check_cash_available / check_position_available.
+
+    Returns:
+        tuple: (cash_balance, {symbol: net_qty})
+    """
+    run_filter = ""
+    params = []
+    if run_type and _has_column(conn, 'fiscal_ledger', 'run_type'):
+        run_filter = "WHERE run_type = ?"
+        params = [run_type]
+
+    rows = conn.execute(f"""
+    SELECT
+        symbol,
+        SUM(CASE 
+            WHEN type = 'DEPOSIT' THEN qty * price - fees - tax_paid
+            WHEN type = 'SELL' THEN qty * price - fees - tax_paid
+            WHEN type = 'BUY' THEN -(qty * price + fees)
+            WHEN type = 'INTEREST' THEN qty
+            ELSE 0 
+        END) as cash_flow,
+        SUM(CASE WHEN type = 'BUY' THEN qty WHEN type = 'SELL' THEN -qty ELSE NULL END) as net_qty
+    FROM fiscal_ledger
+    {run_filter}
+    GROUP BY symbol
+    """, params).fetchall()
+
+    cash_balance = sum(r[1] for r in rows if r[1] is not None)
+    positions = {r[0]: r[2] for r in rows if r[2]}
+    return cash_balance, positions
+
+
+def _latest_volatility(conn, symbols):
+    """Ultima volatility_20d per simbolo (una query per tutto il batch)"""
+    if not symbols:
+        return {}
+    rows = conn.execute("""
+    SELECT symbol, volatility_20d
+    FROM risk_metrics
+    WHERE symbol IN (SELECT UNNEST(?::VARCHAR[]))
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY date DESC) = 1
+    """, [list(symbols)]).fetchall()
+    return {symbol: vol for symbol, vol in rows}
+
+
+def _symbols_with_market_data(conn, symbols, order_date):
+    """Simboli con riga market_data alla data ordine"""
+    if not symbols:
+        return set()
+    rows = conn.execute("""
+    SELECT DISTINCT symbol
+    FROM market_data
+    WHERE symbol IN (SELECT UNNEST(?::VARCHAR[])) AND date = ?
+    """, [list(symbols), order_date]).fetchall()
+    return {r[0] for r in rows}
+
+
+def estimate_order_costs(config, symbol, qty, price, volatility):
+    """Commissione e slippage stimati per un ordine
+
+    Returns:
+        tuple: (commission, slippage, slippage_bps)
+    """
+    position_value = qty * price
+    cost_model = get_cost_model_for_symbol(config, symbol)
+    commission_pct = float(cost_model.get('commission_pct', 0.001))
+    commission = position_value * commission_pct
+    if position_value < 1000:
+        commission = max(5.0, commission)
+
+    volatility = volatility if volatility else 0.15
+    base_slippage_bps = float(cost_model.get('slippage_bps', 5))
+    # EUR/ETF: slippage cresce con vol (annualizzata). Converte vol in bps con fattore prudenziale.
+    vol_slippage_bps = max(0.0, float(volatility) * 100.0 * 0.5)  # es. 15% vol -> ~7.5bps
+    slippage_bps = max(base_slippage_bps, vol_slippage_bps)
+    slippage = position_value * (slippage_bps / 10000)
+    return commission, slippage, slippage_bps
+
+
+def _bulk_insert(conn, table_name, columns, rows):
+    """INSERT multi-riga in un solo statement"""
+    if not rows:
+        return
+    row_placeholder = '(' + ', '.join(['?'] * len(columns)) + ')'
+    conn.execute(
+        f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES "
+        + ', '.join([row_placeholder] * len(rows)),
+        [value for row in rows for value in row]
+    )
+
+
 def execute_orders(orders_file=None, commit=False, order_date=None, run_type='PRODUCTION'):
     """Esegue ordini da file e scrive nel fiscal_ledger
     
@@ -119,28 +222,31 @@ def execute_orders(orders_file=None, commit=False, order_date=None, run_type='PR
     with open(config_path, 'r') as f:
         config = json.load(f)
     
-    conn = duckdb.connect(db_path)
+    # Proxy statistiche SQL solo con ETF_ITA_SQL_STATS=1: sql_calls degli span dalla connessione
+    conn = instrument_connection(duckdb.connect(db_path), 'execute_orders')
 
     market_data_exists = _table_exists(conn, 'market_data')
     
     try:
         # 1. Trova file ordini più recente se non specificato
         if not orders_file:
-            orders_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'orders')
-            order_files = [f for f in os.listdir(orders_dir) if f.startswith('orders_') and f.endswith('.json')]
-            if not order_files:
+            # Ultimo run dall'indice ordini (production), fallback directory legacy data/orders
+            from trading.orders_store import latest_orders_file
+            legacy_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'orders')
+            latest = latest_orders_file(pm.production_orders_path().parent) or latest_orders_file(legacy_dir)
+            if latest is None:
                 print(" Nessun file ordini trovato")
                 return False
             
-            order_files.sort(reverse=True)  # Ordina per data (nome file)
-            orders_file = os.path.join(orders_dir, order_files[0])
+            orders_file = str(latest)
             print(f" File ordini selezionato: {orders_file}")
         
         # 2. Carica ordini
         with open(orders_file, 'r') as f:
             orders_data = json.load(f)
         
-        orders = orders_data.get('orders', [])
+        from trading.orders_store import normalize_orders
+        orders = normalize_orders(orders_data.get('orders', []))
         if not orders:
             print(" Nessun ordine da eseguire")
             return False
@@ -178,10 +284,10 @@ def execute_orders(orders_file=None, commit=False, order_date=None, run_type='PR
                 pm = get_path_manager()
                 config_path = str(pm.etf_universe_path)
                 coverage_threshold = float(orders_data.get('coverage_threshold', 0.8))
-                venue = 'BIT'
                 try:
                     with open(config_path, 'r') as cf:
                         cfg = json.load(cf)
+                    venue = get_default_venue(cfg)
                     symbols = get_universe_symbols(cfg, include_benchmark=False)
                     computed = compute_asof_date(conn, symbols, coverage_threshold=coverage_threshold, venue=venue)
 
@@ -202,6 +308,43 @@ def execute_orders(orders_file=None, commit=False, order_date=None, run_type='PR
         
         fiscal_cols = _table_columns(conn, 'fiscal_ledger')
 
+        # 5.0 Snapshot unico del batch: market_data, volatilità, cash/posizioni, PMC, ID
+        # SELL prima dei BUY (stesso ordine del workflow TWO-PASS): il cash delle
+        # vendite è disponibile per gli acquisti dello stesso batch
+        executable_orders = (
+            [o for o in executable_orders if o['action'] == 'SELL']
+            + [o for o in executable_orders if o['action'] == 'BUY']
+        )
+        batch_symbols = sorted({o['symbol'] for o in executable_orders})
+
+        with span('ledger_snapshot'):
+            if market_data_exists:
+                md_symbols = _symbols_with_market_data(conn, batch_symbols, order_date)
+            volatility_by_symbol = _latest_volatility(conn, batch_symbols)
+            cash_balance, net_positions = load_ledger_snapshot(conn, run_type=run_type)
+            pmc_states = load_position_states(conn, batch_symbols, run_type=run_type)
+            fx = FxLookup.load(conn, batch_symbols, [order_date],
+                               default_currency=(config.get('settings') or {}).get('currency') or BASE_CURRENCY)
+
+        next_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM fiscal_ledger").fetchone()[0]
+        next_journal_id = None
+        if commit:
+            next_journal_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM trade_journal").fetchone()[0]
+
+        ordered_cols = [
+            'id', 'date', 'type', 'symbol', 'qty', 'price', 'fees', 'tax_paid', 'pmc_snapshot', 'run_id',
+            'run_type', 'decision_path', 'reason_code', 'execution_price_mode', 'source_order_id',
+            'trade_currency', 'exchange_rate_used', 'price_eur',
+            'entry_date', 'entry_score', 'expected_holding_days', 'expected_exit_date',
+            'exit_reason', 'holding_days_actual'
+        ]
+        insert_cols = [c for c in ordered_cols if c in fiscal_cols]
+        journal_cols = [
+            'id', 'run_id', 'symbol', 'signal_state', 'risk_scalar', 'explain_code',
+            'flag_override', 'override_reason', 'theoretical_price', 'realized_price', 'slippage_bps'
+        ]
+        journal_rows = []
+
         for order in executable_orders:
             symbol = order['symbol']
             action = order['action']
@@ -211,11 +354,7 @@ def execute_orders(orders_file=None, commit=False, order_date=None, run_type='PR
             # Guardrail HARD: non eseguire BUY/SELL se manca market_data per (symbol, order_date)
             # (Se la tabella market_data non esiste, siamo in un DB minimale / test harness: non bloccare.)
             if market_data_exists:
-                md_ok = conn.execute(
-                    "SELECT 1 FROM market_data WHERE symbol = ? AND date = ? LIMIT 1",
-                    [symbol, order_date]
-                ).fetchone()
-                if not md_ok:
+                if symbol not in md_symbols:
                     print(f"    ⛔ REJECT {action} {symbol} - market_data mancante per {order_date}")
                     order['recommendation'] = 'REJECT'
                     order['reject_reason'] = 'MARKET_DATA_MISSING'
@@ -223,7 +362,8 @@ def execute_orders(orders_file=None, commit=False, order_date=None, run_type='PR
                         'symbol': symbol,
                         'action': action,
                         'order_date': str(order_date),
-                        'reason': 'MARKET_DATA_MISSING'
+                        'reason': 'MARKET_DATA_MISSING',
+                        'reject_reason': 'MARKET_DATA_MISSING'
                     })
                     continue
             else:
@@ -232,37 +372,43 @@ def execute_orders(orders_file=None, commit=False, order_date=None, run_type='PR
                     globals()['_WARNED_NO_MARKET_DATA'] = True
                     print("    ⚠️ market_data assente nel DB: skip guardrail market_data (modalità test/harness)")
 
+            # Prezzo in EUR al cambio as-of della data ordine (batch caricato nello snapshot):
+            # cash, commissioni, tasse e PMC del ledger sono qty * price in EUR
+            trade_currency, exchange_rate, price_eur = fx.convert(symbol, order_date, price)
+            if exchange_rate is None:
+                print(f"    ⛔ REJECT {action} {symbol} - cambio {trade_currency}/{BASE_CURRENCY} mancante al {order_date}")
+                order['recommendation'] = 'REJECT'
+                order['reject_reason'] = 'FX_RATE_MISSING'
+                rejected_orders.append({
+                    'symbol': symbol,
+                    'action': action,
+                    'qty': qty,
+                    'price': price,
+                    'reason': reason,
+                    'reject_reason': f'FX_RATE_MISSING: {trade_currency}',
+                    'order_date': str(order_date),
+                    'timestamp': datetime.now().isoformat()
+                })
+                continue
+            local_price, price = price, price_eur
+
             print(f"\n 🔄 {symbol}: {action} {qty:.0f} @ €{price:.2f}")
+            if trade_currency != BASE_CURRENCY:
+                print(f"    {local_price:.2f} {trade_currency} × {exchange_rate:.4f}")
             print(f"    Reason: {reason}")
-            
-            # 5.1 Validazioni pre-esecuzione HARD CONTROLS
+
+            # 5.1 Costi realistici (per simbolo, slippage da volatilità annualizzata → bps)
+            commission, slippage, slippage_bps = estimate_order_costs(
+                config, symbol, qty, price, volatility_by_symbol.get(symbol)
+            )
+            total_fees = commission + slippage
+
+            # 5.2 Validazioni pre-esecuzione HARD CONTROLS (su snapshot in memoria)
             if action == 'BUY':
                 # Verifica cash disponibile
-                position_value = qty * price
-                cost_model = get_cost_model_for_symbol(config, symbol)
-                commission_pct = float(cost_model.get('commission_pct', 0.001))
-                commission = position_value * commission_pct
-                if position_value < 1000:
-                    commission = max(5.0, commission)
-                
-                # Stima slippage per calcolo cash richiesto
-                volatility_data = conn.execute("""
-                SELECT volatility_20d FROM risk_metrics 
-                WHERE symbol = ? 
-                ORDER BY date DESC LIMIT 1
-                """, [symbol]).fetchone()
-                
-                volatility = volatility_data[0] if volatility_data and volatility_data[0] else 0.15
-                base_slippage_bps = float(cost_model.get('slippage_bps', 5))
-                # EUR/ETF: slippage cresce con vol (annualizzata). Converte vol in bps con fattore prudenziale.
-                vol_slippage_bps = max(0.0, float(volatility) * 100.0 * 0.5)  # es. 15% vol -> ~7.5bps
-                slippage_bps = max(base_slippage_bps, vol_slippage_bps)
-                slippage = position_value * (slippage_bps / 10000)
-                
-                total_required = position_value + commission + slippage
-                cash_available, cash_balance = check_cash_available(conn, total_required, run_type=run_type)
-                
-                if not cash_available:
+                total_required = qty * price + commission + slippage
+
+                if cash_balance < total_required:
                     print(f"    ❌ CASH INSUFFICIENTE: richiesto €{total_required:.2f}, disponibile €{cash_balance:.2f}")
                     rejected_orders.append({
                         'symbol': symbol,
@@ -279,9 +425,9 @@ def execute_orders(orders_file=None, commit=False, order_date=None, run_type='PR
                 
             elif action == 'SELL':
                 # Verifica posizione esistente
-                position_available, available_qty = check_position_available(conn, symbol, qty, run_type=run_type)
+                available_qty = net_positions.get(symbol) or 0
                 
-                if not position_available:
+                if available_qty < qty:
                     print(f"    ❌ POSIZIONE INSUFFICIENTE: richiesto {qty:.0f}, disponibile {available_qty:.0f}")
                     rejected_orders.append({
                         'symbol': symbol,
@@ -295,44 +441,20 @@ def execute_orders(orders_file=None, commit=False, order_date=None, run_type='PR
                     continue
                 
                 print(f"    ✅ Posizione OK: richiesto {qty:.0f}, disponibile {available_qty:.0f}")
-            
-            # 5.2 Calcola costi realistici (per simbolo)
-            position_value = qty * price
-            cost_model = get_cost_model_for_symbol(config, symbol)
-            commission_pct = float(cost_model.get('commission_pct', 0.001))
-            commission = position_value * commission_pct
-            if position_value < 1000:
-                commission = max(5.0, commission)
-
-            # Slippage (basato su volatilità annualizzata → bps)
-            volatility_data = conn.execute(
-                """
-                SELECT volatility_20d FROM risk_metrics 
-                WHERE symbol = ? 
-                ORDER BY date DESC LIMIT 1
-                """,
-                [symbol],
-            ).fetchone()
-            volatility = volatility_data[0] if volatility_data and volatility_data[0] else 0.15
-            base_slippage_bps = float(cost_model.get('slippage_bps', 5))
-            vol_slippage_bps = max(0.0, float(volatility) * 100.0 * 0.5)  # es. 15% -> ~7.5bps
-            slippage_bps = max(base_slippage_bps, vol_slippage_bps)
-            slippage = position_value * (slippage_bps / 10000)
-
-            total_fees = commission + slippage
 
             # 5.3 Calcola tax per vendite via PMC (no side effects in dry-run)
             tax_paid = 0.0
             realized_gain = 0.0
             pmc_snapshot = None
-            state_before = load_position_state(conn, symbol, run_type=run_type)
+            state_before = pmc_states.get(symbol) or PositionState(symbol=symbol, qty=0.0, total_cost=0.0)
 
             if action == 'SELL':
                 realized_gain, pmc_used = estimate_sell_gain(state_before, qty, price, total_fees)
                 pmc_snapshot = pmc_used
 
                 if realized_gain > 0.01:
-                    tax_result = calculate_tax(realized_gain, symbol, order_date, conn, run_type=run_type)
+                    with span('tax'):
+                        tax_result = calculate_tax(realized_gain, symbol, order_date, conn, run_type=run_type)
                     tax_paid = float(tax_result['tax_amount'])
                     print(f"    Gain (PMC): €{realized_gain:.2f}, Tax: €{tax_paid:.2f}")
                     print(f"    {tax_result['explanation']}")
@@ -362,10 +484,7 @@ def execute_orders(orders_file=None, commit=False, order_date=None, run_type='PR
             total_fees = Decimal(str(total_fees)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
             tax_paid = Decimal(str(tax_paid)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
             
-            # 5.5 Ottieni next ID per fiscal_ledger
-            next_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM fiscal_ledger").fetchone()[0]
-            
-            # 5.6 Inserisci in fiscal_ledger (FIX BUG #2-4: order_date, run_type, decision_path, reason_code)
+            # 5.5 Record fiscal_ledger (FIX BUG #2-4: order_date, run_type, decision_path, reason_code)
             execution_price_mode = (
                 order.get('execution_price_mode')
                 or orders_data.get('execution_price_mode')
@@ -389,6 +508,9 @@ def execute_orders(orders_file=None, commit=False, order_date=None, run_type='PR
                 'reason_code': order.get('reason_code') or reason,
                 'execution_price_mode': execution_price_mode,
                 'source_order_id': order.get('source_order_id'),
+                'trade_currency': trade_currency,
+                'exchange_rate_used': exchange_rate,
+                'price_eur': float(price),
                 # Optional holding-period metadata (se presenti nel file ordini)
                 'entry_date': order.get('entry_date'),
                 'entry_score': order.get('entry_score'),
@@ -399,39 +521,26 @@ def execute_orders(orders_file=None, commit=False, order_date=None, run_type='PR
             }
             
             if commit:
-                # Inserimento schema-robust: usa solo le colonne presenti
-                ordered_cols = [
-                    'id', 'date', 'type', 'symbol', 'qty', 'price', 'fees', 'tax_paid', 'pmc_snapshot', 'run_id',
-                    'run_type', 'decision_path', 'reason_code', 'execution_price_mode', 'source_order_id',
-                    'entry_date', 'entry_score', 'expected_holding_days', 'expected_exit_date',
-                    'exit_reason', 'holding_days_actual'
-                ]
-                insert_cols = [c for c in ordered_cols if c in fiscal_cols]
-                placeholders = ', '.join(['?'] * len(insert_cols))
-                col_list = ', '.join(insert_cols)
-
-                conn.execute(
-                    f"INSERT INTO fiscal_ledger ({col_list}) VALUES ({placeholders})",
-                    [ledger_record[c] for c in insert_cols]
-                )
-                
                 print(f"    ✅ Eseguito - ID: {next_id}")
             else:
                 print(f"    📋 Dry-run - ID: {next_id}")
+            next_id += 1
             
             executed_orders.append(ledger_record)
+
+            # 5.6 Aggiorna snapshot in memoria con i valori arrotondati (come li vedrebbe il ledger)
+            if action == 'BUY':
+                cash_balance -= ledger_record['qty'] * ledger_record['price'] + ledger_record['fees']
+                net_positions[symbol] = (net_positions.get(symbol) or 0) + ledger_record['qty']
+                pmc_states[symbol] = apply_buy(state_before, ledger_record['qty'], ledger_record['price'], ledger_record['fees'])
+            else:
+                cash_balance += ledger_record['qty'] * ledger_record['price'] - ledger_record['fees'] - ledger_record['tax_paid']
+                net_positions[symbol] = (net_positions.get(symbol) or 0) - ledger_record['qty']
+                pmc_states[symbol] = apply_sell(state_before, ledger_record['qty'])
             
-            # 5.7 Registra in trade_journal per audit
+            # 5.7 Riga trade_journal per audit
             if commit:
-                # Ottieni next ID per trade_journal
-                next_journal_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM trade_journal").fetchone()[0]
-                
-                conn.execute("""
-                INSERT INTO trade_journal 
-                (id, run_id, symbol, signal_state, risk_scalar, explain_code, 
-                 flag_override, override_reason, theoretical_price, realized_price, slippage_bps)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, [
+                journal_rows.append([
                     next_journal_id,
                     run_id,
                     symbol,
@@ -440,10 +549,19 @@ def execute_orders(orders_file=None, commit=False, order_date=None, run_type='PR
                     reason,
                     False,  # No override
                     None,   # No override reason
-                    price,  # Theoretical price
-                    price,  # Realized price (same for now)
+                    float(price),  # Theoretical price
+                    float(price),  # Realized price (same for now)
                     slippage_bps
                 ])
+                next_journal_id += 1
+
+        # 5.8 Scrittura bulk di ledger e journal (stessa transazione)
+        if commit:
+            # Inserimento schema-robust: usa solo le colonne presenti
+            with span('bulk_insert', rows_written=len(executed_orders) + len(journal_rows)):
+                _bulk_insert(conn, 'fiscal_ledger', insert_cols,
+                             [[r[c] for c in insert_cols] for r in executed_orders])
+                _bulk_insert(conn, 'trade_journal', journal_cols, journal_rows)
         
         # 6. Summary esecuzione
         print(f"\n ESECUZIONE COMPLETATA")
@@ -487,41 +605,22 @@ def execute_orders(orders_file=None, commit=False, order_date=None, run_type='PR
         conn.close()
 
 def validate_orders_file(orders_file):
-    """Valida file ordini prima dell'esecuzione"""
+    """Valida file ordini prima dell'esecuzione (schema compilato, stop al primo errore)"""
+    from trading.orders_store import validate_orders_data, validate_orders_stream, iter_orders
     
     try:
-        with open(orders_file, 'r') as f:
-            data = json.load(f)
-        
-        # Verifica struttura base
-        required_fields = ['timestamp', 'dry_run', 'orders', 'summary']
-        for field in required_fields:
-            if field not in data:
-                print(f"❌ Campo mancante: {field}")
-                return False
+        if str(orders_file).endswith('.ndjson'):
+            ok, error, n_orders = validate_orders_stream(iter_orders(orders_file))
+        else:
+            with open(orders_file, 'r') as f:
+                data = json.load(f)
+            ok, error, n_orders = validate_orders_data(data)
         
-        orders = data['orders']
-        if not isinstance(orders, list):
-            print("❌ Orders non è una lista")
+        if not ok:
+            print(f"❌ {error}")
             return False
         
-        # Verifica struttura ordini
-        for i, order in enumerate(orders):
-            required_order_fields = ['symbol', 'action', 'qty', 'price', 'reason', 'recommendation']
-            for field in required_order_fields:
-                if field not in order:
-                    print(f"❌ Ordine {i}: campo mancante {field}")
-                    return False
-            
-            if order['action'] not in ['BUY', 'SELL', 'HOLD']:
-                print(f"❌ Ordine {i}: action non valido {order['action']}")
-                return False
-            
-            if order['recommendation'] not in ['TRADE', 'HOLD']:
-                print(f"❌ Ordine {i}: recommendation non valido {order['recommendation']}")
-                return False
-        
-        print(f"✅ File ordini valido: {len(orders)} ordini")
+        print(f"✅ File ordini valido: {n_orders} ordini")
         return True
         
     except json.JSONDecodeError as e:
@@ -544,5 +643,6 @@ if __name__ == "__main__":
     if args.orders_file and not validate_orders_file(args.orders_file):
         sys.exit(1)
     
-    success = execute_orders(orders_file=args.orders_file, commit=args.commit)
+    with perf_step('execute_orders'):
+        success = execute_orders(orders_file=args.orders_file, commit=args.commit)
     sys.exit(0 if success else 1)
@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+Orders Store - ETF Italia Project v10
+Storage degli ordini generati da strategy_engine: file, indice dei run, orders_plan
+
+LOGICA:
+- orders_<ts>.json resta il formato di scambio (execute_orders, audit)
+- Sidecar colonnare orders_<ts>.parquet (scritto con DuckDB, nessuna dipendenza extra)
+- Indice dei run per data in orders_index.ndjson (append di una riga per run):
+  niente listing della directory per trovare l'ultimo file o i run di un periodo;
+  indice assente o più vecchio della directory (file scritti senza indice) →
+  i file orders_*.json non indicizzati vengono aggiunti dal listing
+- Validazione con schema compilato una volta sola, in streaming sugli ordini
+  (si ferma al primo errore; i file .ndjson vengono letti riga per riga);
+  qty/price come stringhe numeriche (file storici) convertiti in float, non rifiutati
+- KPI: aggregati di uno o più run con una sola query read_parquet
+  (fallback su JSON per i run storici senza sidecar)
+"""
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+import duckdb
+
+ORDERS_INDEX_NAME = 'orders_index.ndjson'
+
+RUN_REQUIRED_FIELDS = ('timestamp', 'dry_run', 'orders', 'summary')
+
+# Schema ordine: campo → (tipi ammessi, valori ammessi); None = nessun vincolo
+ORDER_SCHEMA = {
+    'symbol': (str, None),
+    'action': (str, ('BUY', 'SELL', 'HOLD')),
+    'qty': ((int, float), None),
+    'price': ((int, float), None),
+    'reason': (None, None),
+    'recommendation': (str, ('TRADE', 'HOLD')),
+}
+
+# Campi numerici: stringhe numeriche convertite in float (file ordini storici)
+NUMERIC_ORDER_FIELDS = ('qty', 'price')
+
+# Colonne del sidecar Parquet (ordine = ordine di scrittura)
+ORDER_COLUMNS = (
+    ('run_id', 'VARCHAR'),
+    ('as_of_date', 'DATE'),
+    ('seq', 'INTEGER'),
+    ('symbol', 'VARCHAR'),
+    ('action', 'VARCHAR'),
+    ('qty', 'DOUBLE'),
+    ('price', 'DOUBLE'),
+    ('reason', 'VARCHAR'),
+    ('recommendation', 'VARCHAR'),
+    ('momentum_score', 'DOUBLE'),
+    ('fees_est', 'DOUBLE'),
+    ('tax_friction_est', 'DOUBLE'),
+    ('trade_score', 'DOUBLE'),
+    ('signal_state', 'VARCHAR'),
+    ('risk_scalar', 'DOUBLE'),
+)
+
+_NUMERIC_DEFAULTS = ('momentum_score', 'fees_est', 'tax_friction_est', 'trade_score')
+
+ORDERS_STATS_SQL = """
+SELECT
+    run_id,
+    COUNT(*) AS total_orders,
+    COUNT(*) FILTER (WHERE action = 'BUY') AS buy_orders,
+    COUNT(*) FILTER (WHERE action = 'SELL') AS sell_orders,
+    COUNT(*) FILTER (WHERE action = 'HOLD') AS hold_orders,
+    COALESCE(SUM(qty * price) FILTER (WHERE action = 'BUY'), 0) AS total_buy_value,
+    COALESCE(SUM(qty * price) FILTER (WHERE action = 'SELL'), 0) AS total_sell_value,
+    COALESCE(SUM(fees_est + tax_friction_est), 0) AS total_costs,
+    COALESCE(SUM(fees_est + tax_friction_est) FILTER (WHERE action IN ('BUY', 'SELL')), 0) AS trade_costs,
+    COALESCE(AVG(momentum_score), 0) AS avg_momentum_score,
+    COALESCE(AVG(trade_score), 0) AS avg_trade_score
+FROM orders
+GROUP BY run_id
+"""
+
+
+def _coerce_number(order, field):
+    """Converte in float una stringa numerica nell'ordine (altrimenti valore invariato)"""
+    value = order.get(field)
+    if isinstance(value, str):
+        try:
+            value = order[field] = float(value)
+        except ValueError:
+            pass
+    return value
+
+
+def normalize_orders(orders):
+    """Converte in float qty/price ricevuti come stringhe numeriche (in place)"""
+    for order in orders:
+        for field in NUMERIC_ORDER_FIELDS:
+            _coerce_number(order, field)
+    return orders
+
+
+def compile_order_validator(schema=ORDER_SCHEMA):
+    """Compila lo schema in una lista di check (campo, tipi, valori ammessi)
+
+    I campi numerici ricevuti come stringa numerica vengono convertiti in float
+    nell'ordine stesso (come li accettava il loader storico).
+
+    Returns:
+        callable(order) -> messaggio di errore o None
+    """
+    checks = [
+        (field, types, frozenset(allowed) if allowed else None, field in NUMERIC_ORDER_FIELDS)
+        for field, (types, allowed) in schema.items()
+    ]
+
+    def validate(order):
+        for field, types, allowed, numeric in checks:
+            if field not in order:
+                return f"campo mancante {field}"
+            value = order[field]
+            if numeric and isinstance(value, str):
+                value = _coerce_number(order, field)
+                if isinstance(value, str):
+                    return f"{field} non numerico {value!r}"
+            if allowed is not None:
+                if value not in allowed:
+                    return f"{field} non valido {value}"
+            elif types is not None and (not isinstance(value, types) or isinstance(value, bool)):
+                return f"{field} tipo non valido {type(value).__name__}"
+        return None
+
+    return validate
+
+
+_validate_order = compile_order_validator()
+
+
+def iter_orders(orders_file):
+    """Itera gli ordini di un file (.ndjson riga per riga, .json via json.load)"""
+    path = Path(orders_file)
+    if path.suffix == '.ndjson':
+        with open(path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    with open(path, 'r') as f:
+        data = json.load(f)
+    yield from data.get('orders', [])
+
+
+def validate_orders_data(data):
+    """Valida struttura run + ordini (stop al primo errore)
+
+    Returns:
+        tuple: (ok, messaggio errore o None, numero ordini)
+    """
+    for field in RUN_REQUIRED_FIELDS:
+        if field not in data:
+            return False, f"Campo mancante: {field}", 0
+    orders = data['orders']
+    if not isinstance(orders, list):
+        return False, "Orders non è una lista", 0
+    for i, order in enumerate(orders):
+        error = _validate_order(order)
+        if error:
+            return False, f"Ordine {i}: {error}", i
+    return True, None, len(orders)
+
+
+def validate_orders_stream(orders):
+    """Valida un iterabile di ordini senza materializzarlo
+
+    Returns:
+        tuple: (ok, messaggio errore o None, ordini validati)
+    """
+    n = 0
+    for n, order in enumerate(orders, start=1):
+        error = _validate_order(order)
+        if error:
+            return False, f"Ordine {n - 1}: {error}", n - 1
+    return True, None, n
+
+
+def orders_parquet_path(orders_file):
+    """Sidecar Parquet di un file ordini (stesso nome, estensione .parquet)"""
+    return Path(orders_file).with_suffix('.parquet')
+
+
+def _run_id_for(orders_file):
+    """Chiave del run nell'indice e nel sidecar: nome file senza estensione"""
+    return Path(orders_file).stem
+
+
+def _order_rows(orders, run_id, as_of_date):
+    rows = []
+    for seq, order in enumerate(orders):
+        row = [run_id, as_of_date, seq]
+        for name, _ in ORDER_COLUMNS[3:]:
+            value = order.get(name)
+            if value is None and name in _NUMERIC_DEFAULTS:
+                value = 0.0
+            row.append(value)
+        rows.append(row)
+    return rows
+
+
+def _load_orders_table(con, rows):
+    columns = ', '.join(f"{name} {dtype}" for name, dtype in ORDER_COLUMNS)
+    con.execute(f"CREATE OR REPLACE TEMP TABLE orders ({columns})")
+    if rows:
+        con.executemany(
+            f"INSERT INTO orders VALUES ({', '.join(['?'] * len(ORDER_COLUMNS))})",
+            rows,
+        )
+
+
+def _sql_path(path):
+    return str(path).replace("'", "''")
+
+
+def write_orders_parquet(orders, parquet_path, run_id, as_of_date=None):
+    """Scrive il sidecar colonnare degli ordini"""
+    con = duckdb.connect()
+    try:
+        _load_orders_table(con, _order_rows(orders, run_id, as_of_date))
+        con.execute(f"COPY orders TO '{_sql_path(parquet_path)}' (FORMAT PARQUET)")
+    finally:
+        con.close()
+    return Path(parquet_path)
+
+
+def append_run_index(orders_dir, entry):
+    """Aggiunge una riga all'indice dei run (orders_index.ndjson)"""
+    index_path = Path(orders_dir) / ORDERS_INDEX_NAME
+    with open(index_path, 'a') as f:
+        f.write(json.dumps(entry, default=str) + '\n')
+    return index_path
+
+
+def _entry_from_name(path):
+    """Voce d'indice ricostruita dal nome file (orders_<YYYYmmdd_HHMMSS>.json)"""
+    stamp = path.stem[len('orders_'):]
+    try:
+        as_of = datetime.strptime(stamp[:8], '%Y%m%d').date().isoformat()
+    except ValueError:
+        as_of = None
+    try:
+        timestamp = datetime.strptime(stamp, '%Y%m%d_%H%M%S').isoformat()
+    except ValueError:
+        timestamp = stamp
+    return {'run_id': path.stem, 'as_of_date': as_of, 'timestamp': timestamp, 'orders_file': path.name}
+
+
+def load_run_index(orders_dir, start_date=None, end_date=None):
+    """Run indicizzati (ordinati per as_of_date, timestamp), filtrati per periodo
+
+    Senza indice (directory storiche) o con indice più vecchio della directory
+    (file scritti senza passare dall'indice) aggiunge le voci dai nomi file.
+    """
+    orders_dir = Path(orders_dir)
+    index_path = orders_dir / ORDERS_INDEX_NAME
+    entries = []
+
+    index_fresh = False
+    if index_path.exists():
+        with open(index_path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    entries.append(json.loads(line))
+        # L'append all'indice segue la scrittura dei file del run: un file creato dopo rende la directory più recente
+        index_fresh = index_path.stat().st_mtime_ns >= orders_dir.stat().st_mtime_ns
+    if not index_fresh and orders_dir.exists():
+        known = {e.get('orders_file') for e in entries}
+        entries.extend(_entry_from_name(path) for path in sorted(orders_dir.glob('orders_*.json'))
+                       if path.name not in known)
+
+    start = str(start_date) if start_date else None
+    end = str(end_date) if end_date else None
+    selected = [
+        e for e in entries
+        if (start is None or (e.get('as_of_date') or '') >= start)
+        and (end is None or (e.get('as_of_date') or '') <= end)
+    ]
+    return sorted(selected, key=lambda e: (e.get('as_of_date') or '', str(e.get('timestamp') or '')))
+
+
+def latest_orders_file(orders_dir):
+    """Ultimo file ordini dall'indice, completato dal listing se assente o non aggiornato"""
+    orders_dir = Path(orders_dir)
+    for entry in reversed(load_run_index(orders_dir)):
+        path = orders_dir / entry['orders_file']
+        if path.exists():
+            return path
+    if orders_dir.exists():
+        files = sorted(orders_dir.glob('orders_*.json'))
+        if files:
+            return files[-1]
+    return None
+
+
+def write_orders_plan(conn, orders, run_id, as_of_date, config_hash=None):
+    """Scrive gli ordini proposti in orders_plan (un solo INSERT multi-riga)
+
+    Returns:
+        int: righe scritte (0 se la tabella non esiste)
+    """
+    exists = conn.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'orders_plan'"
+    ).fetchone()[0]
+    if not exists or not orders:
+        return 0
+
+    next_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM orders_plan").fetchone()[0]
+    plan_date = as_of_date or datetime.now().date().isoformat()
+    rows = []
+    for i, order in enumerate(orders):
+        status = order.get('recommendation')
+        score = order.get('trade_score')
+        rows.append([
+            next_id + i,
+            run_id,
+            plan_date,
+            order['symbol'],
+            order['action'],
+            max(float(order.get('qty') or 0.0), 0.0),
+            status if status in ('TRADE', 'HOLD') else 'REJECTED',
+            order.get('execution_price_mode') or 'CLOSE_SAME_DAY_SLIPPAGE',
+            order.get('price'),
+            min(max(float(score), 0.0), 1.0) if score is not None else None,
+            order.get('decision_path') or 'STRATEGY_ENGINE',
+            order.get('reason_code') or order.get('reason') or 'UNKNOWN',
+            order.get('reject_reason'),
+            config_hash,
+        ])
+
+    placeholder = '(' + ', '.join(['?'] * 14) + ')'
+    conn.execute(
+        """
+        INSERT INTO orders_plan (id, run_id, date, symbol, side, qty, status, execution_price_mode,
+                                 proposed_price, candidate_score, decision_path, reason_code,
+                                 reject_reason, config_snapshot_hash)
+        VALUES """ + ', '.join([placeholder] * len(rows)),
+        [value for row in rows for value in row],
+    )
+    return len(rows)
+
+
+def write_orders_run(orders_summary, orders_file, conn=None, config_hash=None):
+    """Salva un run di ordini: JSON, sidecar Parquet, indice e (con conn) orders_plan
+
+    Args:
+        orders_summary: dict con timestamp, as_of_date, dry_run, orders, summary
+        orders_file: path del file JSON (orders_<ts>.json o forecast_<ts>.json)
+        conn: connessione DuckDB scrivibile per orders_plan (opzionale)
+
+    Returns:
+        dict: run_id, orders_file, parquet_file, orders_plan_rows
+    """
+    orders_file = Path(orders_file)
+    orders_file.parent.mkdir(parents=True, exist_ok=True)
+    orders = orders_summary.get('orders', [])
+    run_id = _run_id_for(orders_file)
+    as_of_date = orders_summary.get('as_of_date')
+    as_of_date = as_of_date if as_of_date not in (None, 'None') else None
+
+    with open(orders_file, 'w') as f:
+        json.dump(orders_summary, f, indent=2)
+
+    parquet_file = write_orders_parquet(orders, orders_parquet_path(orders_file), run_id, as_of_date)
+
+    append_run_index(orders_file.parent, {
+        'run_id': run_id,
+        'as_of_date': as_of_date,
+        'timestamp': orders_summary.get('timestamp'),
+        'dry_run': orders_summary.get('dry_run'),
+        'n_orders': len(orders),
+        'orders_file': orders_file.name,
+        'parquet_file': parquet_file.name,
+    })
+
+    plan_rows = write_orders_plan(conn, orders, run_id, as_of_date, config_hash) if conn is not None else 0
+
+    return {
+        'run_id': run_id,
+        'orders_file': orders_file,
+        'parquet_file': parquet_file,
+        'orders_plan_rows': plan_rows,
+    }
+
+
+def _stats_connection(orders_files):
+    """Connessione in-memory con tabella/vista 'orders' sui file richiesti"""
+    con = duckdb.connect()
+    parquet, legacy = [], []
+    for path in orders_files:
+        path = Path(path)
+        sidecar = path if path.suffix == '.parquet' else orders_parquet_path(path)
+        (parquet if sidecar.exists() else legacy).append((path, sidecar))
+
+    rows = []
+    for path, _ in legacy:
+        with open(path, 'r') as f:
+            data = json.load(f)
+        rows.extend(_order_rows(data.get('orders', []), _run_id_for(path), data.get('as_of_date')))
+    _load_orders_table(con, rows)
+
+    if parquet:
+        files = ', '.join(f"'{_sql_path(sidecar)}'" for _, sidecar in parquet)
+        con.execute(f"INSERT INTO orders SELECT * FROM read_parquet([{files}])")
+    return con
+
+
+def summarize_orders(orders_files):
+    """Aggregati KPI per run (una query colonnare su tutti i file)
+
+    Returns:
+        dict: run_id → metriche (total_orders, buy_orders, ..., avg_trade_score)
+    """
+    if isinstance(orders_files, (str, os.PathLike)):
+        orders_files = [orders_files]
+    con = _stats_connection(orders_files)
+    try:
+        cursor = con.execute(ORDERS_STATS_SQL)
+        columns = [d[0] for d in cursor.description]
+        return {row[0]: dict(zip(columns, row)) for row in cursor.fetchall()}
+    finally:
+        con.close()
+
+
+def summarize_order_file(orders_file):
+    """Aggregati KPI di un singolo file ordini (metriche a zero se vuoto)"""
+    stats = summarize_orders([orders_file])
+    if stats:
+        return next(iter(stats.values()))
+    return {
+        'run_id': Path(orders_file).stem, 'total_orders': 0, 'buy_orders': 0, 'sell_orders': 0,
+        'hold_orders': 0, 'total_buy_value': 0.0, 'total_sell_value': 0.0, 'total_costs': 0.0,
+        'trade_costs': 0.0, 'avg_momentum_score': 0.0, 'avg_trade_score': 0.0,
+    }
+
+
+def summarize_orders_history(orders_dir, start_date=None, end_date=None):
+    """Aggregati per run su un periodo (indice + una query read_parquet)
+
+    Returns:
+        list di dict ordinati per as_of_date (metadati indice + metriche)
+    """
+    orders_dir = Path(orders_dir)
+    entries = [e for e in load_run_index(orders_dir, start_date, end_date)
+               if (orders_dir / e['orders_file']).exists()]
+    if not entries:
+        return []
+    stats = summarize_orders([orders_dir / e['orders_file'] for e in entries])
+    return [{**e, **stats.get(e['run_id'], {})} for e in entries]
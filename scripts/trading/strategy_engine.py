@@ -11,13 +11,14 @@ import duckdb
 
 from datetime import datetime
 
-from utils.universe_helper import get_universe_symbols
+from utils.universe_helper import get_universe_symbols, get_default_venue
 from utils.asof_date import compute_asof_date
 
 # Aggiungi root al path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.path_manager import get_path_manager
+from utils.perf_trace import perf_step, span
 
 from orchestration.session_manager import get_session_manager
 from orchestration.sequence_runner import run_sequence_from
@@ -38,10 +39,11 @@ def strategy_engine(dry_run=True, commit=False):
     with open(config_path, 'r') as f:
         config = json.load(f)
     
-    conn = duckdb.connect(db_path)
+    # Read-only in dry-run: può girare in parallelo agli altri step di sola lettura
+    conn = duckdb.connect(db_path, read_only=(dry_run or not commit))
 
     # Determina una data 'as-of' coerente per evitare future leak / look-ahead
-    venue = 'BIT'
+    venue = get_default_venue(config)
     coverage_threshold = float(config.get('settings', {}).get('coverage_threshold', 0.8))
     universe_symbols = get_universe_symbols(config, include_benchmark=False)
     as_of_date = compute_asof_date(conn, universe_symbols, coverage_threshold=coverage_threshold, venue=venue)
@@ -82,32 +84,35 @@ def strategy_engine(dry_run=True, commit=False):
         print(" Caricamento prezzi correnti...")
         
         current_prices = {}
-        for symbol, signal_state, risk_scalar, explain_code in current_signals:
-            price_data = conn.execute("""
-            SELECT close, adj_close, volume, volatility_20d
-            FROM risk_metrics 
-            WHERE symbol = ? AND date = ?
-            """, [symbol, as_of_date]).fetchone()
+        with span('load_prices') as tracer:
+            for symbol, signal_state, risk_scalar, explain_code in current_signals:
+                tracer.count('sql_calls')
+                price_data = conn.execute("""
+                SELECT close, adj_close, volume, volatility_20d
+                FROM risk_metrics 
+                WHERE symbol = ? AND date = ?
+                """, [symbol, as_of_date]).fetchone()
             
 
-            if not price_data:
-                # Fallback: usa market_data (ultima data <= as_of_date) se risk_metrics non è disponibile per quella data
-                # STRICT: require market_data on as_of_date (no stale pricing)
-                price_data_md = conn.execute("""
-                SELECT close, adj_close, volume, NULL as volatility_20d
-                FROM market_data
-                WHERE symbol = ?
-                  AND date = ?
-                """, [symbol, as_of_date]).fetchone()
-                price_data = price_data_md
+                if not price_data:
+                    # Fallback: usa market_data (ultima data <= as_of_date) se risk_metrics non è disponibile per quella data
+                    # STRICT: require market_data on as_of_date (no stale pricing)
+                    tracer.count('sql_calls')
+                    price_data_md = conn.execute("""
+                    SELECT close, adj_close, volume, NULL as volatility_20d
+                    FROM market_data
+                    WHERE symbol = ?
+                      AND date = ?
+                    """, [symbol, as_of_date]).fetchone()
+                    price_data = price_data_md
 
-            if price_data:
-                current_prices[symbol] = {
-                    'close': price_data[0],
-                    'adj_close': price_data[1],
-                    'volume': price_data[2],
-                    'volatility_20d': price_data[3]
-                }
+                if price_data:
+                    current_prices[symbol] = {
+                        'close': price_data[0],
+                        'adj_close': price_data[1],
+                        'volume': price_data[2],
+                        'volatility_20d': price_data[3]
+                    }
         
         # 4. Calcola portfolio value reale da ledger
         print(" Calcolo portfolio value da ledger...")
@@ -405,11 +410,14 @@ def strategy_engine(dry_run=True, commit=False):
             # Commit → production orders
             orders_file = str(pm.production_orders_path())
         
-        pm.ensure_parent_dir(orders_file)
-        with open(orders_file, 'w') as f:
-            json.dump(orders_summary, f, indent=2)
+        # JSON + sidecar Parquet + indice run; orders_plan solo con connessione scrivibile
+        from trading.orders_store import write_orders_run
+        with span('write_orders', orders=len(orders)):
+            stored = write_orders_run(orders_summary, orders_file, conn=None if (dry_run or not commit) else conn)
         
         print(f"📁 Ordini salvati in: {orders_file}")
+        if stored['orders_plan_rows']:
+            print(f"   orders_plan: {stored['orders_plan_rows']} righe (run {stored['run_id']})")
         
         # 6.1 Esegui ordini se --commit
         if not dry_run and commit:
@@ -453,7 +461,8 @@ if __name__ == "__main__":
     args = parser.parse_args()
     
     # Esegui strategy_engine e poi continua con la sequenza
-    success = strategy_engine(dry_run=args.dry_run, commit=args.commit)
+    with perf_step('strategy_engine'):
+        success = strategy_engine(dry_run=args.dry_run, commit=args.commit)
     
     if success:
         # Continua con la sequenza: backtest_runner, performance_report_generator, analyze_schema_drift
@@ -32,6 +32,7 @@ from utils.universe_helper import (
     get_ter_for_symbol,
     get_underlying_for_symbol,
     get_execution_model_for_symbol,
+    get_default_venue,
 )
 from utils.asof_date import compute_asof_date
 
@@ -42,7 +43,8 @@ def generate_orders_with_holding_period(
     current_date: datetime.date = None,
     run_type: str = 'BACKTEST',
     run_id: str = None,
-    underlying_map: dict = None
+    underlying_map: dict = None,
+    peak_tracker=None
 ) -> dict:
     """
     Genera ordini con logica holding period dinamico + portfolio construction
@@ -71,6 +73,8 @@ def generate_orders_with_holding_period(
         run_type: BACKTEST o PRODUCTION
         run_id: UUID run (generato se None)
         underlying_map: Dict {symbol: underlying} per overlap check
+        peak_tracker: PositionPeakTracker condiviso tra le chiamate (backtest);
+            se None ne crea uno per la chiamata (persistito in PRODUCTION)
         
     Returns:
         Dict con orders, rejects, metrics
@@ -83,7 +87,7 @@ def generate_orders_with_holding_period(
         # Calcola una data as-of coerente (avoid look-ahead) se non fornita
         coverage_threshold = float(config.get('settings', {}).get('coverage_threshold', 0.8))
         symbols = get_universe_symbols(config, include_benchmark=False)
-        current_date = compute_asof_date(conn, symbols, coverage_threshold=coverage_threshold, venue='BIT')
+        current_date = compute_asof_date(conn, symbols, coverage_threshold=coverage_threshold, venue=get_default_venue(config))
     
     if run_id is None:
         run_id = f"backtest_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
@@ -122,19 +126,27 @@ def generate_orders_with_holding_period(
     print("🔴 PASS 1: EXIT/SELL (MANDATORY FIRST)")
     print("-" * 80)
     
-    signals_query = """
+    # Volatilità effettiva: override sintetico di signal_overlay (zombie prices) se presente
+    has_overlay = conn.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'signal_overlay'"
+    ).fetchone()[0] > 0
+    volatility_expr = "COALESCE(o.volatility_override, rm.volatility_20d)" if has_overlay else "rm.volatility_20d"
+    overlay_join = "LEFT JOIN signal_overlay o ON o.symbol = s.symbol AND o.date = s.date" if has_overlay else ""
+
+    signals_query = f"""
     SELECT 
         s.symbol,
         s.signal_state,
         s.risk_scalar,
         s.explain_code,
-        rm.volatility_20d,
+        {volatility_expr} AS volatility_20d,
         rm.sma_200,
         rm.daily_return,
         rm.close,
         rm.adj_close
     FROM signals s
     JOIN risk_metrics rm ON s.symbol = rm.symbol AND s.date = rm.date
+    {overlay_join}
     WHERE s.date = ?
     ORDER BY s.symbol
     """
@@ -192,6 +204,16 @@ def generate_orders_with_holding_period(
     trailing_stop_pct = -0.03  # -3% da peak (più stretto)
     vol_breaker = config.get('risk_management', {}).get('volatility_breaker', 0.20)
     
+    # Peak trailing stop: running max per posizione (seed una volta, poi O(1) per barra)
+    if peak_tracker is None:
+        from risk.trailing_stop_v2 import PositionPeakTracker
+        peak_tracker = PositionPeakTracker(conn, persist=(run_type == 'PRODUCTION'))
+    peak_tracker.observe(
+        current_positions,
+        {symbol: data['close'] for symbol, data in signals_data.items()},
+        current_date
+    )
+    
     for symbol, pos in current_positions.items():
         signal = signals_data.get(symbol)
         if not signal:
@@ -246,13 +268,8 @@ def generate_orders_with_holding_period(
             print(f"  💰 SELL {symbol}: TAKE-PROFIT → {qty:.0f} @ €{price:.2f} (P&L: {pnl_pct*100:+.1f}%)")
             continue
         
-        # MANDATORY 4: Trailing Stop (calcola peak da entry)
-        # Peak stimato via MAX(close) da entry_date a oggi (robusto per backtest)
-        peak_row = conn.execute(
-            """SELECT MAX(close) FROM market_data WHERE symbol = ? AND date BETWEEN ? AND ?""",
-            [symbol, pos['entry_date'], current_date]
-        ).fetchone()
-        peak_close = peak_row[0] if peak_row else None
+        # MANDATORY 4: Trailing Stop (peak = massimo close da entry_date a oggi)
+        peak_close = peak_tracker.peak_price(symbol)
         peak_price = peak_close if (peak_close and peak_close > 0) else price
         peak_price = max(peak_price, entry_price * (1 + trailing_stop_activation))
         drawdown_from_peak = (price - peak_price) / peak_price if peak_price > 0 else 0
@@ -352,9 +369,8 @@ def generate_orders_with_holding_period(
             p.qty,
             md.close,
             p.qty * md.close as market_value
-        FROM positions p
-        JOIN market_data md ON p.symbol = md.symbol
-        WHERE md.date = (SELECT MAX(date) FROM market_data WHERE symbol = p.symbol AND date <= ?)
+        FROM (SELECT *, ?::DATE AS asof_date FROM positions) p
+        ASOF JOIN market_data md ON md.symbol = p.symbol AND md.date <= p.asof_date
     ),
     cash_balance AS (
         SELECT COALESCE(SUM(CASE 
@@ -590,6 +606,7 @@ def generate_orders_with_holding_period(
 def main():
     """Entry point per test standalone"""
     import argparse
+    from risk.trailing_stop_v2 import PositionPeakTracker
     
     parser = argparse.ArgumentParser(description='Strategy Engine V2 con Holding Period')
     parser.add_argument('--date', help='Data target (YYYY-MM-DD)')
@@ -618,7 +635,10 @@ def main():
             current_date=current_date,
             run_type=args.run_type,
             run_id=None,
-            underlying_map=None
+            underlying_map=None,
+            peak_tracker=PositionPeakTracker(
+                conn, persist=(args.run_type == 'PRODUCTION' and not args.dry_run)
+            )
         )
         
         n_sell = len(orders.get('orders_sell', []))
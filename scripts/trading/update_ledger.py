@@ -15,6 +15,7 @@ from datetime import datetime, timedelta
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.path_manager import get_path_manager
+from utils.latest_prices import latest_price_map
 
 def update_ledger(commit=False):
     """Aggiorna ledger con operazioni correnti"""
@@ -168,20 +169,16 @@ def update_ledger(commit=False):
         """).fetchall()
         
         if positions:
+            # Prezzi attuali di tutte le posizioni con una query
+            current_prices = latest_price_map(conn, [p[0] for p in positions])
             for symbol, qty, avg_price, trades in positions:
-                # Ottieni prezzo attuale
-                current_price = conn.execute("""
-                SELECT close FROM market_data 
-                WHERE symbol = ? 
-                ORDER BY date DESC 
-                LIMIT 1
-                """, [symbol]).fetchone()
+                current_price = current_prices.get(symbol)
                 
-                if current_price:
-                    market_value = qty * current_price[0]
-                    pnl = (current_price[0] - avg_price) * qty
+                if current_price is not None:
+                    market_value = qty * current_price
+                    pnl = (current_price - avg_price) * qty
                     
-                    print(f"  {symbol}: {qty:,.0f} @ €{avg_price:.2f} → €{current_price[0]:.2f}")
+                    print(f"  {symbol}: {qty:,.0f} @ €{avg_price:.2f} → €{current_price:.2f}")
                     print(f"    Market value: €{market_value:,.2f} | PnL: €{pnl:+,.2f} | Trades: {trades}")
                 else:
                     print(f"  {symbol}: {qty:,.0f} @ €{avg_price:.2f} (no price data)")
@@ -14,7 +14,7 @@ from __future__ import annotations
 import math
 from typing import List, Optional
 
-def compute_asof_date(conn, symbols: List[str], coverage_threshold: float = 0.8, venue: str = 'BIT'):
+def compute_asof_date(conn, symbols: List[str], coverage_threshold: float = 0.8, venue: Optional[str] = None):
     """Restituisce l'ultima data 'tradabile' coerente per un set di simboli.
 
     Requisiti:
@@ -26,7 +26,7 @@ def compute_asof_date(conn, symbols: List[str], coverage_threshold: float = 0.8,
       conn: duckdb connection
       symbols: lista simboli (escludere benchmark se non rilevante)
       coverage_threshold: 0..1
-      venue: trading venue
+      venue: trading venue (default: ETF_VENUE o venue di default, vedi universe_helper)
 
     Returns:
       datetime.date oppure None se non disponibile
@@ -34,6 +34,10 @@ def compute_asof_date(conn, symbols: List[str], coverage_threshold: float = 0.8,
     if not symbols:
         return conn.execute("SELECT MAX(date) FROM market_data").fetchone()[0]
 
+    if venue is None:
+        from utils.universe_helper import get_default_venue
+        venue = get_default_venue()
+
     threshold = float(coverage_threshold) if coverage_threshold is not None else 0.8
     threshold = max(0.0, min(1.0, threshold))
     min_required = max(1, int(math.ceil(threshold * len(symbols))))
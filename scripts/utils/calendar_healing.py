@@ -21,6 +21,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import duckdb
 from utils.path_manager import get_path_manager
+from utils.universe_helper import get_default_venue
 
 
 class CalendarHealing:
@@ -78,7 +79,7 @@ class CalendarHealing:
         quality_flag: str,
         reason: str,
         symbol: Optional[str] = None,
-        venue: str = 'BIT'
+        venue: Optional[str] = None
     ) -> bool:
         """
         Marca un giorno come problematico nel trading calendar.
@@ -92,6 +93,7 @@ class CalendarHealing:
         Returns:
             True se flagging riuscito
         """
+        venue = venue or get_default_venue()
         conn = duckdb.connect(self.db_path)
         
         try:
@@ -157,13 +159,14 @@ class CalendarHealing:
         quality_flag: str,
         reason: str,
         symbol: Optional[str] = None,
-        venue: str = 'BIT'
+        venue: Optional[str] = None
     ) -> bool:
         """Marca un giorno OPEN come "degraded" senza chiuderlo.
 
         Usa gli stessi campi del calendar healing (quality_flag, flagged_at, flagged_reason).
         Non modifica is_open.
         """
+        venue = venue or get_default_venue()
         conn = duckdb.connect(self.db_path)
         try:
             exists = conn.execute(
@@ -207,8 +210,9 @@ class CalendarHealing:
         finally:
             conn.close()
 
-    def heal_partial_date(self, date: str, venue: str = 'BIT') -> bool:
+    def heal_partial_date(self, date: str, venue: Optional[str] = None) -> bool:
         """Pulisce i flag su un giorno OPEN (non modifica is_open)."""
+        venue = venue or get_default_venue()
         conn = duckdb.connect(self.db_path)
         try:
             flagged = conn.execute(
@@ -289,13 +293,14 @@ class CalendarHealing:
         
         return True
     
-    def get_flagged_dates_for_retry(self, venue: str = 'BIT') -> List[Dict]:
+    def get_flagged_dates_for_retry(self, venue: Optional[str] = None) -> List[Dict]:
         """
         Ritorna lista di giorni flaggati che devono essere ritentati oggi.
         
         Returns:
             Lista di dict con info giorni da ritentare
         """
+        venue = venue or get_default_venue()
         conn = duckdb.connect(self.db_path)
         
         try:
@@ -338,13 +343,14 @@ class CalendarHealing:
         finally:
             conn.close()
     
-    def increment_retry_count(self, date: str, venue: str = 'BIT') -> None:
+    def increment_retry_count(self, date: str, venue: Optional[str] = None) -> None:
         """
         Incrementa retry_count per un giorno dopo tentativo fallito.
         
         Args:
             date: Data da aggiornare
         """
+        venue = venue or get_default_venue()
         conn = duckdb.connect(self.db_path)
         
         try:
@@ -359,7 +365,7 @@ class CalendarHealing:
         finally:
             conn.close()
     
-    def heal_date(self, date: str, symbol: Optional[str] = None, venue: str = 'BIT') -> bool:
+    def heal_date(self, date: str, symbol: Optional[str] = None, venue: Optional[str] = None) -> bool:
         """
         Ripristina un giorno come trading day dopo healing riuscito.
         
@@ -370,6 +376,7 @@ class CalendarHealing:
         Returns:
             True se healing riuscito
         """
+        venue = venue or get_default_venue()
         conn = duckdb.connect(self.db_path)
         
         try:
@@ -409,13 +416,14 @@ class CalendarHealing:
         finally:
             conn.close()
     
-    def get_healing_stats(self, venue: str = 'BIT') -> Dict:
+    def get_healing_stats(self, venue: Optional[str] = None) -> Dict:
         """
         Ritorna statistiche sistema healing.
         
         Returns:
             Dict con statistiche
         """
+        venue = venue or get_default_venue()
         conn = duckdb.connect(self.db_path)
         
         try:
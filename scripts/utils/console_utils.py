@@ -6,6 +6,8 @@ Utility per gestione robusta console Windows (UTF-8 encoding)
 import sys
 import io
 
+_console_configured = False
+
 
 def setup_windows_console():
     """
@@ -18,13 +20,19 @@ def setup_windows_console():
     1. Tenta reconfigure() se disponibile (Python 3.7+)
     2. Fallback con TextIOWrapper se reconfigure fallisce
     3. Gestisce gracefully errori (non blocca esecuzione)
+    
+    Idempotente: chiamate successive nello stesso processo non fanno nulla.
     """
+    global _console_configured
+    if _console_configured:
+        return True
     
     # Layer 1: Reconfigure (Python 3.7+)
     if hasattr(sys.stdout, "reconfigure"):
         try:
             sys.stdout.reconfigure(encoding="utf-8", errors="replace")
             sys.stderr.reconfigure(encoding="utf-8", errors="replace")
+            _console_configured = True
             return True
         except Exception:
             pass  # Fallback to layer 2
@@ -48,6 +56,7 @@ def setup_windows_console():
                 line_buffering=True
             )
         
+        _console_configured = True
         return True
         
     except Exception:
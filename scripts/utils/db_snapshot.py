@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+DB Snapshot - ETF Italia Project v10
+Copia read-only del database per report e monitor, pubblicata dopo ogni stage che scrive
+
+LOGICA:
+- DuckDB ammette un solo processo writer e anche un lettore read-only tiene un lock
+  sul file: report e monitor che aprono etf_data.duckdb bloccano ingest/backtest
+- publish_snapshot(): connessione in memoria, ATTACH del DB (READ_ONLY) e
+  COPY FROM DATABASE in un file nuovo (data/cache/db_snapshots/etf_data_<ts>.duckdb),
+  poi LATEST.json aggiornato con os.replace → i lettori vedono sempre uno snapshot completo
+- Ogni snapshot è un file nuovo: i lettori già aperti sul precedente non vengono toccati;
+  restano gli ultimi KEEP_SNAPSHOTS (i file ancora aperti altrove sono ignorati)
+- publish_after_write(): a fine run standalone di un writer (ingest, signals, backtest);
+  nella sequenza lo snapshot lo pubblica il runner dopo i writer che toccano tabelle
+  lette da un reader successivo (step_graph.snapshot_publish_steps)
+- reader_db_path(): path da aprire con read_only=True
+  - ETF_READ_SNAPSHOT=1 (solo env dei processi figli della sequenza): snapshot se presente
+  - ETF_READ_SNAPSHOT=0: sempre il DB principale
+  - default: snapshot solo se allineato al DB (mtime/size registrati alla pubblicazione),
+    altrimenti il DB principale
+- connect_reader(): apre il path read-only; DB principale bloccato da un writer (es. dopo
+  un CHECKPOINT lo snapshot non è più allineato) → ultimo snapshot pubblicato di quel DB,
+  con avviso che i dati possono non essere aggiornati
+"""
+
+import sys
+import os
+import json
+from datetime import datetime
+from pathlib import Path
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SNAPSHOT_ENV = 'ETF_READ_SNAPSHOT'
+SEQUENCE_CHILD_ENV = 'ETF_ITA_SEQUENCE_CHILD'  # vedi orchestration/sequence_runner.py
+LATEST_FILE = 'LATEST.json'
+KEEP_SNAPSHOTS = 2
+
+
+def _default_paths(db_path=None, snapshots_dir=None):
+    if db_path is None or snapshots_dir is None:
+        from utils.path_manager import get_path_manager
+        pm = get_path_manager()
+        db_path = db_path or pm.db_path
+        snapshots_dir = snapshots_dir or pm.db_snapshots_dir
+    return Path(db_path), Path(snapshots_dir)
+
+
+def _sql_path(path):
+    return str(path).replace('\\', '/').replace("'", "''")
+
+
+def _source_stat(db_path):
+    st = os.stat(db_path)
+    return {'source_mtime_ns': st.st_mtime_ns, 'source_size': st.st_size}
+
+
+def load_snapshot_info(snapshots_dir=None):
+    """Metadati dell'ultimo snapshot pubblicato (None se assente)"""
+    _, snapshots_dir = _default_paths(snapshots_dir=snapshots_dir)
+    try:
+        with open(snapshots_dir / LATEST_FILE, 'r') as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not (snapshots_dir / info.get('file', '')).is_file():
+        return None
+    info['path'] = str(snapshots_dir / info['file'])
+    return info
+
+
+def snapshot_is_current(db_path=None, snapshots_dir=None, info=None):
+    """True se l'ultimo snapshot riflette il DB attuale (nessuna scrittura successiva)"""
+    db_path, snapshots_dir = _default_paths(db_path, snapshots_dir)
+    info = info or load_snapshot_info(snapshots_dir)
+    if not info or not db_path.exists():
+        return False
+    stat = _source_stat(db_path)
+    return (info.get('source_mtime_ns'), info.get('source_size')) == (stat['source_mtime_ns'], stat['source_size'])
+
+
+def publish_snapshot(db_path=None, snapshots_dir=None, keep=KEEP_SNAPSHOTS):
+    """
+    Pubblica uno snapshot consistente del DB (da chiamare a writer chiuso)
+
+    Returns:
+        dict: file, path, published_at, seconds, size
+    """
+    import duckdb
+    import time
+
+    db_path, snapshots_dir = _default_paths(db_path, snapshots_dir)
+    snapshots_dir.mkdir(parents=True, exist_ok=True)
+    t0 = time.perf_counter()
+
+    stat = _source_stat(db_path)
+    name = f"{db_path.stem}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.duckdb"
+    tmp_path = snapshots_dir / f".{name}.{os.getpid()}.tmp"
+    conn = duckdb.connect()
+    try:
+        conn.execute(f"ATTACH '{_sql_path(db_path)}' AS snapshot_src (READ_ONLY)")
+        conn.execute(f"ATTACH '{_sql_path(tmp_path)}' AS snapshot_dst")
+        conn.execute("COPY FROM DATABASE snapshot_src TO snapshot_dst")
+        conn.execute("DETACH snapshot_dst")
+        conn.execute("DETACH snapshot_src")
+    except Exception:
+        conn.close()
+        for leftover in (tmp_path, Path(f"{tmp_path}.wal")):
+            if leftover.exists():
+                leftover.unlink()
+        raise
+    conn.close()
+    os.replace(tmp_path, snapshots_dir / name)
+
+    info = {
+        'file': name,
+        'source_db': str(db_path),
+        'published_at': datetime.now().isoformat(),
+        'seconds': round(time.perf_counter() - t0, 3),
+        'size': (snapshots_dir / name).stat().st_size,
+        **stat,
+    }
+    latest_tmp = snapshots_dir / f"{LATEST_FILE}.{os.getpid()}.tmp"
+    with open(latest_tmp, 'w') as f:
+        json.dump(info, f, indent=2)
+    os.replace(latest_tmp, snapshots_dir / LATEST_FILE)
+
+    # Pulizia snapshot vecchi (un file ancora aperto da un lettore resta fino al giro successivo)
+    for old in sorted(snapshots_dir.glob(f"{db_path.stem}_*.duckdb"))[:-keep]:
+        try:
+            old.unlink()
+        except OSError:
+            pass
+    return dict(info, path=str(snapshots_dir / name))
+
+
+def ensure_snapshot(db_path=None, snapshots_dir=None):
+    """Pubblica uno snapshot solo se assente o non allineato al DB"""
+    db_path, snapshots_dir = _default_paths(db_path, snapshots_dir)
+    info = load_snapshot_info(snapshots_dir)
+    if snapshot_is_current(db_path, snapshots_dir, info):
+        return info
+    return publish_snapshot(db_path, snapshots_dir)
+
+
+def publish_after_write(step, db_path=None):
+    """Pubblica lo snapshot dopo un writer lanciato da solo (non bloccante)"""
+    if os.environ.get(SEQUENCE_CHILD_ENV):
+        return None
+    try:
+        info = publish_snapshot(db_path)
+    except Exception as e:
+        print(f"⚠️  Snapshot DB dopo {step} non pubblicato (report sul DB principale): {e}")
+        return None
+    print(f"📸 Snapshot DB pubblicato: {info['file']} ({info['seconds']:.1f}s)")
+    return info
+
+
+def reader_db_path(db_path=None, snapshots_dir=None, mode=None):
+    """Path del DB per i lettori (snapshot o DB principale), da aprire con read_only=True
+
+    mode: come SNAPSHOT_ENV ('1' ultimo snapshot pubblicato, '0' DB principale);
+    None legge l'env del processo.
+    """
+    db_path, snapshots_dir = _default_paths(db_path, snapshots_dir)
+    if mode is None:
+        mode = os.environ.get(SNAPSHOT_ENV, '')
+    if mode == '0':
+        return str(db_path)
+    info = load_snapshot_info(snapshots_dir)
+    if info and (mode == '1' or snapshot_is_current(db_path, snapshots_dir, info)):
+        return info['path']
+    return str(db_path)
+
+
+def connect_reader(db_path=None, snapshots_dir=None, connect=None):
+    """Connessione read-only per report e monitor
+
+    Args:
+        db_path: path da aprire (default reader_db_path())
+        connect: factory delle connessioni (default duckdb.connect)
+    Returns:
+        tuple: (conn, path aperto); lock del writer sul DB principale → ultimo snapshot
+        pubblicato dello stesso DB (dati possibilmente non aggiornati)
+    """
+    if connect is None:
+        import duckdb
+        connect = duckdb.connect
+    path = str(db_path) if db_path is not None else reader_db_path(snapshots_dir=snapshots_dir)
+    try:
+        return connect(path, read_only=True), path
+    except Exception as e:
+        if 'lock' not in str(e).lower():
+            raise
+        _, snapshots_dir = _default_paths(path, snapshots_dir)
+        info = load_snapshot_info(snapshots_dir)
+        if not info or info['path'] == path or Path(info.get('source_db', '')).resolve() != Path(path).resolve():
+            raise
+        print(f"⚠️  {Path(path).name} bloccato da un writer: lettura dallo snapshot {info['file']} "
+              f"del {info['published_at']} (dati possibilmente non aggiornati)")
+        return connect(info['path'], read_only=True), info['path']
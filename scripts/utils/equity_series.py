@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Equity Series - ETF Italia Project v10
+Serie giornaliera equity/cash/posizioni dal fiscal_ledger (somme cumulative, tempo lineare)
+
+LOGICA:
+- Delta per data dal ledger (cash: DEPOSIT/SELL/BUY/INTEREST come nei report;
+  quantità: BUY/SELL per simbolo) → SUM() OVER (ORDER BY date) sulla griglia date
+  (date di mercato ∪ date ledger): nessun join non-equi date × righe ledger
+- Valore posizioni: quantità cumulata × ultimo close disponibile (LOCF per simbolo)
+  solo sui simboli scambiati
+- daily_return al netto dei flussi esterni (DEPOSIT del giorno): (equity - flow) / equity_prev - 1
+- Cache per run: equity_<RUN_TYPE>_<run_id>.parquet in data/cache/equity_series
+  (run_id = ultima scrittura nel ledger) con fingerprint ledger + market_data nel
+  .json accanto; fingerprint cambiato → ricalcolo. Report, production_kpi e
+  portfolio_risk_monitor leggono la stessa serie
+- Scrittura della cache sotto lock su file per run_type (temporaneo per processo +
+  os.replace); una lettura fallita della cache ricade sul calcolo diretto
+"""
+
+import sys
+import os
+import json
+import re
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.kpi_kernels import TRADING_DAYS, annualized_vol, max_drawdown
+
+SERIES_VERSION = 1
+
+# Parametri: run_type (x2, NULL = tutto il ledger)
+EQUITY_SERIES_QUERY = """
+WITH ledger AS (
+    SELECT date, symbol, type, qty, price, fees, tax_paid
+    FROM fiscal_ledger
+    WHERE ? IS NULL OR run_type = ?
+),
+dates AS (
+    SELECT date FROM market_data WHERE date >= (SELECT MIN(date) FROM ledger)
+    UNION
+    SELECT date FROM ledger
+),
+cash_delta AS (
+    SELECT
+        date,
+        SUM(CASE
+            WHEN type = 'DEPOSIT' THEN qty * price - fees - tax_paid
+            WHEN type = 'SELL' THEN qty * price - fees - tax_paid
+            WHEN type = 'BUY' THEN -(qty * price + fees)
+            WHEN type = 'INTEREST' THEN qty
+            ELSE 0
+        END) AS cash_delta,
+        SUM(CASE WHEN type = 'DEPOSIT' THEN qty * price - fees - tax_paid ELSE 0 END) AS external_flow
+    FROM ledger
+    GROUP BY date
+),
+qty_delta AS (
+    SELECT symbol, date, SUM(CASE WHEN type = 'BUY' THEN qty ELSE -qty END) AS qty_delta
+    FROM ledger
+    WHERE type IN ('BUY', 'SELL')
+    GROUP BY symbol, date
+),
+grid AS (
+    SELECT s.symbol, d.date
+    FROM (SELECT DISTINCT symbol FROM qty_delta) s
+    CROSS JOIN dates d
+),
+positions AS (
+    SELECT
+        g.date,
+        SUM(COALESCE(q.qty_delta, 0)) OVER w AS qty,
+        LAST_VALUE(md.close IGNORE NULLS) OVER w AS price
+    FROM grid g
+    LEFT JOIN qty_delta q ON q.symbol = g.symbol AND q.date = g.date
+    LEFT JOIN market_data md ON md.symbol = g.symbol AND md.date = g.date
+    WINDOW w AS (PARTITION BY g.symbol ORDER BY g.date ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
+),
+holdings AS (
+    SELECT
+        date,
+        SUM(CASE WHEN qty > 1e-9 THEN qty * COALESCE(price, 0) ELSE 0 END) AS market_value,
+        COUNT(*) FILTER (WHERE qty > 1e-9) AS n_positions
+    FROM positions
+    GROUP BY date
+),
+series AS (
+    SELECT
+        d.date,
+        SUM(COALESCE(c.cash_delta, 0)) OVER (ORDER BY d.date) AS cash,
+        COALESCE(h.market_value, 0) AS market_value,
+        COALESCE(c.external_flow, 0) AS external_flow,
+        COALESCE(h.n_positions, 0) AS n_positions
+    FROM dates d
+    LEFT JOIN cash_delta c ON c.date = d.date
+    LEFT JOIN holdings h ON h.date = d.date
+)
+SELECT
+    date,
+    cash,
+    market_value,
+    cash + market_value AS equity,
+    external_flow,
+    n_positions,
+    (cash + market_value - external_flow) / NULLIF(LAG(cash + market_value) OVER (ORDER BY date), 0) - 1 AS daily_return
+FROM series
+ORDER BY date
+"""
+
+
+def default_series_dir():
+    """Directory della cache (data/cache/equity_series)"""
+    from utils.path_manager import get_path_manager
+    return get_path_manager().equity_series_dir
+
+
+def _has_run_type(conn):
+    return conn.execute("""
+    SELECT COUNT(*) FROM information_schema.columns
+    WHERE table_name = 'fiscal_ledger' AND column_name = 'run_type'
+    """).fetchone()[0] > 0
+
+
+def ledger_run_id(conn, run_type=None):
+    """run_id dell'ultima scrittura nel ledger (chiave della cache)"""
+    row = conn.execute("""
+    SELECT run_id FROM fiscal_ledger
+    WHERE ? IS NULL OR run_type = ?
+    ORDER BY id DESC LIMIT 1
+    """, [run_type, run_type]).fetchone()
+    return (row[0] if row else None) or 'none'
+
+
+def series_fingerprint(conn, run_type=None):
+    """Fingerprint degli input: righe ledger del run_type + market_data"""
+    ledger = conn.execute("""
+    SELECT COUNT(*), bit_xor(hash(fl)) FROM fiscal_ledger fl
+    WHERE ? IS NULL OR run_type = ?
+    """, [run_type, run_type]).fetchone()
+    market = conn.execute("SELECT COUNT(*), bit_xor(hash(md)), MAX(date) FROM market_data md").fetchone()
+    return f"{ledger[0]}:{ledger[1]}|{market[0]}:{market[1]}:{market[2]}"
+
+
+def compute_equity_series(conn, run_type=None):
+    """Serie giornaliera (DataFrame): date, cash, market_value, equity, external_flow, n_positions, daily_return"""
+    if run_type is not None and not _has_run_type(conn):
+        run_type = None
+    return conn.execute(EQUITY_SERIES_QUERY, [run_type, run_type]).fetchdf()
+
+
+def _sql_path(path):
+    return str(path).replace('\\', '/').replace("'", "''")
+
+
+def _cache_name(run_type, run_id):
+    safe_run_id = re.sub(r'[^A-Za-z0-9_.-]', '_', str(run_id))
+    return f"equity_{run_type or 'ALL'}_{safe_run_id}"
+
+
+def load_equity_series(conn, run_type=None, series_dir=None, refresh=True):
+    """Serie equity dalla cache per run (ricalcolata e salvata se il fingerprint è cambiato)
+
+    Args:
+        conn: connessione DuckDB (anche read-only: la cache è su file)
+        run_type: 'PRODUCTION' | 'BACKTEST' | None (tutto il ledger)
+        refresh: False → calcolo diretto senza leggere/scrivere la cache
+    """
+    if run_type is not None and not _has_run_type(conn):
+        run_type = None
+    if not refresh:
+        return compute_equity_series(conn, run_type)
+
+    series_dir = Path(series_dir or default_series_dir())
+    name = _cache_name(run_type, ledger_run_id(conn, run_type))
+    parquet_path = series_dir / f"{name}.parquet"
+    meta_path = series_dir / f"{name}.json"
+    fingerprint = series_fingerprint(conn, run_type)
+
+    cached = _read_cached(conn, parquet_path, meta_path, fingerprint)
+    if cached is not None:
+        return cached
+
+    from orchestration.artifact_writer import file_lock, write_json
+
+    series_dir.mkdir(parents=True, exist_ok=True)
+    # Lock per run_type: calcolo, replace e pulizia delle versioni obsolete non si
+    # sovrappongono a quelli di un altro processo sulla stessa serie
+    with file_lock(series_dir / f"equity_{run_type or 'ALL'}"):
+        cached = _read_cached(conn, parquet_path, meta_path, fingerprint)
+        if cached is not None:
+            return cached
+
+        tmp_path = parquet_path.with_name(f"{parquet_path.name}.{os.getpid()}.tmp")
+        try:
+            conn.execute(
+                f"COPY ({EQUITY_SERIES_QUERY}) TO '{_sql_path(tmp_path)}' (FORMAT PARQUET)",
+                [run_type, run_type],
+            )
+            os.replace(tmp_path, parquet_path)
+            # Una sola serie per run_type: le versioni di run precedenti sono obsolete
+            for stale in series_dir.glob(f"equity_{run_type or 'ALL'}_*"):
+                if stale.stem != name:
+                    stale.unlink(missing_ok=True)
+            write_json(meta_path, {
+                'version': SERIES_VERSION,
+                'run_type': run_type,
+                'fingerprint': fingerprint,
+                'created_at': datetime.now().isoformat(),
+            })
+            return conn.execute("SELECT * FROM read_parquet(?) ORDER BY date", [str(parquet_path)]).fetchdf()
+        except Exception as e:
+            Path(tmp_path).unlink(missing_ok=True)
+            print(f"WARN equity series non salvata in cache: {e}")
+    return compute_equity_series(conn, run_type)
+
+
+def _read_cached(conn, parquet_path, meta_path, fingerprint):
+    """Serie dalla cache se allineata al fingerprint (None se assente, obsoleta o illeggibile)
+
+    Qualsiasi errore di lettura (file rimosso da un writer concorrente, parquet
+    troncato: duckdb.IOException non è un OSError) vale come cache mancante.
+    """
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if meta.get('version') != SERIES_VERSION or meta.get('fingerprint') != fingerprint:
+            return None
+        return conn.execute("SELECT * FROM read_parquet(?) ORDER BY date", [str(parquet_path)]).fetchdf()
+    except Exception:
+        return None
+
+def series_summary(series):
+    """Metriche del portafoglio dalla serie (returns al netto dei flussi esterni)"""
+    if series is None or len(series) == 0:
+        return None
+
+    returns = series['daily_return'].to_numpy(dtype=float, na_value=np.nan)[1:]
+    returns = returns[np.isfinite(returns)]
+    growth = np.cumprod(1.0 + returns) if len(returns) else np.ones(1)
+    total_return = float(growth[-1] - 1.0)
+    trading_days = int(len(series))
+    last = series.iloc[-1]
+
+    return {
+        'start_date': str(series['date'].iloc[0])[:10],
+        'end_date': str(last['date'])[:10],
+        'trading_days': trading_days,
+        'start_value': float(series['equity'].iloc[0]),
+        'end_value': float(last['equity']),
+        'cash_balance': float(last['cash']),
+        'market_value': float(last['market_value']),
+        'positions_count': int(last['n_positions']),
+        'total_deposits': float(series['external_flow'].sum()),
+        'total_return': total_return,
+        'annual_return': total_return * (TRADING_DAYS / trading_days) if trading_days > 0 else 0.0,
+        'volatility': float(annualized_vol(returns)) if len(returns) else 0.0,
+        'max_drawdown': float(max_drawdown(growth, start_value=1.0)),
+        'best_daily_return': float(returns.max()) if len(returns) else 0.0,
+        'worst_daily_return': float(returns.min()) if len(returns) else 0.0,
+        'var_5_daily': float(np.percentile(returns, 5)) if len(returns) else 0.0,
+    }
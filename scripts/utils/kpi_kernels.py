@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+KPI Kernels - ETF Italia Project v10
+Kernel NumPy per drawdown/CAGR/volatilità/Sharpe condivisi dal codice KPI
+
+Tutti i kernel accettano array 1-D (una equity curve / serie di returns) o
+2-D (batch: una curva per riga, tempo sull'ultimo asse). Nessun DataFrame
+intermedio: con input 1-D restituiscono float, con input 2-D array per riga.
+
+Convenzioni:
+- max_dd è negativo (es. -0.25 = -25%), come in backtest_engine/backtest_runner
+- equity_kpis replica pct_change().dropna(): il primo punto è solo la base
+  del primo return, CAGR e drawdown partono dal secondo punto
+- returns_kpis replica MonteCarloStressTest: curva costruita da initial_equity,
+  CAGR su n_periodi / 252, Sharpe/Sortino su media/std (ddof=0) dei returns
+"""
+
+import numpy as np
+
+TRADING_DAYS = 252
+
+
+def _as_batch(values):
+    """Array float 2-D (batch × tempo) + flag per restituire scalari"""
+    arr = np.asarray(values, dtype=float)
+    if arr.ndim == 1:
+        return arr[None, :], True
+    return arr, False
+
+
+def _finish(metrics, squeeze):
+    """Converte il risultato batch in float se l'input era 1-D"""
+    if squeeze:
+        return {k: float(v[0]) for k, v in metrics.items()}
+    return metrics
+
+
+def simple_returns(equity):
+    """Returns semplici lungo l'ultimo asse (lunghezza - 1)"""
+    equity = np.asarray(equity, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return equity[..., 1:] / equity[..., :-1] - 1.0
+
+
+def drawdown_series(equity, start_value=None):
+    """Drawdown punto per punto rispetto al massimo corrente (<= 0)
+
+    Args:
+        equity: equity curve (1-D o 2-D)
+        start_value: valore iniziale incluso nel massimo corrente (opzionale)
+    """
+    equity = np.asarray(equity, dtype=float)
+    peaks = equity if start_value is None else np.maximum(equity, start_value)
+    running_max = np.maximum.accumulate(peaks, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (equity - running_max) / running_max
+
+
+def max_drawdown(equity, start_value=None):
+    """Massimo drawdown (negativo) lungo l'ultimo asse"""
+    equity = np.asarray(equity, dtype=float)
+    if equity.shape[-1] == 0:
+        return np.zeros(equity.shape[:-1]) if equity.ndim > 1 else 0.0
+    dd = np.minimum(drawdown_series(equity, start_value).min(axis=-1), 0.0)
+    return dd if equity.ndim > 1 else float(dd)
+
+
+def annualized_vol(returns, periods_per_year=TRADING_DAYS, ddof=1):
+    """Volatilità annualizzata ignorando NaN/inf (0 se osservazioni insufficienti)"""
+    batch, squeeze = _as_batch(returns)
+    finite = np.isfinite(batch)
+    n = finite.sum(axis=-1)
+    clean = np.where(finite, batch, 0.0)
+    mean = clean.sum(axis=-1) / np.maximum(n, 1)
+    sq = np.where(finite, (batch - mean[:, None]) ** 2, 0.0).sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vol = np.where(n > ddof, np.sqrt(sq / np.maximum(n - ddof, 1)), 0.0) * np.sqrt(periods_per_year)
+    return float(vol[0]) if squeeze else vol
+
+
+def equity_kpis(equity, elapsed_days=None, dates=None, day_count=365.25, periods_per_year=TRADING_DAYS):
+    """KPI da equity curve: cagr, max_dd, vol, sharpe (= cagr / vol), valori e total_return
+
+    Args:
+        equity: equity curve (1-D o 2-D, almeno 2 punti)
+        elapsed_days: giorni di calendario tra secondo e ultimo punto
+        dates: in alternativa a elapsed_days, date della curva (1-D, datetime.date)
+        day_count: base annua per il CAGR (365.25 portfolio, 365 benchmark)
+    """
+    batch, squeeze = _as_batch(equity)
+    n_sims, n_points = batch.shape
+    if n_points < 2:
+        zeros = np.zeros(n_sims)
+        return _finish({
+            'cagr': zeros, 'max_dd': zeros, 'vol': zeros, 'sharpe': zeros,
+            'initial_value': zeros, 'final_value': zeros, 'total_return': zeros,
+        }, squeeze)
+
+    if elapsed_days is None:
+        elapsed_days = (dates[-1] - dates[1]).days if dates is not None else n_points - 2
+
+    levels = batch[:, 1:]
+    initial_value = levels[:, 0]
+    final_value = levels[:, -1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if elapsed_days > 0:
+            cagr = (final_value / initial_value) ** (day_count / elapsed_days) - 1.0
+        else:
+            cagr = np.zeros(n_sims)
+        total_return = (final_value - initial_value) / initial_value
+
+    max_dd = max_drawdown(levels)
+    vol = annualized_vol(simple_returns(batch), periods_per_year=periods_per_year, ddof=1)
+    sharpe = np.where(vol > 0, cagr / np.where(vol > 0, vol, 1.0), 0.0)
+
+    return _finish({
+        'cagr': cagr,
+        'max_dd': max_dd,
+        'vol': vol,
+        'sharpe': sharpe,
+        'initial_value': initial_value,
+        'final_value': final_value,
+        'total_return': total_return,
+    }, squeeze)
+
+
+def returns_kpis(returns, initial_equity=1.0, periods_per_year=TRADING_DAYS):
+    """KPI da serie di returns: cagr, max_dd, sharpe, sortino, calmar, final_equity
+
+    La curva parte da initial_equity (incluso nel drawdown). Calmar = cagr / |max_dd|.
+    """
+    batch, squeeze = _as_batch(returns)
+    n_sims, n_days = batch.shape
+    if n_days == 0:
+        zeros = np.zeros(n_sims)
+        return _finish({
+            'cagr': zeros, 'max_dd': zeros, 'sharpe': zeros, 'sortino': zeros,
+            'calmar': zeros, 'final_equity': np.full(n_sims, float(initial_equity)),
+        }, squeeze)
+
+    growth = np.cumprod(1.0 + batch, axis=-1)
+    final_equity = initial_equity * growth[:, -1]
+
+    years = n_days / float(periods_per_year)
+    cagr = growth[:, -1] ** (1.0 / years) - 1.0
+    max_dd = max_drawdown(growth, start_value=1.0)
+
+    mean_return = batch.mean(axis=-1)
+    std_return = batch.std(axis=-1)
+
+    # Downside deviation: std (ddof=0) dei soli returns negativi, fallback std totale
+    neg = batch < 0
+    n_neg = neg.sum(axis=-1)
+    neg_mean = np.where(neg, batch, 0.0).sum(axis=-1) / np.maximum(n_neg, 1)
+    neg_var = np.where(neg, (batch - neg_mean[:, None]) ** 2, 0.0).sum(axis=-1) / np.maximum(n_neg, 1)
+    downside_std = np.where(n_neg > 0, np.sqrt(neg_var), std_return)
+
+    ann = np.sqrt(periods_per_year)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(std_return > 0, mean_return / std_return * ann, 0.0)
+        sortino = np.where(downside_std > 0, mean_return / downside_std * ann, 0.0)
+        calmar = np.where(max_dd < 0, cagr / np.abs(max_dd), 0.0)
+
+    return _finish({
+        'cagr': cagr,
+        'max_dd': max_dd,
+        'sharpe': sharpe,
+        'sortino': sortino,
+        'calmar': calmar,
+        'final_equity': final_equity,
+    }, squeeze)
+
+
+def benchmark_kernels(n_curves=1000, n_days=1260, repeat=3, seed=0):
+    """Microbenchmark: kernel batch vs loop pandas (cummax/pct_change) su n_curves curve
+
+    Returns:
+        dict: tempi migliori (ms) e speedup
+    """
+    import time
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    equity = 10000.0 * np.cumprod(1.0 + rng.normal(0.0003, 0.01, (n_curves, n_days)), axis=1)
+    dates = pd.bdate_range('2020-01-01', periods=n_days)
+    elapsed = (dates[-1] - dates[1]).days
+
+    def _pandas_loop():
+        for row in equity:
+            df = pd.DataFrame({'equity': row}, index=dates)
+            df['daily_return'] = df['equity'].pct_change(fill_method=None)
+            df = df.dropna()
+            df['cummax'] = df['equity'].cummax()
+            df['drawdown'] = (df['equity'] - df['cummax']) / df['cummax']
+            df['drawdown'].min()
+            df['daily_return'].std()
+
+    def _best(fn):
+        times = []
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - start) * 1000.0)
+        return min(times)
+
+    pandas_ms = _best(_pandas_loop)
+    batch_ms = _best(lambda: equity_kpis(equity, elapsed_days=elapsed))
+    loop_ms = _best(lambda: [equity_kpis(row, elapsed_days=elapsed) for row in equity])
+
+    return {
+        'n_curves': n_curves,
+        'n_days': n_days,
+        'pandas_loop_ms': round(pandas_ms, 2),
+        'kernel_loop_ms': round(loop_ms, 2),
+        'kernel_batch_ms': round(batch_ms, 2),
+        'speedup_batch': round(pandas_ms / batch_ms, 1) if batch_ms > 0 else None,
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Microbenchmark kernel KPI')
+    parser.add_argument('--curves', type=int, default=1000, help='Numero equity curve')
+    parser.add_argument('--days', type=int, default=1260, help='Punti per curva')
+    parser.add_argument('--repeat', type=int, default=3, help='Ripetizioni (si usa il minimo)')
+    args = parser.parse_args()
+
+    result = benchmark_kernels(args.curves, args.days, args.repeat)
+    print("⏱️  KPI KERNELS MICROBENCHMARK")
+    print("=" * 60)
+    print(f"Curve: {result['n_curves']} × {result['n_days']} punti")
+    print(f"pandas (loop):  {result['pandas_loop_ms']:>10.2f}ms")
+    print(f"kernel (loop):  {result['kernel_loop_ms']:>10.2f}ms")
+    print(f"kernel (batch): {result['kernel_batch_ms']:>10.2f}ms  ({result['speedup_batch']}x)")
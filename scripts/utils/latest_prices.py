@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Latest Prices - ETF Italia Project v10
+Ultimo prezzo per simbolo (tabella mantenuta all'ingest) e prezzi as-of per date storiche
+
+LOGICA:
+- Tabella latest_prices: una riga per simbolo (ultima data, close, adj_close)
+  ricalcolata con un GROUP BY + arg_max su market_data da setup_db e da
+  bulk_load.merge_bars per i simboli del blocco (ingest, backfill)
+- Marker latest_prices_meta (una riga: COUNT(*) e MAX(date) di market_data al
+  momento del refresh) scritto da refresh_latest_prices nella stessa transazione
+  del chiamante; merge_bars fa un refresh completo se il marker non era allineato
+  prima della scrittura (scrittura fuori da merge_bars)
+- latest_prices_source(): nome della tabella da usare nelle query (JOIN hash al posto
+  delle subquery correlate ORDER BY date DESC LIMIT 1 per riga); DB senza tabella o
+  marker diverso da market_data (righe aggiunte/rimosse o data massima cambiata
+  fuori da merge_bars) → stessa aggregazione inline
+- asof_prices(): prezzo all'ultima data <= as-of per una lista di simboli con un
+  ASOF JOIN (una query, nessun lookup per simbolo)
+"""
+
+import sys
+import os
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+LATEST_PRICES_TABLE = 'latest_prices'
+LATEST_PRICES_META_TABLE = 'latest_prices_meta'
+
+# Aggregazione su market_data ({where}: filtro opzionale sui simboli)
+LATEST_PRICES_AGG = """
+SELECT
+    symbol,
+    MAX(date) AS date,
+    arg_max(close, date) AS close,
+    arg_max(adj_close, date) AS adj_close
+FROM market_data
+{where}
+GROUP BY symbol
+"""
+
+# Parametri: simboli (lista), data as-of
+ASOF_PRICES_QUERY = """
+SELECT q.symbol, md.date, md.close, md.adj_close
+FROM (SELECT UNNEST(?::VARCHAR[]) AS symbol, ?::DATE AS asof_date) q
+ASOF LEFT JOIN market_data md ON md.symbol = q.symbol AND md.date <= q.asof_date
+ORDER BY q.symbol
+"""
+
+
+def ensure_latest_prices_table(conn):
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {LATEST_PRICES_TABLE} (
+        symbol VARCHAR PRIMARY KEY,
+        date DATE NOT NULL,
+        close DOUBLE,
+        adj_close DOUBLE,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+
+def ensure_latest_prices_meta_table(conn):
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {LATEST_PRICES_META_TABLE} (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        market_rows BIGINT NOT NULL,
+        market_max_date DATE,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+
+def refresh_latest_prices(conn, symbols=None):
+    """Ricalcola latest_prices (tutti i simboli o solo quelli dati) - restituisce le righe scritte"""
+    ensure_latest_prices_table(conn)
+    if symbols is None:
+        conn.execute(f"DELETE FROM {LATEST_PRICES_TABLE}")
+        where, params = "", []
+    else:
+        symbols = list(symbols)
+        if not symbols:
+            return 0
+        conn.execute(f"DELETE FROM {LATEST_PRICES_TABLE} WHERE list_contains(?::VARCHAR[], symbol)", [symbols])
+        where, params = "WHERE list_contains(?::VARCHAR[], symbol)", [symbols]
+    conn.execute(f"""
+    INSERT INTO {LATEST_PRICES_TABLE} (symbol, date, close, adj_close)
+    SELECT symbol, date, close, adj_close
+    FROM ({LATEST_PRICES_AGG.format(where=where)})
+    """, params)
+    ensure_latest_prices_meta_table(conn)
+    conn.execute(f"""
+    INSERT OR REPLACE INTO {LATEST_PRICES_META_TABLE} (id, market_rows, market_max_date, updated_at)
+    SELECT 1, COUNT(*), MAX(date), CURRENT_TIMESTAMP FROM market_data
+    """)
+    if symbols is None:
+        return conn.execute(f"SELECT COUNT(*) FROM {LATEST_PRICES_TABLE}").fetchone()[0]
+    return conn.execute(f"SELECT COUNT(*) FROM {LATEST_PRICES_TABLE} WHERE list_contains(?::VARCHAR[], symbol)",
+                        [symbols]).fetchone()[0]
+
+
+def latest_prices_in_sync(conn):
+    """True se il marker dell'ultimo refresh corrisponde a COUNT(*) e MAX(date) di market_data"""
+    tables = {r[0] for r in conn.execute("SHOW TABLES").fetchall()}
+    if LATEST_PRICES_TABLE not in tables or LATEST_PRICES_META_TABLE not in tables:
+        return False
+    row = conn.execute(f"""
+    SELECT m.market_rows = md.n AND m.market_max_date IS NOT DISTINCT FROM md.max_date
+    FROM {LATEST_PRICES_META_TABLE} m, (SELECT COUNT(*) AS n, MAX(date) AS max_date FROM market_data) md
+    """).fetchone()
+    return bool(row and row[0])
+
+
+def latest_prices_source(conn):
+    """Relazione SQL (symbol, date, close, adj_close) da usare in FROM/JOIN"""
+    if latest_prices_in_sync(conn):
+        return LATEST_PRICES_TABLE
+    return f"({LATEST_PRICES_AGG.format(where='')})"
+
+
+def latest_price_map(conn, symbols=None, column='close'):
+    """{symbol: prezzo} all'ultima data disponibile per simbolo"""
+    if column not in ('close', 'adj_close'):
+        raise ValueError(f"Colonna prezzo non supportata: {column}")
+    source = latest_prices_source(conn)
+    if symbols is None:
+        rows = conn.execute(f"SELECT symbol, {column} FROM {source} lp").fetchall()
+    else:
+        rows = conn.execute(f"SELECT symbol, {column} FROM {source} lp WHERE list_contains(?::VARCHAR[], symbol)",
+                            [list(symbols)]).fetchall()
+    return {symbol: price for symbol, price in rows}
+
+
+def asof_prices(conn, symbols, asof_date, column='close'):
+    """{symbol: (data, prezzo)} all'ultima data <= asof_date (simboli senza storico esclusi)"""
+    if column not in ('close', 'adj_close'):
+        raise ValueError(f"Colonna prezzo non supportata: {column}")
+    symbols = list(symbols)
+    if not symbols:
+        return {}
+    out = {}
+    for symbol, price_date, close, adj_close in conn.execute(ASOF_PRICES_QUERY, [symbols, asof_date]).fetchall():
+        if price_date is not None:
+            out[symbol] = (price_date, close if column == 'close' else adj_close)
+    return out
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Market Cube - ETF Italia Project v10
+Cache persistente date × simboli delle serie di mercato (array NumPy memory-mapped)
+
+LOGICA:
+- Un file .npy float64 (T × N) per campo: close, adj_close, volume, returns,
+  sma_200, volatility_20d (stesse definizioni della vista risk_metrics)
+- Asse date (dates.npy, datetime64[D]) e simboli (meta.json) condivisi da tutti i campi;
+  NaN dove il simbolo non ha dati in quella data
+- Apertura con np.load(mmap_mode='r'): nessuna query, pagine condivise tra processi
+- Fingerprint di market_data (COUNT + XOR hash di riga) salvato in meta.json:
+  - invariato → cache valida
+  - invariato fino all'ultima data in cache → append delle sole date nuove
+  - altrimenti (correzioni storiche, simboli nuovi) → ricostruzione completa
+- Scrittura atomica (file temporaneo per processo + os.replace, meta.json per ultimo):
+  i reader già aperti continuano a leggere la versione precedente
+- Build serializzata da un lock su file (meta.json.lock, come il manifest degli
+  artifact): due processi non ricostruiscono la cache in parallelo e il secondo
+  trova la cache già aggiornata
+"""
+
+import sys
+import os
+import json
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CUBE_VERSION = 1
+CUBE_FIELDS = ('close', 'adj_close', 'volume', 'returns', 'sma_200', 'volatility_20d')
+META_FILE = 'meta.json'
+DATES_FILE = 'dates.npy'
+
+# Stesse finestre della vista risk_metrics (setup_db.py), calcolate su tutto lo storico;
+# il filtro sulle date nuove è applicato dopo le window function
+CUBE_QUERY = """
+WITH base AS (
+    SELECT
+        symbol,
+        date,
+        close,
+        adj_close,
+        volume,
+        (adj_close - LAG(adj_close) OVER w) / LAG(adj_close) OVER w AS returns
+    FROM market_data
+    WINDOW w AS (PARTITION BY symbol ORDER BY date)
+),
+metrics AS (
+    SELECT
+        symbol,
+        date,
+        close,
+        adj_close,
+        volume,
+        returns,
+        AVG(adj_close) OVER (PARTITION BY symbol ORDER BY date ROWS BETWEEN 199 PRECEDING AND CURRENT ROW) AS sma_200,
+        STDDEV_SAMP(returns) OVER (PARTITION BY symbol ORDER BY date ROWS BETWEEN 19 PRECEDING AND CURRENT ROW) * SQRT(252) AS volatility_20d
+    FROM base
+)
+SELECT date, symbol, close, adj_close, volume, returns, sma_200, volatility_20d
+FROM metrics
+WHERE ? IS NULL OR date > ?
+ORDER BY date, symbol
+"""
+
+
+def default_cube_dir():
+    """Directory della cache (data/cache/market_cube)"""
+    from utils.path_manager import get_path_manager
+    return get_path_manager().market_cube_dir
+
+
+def market_data_fingerprint(conn, through_date=None):
+    """Fingerprint di market_data (eventualmente limitato alle date <= through_date)"""
+    row = conn.execute("""
+    SELECT COUNT(*), bit_xor(hash(md)), MAX(date)
+    FROM market_data md
+    WHERE ? IS NULL OR date <= ?
+    """, [through_date, through_date]).fetchone()
+    return f"{row[0]}:{row[1]}:{row[2]}"
+
+
+def _market_symbols(conn):
+    return [r[0] for r in conn.execute("SELECT DISTINCT symbol FROM market_data ORDER BY symbol").fetchall()]
+
+
+def _load_block(conn, symbols, after_date=None):
+    """Righe di market_data (con metriche) pivotate in array date × simboli per campo"""
+    df = conn.execute(CUBE_QUERY, [after_date, after_date]).fetchdf()
+    if len(df) == 0:
+        return np.empty(0, dtype='datetime64[D]'), {f: np.empty((0, len(symbols))) for f in CUBE_FIELDS}
+
+    col_index = {s: j for j, s in enumerate(symbols)}
+    dates = df['date'].to_numpy(dtype='datetime64[D]')
+    unique_dates, row_idx = np.unique(dates, return_inverse=True)
+    col_idx = df['symbol'].map(col_index).to_numpy()
+
+    arrays = {}
+    for field in CUBE_FIELDS:
+        matrix = np.full((len(unique_dates), len(symbols)), np.nan)
+        matrix[row_idx, col_idx] = df[field].to_numpy(dtype=float, na_value=np.nan)
+        arrays[field] = matrix
+    return unique_dates, arrays
+
+
+def _atomic_save(path, array):
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def _read_meta(cube_dir):
+    meta_path = Path(cube_dir) / META_FILE
+    if not meta_path.exists():
+        return None
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if meta.get('version') != CUBE_VERSION or tuple(meta.get('fields', ())) != CUBE_FIELDS:
+        return None
+    return meta
+
+
+def _write_cube(cube_dir, dates, symbols, arrays, fingerprint):
+    cube_dir = Path(cube_dir)
+    cube_dir.mkdir(parents=True, exist_ok=True)
+    _atomic_save(cube_dir / DATES_FILE, dates)
+    for field in CUBE_FIELDS:
+        _atomic_save(cube_dir / f'{field}.npy', arrays[field])
+
+    meta = {
+        'version': CUBE_VERSION,
+        'fields': list(CUBE_FIELDS),
+        'symbols': list(symbols),
+        'n_dates': int(len(dates)),
+        'last_date': str(dates[-1]) if len(dates) else None,
+        'fingerprint': fingerprint,
+        'built_at': datetime.now().isoformat(),
+    }
+    tmp_meta = cube_dir / f"{META_FILE}.{os.getpid()}.tmp"
+    with open(tmp_meta, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_meta, cube_dir / META_FILE)
+    return meta
+
+
+class MarketCube:
+    """Serie di mercato allineate date × simboli, lette da file .npy memory-mapped"""
+
+    def __init__(self, dates, symbols, arrays, meta=None):
+        self.dates = dates
+        self.symbols = list(symbols)
+        self.meta = meta or {}
+        self._arrays = arrays
+        self._col_index = {s: j for j, s in enumerate(self.symbols)}
+
+    @classmethod
+    def open(cls, cube_dir=None, mmap_mode='r'):
+        """Apre la cache senza toccare il DB (None se assente o incompleta)"""
+        cube_dir = Path(cube_dir) if cube_dir is not None else default_cube_dir()
+        meta = _read_meta(cube_dir)
+        if meta is None:
+            return None
+        try:
+            dates = np.load(cube_dir / DATES_FILE, mmap_mode=mmap_mode)
+            arrays = {f: np.load(cube_dir / f'{f}.npy', mmap_mode=mmap_mode) for f in CUBE_FIELDS}
+        except (OSError, ValueError):
+            return None
+
+        shape = (meta['n_dates'], len(meta['symbols']))
+        if len(dates) != shape[0] or any(a.shape != shape for a in arrays.values()):
+            # Scrittura concorrente in corso: la cache verrà riletta al prossimo open
+            return None
+        return cls(dates, meta['symbols'], arrays, meta)
+
+    @property
+    def fingerprint(self):
+        return self.meta.get('fingerprint')
+
+    @property
+    def shape(self):
+        return (len(self.dates), len(self.symbols))
+
+    def __contains__(self, symbol):
+        return symbol in self._col_index
+
+    def __getitem__(self, field):
+        return self._arrays[field]
+
+    def columns(self, symbols):
+        """Indici colonna dei simboli (KeyError se un simbolo non è in cache)"""
+        return np.array([self._col_index[s] for s in symbols], dtype=int)
+
+    def row_slice(self, start_date=None, end_date=None):
+        """Slice di righe per l'intervallo di date [start_date, end_date]"""
+        lo = 0 if start_date is None else int(np.searchsorted(self.dates, np.datetime64(str(start_date), 'D'), 'left'))
+        hi = len(self.dates) if end_date is None else int(np.searchsorted(self.dates, np.datetime64(str(end_date), 'D'), 'right'))
+        return slice(lo, hi)
+
+    def matrix(self, field, symbols=None, start_date=None, end_date=None):
+        """Sotto-matrice (date, simboli, valori) per campo, simboli e periodo"""
+        rows = self.row_slice(start_date, end_date)
+        if symbols is None:
+            return self.dates[rows], list(self.symbols), self._arrays[field][rows]
+        symbols = list(symbols)
+        return self.dates[rows], symbols, self._arrays[field][rows][:, self.columns(symbols)]
+
+    def frame(self, field, symbols=None, start_date=None, end_date=None):
+        """Come matrix() ma in DataFrame pandas (indice date, colonne simboli)"""
+        import pandas as pd
+
+        dates, symbols, values = self.matrix(field, symbols, start_date, end_date)
+        return pd.DataFrame(np.array(values), index=pd.DatetimeIndex(dates, name='date'), columns=symbols)
+
+    def latest(self, field, symbols=None, as_of=None):
+        """Ultimo valore non NaN per simbolo alla data as_of (NaN se assente)"""
+        _, symbols, values = self.matrix(field, symbols, end_date=as_of)
+        result = np.full(len(symbols), np.nan)
+        if len(values) == 0:
+            return symbols, result
+        valid = ~np.isnan(values)
+        has_value = valid.any(axis=0)
+        last_idx = len(values) - 1 - np.argmax(valid[::-1], axis=0)
+        result[has_value] = values[last_idx[has_value], np.flatnonzero(has_value)]
+        return symbols, result
+
+
+def build_market_cube(conn, cube_dir=None, force=False):
+    """Crea/aggiorna la cache dal DB (solo letture: va bene una connessione read-only)
+
+    Returns:
+        dict: action ('fresh' | 'append' | 'rebuild'), n_dates, n_symbols, fingerprint
+    """
+    from orchestration.artifact_writer import file_lock
+
+    cube_dir = Path(cube_dir) if cube_dir is not None else default_cube_dir()
+    cube_dir.mkdir(parents=True, exist_ok=True)
+    with file_lock(cube_dir / META_FILE):
+        return _build_locked(conn, cube_dir, force)
+
+
+def _build_locked(conn, cube_dir, force):
+    fingerprint = market_data_fingerprint(conn)
+    meta = None if force else _read_meta(cube_dir)
+    symbols = _market_symbols(conn)
+
+    action = 'rebuild'
+    if meta is not None and meta['symbols'] == symbols:
+        if meta['fingerprint'] == fingerprint:
+            return {'action': 'fresh', 'n_dates': meta['n_dates'], 'n_symbols': len(symbols),
+                    'fingerprint': fingerprint}
+        last_date = meta['last_date']
+        if last_date and market_data_fingerprint(conn, last_date) == meta['fingerprint']:
+            action = 'append'
+
+    if action == 'append':
+        cube = MarketCube.open(cube_dir, mmap_mode=None)
+        if cube is None:
+            action = 'rebuild'
+        else:
+            new_dates, block = _load_block(conn, symbols, after_date=meta['last_date'])
+            dates = np.concatenate([cube.dates, new_dates])
+            arrays = {f: np.vstack([cube[f], block[f]]) for f in CUBE_FIELDS}
+
+    if action == 'rebuild':
+        dates, arrays = _load_block(conn, symbols)
+
+    meta = _write_cube(cube_dir, dates, symbols, arrays, fingerprint)
+    return {'action': action, 'n_dates': meta['n_dates'], 'n_symbols': len(symbols), 'fingerprint': fingerprint}
+
+
+def load_market_cube(conn=None, cube_dir=None, refresh=True):
+    """Cache pronta all'uso: con conn verifica il fingerprint e aggiorna se serve
+
+    Senza conn (o refresh=False) apre la cache così com'è. Errori di build non sono
+    bloccanti: i chiamanti ricadono sulle query DuckDB quando il risultato è None.
+    """
+    if conn is not None and refresh:
+        try:
+            build_market_cube(conn, cube_dir)
+        except Exception as e:
+            print(f"WARN: market cube non aggiornato: {e}")
+            return None
+    return MarketCube.open(cube_dir)
+
+
+def main():
+    import argparse
+    import duckdb
+    from utils.path_manager import get_path_manager
+
+    parser = argparse.ArgumentParser(description='Market cube (cache date × simboli memory-mapped)')
+    parser.add_argument('--rebuild', action='store_true', help='Ricostruzione completa')
+    parser.add_argument('--info', action='store_true', help='Mostra stato della cache senza aggiornarla')
+    args = parser.parse_args()
+
+    if args.info:
+        cube = MarketCube.open()
+        if cube is None:
+            print("❌ Market cube assente")
+            return False
+        print(f"📦 Market cube: {cube.shape[0]} date × {cube.shape[1]} simboli "
+              f"(ultima data {cube.meta.get('last_date')}, build {cube.meta.get('built_at')})")
+        return True
+
+    conn = duckdb.connect(str(get_path_manager().db_path), read_only=True)
+    try:
+        result = build_market_cube(conn, force=args.rebuild)
+    finally:
+        conn.close()
+    print(f"✅ Market cube {result['action']}: {result['n_dates']} date × {result['n_symbols']} simboli")
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Market Store - ETF Italia Project v10
+Layout multi-venue/multi-valuta: anagrafica strumenti, market_data partizionata e cambi FX
+
+LOGICA:
+- instruments: symbol → venue, currency, fx_pair (da etf_universe.json, venue di default
+  da ETF_VENUE/settings.venue); simboli non censiti → venue di default, EUR
+- market_data partizionata: una tabella per venue/anno (market_data_<venue>_<anno>, PK e
+  CHECK di setup_db) censita in market_data_partitions; market_data è la vista UNION ALL
+  delle partizioni con venue costante e range date per ramo → i filtri su venue/date
+  (market_data_source o WHERE sulla vista) leggono solo le partizioni coinvolte.
+  Scritture solo via write_market_rows/delete_market_rows (merge_bars, ingest_data);
+  partition_market_data migra una market_data legacy (setup_db). DB legacy/di test con
+  market_data tabella: stesse funzioni, un solo statement sulla tabella
+- fx_rates: cambio giornaliero rate_eur = EUR per 1 unità di valuta (es. USDEUR=X);
+  conversione con un ASOF JOIN (ultima data <= data) per tutto il batch (eur_conversion_sql,
+  FxLookup per simboli × date in memoria, prices_to_eur per DataFrame)
+- fiscal_ledger in EUR: price = prezzo eseguito convertito (= price_eur), trade_currency ed
+  exchange_rate_used registrano valuta e cambio (prezzo in valuta = price / exchange_rate_used);
+  cash, commissioni, tasse e PMC restano qty * price. Ordini senza cambio disponibile alla
+  data → FX_RATE_MISSING
+"""
+
+import sys
+import os
+import re
+from datetime import date
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.universe_helper import get_default_venue, iter_universe_etfs
+
+BASE_CURRENCY = 'EUR'
+INSTRUMENTS_TABLE = 'instruments'
+FX_TABLE = 'fx_rates'
+
+
+def _tables(conn):
+    return {r[0] for r in conn.execute("SHOW TABLES").fetchall()}
+
+
+# ==================== INSTRUMENTS ====================
+
+def ensure_instruments_table(conn):
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {INSTRUMENTS_TABLE} (
+        symbol VARCHAR PRIMARY KEY,
+        venue VARCHAR NOT NULL,
+        currency VARCHAR NOT NULL DEFAULT 'EUR',
+        fx_pair VARCHAR
+    )
+    """)
+
+
+def instrument_rows(config):
+    """[(symbol, venue, currency, fx_pair)] dall'universo (benchmark inclusi)"""
+    venue = get_default_venue(config)
+    base = (config.get('settings', {}) or {}).get('currency') or BASE_CURRENCY
+    rows = {}
+    for etf in iter_universe_etfs(config, include_benchmark=True):
+        currency = etf.get('currency') or base
+        fx_pair = etf.get('fx_pair') or (None if currency == BASE_CURRENCY else f"{currency}{BASE_CURRENCY}=X")
+        rows[etf['symbol']] = (etf['symbol'], etf.get('venue') or venue, currency, fx_pair)
+    return list(rows.values())
+
+
+def sync_instruments(conn, config):
+    """Allinea instruments all'universo (restituisce il numero di strumenti)"""
+    ensure_instruments_table(conn)
+    rows = instrument_rows(config)
+    if rows:
+        conn.executemany(f"INSERT OR REPLACE INTO {INSTRUMENTS_TABLE} VALUES (?, ?, ?, ?)", rows)
+    return len(rows)
+
+
+# ==================== FX ====================
+
+def ensure_fx_table(conn):
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {FX_TABLE} (
+        currency VARCHAR NOT NULL,
+        date DATE NOT NULL,
+        rate_eur DOUBLE NOT NULL CHECK (rate_eur > 0),
+        source VARCHAR DEFAULT 'YF',
+        PRIMARY KEY (currency, date)
+    )
+    """)
+
+
+def upsert_fx_rates(conn, currency, rates, source='YF'):
+    """Carica cambi {data: rate_eur} (o lista di coppie) per una valuta in un solo statement"""
+    ensure_fx_table(conn)
+    items = list(rates.items()) if isinstance(rates, dict) else list(rates)
+    items = [(d, float(r)) for d, r in items if r is not None and r == r and r > 0]
+    if not items:
+        return 0
+    conn.execute(f"""
+    INSERT OR REPLACE INTO {FX_TABLE} (currency, date, rate_eur, source)
+    SELECT ?, d::DATE, r, ? FROM (SELECT UNNEST(?::DATE[]) AS d, UNNEST(?::DOUBLE[]) AS r)
+    """, [currency, source, [d for d, _ in items], [r for _, r in items]])
+    return len(items)
+
+
+def refresh_fx_rates(conn, config, end_date, fetch, initial_start):
+    """Cambi delle valute non-EUR dell'universo dopo l'ultima data in fx_rates (delta)
+
+    Args:
+        fetch: fetch(pair, start, end) → DataFrame con colonna Close (end esclusa) o None
+    Returns:
+        dict: {currency: righe caricate}
+    """
+    from datetime import timedelta
+
+    ensure_fx_table(conn)
+    pairs = {currency: pair for _, _, currency, pair in instrument_rows(config)
+             if currency != BASE_CURRENCY and pair}
+    if not pairs:
+        return {}
+    last = dict(conn.execute(f"SELECT currency, MAX(date) FROM {FX_TABLE} GROUP BY currency").fetchall())
+    loaded = {}
+    for currency, pair in sorted(pairs.items()):
+        start = last[currency] + timedelta(days=1) if last.get(currency) else initial_start
+        if start > end_date:
+            loaded[currency] = 0
+            continue
+        hist = fetch(pair, start, end_date + timedelta(days=1))
+        if hist is None or hist.empty:
+            loaded[currency] = 0
+            continue
+        loaded[currency] = upsert_fx_rates(conn, currency, zip(hist.index.date, hist['Close'].tolist()))
+    return loaded
+
+
+# ==================== MARKET DATA (partizioni venue/anno) ====================
+
+MARKET_TABLE = 'market_data'
+PARTITIONS_TABLE = 'market_data_partitions'
+MARKET_DATA_SCHEMA = (
+    ('symbol', 'VARCHAR'), ('date', 'DATE'), ('adj_close', 'DOUBLE'), ('close', 'DOUBLE'),
+    ('high', 'DOUBLE'), ('low', 'DOUBLE'), ('volume', 'BIGINT'), ('source', 'VARCHAR'),
+)
+MARKET_DATA_COLUMNS = tuple(name for name, _ in MARKET_DATA_SCHEMA)
+_PARTITION_NAME = re.compile(r'^market_data_[a-z0-9_]+_\d{4}$')
+
+
+def create_market_table(conn, table=MARKET_TABLE):
+    """Tabella OHLCV con PK (symbol, date) e CHECK di setup_db (market_data legacy o partizione)"""
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        symbol VARCHAR NOT NULL,
+        date DATE NOT NULL,
+        adj_close DOUBLE CHECK (adj_close > 0),
+        close DOUBLE CHECK (close > 0),
+        high DOUBLE CHECK (high >= 0),
+        low DOUBLE CHECK (low >= 0),
+        volume BIGINT CHECK (volume >= 0),
+        source VARCHAR DEFAULT 'YF',
+        PRIMARY KEY (symbol, date),
+        CHECK (high >= low),
+        CHECK (high >= close),
+        CHECK (low <= close)
+    )
+    """)
+
+
+def partition_table_name(venue, year):
+    return f"market_data_{re.sub(r'[^0-9a-z]+', '_', str(venue).lower()).strip('_')}_{int(year)}"
+
+
+def is_partition_table(name):
+    """True per le tabelle fisiche del layout partizionato (partizioni e registro)"""
+    return name == PARTITIONS_TABLE or bool(_PARTITION_NAME.match(name))
+
+
+def is_partitioned(conn):
+    return PARTITIONS_TABLE in _tables(conn)
+
+
+def market_partitions(conn):
+    """[(venue, year, table_name)] ordinati per venue, anno"""
+    return conn.execute(f"SELECT venue, year, table_name FROM {PARTITIONS_TABLE} ORDER BY venue, year").fetchall()
+
+
+def _sql_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def refresh_market_view(conn):
+    """market_data = UNION ALL delle partizioni con venue costante e range date dell'anno
+
+    Venue e range espliciti per ramo: i filtri su venue/date escludono le partizioni
+    non coinvolte (nessuna scansione) in ogni query sulla vista.
+    """
+    cols = ', '.join(MARKET_DATA_COLUMNS)
+    branches = [
+        f"SELECT {cols}, {_sql_literal(venue)} AS venue FROM {table}\n"
+        f"WHERE date BETWEEN DATE '{year}-01-01' AND DATE '{year}-12-31'"
+        for venue, year, table in market_partitions(conn)
+    ]
+    if not branches:
+        typed = ', '.join(f"NULL::{sql_type} AS {name}" for name, sql_type in MARKET_DATA_SCHEMA)
+        branches = [f"SELECT {typed}, NULL::VARCHAR AS venue WHERE false"]
+    conn.execute(f"CREATE OR REPLACE VIEW {MARKET_TABLE} AS\n" + "\nUNION ALL\n".join(branches))
+
+
+def _write_partitions(conn, select_sql, params, default_venue):
+    """Instrada le righe di select_sql nelle partizioni venue/anno (restituisce le partizioni create)"""
+    venue = default_venue or get_default_venue()
+    cols = ', '.join(MARKET_DATA_COLUMNS)
+    venue_sql, join = '?', ''
+    if INSTRUMENTS_TABLE in _tables(conn):
+        venue_sql = 'COALESCE(i.venue, ?)'
+        join = f"LEFT JOIN {INSTRUMENTS_TABLE} i ON i.symbol = r.symbol"
+    conn.execute(f"""
+    CREATE OR REPLACE TEMP TABLE market_rows_in AS
+    SELECT r.* REPLACE (r.date::DATE AS date), {venue_sql} AS venue, year(r.date::DATE)::INTEGER AS year
+    FROM ({select_sql}) r {join}
+    """, [venue] + list(params))
+    try:
+        registry = {(v, y): t for v, y, t in market_partitions(conn)}
+        created = 0
+        for part_venue, year in conn.execute("SELECT DISTINCT venue, year FROM market_rows_in ORDER BY 1, 2").fetchall():
+            table = registry.get((part_venue, year))
+            if table is None:
+                table = partition_table_name(part_venue, year)
+                create_market_table(conn, table)
+                conn.execute(f"INSERT INTO {PARTITIONS_TABLE} VALUES (?, ?, ?)", [part_venue, year, table])
+                registry[(part_venue, year)] = table
+                created += 1
+            conn.execute(f"""
+            INSERT OR REPLACE INTO {table} ({cols})
+            SELECT {cols} FROM market_rows_in WHERE venue = ? AND year = ?
+            """, [part_venue, year])
+            # Simbolo passato ad altra venue: (symbol, date) resta unica in market_data
+            for (other_venue, other_year), other in registry.items():
+                if other_year == year and other_venue != part_venue:
+                    conn.execute(f"""
+                    DELETE FROM {other} USING market_rows_in r
+                    WHERE {other}.symbol = r.symbol AND {other}.date = r.date AND r.venue = ? AND r.year = ?
+                    """, [part_venue, year])
+        return created
+    finally:
+        conn.execute("DROP TABLE IF EXISTS market_rows_in")
+
+
+def write_market_rows(conn, select_sql, params=None, default_venue=None):
+    """INSERT OR REPLACE in market_data delle righe di select_sql (colonne MARKET_DATA_COLUMNS)
+
+    Layout partizionato: ogni riga va nella partizione della venue del simbolo
+    (instruments, default get_default_venue()) e dell'anno; vista ricreata solo se
+    nasce una partizione. Layout legacy: un solo statement sulla tabella.
+    """
+    params = list(params or [])
+    if not is_partitioned(conn):
+        cols = ', '.join(MARKET_DATA_COLUMNS)
+        conn.execute(f"INSERT OR REPLACE INTO {MARKET_TABLE} ({cols})\nSELECT {cols} FROM ({select_sql})", params)
+        return
+    if _write_partitions(conn, select_sql, params, default_venue):
+        refresh_market_view(conn)
+
+
+def delete_market_rows(conn, symbols):
+    """Elimina lo storico dei simboli (tabella legacy o tutte le partizioni)"""
+    tables = [t for _, _, t in market_partitions(conn)] if is_partitioned(conn) else [MARKET_TABLE]
+    for table in tables:
+        conn.execute(f"DELETE FROM {table} WHERE list_contains(?::VARCHAR[], symbol)", [list(symbols)])
+
+
+def partition_market_data(conn, default_venue=None):
+    """Passa market_data al layout partizionato (idempotente)
+
+    Tabella legacy → righe copiate nelle partizioni venue/anno, tabella eliminata e
+    sostituita dalla vista; DB senza market_data → vista vuota.
+
+    Returns:
+        int: righe migrate
+    """
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {PARTITIONS_TABLE} (
+        venue VARCHAR NOT NULL,
+        year INTEGER NOT NULL,
+        table_name VARCHAR NOT NULL UNIQUE,
+        PRIMARY KEY (venue, year)
+    )
+    """)
+    kind = conn.execute("""
+    SELECT table_type FROM information_schema.tables
+    WHERE table_schema = 'main' AND table_name = ?
+    """, [MARKET_TABLE]).fetchone()
+    if kind is not None and kind[0] == 'VIEW':
+        return 0
+    migrated = 0
+    if kind is not None:
+        migrated = conn.execute(f"SELECT COUNT(*) FROM {MARKET_TABLE}").fetchone()[0]
+        _write_partitions(conn, f"SELECT {', '.join(MARKET_DATA_COLUMNS)} FROM {MARKET_TABLE}", [], default_venue)
+        conn.execute(f"DROP TABLE {MARKET_TABLE}")
+    refresh_market_view(conn)
+    return migrated
+
+
+def market_data_source(conn, venue=None, start=None, end=None):
+    """Relazione market_data filtrata per venue/periodo (FROM/JOIN delle query)
+
+    Layout partizionato: solo le partizioni della venue/del periodo vengono lette.
+    Layout legacy: nessuna colonna venue, filtro venue ignorato.
+    """
+    filters = []
+    if venue is not None and is_partitioned(conn):
+        filters.append(f"venue = {_sql_literal(venue)}")
+    if start is not None:
+        filters.append(f"date >= DATE '{date.fromisoformat(str(start)[:10])}'")
+    if end is not None:
+        filters.append(f"date <= DATE '{date.fromisoformat(str(end)[:10])}'")
+    if not filters:
+        return MARKET_TABLE
+    return f"(SELECT {', '.join(MARKET_DATA_COLUMNS)} FROM {MARKET_TABLE} WHERE {' AND '.join(filters)})"
+
+
+# ==================== CONVERSIONE EUR ====================
+
+def eur_conversion_sql(conn, relation, price_columns=(), default_currency=BASE_CURRENCY):
+    """SELECT su relation (colonne symbol, date) + currency, exchange_rate e <col>_eur
+
+    Un solo ASOF JOIN su fx_rates per tutte le righe (cambio all'ultima data <= date);
+    exchange_rate/<col>_eur NULL se il cambio manca. Tabelle assenti (DB minimali):
+    valuta di default, cambio 1.0 solo per EUR.
+    """
+    tables = _tables(conn)
+    default = default_currency.replace("'", "''")
+    joins = ''
+    currency = f"'{default}'"
+    if INSTRUMENTS_TABLE in tables:
+        currency = f"COALESCE(i.currency, '{default}')"
+        joins += f"\nLEFT JOIN {INSTRUMENTS_TABLE} i ON i.symbol = r.symbol"
+    if FX_TABLE in tables:
+        rate = f"CASE WHEN {currency} = '{BASE_CURRENCY}' THEN 1.0 ELSE fx.rate_eur END"
+        joins += f"\nASOF LEFT JOIN {FX_TABLE} fx ON fx.currency = {currency} AND fx.date <= r.date"
+    else:
+        rate = f"CASE WHEN {currency} = '{BASE_CURRENCY}' THEN 1.0 END"
+    converted = ''.join(f", r.{c} * ({rate}) AS {c}_eur" for c in price_columns)
+    return f"SELECT r.*, {currency} AS currency, {rate} AS exchange_rate{converted}\nFROM ({relation}) r{joins}"
+
+
+class FxLookup:
+    """Cambi as-of per un batch simboli × date (un ASOF JOIN su fx_rates al caricamento)"""
+
+    def __init__(self, currencies=None, rates=None, default_currency=BASE_CURRENCY):
+        self.currencies = dict(currencies or {})
+        self.rates = dict(rates or {})
+        self.default_currency = default_currency
+
+    @classmethod
+    def load(cls, conn, symbols=None, dates=(), default_currency=BASE_CURRENCY):
+        """symbols None → tutti gli strumenti di instruments; dates: date di conversione"""
+        tables = _tables(conn)
+        params = []
+        if symbols is not None:
+            symbols_sql = "SELECT UNNEST(?::VARCHAR[]) AS symbol"
+            params.append(list(symbols))
+        elif INSTRUMENTS_TABLE in tables:
+            symbols_sql = f"SELECT symbol FROM {INSTRUMENTS_TABLE}"
+        else:
+            return cls(default_currency=default_currency)
+        params.append(list(dates) or [None])
+        legs = f"SELECT s.symbol, d.date FROM ({symbols_sql}) s CROSS JOIN (SELECT UNNEST(?::DATE[]) AS date) d"
+        currencies, rates = {}, {}
+        for symbol, on_date, currency, rate in conn.execute(
+            f"SELECT symbol, date, currency, exchange_rate FROM ({eur_conversion_sql(conn, legs, default_currency=default_currency)})",
+            params,
+        ).fetchall():
+            currencies[symbol] = currency
+            if on_date is not None:
+                rates[(currency, on_date)] = rate
+        return cls(currencies, rates, default_currency)
+
+    def currency(self, symbol):
+        return self.currencies.get(symbol, self.default_currency)
+
+    def rate(self, currency, on_date):
+        """EUR per 1 unità di currency a on_date (None se il cambio manca o la data non è nel batch)"""
+        if currency == BASE_CURRENCY:
+            return 1.0
+        return self.rates.get((currency, on_date))
+
+    def convert(self, symbol, on_date, price):
+        """(currency, exchange_rate, price_eur); rate/price_eur None se il cambio manca"""
+        currency = self.currency(symbol)
+        rate = self.rate(currency, on_date)
+        return currency, rate, (price * rate if rate is not None and price is not None else None)
+
+
+def prices_to_eur(conn, prices):
+    """DataFrame (symbol, date, price) → + currency, exchange_rate, price_eur in una query"""
+    conn.register('prices_in', prices[['symbol', 'date', 'price']])
+    try:
+        relation = "SELECT symbol, date::DATE AS date, price FROM prices_in"
+        return conn.execute(
+            f"{eur_conversion_sql(conn, relation, ['price'])}\nORDER BY r.symbol, r.date"
+        ).fetchdf()
+    finally:
+        conn.unregister('prices_in')
@@ -134,6 +134,38 @@ class PathManager:
         """Path per current_session.json"""
         return self.root / 'data' / 'reports' / 'current_session.json'
     
+    @property
+    def sequence_state_path(self):
+        """Path per stato ultima sequenza riuscita (fingerprint input per step)"""
+        return self.root / 'data' / 'reports' / 'sequence_state.json'
+    
+    # ==================== CACHE ====================
+    
+    @property
+    def market_cube_dir(self):
+        """Directory market cube (array date × simboli memory-mapped)"""
+        return self.root / 'data' / 'cache' / 'market_cube'
+    
+    @property
+    def equity_series_dir(self):
+        """Directory serie equity/cash/posizioni per run (Parquet)"""
+        return self.root / 'data' / 'cache' / 'equity_series'
+    
+    @property
+    def http_cache_dir(self):
+        """Directory cache risposte dei provider dati (data_sources)"""
+        return self.root / 'data' / 'cache' / 'http'
+    
+    @property
+    def db_snapshots_dir(self):
+        """Directory snapshot read-only del DB per report e monitor (vedi utils/db_snapshot.py)"""
+        return self.root / 'data' / 'cache' / 'db_snapshots'
+    
+    @property
+    def schema_gate_cache_path(self):
+        """Esito schema contract gate per impronta del catalogo"""
+        return self.root / 'data' / 'cache' / 'schema_contract_gate.json'
+    
     # ==================== TEMP ====================
     
     @property
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Perf Trace - ETF Italia Project v10
+Strumentazione leggera della pipeline: span annidati con tempo wall/CPU e contatori
+
+LOGICA:
+- span(name) è un context manager: misura perf_counter/process_time e raccoglie
+  contatori (sql_calls, rows_read, ...) incrementati con count() durante lo span
+- Gli span sono aggregati per percorso (es. backtest/run_simulation/day):
+  chiamate, wall/CPU totali e massimi, contatori sommati; i contatori risalgono
+  agli span padre alla chiusura (lo span radice contiene i totali dello step)
+- perf_step(step) avvolge un entry point CLI: span radice, profilo opzionale e
+  scrittura di perf_trace_<ts>.json nella sessione (SessionManager.add_report_to_session)
+- Profilo per step opzionale via env ETF_ITA_PROFILE=cprofile|pyinstrument
+  (pyinstrument se installato, altrimenti cProfile); dump nella cartella analysis
+- Solo libreria standard: importabile dagli entry point senza costi di cold-start
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE_ENV = 'ETF_ITA_PROFILE'
+
+
+class _SpanStats:
+    __slots__ = ('calls', 'wall_s', 'cpu_s', 'max_wall_s', 'counters')
+
+    def __init__(self):
+        self.calls = 0
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.max_wall_s = 0.0
+        self.counters = {}
+
+
+class PerfTracer:
+    """Raccoglie span e contatori di un processo (uno stack di span per thread)"""
+
+    def __init__(self):
+        self._stats = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.started_at = datetime.now().isoformat()
+        self._t0 = time.perf_counter()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, name, **counters):
+        """Misura un blocco; counters iniziali opzionali (es. rows_read=len(df))"""
+        stack = self._stack()
+        frame = [f"{stack[-1][0]}/{name}" if stack else name, dict(counters)]
+        stack.append(frame)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield self
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            stack.pop()
+            self.record(name, wall, cpu, **frame[1])
+
+    def record(self, name, wall_s, cpu_s=0.0, **counters):
+        """Registra come span figlio un intervallo già misurato (loop lunghi, callback)"""
+        stack = self._stack()
+        path = f"{stack[-1][0]}/{name}" if stack else name
+        with self._lock:
+            stats = self._stats.get(path)
+            if stats is None:
+                stats = self._stats[path] = _SpanStats()
+            stats.calls += 1
+            stats.wall_s += wall_s
+            stats.cpu_s += cpu_s
+            stats.max_wall_s = max(stats.max_wall_s, wall_s)
+            for key, value in counters.items():
+                stats.counters[key] = stats.counters.get(key, 0) + value
+        if stack:
+            parent = stack[-1][1]
+            for key, value in counters.items():
+                parent[key] = parent.get(key, 0) + value
+
+    def count(self, key, n=1):
+        """Incrementa un contatore dello span corrente (ignorato fuori da uno span)"""
+        stack = self._stack()
+        if stack:
+            counters = stack[-1][1]
+            counters[key] = counters.get(key, 0) + n
+
+    def to_dict(self, step=None):
+        """Trace serializzabile (span ordinati per percorso)"""
+        with self._lock:
+            spans = [
+                {
+                    'path': path,
+                    'calls': s.calls,
+                    'wall_ms': round(s.wall_s * 1000, 3),
+                    'cpu_ms': round(s.cpu_s * 1000, 3),
+                    'max_wall_ms': round(s.max_wall_s * 1000, 3),
+                    'counters': dict(s.counters),
+                }
+                for path, s in sorted(self._stats.items())
+            ]
+        return {
+            'step': step,
+            'pid': os.getpid(),
+            'started_at': self.started_at,
+            'elapsed_ms': round((time.perf_counter() - self._t0) * 1000, 3),
+            'spans': spans,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+        self.started_at = datetime.now().isoformat()
+        self._t0 = time.perf_counter()
+
+
+_tracer = PerfTracer()
+
+
+def get_tracer():
+    """Tracer globale del processo"""
+    return _tracer
+
+
+def span(name, **counters):
+    """Span sul tracer globale"""
+    return _tracer.span(name, **counters)
+
+
+def count(key, n=1):
+    """Contatore sullo span corrente del tracer globale"""
+    _tracer.count(key, n)
+
+
+def record(name, wall_s, cpu_s=0.0, **counters):
+    """Intervallo già misurato come span figlio sul tracer globale"""
+    _tracer.record(name, wall_s, cpu_s, **counters)
+
+
+def traced(name=None):
+    """Decoratore: esegue la funzione dentro uno span (default: nome funzione)"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        def wrapper(*args, **kwargs):
+            with _tracer.span(span_name):
+                return func(*args, **kwargs)
+
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def _profiler(mode):
+    """Profilo opzionale del blocco: yield di una callable(path_base) che salva il dump"""
+    if mode == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("WARN: pyinstrument non installato, uso cProfile")
+            mode = 'cprofile'
+        else:
+            profiler = Profiler()
+
+            def dump(path_base):
+                if profiler.is_running:
+                    profiler.stop()
+                with open(f"{path_base}.html", 'w', encoding='utf-8') as f:
+                    f.write(profiler.output_html())
+
+            profiler.start()
+            try:
+                yield dump
+            finally:
+                if profiler.is_running:
+                    profiler.stop()
+            return
+
+    if mode == 'cprofile':
+        import cProfile
+
+        profiler = cProfile.Profile()
+
+        def dump(path_base):
+            profiler.disable()
+            profiler.dump_stats(f"{path_base}.prof")
+
+        profiler.enable()
+        try:
+            yield dump
+        finally:
+            profiler.disable()
+        return
+
+    yield None
+
+
+def write_perf_trace(step, session_manager=None, tracer=None):
+    """Salva il trace nella sessione corrente (perf_trace_<ts>.json in analysis)"""
+    if session_manager is None:
+        from orchestration.session_manager import get_session_manager
+        session_manager = get_session_manager()
+    tracer = tracer or _tracer
+    return session_manager.add_report_to_session('perf_trace', tracer.to_dict(step), 'json')
+
+
+@contextmanager
+def perf_step(step, session_manager=None, write=True):
+    """Entry point strumentato: span radice, profilo opzionale, trace nella sessione
+
+    Errori di scrittura del trace non interrompono lo step (solo WARN).
+    """
+    mode = os.environ.get(PROFILE_ENV, '').strip().lower() or None
+    with _profiler(mode) as dump:
+        try:
+            with _tracer.span(step):
+                yield _tracer
+        finally:
+            if write:
+                try:
+                    trace_file = write_perf_trace(step, session_manager)
+                    if dump is not None:
+                        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                        dump(str(trace_file.parent / f"profile_{step}_{timestamp}"))
+                except Exception as e:
+                    print(f"WARN: perf trace non salvato: {e}")
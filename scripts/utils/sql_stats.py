@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+SQL Stats - ETF Italia Project v10
+Statistiche delle query DuckDB tramite connessione proxy
+
+LOGICA:
+- StatsConnection avvolge una connessione DuckDB: execute/executemany e fetch*
+  sono cronometrati, il resto (commit, rollback, close, ...) è delegato
+- Aggregazione per testo SQL normalizzato (spazi compressi, VALUES multi-riga
+  ridotti a un solo gruppo): chiamate, latenza totale/mediana/max, righe lette
+- Report ordinato per tempo totale con EXPLAIN ANALYZE dei peggiori SELECT
+  (rieseguiti con gli ultimi parametri: solo query di lettura)
+- Attivazione: esplicita (stats=QueryStats()) oppure env ETF_ITA_SQL_STATS=1;
+  con env il report sql_stats_<ts>.json va nella sessione alla chiusura della connessione
+- Budget per i test: assert_query_budget() fallisce con l'elenco dei peggiori
+- Contatori sql_calls/rows_read propagati anche allo span perf_trace corrente
+"""
+
+import atexit
+import os
+import re
+import statistics
+import time
+
+from utils.perf_trace import count as _perf_count
+
+SQL_STATS_ENV = 'ETF_ITA_SQL_STATS'
+DEFAULT_EXPLAIN_TOP = 5
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_VALUES_GROUPS_RE = re.compile(r'(\([?,\s]+\))(?:\s*,\s*\([?,\s]+\))+')
+_READ_ONLY_RE = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """Chiave di aggregazione: spazi compressi, gruppi VALUES ripetuti → uno solo"""
+    text = _WHITESPACE_RE.sub(' ', str(sql)).strip()
+    return _VALUES_GROUPS_RE.sub(r'\1, ...', text)
+
+
+class _QueryRecord:
+    __slots__ = ('sql', 'calls', 'latencies', 'rows', 'sample_params')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.latencies = []
+        self.rows = 0
+        self.sample_params = None
+
+
+class QueryStats:
+    """Collettore delle statistiche per testo SQL"""
+
+    def __init__(self):
+        self._records = {}
+        self._last = None
+
+    def record_execute(self, sql, params, elapsed_s, explainable=True):
+        key = normalize_sql(sql)
+        rec = self._records.get(key)
+        if rec is None:
+            rec = self._records[key] = _QueryRecord(key)
+        rec.calls += 1
+        rec.latencies.append(elapsed_s)
+        rec.sample_params = (sql, params) if explainable else None
+        self._last = rec
+        _perf_count('sql_calls')
+
+    def record_fetch(self, rows, elapsed_s):
+        rec = self._last
+        if rec is None:
+            return
+        rec.rows += rows
+        if rec.latencies:
+            rec.latencies[-1] += elapsed_s
+        _perf_count('rows_read', rows)
+
+    @property
+    def total_calls(self):
+        return sum(r.calls for r in self._records.values())
+
+    def calls_for(self, pattern):
+        """Chiamate totali delle query il cui testo contiene pattern (case-insensitive)"""
+        pattern = pattern.lower()
+        return sum(r.calls for k, r in self._records.items() if pattern in k.lower())
+
+    def ranked(self, key='total_ms'):
+        """Statistiche per query, ordinate (desc) per total_ms | calls | rows"""
+        rows = []
+        for rec in self._records.values():
+            latencies_ms = [x * 1000 for x in rec.latencies]
+            rows.append({
+                'sql': rec.sql,
+                'calls': rec.calls,
+                'total_ms': round(sum(latencies_ms), 3),
+                'median_ms': round(statistics.median(latencies_ms), 3) if latencies_ms else 0.0,
+                'max_ms': round(max(latencies_ms), 3) if latencies_ms else 0.0,
+                'rows': rec.rows,
+            })
+        return sorted(rows, key=lambda r: r[key], reverse=True)
+
+    def explain_top(self, conn, top=DEFAULT_EXPLAIN_TOP):
+        """EXPLAIN ANALYZE delle query di lettura più costose (sql normalizzato → piano)"""
+        raw = conn.raw if isinstance(conn, StatsConnection) else conn
+        plans = {}
+        for row in self.ranked():
+            if len(plans) >= top:
+                break
+            rec = self._records[row['sql']]
+            if rec.sample_params is None:
+                continue
+            sql, params = rec.sample_params
+            if not _READ_ONLY_RE.match(sql):
+                continue
+            try:
+                result = raw.execute(f"EXPLAIN ANALYZE {sql}", params).fetchall() if params is not None \
+                    else raw.execute(f"EXPLAIN ANALYZE {sql}").fetchall()
+                plans[row['sql']] = '\n'.join(str(r[-1]) for r in result)
+            except Exception as e:
+                plans[row['sql']] = f"EXPLAIN non disponibile: {e}"
+        return plans
+
+    def report(self, conn=None, top=20, explain_top=DEFAULT_EXPLAIN_TOP):
+        """Report serializzabile: totali + top query (con piani se conn è fornita)"""
+        ranked = self.ranked()
+        plans = self.explain_top(conn, explain_top) if conn is not None and explain_top else {}
+        queries = []
+        for row in ranked[:top]:
+            if row['sql'] in plans:
+                row = dict(row, explain_analyze=plans[row['sql']])
+            queries.append(row)
+        return {
+            'total_calls': self.total_calls,
+            'distinct_queries': len(ranked),
+            'total_ms': round(sum(r['total_ms'] for r in ranked), 3),
+            'total_rows': sum(r['rows'] for r in ranked),
+            'queries': queries,
+        }
+
+    def reset(self):
+        self._records = {}
+        self._last = None
+
+
+def _count_rows(result):
+    if result is None:
+        return 0
+    if isinstance(result, tuple):
+        return 1
+    if isinstance(result, dict):
+        first = next(iter(result.values()), None)
+        return len(first) if first is not None else 0
+    num_rows = getattr(result, 'num_rows', None)
+    if num_rows is not None:
+        return int(num_rows)
+    try:
+        return len(result)
+    except TypeError:
+        return 0
+
+
+class StatsConnection:
+    """Proxy di una connessione DuckDB che registra ogni query in QueryStats"""
+
+    _FETCH_METHODS = frozenset((
+        'fetchone', 'fetchall', 'fetchmany', 'fetchdf', 'df', 'fetchnumpy',
+        'fetch_df', 'fetch_arrow_table', 'arrow', 'pl',
+    ))
+
+    def __init__(self, conn, stats, on_close=None):
+        self.raw = conn
+        self.stats = stats
+        self._on_close = on_close
+
+    def execute(self, sql, parameters=None):
+        start = time.perf_counter()
+        if parameters is None:
+            self.raw.execute(sql)
+        else:
+            self.raw.execute(sql, parameters)
+        self.stats.record_execute(sql, parameters, time.perf_counter() - start)
+        return self
+
+    def executemany(self, sql, parameters=None):
+        start = time.perf_counter()
+        if parameters is None:
+            self.raw.executemany(sql)
+        else:
+            self.raw.executemany(sql, parameters)
+        # I parametri di executemany non sono riusabili per EXPLAIN
+        self.stats.record_execute(sql, None, time.perf_counter() - start, explainable=False)
+        return self
+
+    def __getattr__(self, name):
+        attr = getattr(self.raw, name)
+        if name not in self._FETCH_METHODS:
+            return attr
+
+        def fetch(*args, **kwargs):
+            start = time.perf_counter()
+            result = attr(*args, **kwargs)
+            self.stats.record_fetch(_count_rows(result), time.perf_counter() - start)
+            return result
+
+        return fetch
+
+    def flush(self):
+        """Esegue una sola volta la callback di chiusura (report con EXPLAIN a connessione aperta)"""
+        callback, self._on_close = self._on_close, None
+        if callback is not None:
+            callback(self)
+
+    def close(self):
+        self.flush()
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def sql_stats_enabled():
+    """True se ETF_ITA_SQL_STATS è attivo (sequence_runner lo imposta nell'env degli step)"""
+    return os.environ.get(SQL_STATS_ENV, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def write_sql_stats_report(stats, step, conn=None, session_manager=None, explain_top=DEFAULT_EXPLAIN_TOP):
+    """Salva il report nella sessione corrente (sql_stats_<ts>.json in analysis)"""
+    if session_manager is None:
+        from orchestration.session_manager import get_session_manager
+        session_manager = get_session_manager()
+    report = stats.report(conn=conn, explain_top=explain_top)
+    report['step'] = step
+    return session_manager.add_report_to_session('sql_stats', report, 'json')
+
+
+def instrument_connection(conn, step, stats=None):
+    """Avvolge conn in StatsConnection se richiesto (stats esplicito o env attivo)
+
+    Con env attivo il report (con EXPLAIN dei SELECT peggiori) viene scritto nella
+    sessione alla chiusura della connessione, o all'uscita del processo se non chiusa.
+    """
+    if stats is None:
+        if not sql_stats_enabled():
+            return conn
+
+        def _write_report(proxy):
+            try:
+                report_file = write_sql_stats_report(proxy.stats, step, conn=proxy)
+                print(f"SQL stats ({step}): {proxy.stats.total_calls} query → {report_file}")
+            except Exception as e:
+                print(f"WARN: SQL stats non salvate: {e}")
+
+        proxy = StatsConnection(conn, QueryStats(), on_close=_write_report)
+        atexit.register(proxy.flush)
+        return proxy
+    return StatsConnection(conn, stats)
+
+
+def assert_query_budget(stats, max_total=None, max_per_query=None, top=5):
+    """Test mode: fallisce se il numero di query supera i limiti (con i peggiori in errore)"""
+    ranked = stats.ranked('calls')
+    problems = []
+    if max_total is not None and stats.total_calls > max_total:
+        problems.append(f"query totali {stats.total_calls} > {max_total}")
+    if max_per_query is not None:
+        over = [r for r in ranked if r['calls'] > max_per_query]
+        if over:
+            problems.append(f"{len(over)} query oltre {max_per_query} chiamate")
+    if problems:
+        worst = '\n'.join(f"  {r['calls']:>6}x {r['sql'][:160]}" for r in ranked[:top])
+        raise AssertionError('; '.join(problems) + '\n' + worst)
+
+
+def summarize_session_sql_stats(session_manager=None, top=20):
+    """Classifica unica delle query di tutti gli step della sessione corrente"""
+    import json
+
+    if session_manager is None:
+        from orchestration.session_manager import get_session_manager
+        session_manager = get_session_manager()
+
+    merged = {}
+    steps = []
+    for path in sorted(session_manager.get_subdir_path('analysis').glob('sql_stats_*.json')):
+        if path.name.startswith('sql_stats_summary_'):
+            continue
+        with open(path, 'r') as f:
+            report = json.load(f)
+        steps.append({'step': report.get('step'), 'total_calls': report.get('total_calls'),
+                      'total_ms': report.get('total_ms'), 'file': path.name})
+        for q in report.get('queries', []):
+            row = merged.setdefault(q['sql'], {'sql': q['sql'], 'calls': 0, 'total_ms': 0.0, 'rows': 0, 'steps': []})
+            row['calls'] += q['calls']
+            row['total_ms'] = round(row['total_ms'] + q['total_ms'], 3)
+            row['rows'] += q['rows']
+            row['steps'].append(report.get('step'))
+
+    queries = sorted(merged.values(), key=lambda r: r['total_ms'], reverse=True)[:top]
+    return {'steps': steps, 'queries': queries}
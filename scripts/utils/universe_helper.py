@@ -13,10 +13,13 @@ con API precedenti.
 from __future__ import annotations
 
 import json
+import os
 from datetime import date, datetime
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+DEFAULT_VENUE = 'XMIL'
+
 
 def _parse_date(value: Any) -> Optional[date]:
     """Parse a YYYY-MM-DD string (or date) into datetime.date."""
@@ -144,3 +147,20 @@ def get_execution_model_for_symbol(config: Dict[str, Any], symbol: str) -> Optio
     if etf:
         return etf.get('execution_model') or None
     return None
+
+
+def get_default_venue(config: Optional[Dict[str, Any]] = None) -> str:
+    """Venue di default: env ETF_VENUE → settings.venue → venue → XMIL."""
+    cfg = config or {}
+    settings = cfg.get('settings') if isinstance(cfg.get('settings'), dict) else {}
+    return os.getenv('ETF_VENUE') or settings.get('venue') or cfg.get('venue') or DEFAULT_VENUE
+
+
+def get_venue_for_symbol(config: Dict[str, Any], symbol: str) -> str:
+    etf = get_universe_etf_by_symbol(config, symbol)
+    return (etf or {}).get('venue') or get_default_venue(config)
+
+
+def get_currency_for_symbol(config: Dict[str, Any], symbol: str) -> str:
+    etf = get_universe_etf_by_symbol(config, symbol)
+    return (etf or {}).get('currency') or ((config or {}).get('settings', {}) or {}).get('currency') or 'EUR'
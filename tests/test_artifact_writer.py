@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Test Artifact Writer - ETF Italia Project v10
+Formati tabellari compatti, manifest, scrittura in background e nomi univoci dei report
+"""
+
+import sys
+import os
+import json
+import subprocess
+import threading
+from pathlib import Path
+
+import pytest
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+from orchestration.artifact_writer import ArtifactWriter, load_manifest, read_table, write_artifact
+from orchestration.session_manager import SessionManager
+
+ROWS = [{'date': f"2025-01-{d:02d}", 'symbol': s, 'qty': d * 10, 'price': 100.0 + d}
+        for d in range(1, 21) for s in ('CSSPX.MI', 'XS2L.MI')]
+
+
+@pytest.mark.parametrize('format_type', ['ndjson.gz', 'parquet'])
+def test_tabular_round_trip_and_manifest(tmp_path, format_type):
+    path = tmp_path / f"orders.{format_type}"
+    info = write_artifact(path, ROWS, format_type, 'backtest_orders', tmp_path / 'manifest.json', {'run_id': 'r1'})
+    assert info['rows'] == len(ROWS)
+    assert info['columns'] == ['date', 'symbol', 'qty', 'price']
+
+    data = read_table(path)
+    records = data if isinstance(data, list) else data.to_dict(orient='records')
+    assert [(r['symbol'], int(r['qty']), float(r['price'])) for r in records] == \
+        [(r['symbol'], r['qty'], r['price']) for r in ROWS]
+
+    # Più compatto del JSON indentato equivalente
+    assert path.stat().st_size < len(json.dumps(ROWS, indent=2))
+
+    entries = load_manifest(tmp_path)
+    assert len(entries) == 1
+    assert entries[0]['file'] == path.name and entries[0]['type'] == 'backtest_orders'
+    assert entries[0]['rows'] == len(ROWS) and entries[0]['run_id'] == 'r1'
+
+    # Riscrittura dello stesso file: voce sostituita, non duplicata
+    write_artifact(path, ROWS[:4], format_type, 'backtest_orders', tmp_path / 'manifest.json')
+    assert [e['rows'] for e in load_manifest(tmp_path)] == [4]
+
+
+def test_background_writer_flush_and_errors(tmp_path):
+    writer = ArtifactWriter()
+    for i in range(5):
+        writer.submit(write_artifact, tmp_path / f"part_{i}.ndjson.gz", ROWS, 'ndjson.gz',
+                      'part', tmp_path / 'manifest.json')
+    writer.submit(write_artifact, tmp_path / 'bad.csv', ROWS, 'csv')
+    errors = writer.flush()
+
+    assert writer.pending == 0
+    assert len(errors) == 1 and 'bad.csv' in errors[0]
+    assert sorted(e['file'] for e in load_manifest(tmp_path)) == [f"part_{i}.ndjson.gz" for i in range(5)]
+    # Nessun file temporaneo residuo
+    assert not list(tmp_path.glob('*.tmp'))
+    assert writer.flush() == []
+
+
+def test_manifest_concurrent_writers_keep_all_entries(tmp_path):
+    manifest = tmp_path / 'manifest.json'
+    # Processi paralleli (step della sequenza) sullo stesso manifest
+    script = (
+        "import sys; sys.path.insert(0, sys.argv[1])\n"
+        "from orchestration.artifact_writer import update_manifest\n"
+        "for i in range(25):\n"
+        "    update_manifest(sys.argv[2], {'file': f'p{sys.argv[3]}_{i}.ndjson.gz', 'type': 'part'})\n"
+    )
+    procs = [subprocess.Popen([sys.executable, '-c', script, scripts_dir, str(manifest), str(p)]) for p in range(4)]
+
+    # Nel processo: percorso sincrono e background insieme
+    writer = ArtifactWriter()
+    threads = [threading.Thread(target=lambda k=k: [
+        write_artifact(tmp_path / f"t{k}_{i}.ndjson.gz", ROWS[:2], 'ndjson.gz', 'part', manifest)
+        for i in range(10)]) for k in range(2)]
+    for t in threads:
+        t.start()
+    for i in range(10):
+        writer.submit(write_artifact, tmp_path / f"bg_{i}.ndjson.gz", ROWS[:2], 'ndjson.gz', 'part', manifest)
+    for t in threads:
+        t.join()
+    assert writer.flush() == []
+    assert all(p.wait(timeout=60) == 0 for p in procs)
+
+    files = {e['file'] for e in load_manifest(tmp_path)}
+    assert len(files) == 4 * 25 + 2 * 10 + 10
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_session_reports_unique_names_and_cached_subdirs(tmp_path, monkeypatch):
+    sm = SessionManager(base_reports_dir=str(tmp_path / 'sessions'), script_name='test_artifact_writer')
+    sm.create_session()
+    subdir = sm.get_subdir_path('backtests')
+
+    # Sottocartella risolta una sola volta per sessione
+    def fail_iterdir(self):
+        raise AssertionError('iterdir non atteso')
+    monkeypatch.setattr(Path, 'iterdir', fail_iterdir)
+    assert sm.get_subdir_path('backtests') == subdir
+
+    # Report nello stesso secondo: nessuna sovrascrittura
+    paths = [sm.add_report_to_session('backtest', {'i': i}) for i in range(3)]
+    assert len(set(paths)) == 3
+    assert [json.loads(p.read_text())['i'] for p in paths] == [0, 1, 2]
+
+    artifact = sm.add_artifact_to_session('backtest', ROWS, 'ndjson.gz', meta={'kind': 'orders'})
+    assert sm.flush_artifacts() == []
+    assert artifact.parent == subdir and len(read_table(artifact)) == len(ROWS)
+    entries = load_manifest(sm.get_current_session_dir())
+    assert [e['kind'] for e in entries] == ['orders']
+    assert entries[0]['file'] == artifact.relative_to(sm.get_current_session_dir()).as_posix()
+
+    with pytest.raises(ValueError):
+        sm.add_artifact_to_session('backtest', ROWS, 'json')
@@ -83,3 +83,21 @@ def test_backtest_kpi_equity_curve_is_reasonable(tmp_path):
         assert kpi['turnover'] >= 0.0
     finally:
         conn.close()
+
+
+def test_backtest_kpi_values_positions_in_eur(tmp_path):
+    from utils.market_store import sync_instruments, upsert_fx_rates
+
+    conn = _setup_db(tmp_path)
+    try:
+        # AAA quotato in USD (cambio 0.5): BUY a 50 EUR nel ledger, valutazione close × cambio
+        sync_instruments(conn, {'universe': {'benchmark': [{'symbol': 'AAA', 'currency': 'USD'}]}})
+        upsert_fx_rates(conn, 'USD', {'2025-01-01': 0.5})
+        conn.execute("UPDATE fiscal_ledger SET price = 50 WHERE id = 2")
+        config = {'universe': {'benchmark': [{'symbol': 'AAA'}]}}
+        kpi = calculate_kpi(conn, config, start_date='2025-01-02', end_date='2025-01-03')
+
+        # Equity: 950 + 100 × 0.5 → 950 + 110 × 0.5
+        assert abs(kpi['turnover'] - 50 / (2 * 1005.0)) < 1e-9
+    finally:
+        conn.close()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test Benchmarks - ETF Italia Project v10
+Workspace sintetico deterministico, isolamento path/sessione e confronto baseline
+"""
+
+import sys
+import os
+import json
+from argparse import Namespace
+
+import duckdb
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+benchmarks_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+if benchmarks_dir not in sys.path:
+    sys.path.append(benchmarks_dir)
+
+from run_benchmarks import StageContext, compare_to_baseline, stage_ingest
+from synthetic_db import bench_workspace, build_synthetic_workspace
+from utils.path_manager import get_path_manager
+
+
+def test_synthetic_workspace_deterministic(tmp_path):
+    a = build_synthetic_workspace(tmp_path / 'a', n_symbols=3, years=1, seed=7, ingest_days=5)
+    b = build_synthetic_workspace(tmp_path / 'b', n_symbols=3, years=1, seed=7, ingest_days=5)
+
+    with open(a['config_path']) as f:
+        config = json.load(f)
+    assert [e['symbol'] for e in config['universe']['core'] + config['universe']['satellite']] == a['symbols'][:3]
+    assert a['rows_loaded'] == 4 * (252 - 5) and a['rows_feed'] == 4 * 5
+
+    query = "SELECT symbol, date, adj_close FROM market_data ORDER BY symbol, date"
+    conn_a, conn_b = duckdb.connect(a['db_path'], read_only=True), duckdb.connect(b['db_path'], read_only=True)
+    try:
+        assert conn_a.execute(query).fetchall() == conn_b.execute(query).fetchall()
+        # Le sedute del feed non sono nel DB
+        assert conn_a.execute("SELECT MAX(date) FROM market_data").fetchone()[0] < a['ingest_from']
+    finally:
+        conn_a.close()
+        conn_b.close()
+
+    frame, source = a['feed'](a['symbols'][0], a['ingest_from'], a['end_date'])
+    assert source == 'BENCH' and len(frame) == 5
+    assert {'Close', 'High', 'Low', 'Volume'} <= set(frame.columns)
+
+
+def test_ingest_stage_isolated(tmp_path):
+    real_db = get_path_manager().db_path
+    ws = build_synthetic_workspace(tmp_path / 'ws', n_symbols=2, years=1, ingest_days=3)
+    ctx = StageContext(ws, Namespace())
+    with bench_workspace(ws['root']) as pm:
+        assert str(pm.db_path) == ws['db_path']
+        ok, info = stage_ingest(ctx)
+    assert ok and info['rows_feed'] == 3 * 3
+    assert get_path_manager().db_path == real_db
+
+    conn = duckdb.connect(ws['db_path'], read_only=True)
+    try:
+        assert conn.execute("SELECT MAX(date) FROM market_data").fetchone()[0] == ws['end_date']
+    finally:
+        conn.close()
+    assert ctx._measured['wall_s'] > 0
+    assert any(s['path'] == 'db_write' for s in ctx._measured['spans'])
+
+
+def test_compare_to_baseline():
+    results = {'stages': {'a': {'wall_s': 2.0}, 'b': {'wall_s': 1.0}, 'c': {'wall_s': 0.02}, 'd': {'wall_s': 1.0}}}
+    baseline = {'stages': {'a': {'wall_s': 1.0}, 'b': {'wall_s': 1.0}, 'c': {'wall_s': 0.01}}}
+    cmp = compare_to_baseline(results, baseline, threshold=1.25)
+    assert cmp['a'] == {'baseline_s': 1.0, 'ratio': 2.0, 'regression': True}
+    assert not cmp['b']['regression']
+    # Step troppo brevi: ratio riportato ma niente regressione
+    assert cmp['c']['ratio'] == 2.0 and not cmp['c']['regression']
+    assert cmp['d']['ratio'] is None
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Test Bulk Backfill - ETF Italia Project v10
+Merge DuckDB a blocchi e backfill a finestre ripristinabile (watermark per simbolo)
+"""
+
+import sys
+import os
+import threading
+from datetime import date, timedelta
+
+import duckdb
+import pandas as pd
+import pytest
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+from data.bulk_load import backfill_history, merge_bars, to_staging_frame
+from utils.perf_trace import get_tracer, span
+from utils.sql_stats import QueryStats, StatsConnection
+
+TARGET = date(2015, 1, 1)
+EXISTING_FROM = date(2024, 1, 1)
+INCEPTION = {'AAA': date(2012, 6, 1), 'BBB': date(2019, 3, 1)}
+
+
+def _bars(symbol, start, end):
+    """Barre del provider in [start, end) (indice Date con timezone, come yfinance)"""
+    days = pd.bdate_range(max(start, INCEPTION[symbol]), end - timedelta(days=1), tz='Europe/Rome')
+    close = [100.0 + (d.toordinal() % 50) / 10 for d in days]
+    return pd.DataFrame({
+        'Open': close, 'High': [c + 1 for c in close], 'Low': [c - 1 for c in close],
+        'Close': close, 'Volume': [1000] * len(days),
+    }, index=pd.DatetimeIndex(days, name='Date'))
+
+
+class FakeProvider:
+    def __init__(self, fail_after=None):
+        self.calls = []
+        self.fail_after = fail_after
+        self._lock = threading.Lock()
+
+    def __call__(self, symbol, start, end):
+        with self._lock:
+            self.calls.append((symbol, start, end))
+            if self.fail_after is not None and len(self.calls) > self.fail_after and symbol == 'AAA':
+                raise ConnectionError('rete non disponibile')
+        return _bars(symbol, start, end)
+
+
+def _setup_db(tmp_path):
+    conn = duckdb.connect(os.path.join(tmp_path, 'backfill.duckdb'))
+    for table in ('market_data', 'staging_data'):
+        conn.execute(f"""
+        CREATE TABLE {table} (
+            symbol VARCHAR NOT NULL, date DATE NOT NULL, adj_close DOUBLE, close DOUBLE,
+            high DOUBLE, low DOUBLE, volume BIGINT, source VARCHAR DEFAULT 'YF',
+            PRIMARY KEY (symbol, date)
+        )
+        """)
+    for symbol in INCEPTION:
+        merge_bars(conn, to_staging_frame(_bars(symbol, EXISTING_FROM, date(2024, 3, 1)), symbol, 'YF'))
+    return conn
+
+
+def _history(conn):
+    return conn.execute("SELECT symbol, date, close FROM market_data ORDER BY symbol, date").fetchall()
+
+
+def test_staging_frame_and_merge(tmp_path):
+    conn = _setup_db(tmp_path)
+    try:
+        bars = to_staging_frame(_bars('AAA', date(2024, 2, 26), date(2024, 3, 9)), 'AAA', 'YF')
+        # Date locali senza timezone (nessuno spostamento al giorno precedente)
+        assert bars['date'].dt.date.tolist()[0] == date(2024, 2, 26)
+        assert (bars['adj_close'] == bars['close']).all()
+
+        bars['close'] = bars['close'] + 0.5
+        stats = QueryStats()
+        proxy = StatsConnection(conn, stats)
+        tracer = get_tracer()
+        tracer.reset()
+        with span('db_write'):
+            assert merge_bars(proxy, [bars, bars]) == len(bars)
+        # Un blocco: controllo marker latest_prices (2) + delete staging + insert staging + layout
+        # market_data + merge + refresh latest_prices e marker (6), senza statement per riga
+        assert stats.total_calls == 12
+        # sql_calls dello span contato dalla connessione (nessun valore scritto a mano)
+        spans = {x['path']: x for x in tracer.to_dict()['spans']}
+        assert spans['db_write']['counters']['sql_calls'] == stats.total_calls
+        assert conn.execute("SELECT date, close FROM latest_prices WHERE symbol = 'AAA'").fetchone() \
+            == (date(2024, 3, 8), pytest.approx(bars['close'].iloc[-1]))
+        assert conn.execute("SELECT MAX(date) FROM market_data WHERE symbol = 'AAA'").fetchone()[0] == date(2024, 3, 8)
+        assert conn.execute("SELECT close FROM market_data WHERE symbol = 'AAA' AND date = '2024-02-26'").fetchone()[0] \
+            == pytest.approx(bars['close'].iloc[0])
+    finally:
+        conn.close()
+
+
+def test_merge_realigns_stale_latest_prices(tmp_path):
+    from utils.latest_prices import latest_prices_source
+
+    conn = _setup_db(tmp_path)
+    try:
+        assert latest_prices_source(conn) == 'latest_prices'
+        # Scrittura di BBB fuori da merge_bars: il merge di AAA riallinea tutta la tabella
+        conn.execute("INSERT INTO market_data (symbol, date, adj_close, close, high, low, volume) "
+                     "VALUES ('BBB', '2024-03-04', 1.0, 1.0, 1.0, 1.0, 1)")
+        assert latest_prices_source(conn) != 'latest_prices'
+        merge_bars(conn, to_staging_frame(_bars('AAA', date(2024, 3, 1), date(2024, 3, 2)), 'AAA', 'YF'))
+        assert latest_prices_source(conn) == 'latest_prices'
+        assert conn.execute("SELECT date FROM latest_prices WHERE symbol = 'BBB'").fetchone()[0] == date(2024, 3, 4)
+    finally:
+        conn.close()
+
+
+def test_merge_into_partitioned_market_data(tmp_path):
+    from utils.market_store import market_partitions, partition_market_data
+
+    conn = _setup_db(tmp_path)
+    try:
+        before = _history(conn)
+        partition_market_data(conn, 'XMIL')
+        # Blocco a cavallo d'anno: righe nelle partizioni 2023/2024 della venue di default
+        merge_bars(conn, to_staging_frame(_bars('AAA', date(2023, 12, 20), date(2024, 1, 10)), 'AAA', 'YF'))
+        assert [(v, y) for v, y, _ in market_partitions(conn)] == [('XMIL', 2023), ('XMIL', 2024)]
+        after = _history(conn)
+        assert set(before) < set(after)
+        assert min(d for s, d, _ in after if s == 'AAA') == date(2023, 12, 20)
+        assert conn.execute("SELECT MAX(date) FROM latest_prices WHERE symbol = 'AAA'").fetchone()[0] == date(2024, 2, 29)
+    finally:
+        conn.close()
+
+
+def test_backfill_windows_and_watermarks(tmp_path):
+    conn = _setup_db(tmp_path)
+    try:
+        provider = FakeProvider()
+        loaded = backfill_history(conn, ['AAA', 'BBB', 'ZZZ'], TARGET, provider, window_days=3 * 365,
+                                  log=lambda *_: None)
+
+        oldest = dict(conn.execute("SELECT symbol, MIN(date) FROM market_data GROUP BY symbol").fetchall())
+        assert oldest == {'AAA': date(2015, 1, 1), 'BBB': date(2019, 3, 1)}
+        assert loaded['AAA'] == conn.execute(
+            "SELECT COUNT(*) FROM market_data WHERE symbol = 'AAA' AND date < ?", [EXISTING_FROM]).fetchone()[0]
+        # Finestre contigue senza sovrapposizioni, simbolo senza storico ignorato
+        windows = sorted((s, start, end) for s, start, end in provider.calls if s == 'AAA')
+        assert windows[0][1] == TARGET and windows[-1][2] == EXISTING_FROM
+        assert all(a[2] == b[1] for a, b in zip(windows, windows[1:]))
+        assert {s for s, _, _ in provider.calls} == {'AAA', 'BBB'}
+
+        # BBB: finestre prima dell'inception coperte dal watermark, nessun nuovo download
+        marks = dict(conn.execute("SELECT symbol, backfilled_to FROM backfill_watermarks").fetchall())
+        assert marks == {'AAA': TARGET, 'BBB': TARGET}
+        provider.calls.clear()
+        assert backfill_history(conn, ['AAA', 'BBB'], TARGET, provider, log=lambda *_: None) == {}
+        assert provider.calls == []
+    finally:
+        conn.close()
+
+
+def test_backfill_resumes_after_failure(tmp_path):
+    (tmp_path / 'ref').mkdir()
+    reference_conn = _setup_db(tmp_path / 'ref')
+    try:
+        backfill_history(reference_conn, ['AAA', 'BBB'], TARGET, FakeProvider(), window_days=2 * 365,
+                         log=lambda *_: None)
+        expected = _history(reference_conn)
+    finally:
+        reference_conn.close()
+
+    conn = _setup_db(tmp_path)
+    try:
+        # Primo round completo, poi AAA fallisce: il round successivo di BBB viene comunque caricato
+        failing = FakeProvider(fail_after=2)
+        backfill_history(conn, ['AAA', 'BBB'], TARGET, failing, window_days=2 * 365, log=lambda *_: None)
+        mark = conn.execute("SELECT backfilled_to FROM backfill_watermarks WHERE symbol = 'AAA'").fetchone()[0]
+        assert TARGET < mark < EXISTING_FROM
+        assert conn.execute("SELECT MIN(date) FROM market_data WHERE symbol = 'AAA'").fetchone()[0] >= mark
+
+        resumed = FakeProvider()
+        backfill_history(conn, ['AAA', 'BBB'], TARGET, resumed, window_days=2 * 365, log=lambda *_: None)
+        # Ripresa dal watermark: nessuna finestra già caricata richiesta di nuovo
+        assert {s for s, _, _ in resumed.calls} == {'AAA'}
+        assert max(end for _, _, end in resumed.calls) == mark
+        assert _history(conn) == expected
+    finally:
+        conn.close()
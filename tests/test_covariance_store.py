@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Test Covariance Store - ETF Italia Project v10
+Validazione stimatori rolling (window/EWMA), aggiornamento incrementale e risk parity
+"""
+
+import sys
+import os
+from datetime import date, timedelta
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+from risk.covariance_store import (
+    ewma_covariance,
+    load_covariance,
+    risk_contributions,
+    risk_parity_weights,
+    rolling_window_covariance,
+    update_covariance_store,
+    window_covariance_tail,
+)
+
+SYMBOLS = ['AAA', 'BBB', 'CCC']
+METHODS = (('ewma', 0.94), ('window', 30))
+
+
+def _returns(n_days=200, seed=0):
+    rng = np.random.default_rng(seed)
+    common = rng.normal(0, 0.01, n_days)
+    returns = np.column_stack([common + rng.normal(0, 0.005, n_days) * k for k in (1, 2, 3)])
+    returns[10:30, 2] = np.nan  # Buco dati su un simbolo
+    return returns
+
+
+def _setup_db(tmp_path, n_days):
+    conn = duckdb.connect(str(tmp_path / 'cov.duckdb'))
+    conn.execute("CREATE TABLE prices (symbol VARCHAR, date DATE, adj_close DOUBLE)")
+    conn.execute("""
+    CREATE VIEW risk_metrics AS
+    SELECT symbol, date, adj_close,
+           adj_close / LAG(adj_close) OVER (PARTITION BY symbol ORDER BY date) - 1 AS daily_return
+    FROM prices
+    """)
+    _append_prices(conn, 0, n_days)
+    return conn
+
+
+def _append_prices(conn, start, end):
+    returns = np.nan_to_num(_returns(400))
+    levels = 100 * np.cumprod(1 + returns, axis=0)
+    rows = [
+        (s, date(2023, 1, 2) + timedelta(days=t), float(levels[t, j]))
+        for t in range(start, end) for j, s in enumerate(SYMBOLS)
+    ]
+    conn.executemany("INSERT INTO prices VALUES (?, ?, ?)", rows)
+
+
+def test_window_covariance_matches_pandas_pairwise():
+    returns = _returns()
+    cov, counts = rolling_window_covariance(returns, window=60, min_periods=20)
+    expected = pd.DataFrame(returns).rolling(60, min_periods=20).cov().values.reshape(cov.shape)
+
+    assert np.array_equal(np.isnan(cov), np.isnan(expected))
+    assert np.nanmax(np.abs(cov - expected)) < 1e-15
+    assert counts[59, 0, 2] == 40  # 20 giorni mancanti su CCC nella prima finestra
+
+
+def test_ewma_incremental_equals_full_recursion():
+    returns = _returns()
+    full, full_n = ewma_covariance(returns, lam=0.94, min_periods=1)
+    head, head_n = ewma_covariance(returns[:120], lam=0.94, min_periods=1)
+    tail, _ = ewma_covariance(returns[120:], lam=0.94, min_periods=1, state=(head[-1], head_n[-1]))
+    assert np.allclose(full[120:], tail, rtol=1e-12, atol=0)
+
+    # tail: stesse ultime matrici, senza allocare T × N × N
+    last, last_n = ewma_covariance(returns, lam=0.94, min_periods=1, tail=3)
+    assert last.shape == (3, 3, 3)
+    assert np.array_equal(last, full[-3:]) and np.array_equal(last_n, full_n[-3:])
+
+
+def test_window_tail_matches_rolling():
+    returns = _returns()
+    full, full_n = rolling_window_covariance(returns, window=60, min_periods=20)
+    tail, tail_n = window_covariance_tail(returns, window=60, tail=4, min_periods=20)
+    assert np.array_equal(tail_n, full_n[-4:])
+    assert np.array_equal(np.isnan(tail), np.isnan(full[-4:]))
+    assert np.nanmax(np.abs(tail - full[-4:])) < 1e-15
+
+
+def test_store_incremental_update_matches_rebuild(tmp_path):
+    conn = _setup_db(tmp_path, 150)
+    try:
+        first = update_covariance_store(conn, symbols=SYMBOLS, methods=METHODS)
+        assert first == {'ewma_0.94': 5, 'window_30': 5}
+
+        # Nessuna data nuova: nessun inserimento
+        assert update_covariance_store(conn, symbols=SYMBOLS, methods=METHODS) == {'ewma_0.94': 0, 'window_30': 0}
+
+        _append_prices(conn, 150, 152)
+        assert update_covariance_store(conn, symbols=SYMBOLS, methods=METHODS) == {'ewma_0.94': 2, 'window_30': 2}
+        _append_prices(conn, 152, 200)
+        assert update_covariance_store(conn, symbols=SYMBOLS, methods=METHODS) == {'ewma_0.94': 5, 'window_30': 5}
+        incremental = {m: load_covariance(conn, method=m, param=p) for m, p in METHODS}
+
+        update_covariance_store(conn, symbols=SYMBOLS, methods=METHODS, rebuild=True)
+        for method, param in METHODS:
+            rebuilt = load_covariance(conn, method=method, param=param)
+            assert rebuilt['date'] == incremental[method]['date']
+            assert rebuilt['symbols'] == SYMBOLS
+            assert np.allclose(rebuilt['cov'], incremental[method]['cov'], rtol=1e-10)
+            assert np.allclose(np.diag(rebuilt['corr']), 1.0)
+
+        # Nuovo simbolo nell'universo: ricostruzione con matrice più grande
+        conn.execute("""
+        INSERT INTO prices SELECT 'DDD', date, adj_close * 1.5 FROM prices WHERE symbol = 'AAA'
+        """)
+        update_covariance_store(conn, symbols=SYMBOLS + ['DDD'], methods=METHODS)
+        assert load_covariance(conn, method='window', param=30)['cov'].shape == (4, 4)
+    finally:
+        conn.close()
+
+
+def test_store_rows_bounded_per_update(tmp_path):
+    n_symbols, n_days = 40, 600
+    rng = np.random.default_rng(3)
+    symbols = [f"S{i:02d}" for i in range(n_symbols)]
+    conn = duckdb.connect(str(tmp_path / 'bound.duckdb'))
+    try:
+        conn.execute("CREATE TABLE risk_metrics (symbol VARCHAR, date DATE, daily_return DOUBLE)")
+        days = pd.bdate_range('2020-01-01', periods=n_days)
+        frame = pd.DataFrame({
+            'symbol': np.repeat(symbols, n_days),
+            'date': np.tile(days.date, n_symbols),
+            'daily_return': rng.normal(0, 0.01, n_days * n_symbols),
+        })
+        conn.register('frame', frame)
+        conn.execute("INSERT INTO risk_metrics SELECT * FROM frame WHERE date < '2022-04-01'")
+
+        def _rows():
+            return conn.execute("SELECT COUNT(*) FROM covariance_store").fetchone()[0]
+
+        methods = (('ewma', 0.94), ('window', 60), ('window', 252))
+        update_covariance_store(conn, symbols=symbols, methods=methods, tail_dates=3)
+        # Ricostruzione su tutta la storia: solo la coda per metodo
+        assert _rows() == len(methods) * 3 * n_symbols ** 2
+
+        conn.execute("INSERT INTO risk_metrics SELECT * FROM frame WHERE date >= '2022-04-01'")
+        added = update_covariance_store(conn, symbols=symbols, methods=methods, tail_dates=3)
+        assert all(v == 3 for v in added.values())
+        assert _rows() == len(methods) * 3 * n_symbols ** 2
+    finally:
+        conn.close()
+
+
+def test_risk_parity_equalizes_contributions():
+    cov = np.cov(np.nan_to_num(_returns()), rowvar=False)
+    weights = risk_parity_weights(cov)
+    contributions = risk_contributions(weights, cov)
+
+    assert abs(weights.sum() - 1.0) < 1e-12
+    assert np.allclose(contributions, 1.0 / 3, atol=1e-8)
+    # L'asset più volatile riceve il peso minore
+    assert np.argmin(weights) == np.argmax(np.diag(cov))
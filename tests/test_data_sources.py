@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Test Data Sources - ETF Italia Project v10
+Client provider offline su fixture registrate: cache su disco, TTL, richieste condizionali
+"""
+
+import sys
+import os
+import time
+from datetime import date
+
+import pandas as pd
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+from data.data_sources import DataSourceClient
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'data_sources')
+
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES, name), 'r') as f:
+        return f.read()
+
+
+class FakeResponse:
+    def __init__(self, status_code, text='', headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+
+class RecordedSession:
+    """Risposte Stooq registrate (ETag fisso, 304 se If-None-Match coincide)"""
+
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.requests.append((url, dict(params or {}), dict(headers or {})))
+        if (headers or {}).get('If-None-Match') == '"stooq-v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, _fixture('stooq_csspxmi.csv'), {'ETag': '"stooq-v1"'})
+
+
+class RecordedTicker:
+    instances = 0
+
+    def __init__(self, symbol):
+        RecordedTicker.instances += 1
+        self.symbol = symbol
+        self.calls = []
+
+    def history(self, start, end):
+        self.calls.append((start, end))
+        df = pd.read_csv(os.path.join(FIXTURES, 'yf_csspx_history.csv'))
+        index = pd.DatetimeIndex(pd.to_datetime(df.pop('Date'), utc=True)).tz_convert('Europe/Rome')
+        df.index = index.rename('Date')
+        return df[(df.index.date >= start) & (df.index.date < end)]
+
+
+def _client(tmp_path, session=None, **kwargs):
+    return DataSourceClient(cache_dir=tmp_path / 'http', session=session or RecordedSession(),
+                            ticker_factory=RecordedTicker, rate_limit_seconds=0, **kwargs)
+
+
+def test_stooq_range_cache_and_conditional_request(tmp_path):
+    session = RecordedSession()
+    client = _client(tmp_path, session)
+    first = client.stooq_history('CSSPX.MI', date(2025, 1, 10), date(2025, 1, 20))
+    assert first.index.min().date() == date(2025, 1, 10) and first.index.max().date() == date(2025, 1, 20)
+    # Solo il range richiesto (delta), simbolo convertito
+    _, params, _ = session.requests[0]
+    assert params == {'s': 'csspxmi', 'i': 'd', 'd1': '20250110', 'd2': '20250120'}
+
+    # Stessa chiave entro il TTL: nessuna richiesta
+    again = client.stooq_history('CSSPX.MI', date(2025, 1, 10), date(2025, 1, 20))
+    pd.testing.assert_frame_equal(first, again)
+    assert len(session.requests) == 1 and client.stats['cache_hits'] == 1
+
+    # Entry scaduta: richiesta condizionale, 304 → corpo in cache
+    expired = _client(tmp_path, session, ttl_seconds=0)
+    time.sleep(0.01)
+    revalidated = expired.stooq_history('CSSPX.MI', date(2025, 1, 10), date(2025, 1, 20))
+    pd.testing.assert_frame_equal(first, revalidated)
+    assert session.requests[-1][2] == {'If-None-Match': '"stooq-v1"'}
+    assert expired.stats['not_modified'] == 1
+
+
+def test_yf_ticker_reused_and_cached_offline(tmp_path):
+    RecordedTicker.instances = 0
+    client = _client(tmp_path)
+    hist = client.yf_history('CSSPX.MI', date(2025, 1, 2), date(2025, 1, 17))
+    assert hist.index.tz is None
+    # Date di mercato locali (nessuno spostamento per la timezone)
+    assert hist.index[0] == pd.Timestamp('2025-01-02') and hist.index[-1] == pd.Timestamp('2025-01-16')
+    assert list(hist.columns) == ['Open', 'High', 'Low', 'Close', 'Volume']
+
+    client.yf_history('CSSPX.MI', date(2025, 1, 17), date(2025, 2, 1))
+    assert RecordedTicker.instances == 1
+    assert client.stats['network'] == 2
+
+    # Offline: solo cache (stesso risultato), chiavi non in cache → None senza rete
+    offline = _client(tmp_path, offline=True, ttl_seconds=0)
+    cached = offline.yf_history('CSSPX.MI', date(2025, 1, 2), date(2025, 1, 17))
+    pd.testing.assert_frame_equal(hist, cached, check_freq=False)
+    assert offline.yf_history('CSSPX.MI', date(2025, 1, 2), date(2025, 1, 10)) is None
+    assert offline.stats['network'] == 0 and RecordedTicker.instances == 1
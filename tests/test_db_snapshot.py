@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Test DB Snapshot - ETF Italia Project v10
+Snapshot read-only per report/monitor e scheduler che sovrappone reader dello snapshot e writer
+"""
+
+import sys
+import os
+import subprocess
+import threading
+import time
+
+import duckdb
+import pytest
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+from orchestration.sequence_runner import run_steps_dag
+from utils.db_snapshot import (
+    SNAPSHOT_ENV, connect_reader, ensure_snapshot, load_snapshot_info, publish_snapshot, reader_db_path,
+    snapshot_is_current,
+)
+
+
+def _create_db(tmp_path):
+    db_path = tmp_path / 'etf_data.duckdb'
+    conn = duckdb.connect(str(db_path))
+    conn.execute("CREATE TABLE market_data (symbol VARCHAR, date DATE, close DOUBLE, PRIMARY KEY (symbol, date))")
+    conn.execute("INSERT INTO market_data VALUES ('AAA', '2025-01-02', 100.0), ('AAA', '2025-01-03', 101.0)")
+    conn.execute("CREATE VIEW last_close AS SELECT symbol, MAX(close) AS close FROM market_data GROUP BY symbol")
+    conn.close()
+    return db_path
+
+
+def test_snapshot_readable_while_writer_holds_db(tmp_path):
+    db_path = _create_db(tmp_path)
+    snapshots_dir = tmp_path / 'snapshots'
+    info = publish_snapshot(db_path, snapshots_dir)
+    assert load_snapshot_info(snapshots_dir)['file'] == info['file']
+    assert snapshot_is_current(db_path, snapshots_dir)
+
+    writer = duckdb.connect(str(db_path))
+    try:
+        writer.execute("INSERT INTO market_data VALUES ('AAA', '2025-01-06', 102.0)")
+        reader = duckdb.connect(info['path'], read_only=True)
+        try:
+            assert reader.execute("SELECT COUNT(*) FROM market_data").fetchone()[0] == 2
+            assert reader.execute("SELECT close FROM last_close").fetchone()[0] == 101.0
+        finally:
+            reader.close()
+    finally:
+        writer.close()
+
+    # Dopo la scrittura lo snapshot non è più allineato: ensure_snapshot ne pubblica uno nuovo
+    assert not snapshot_is_current(db_path, snapshots_dir)
+    fresh = ensure_snapshot(db_path, snapshots_dir)
+    assert fresh['file'] != info['file']
+    assert ensure_snapshot(db_path, snapshots_dir)['file'] == fresh['file']
+    conn = duckdb.connect(fresh['path'], read_only=True)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM market_data").fetchone()[0] == 3
+    finally:
+        conn.close()
+
+
+def test_reader_path_modes_and_pruning(tmp_path, monkeypatch):
+    db_path = _create_db(tmp_path)
+    snapshots_dir = tmp_path / 'snapshots'
+    monkeypatch.delenv(SNAPSHOT_ENV, raising=False)
+
+    # Nessuno snapshot: DB principale in ogni modalità
+    assert reader_db_path(db_path, snapshots_dir) == str(db_path)
+    monkeypatch.setenv(SNAPSHOT_ENV, '1')
+    assert reader_db_path(db_path, snapshots_dir) == str(db_path)
+
+    for _ in range(3):
+        info = publish_snapshot(db_path, snapshots_dir, keep=2)
+    assert len(list(snapshots_dir.glob('etf_data_*.duckdb'))) == 2
+    assert not list(snapshots_dir.glob('*.tmp'))
+
+    monkeypatch.delenv(SNAPSHOT_ENV)
+    assert reader_db_path(db_path, snapshots_dir) == info['path']
+    monkeypatch.setenv(SNAPSHOT_ENV, '0')
+    assert reader_db_path(db_path, snapshots_dir) == str(db_path)
+
+    conn = duckdb.connect(str(db_path))
+    conn.execute("DELETE FROM market_data WHERE date = '2025-01-03'")
+    conn.close()
+    # Default: snapshot non allineato → DB principale; nella sequenza (=1) lo snapshot pubblicato
+    monkeypatch.delenv(SNAPSHOT_ENV)
+    assert reader_db_path(db_path, snapshots_dir) == str(db_path)
+    monkeypatch.setenv(SNAPSHOT_ENV, '1')
+    assert reader_db_path(db_path, snapshots_dir) == info['path']
+
+
+def test_connect_reader_falls_back_to_snapshot_when_locked(tmp_path, monkeypatch):
+    db_path = _create_db(tmp_path)
+    snapshots_dir = tmp_path / 'snapshots'
+    monkeypatch.delenv(SNAPSHOT_ENV, raising=False)
+    info = publish_snapshot(db_path, snapshots_dir)
+    conn = duckdb.connect(str(db_path))
+    conn.execute("CHECKPOINT")
+    conn.execute("INSERT INTO market_data VALUES ('AAA', '2025-01-06', 102.0)")
+    conn.close()
+    # Snapshot non allineato: il path scelto è il DB principale
+    assert reader_db_path(db_path, snapshots_dir) == str(db_path)
+
+    # Writer in un altro processo: lock sul file, il lettore ripiega sullo snapshot
+    writer = subprocess.Popen(
+        [sys.executable, '-c', "import duckdb, sys, time; c = duckdb.connect(sys.argv[1]); print('ready', flush=True); time.sleep(60)",
+         str(db_path)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    try:
+        assert writer.stdout.readline().strip() == 'ready'
+        conn, path = connect_reader(str(db_path), snapshots_dir)
+        try:
+            assert path == info['path']
+            assert conn.execute("SELECT COUNT(*) FROM market_data").fetchone()[0] == 2
+        finally:
+            conn.close()
+
+        # Snapshot di un altro DB: nessun fallback, errore di lock invariato
+        other = tmp_path / 'other'
+        other.mkdir()
+        publish_snapshot(_create_db(other), snapshots_dir)
+        with pytest.raises(duckdb.IOException):
+            connect_reader(str(db_path), snapshots_dir)
+    finally:
+        writer.kill()
+        writer.wait()
+
+
+def test_snapshot_readers_overlap_writer_but_writers_stay_alone():
+    steps = ['risk_management', 'check_guardrails', 'portfolio_risk_monitor', 'strategy_engine',
+             'backtest_runner', 'performance_report_generator']
+    writers = {'risk_management', 'backtest_runner'}
+    active = []
+    overlaps = []
+    lock = threading.Lock()
+
+    def run_step(step, label):
+        with lock:
+            overlaps.extend((step, other) for other in active)
+            active.append(step)
+        time.sleep(0.1)
+        with lock:
+            active.remove(step)
+        return True
+
+    ok, report, _ = run_steps_dag(steps, run_step, max_workers=3, snapshot_readers=True)
+    assert ok
+    assert all(report['steps'][s]['status'] == 'done' for s in steps)
+    pairs = {frozenset(p) for p in overlaps}
+    # portfolio_risk_monitor (snapshot) gira insieme a risk_management (writer)
+    assert frozenset(('portfolio_risk_monitor', 'risk_management')) in pairs
+    for pair in pairs:
+        # Mai due writer insieme, mai un writer con un reader del DB principale (strategy_engine)
+        assert not pair <= writers
+        assert not (pair & writers and 'strategy_engine' in pair)
+
+
+def test_publish_only_after_writers_feeding_later_readers():
+    from orchestration.sequence_runner import EXECUTION_ORDER
+    from orchestration.step_graph import snapshot_publish_steps
+
+    # risk_management scrive signals/signal_overlay, che nessun reader successivo legge;
+    # backtest_runner scrive fiscal_ledger, letto da performance_report_generator
+    assert snapshot_publish_steps(EXECUTION_ORDER) == {'backtest_runner'}
+    assert snapshot_publish_steps(['risk_management', 'portfolio_risk_monitor']) == set()
+    assert snapshot_publish_steps(['risk_management', 'check_guardrails']) == {'risk_management'}
+    # Step non dichiarato: writer conservativo, ma solo se dopo c'è un reader dello snapshot
+    assert snapshot_publish_steps(['custom_step', 'portfolio_risk_monitor']) == {'custom_step'}
+    assert snapshot_publish_steps(['portfolio_risk_monitor', 'custom_step']) == set()
+
+
+def test_snapshot_flag_reaches_child_only(tmp_path, monkeypatch):
+    from orchestration.sequence_runner import _run_script_with_progress
+
+    monkeypatch.delenv(SNAPSHOT_ENV, raising=False)
+    script = tmp_path / 'child.py'
+    script.write_text(f"import os, sys\nsys.exit(0 if os.environ.get('{SNAPSHOT_ENV}') == '1' else 3)\n")
+    assert _run_script_with_progress(str(script), str(tmp_path), extra_env={SNAPSHOT_ENV: '1'}) == 0
+    assert SNAPSHOT_ENV not in os.environ
+    assert _run_script_with_progress(str(script), str(tmp_path)) == 3
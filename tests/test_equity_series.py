@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Test Equity Series - ETF Italia Project v10
+Serie equity/cash/posizioni a somme cumulative vs calcolo giorno per giorno, cache per run
+"""
+
+import sys
+import os
+import json
+from datetime import date, timedelta
+
+import duckdb
+import numpy as np
+import pytest
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+import utils.equity_series as equity_series
+from reports.performance_report_generator import generate_performance_report
+from utils.equity_series import compute_equity_series, load_equity_series, series_summary
+
+START = date(2025, 1, 6)
+SYMBOLS = ('AAA', 'BBB')
+
+
+def _ledger_row(i, d, type_, symbol, qty, price, fees=0.0, tax=0.0, run_id='run_1', run_type='PRODUCTION'):
+    return [i, d, type_, symbol, qty, price, fees, tax, run_id, run_type]
+
+
+def _setup_db(tmp_path):
+    db_path = os.path.join(tmp_path, 'equity_series.duckdb')
+    conn = duckdb.connect(db_path)
+    conn.execute("CREATE TABLE market_data (symbol VARCHAR, date DATE, adj_close DOUBLE, close DOUBLE)")
+    conn.execute("""
+    CREATE TABLE fiscal_ledger (
+        id INTEGER PRIMARY KEY, date DATE NOT NULL, type VARCHAR NOT NULL, symbol VARCHAR NOT NULL,
+        qty DOUBLE NOT NULL, price DOUBLE NOT NULL, fees DOUBLE DEFAULT 0.0, tax_paid DOUBLE DEFAULT 0.0,
+        run_id VARCHAR, run_type VARCHAR
+    )
+    """)
+
+    rng = np.random.default_rng(3)
+    days = [START + timedelta(days=i) for i in range(40) if (START + timedelta(days=i)).weekday() < 5]
+    rows = []
+    for symbol, base in zip(SYMBOLS, (10.0, 50.0)):
+        prices = base * np.cumprod(1 + rng.normal(0, 0.01, len(days)))
+        for d, p in zip(days, prices):
+            # BBB senza prezzo un giorno: il valore usa l'ultimo close disponibile
+            if symbol == 'BBB' and d == days[10]:
+                continue
+            rows.append([symbol, d, float(p), float(p)])
+    conn.executemany("INSERT INTO market_data VALUES (?, ?, ?, ?)", rows)
+
+    conn.executemany("INSERT INTO fiscal_ledger VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+        _ledger_row(1, days[0], 'DEPOSIT', 'CASH', 10000, 1.0),
+        _ledger_row(2, days[2], 'BUY', 'AAA', 300, 10.0, fees=3.0),
+        _ledger_row(3, days[5], 'BUY', 'BBB', 50, 50.0, fees=2.5),
+        _ledger_row(4, days[12], 'DEPOSIT', 'CASH', 5000, 1.0),
+        _ledger_row(5, days[15], 'SELL', 'AAA', 100, 11.0, fees=1.0, tax=2.6),
+        _ledger_row(6, days[20], 'INTEREST', 'CASH', 4.2, 1.0),
+        _ledger_row(7, days[3], 'DEPOSIT', 'CASH', 99999, 1.0, run_id='bt', run_type='BACKTEST'),
+    ])
+    conn.commit()
+    return conn, days
+
+
+def _naive_series(conn, days, run_type):
+    """Equity giorno per giorno con query sul ledger fino alla data (riferimento)"""
+    ledger = conn.execute("SELECT date, type, symbol, qty, price, fees, tax_paid FROM fiscal_ledger "
+                          "WHERE run_type = ? ORDER BY id", [run_type]).fetchall()
+    closes = {(s, d): c for s, d, c in conn.execute("SELECT symbol, date, close FROM market_data").fetchall()}
+    out = []
+    for d in days:
+        cash, qty = 0.0, {}
+        for ld, t, s, q, p, f, tx in ledger:
+            if ld > d:
+                continue
+            if t in ('DEPOSIT', 'SELL'):
+                cash += q * p - f - tx
+            elif t == 'BUY':
+                cash -= q * p + f
+            elif t == 'INTEREST':
+                cash += q
+            if t in ('BUY', 'SELL'):
+                qty[s] = qty.get(s, 0) + (q if t == 'BUY' else -q)
+        value = 0.0
+        for s, q in qty.items():
+            last = [closes[(s, x)] for x in days if x <= d and (s, x) in closes]
+            value += q * last[-1] if last else 0.0
+        out.append((d, cash, value))
+    return out
+
+
+def test_series_matches_naive(tmp_path):
+    conn, days = _setup_db(tmp_path)
+    try:
+        series = compute_equity_series(conn, run_type='PRODUCTION')
+        assert [d.date() for d in series['date']] == days
+        for (d, cash, value), row in zip(_naive_series(conn, days, 'PRODUCTION'), series.itertuples()):
+            assert row.cash == pytest.approx(cash)
+            assert row.market_value == pytest.approx(value)
+            assert row.equity == pytest.approx(cash + value)
+
+        # Il deposito intermedio non è un return
+        i = days.index(days[12])
+        expected = (series['equity'][i] - 5000) / series['equity'][i - 1] - 1
+        assert series['daily_return'][i] == pytest.approx(expected)
+
+        summary = series_summary(series)
+        assert summary['total_deposits'] == pytest.approx(15000)
+        assert summary['positions_count'] == 2
+        assert abs(summary['total_return']) < 0.2 and summary['max_drawdown'] <= 0
+    finally:
+        conn.close()
+
+
+def test_cache_per_run_and_invalidation(tmp_path):
+    conn, days = _setup_db(tmp_path)
+    series_dir = tmp_path / 'cache'
+    try:
+        first = load_equity_series(conn, 'PRODUCTION', series_dir=series_dir)
+        cached = sorted(p.name for p in series_dir.iterdir())
+        assert cached == ['equity_PRODUCTION.lock', 'equity_PRODUCTION_run_1.json', 'equity_PRODUCTION_run_1.parquet']
+
+        # Cache valida: stesso risultato senza ricalcolo
+        with open(series_dir / 'equity_PRODUCTION_run_1.json') as f:
+            created_at = json.load(f)['created_at']
+        again = load_equity_series(conn, 'PRODUCTION', series_dir=series_dir)
+        assert again['equity'].tolist() == pytest.approx(first['equity'].tolist())
+        with open(series_dir / 'equity_PRODUCTION_run_1.json') as f:
+            assert json.load(f)['created_at'] == created_at
+
+        # Nuovo run nel ledger: serie ricalcolata sotto il nuovo run_id, la vecchia rimossa
+        conn.execute("INSERT INTO fiscal_ledger VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     _ledger_row(8, days[-1], 'SELL', 'BBB', 50, 52.0, fees=1.0, run_id='run_2'))
+        updated = load_equity_series(conn, 'PRODUCTION', series_dir=series_dir)
+        assert sorted(p.stem for p in series_dir.glob('*_run_*')) == ['equity_PRODUCTION_run_2'] * 2
+        assert updated['n_positions'].iloc[-1] == 1
+        assert updated['cash'].iloc[-1] == pytest.approx(first['cash'].iloc[-1] + 50 * 52.0 - 1.0)
+    finally:
+        conn.close()
+
+
+def test_unreadable_cache_falls_back(tmp_path):
+    conn, _ = _setup_db(tmp_path)
+    series_dir = tmp_path / 'cache'
+    try:
+        expected = compute_equity_series(conn, run_type='PRODUCTION')
+        load_equity_series(conn, 'PRODUCTION', series_dir=series_dir)
+
+        # Parquet troncato con meta ancora valido (duckdb.IOException, non OSError): ricostruita
+        (series_dir / 'equity_PRODUCTION_run_1.parquet').write_bytes(b'PAR1')
+        series = load_equity_series(conn, 'PRODUCTION', series_dir=series_dir)
+        assert series['equity'].tolist() == pytest.approx(expected['equity'].tolist())
+        assert not list(series_dir.glob('*.tmp'))
+    finally:
+        conn.close()
+
+
+def test_performance_report_from_series(tmp_path, monkeypatch):
+    conn, _ = _setup_db(tmp_path)
+    conn.execute("DELETE FROM fiscal_ledger WHERE run_type = 'BACKTEST'")
+    conn.commit()
+    series = compute_equity_series(conn)
+    conn.close()
+
+    monkeypatch.setattr(equity_series, 'default_series_dir', lambda: tmp_path / 'cache')
+    out_dir = tmp_path / 'reports'
+    db_path = os.path.join(tmp_path, 'equity_series.duckdb')
+    assert generate_performance_report(db_path, output_dir=str(out_dir))
+
+    report_file = next(out_dir.glob('performance_*.json'))
+    with open(report_file) as f:
+        report = json.load(f)
+    summary = series_summary(series)
+    assert report['portfolio_summary']['total_value'] == pytest.approx(summary['end_value'])
+    assert report['portfolio_summary']['cash_balance'] == pytest.approx(summary['cash_balance'])
+    assert report['performance_metrics']['trading_days'] == len(series)
+    assert report['performance_metrics']['max_drawdown_pct'] == pytest.approx(summary['max_drawdown'] * 100)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Test Execute Orders Batch - ETF Italia Project v10
+Snapshot ledger unico, controlli pre-trade in memoria (SELL → BUY) e scrittura bulk
+"""
+
+import sys
+import os
+import json
+from datetime import date
+from pathlib import Path
+from unittest.mock import patch
+
+import duckdb
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+import trading.execute_orders as execute_orders
+from fiscal.pmc_engine import load_position_state, load_position_states
+from trading.execute_orders import check_cash_available, check_position_available, load_ledger_snapshot
+from utils.market_store import sync_instruments, upsert_fx_rates
+
+
+def _setup_db(tmp_path):
+    db_path = os.path.join(tmp_path, 'test_execute_batch.duckdb')
+    conn = duckdb.connect(db_path)
+    conn.execute("""
+    CREATE TABLE fiscal_ledger (
+        id INTEGER PRIMARY KEY, date DATE NOT NULL, type VARCHAR NOT NULL, symbol VARCHAR NOT NULL,
+        qty DOUBLE NOT NULL, price DOUBLE NOT NULL, fees DOUBLE DEFAULT 0.0, tax_paid DOUBLE DEFAULT 0.0,
+        pmc_snapshot DOUBLE, run_id VARCHAR, run_type VARCHAR
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE trade_journal (
+        id INTEGER PRIMARY KEY, run_id VARCHAR NOT NULL, symbol VARCHAR NOT NULL, signal_state VARCHAR NOT NULL,
+        risk_scalar DOUBLE, explain_code VARCHAR, flag_override BOOLEAN DEFAULT FALSE, override_reason VARCHAR,
+        theoretical_price DOUBLE, realized_price DOUBLE, slippage_bps DOUBLE
+    )
+    """)
+    conn.execute("CREATE TABLE risk_metrics (symbol VARCHAR, date DATE, volatility_20d DOUBLE)")
+    conn.execute("CREATE TABLE symbol_registry (symbol VARCHAR PRIMARY KEY, name VARCHAR, tax_category VARCHAR)")
+    conn.execute("""
+    CREATE TABLE tax_loss_carryforward (
+        id INTEGER PRIMARY KEY, symbol VARCHAR NOT NULL, realize_date DATE NOT NULL, loss_amount DOUBLE NOT NULL,
+        used_amount DOUBLE DEFAULT 0.0, expires_at DATE NOT NULL, tax_category VARCHAR NOT NULL
+    )
+    """)
+
+    d = date(2025, 1, 2)
+    conn.executemany("INSERT INTO fiscal_ledger (id, date, type, symbol, qty, price, fees, tax_paid, run_id, run_type) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'PRODUCTION')", [
+                         [1, d, 'DEPOSIT', 'CASH', 2000, 1.0, 0, 0, 'init'],
+                         [2, d, 'BUY', 'AAA', 100, 10.0, 5.0, 0, 'init'],
+                         [3, d, 'BUY', 'BBB', 10, 20.0, 5.0, 0, 'init'],
+                         [4, d, 'SELL', 'BBB', 4, 22.0, 5.0, 1.0, 'init'],
+                     ])
+    conn.executemany("INSERT INTO risk_metrics VALUES (?, ?, ?)",
+                     [['AAA', d, 0.15], ['CCC', d, 0.30], ['DDD', d, 0.10]])
+    conn.execute("""
+    INSERT INTO symbol_registry VALUES
+        ('AAA', 'ETF A', 'OICR_ETF'), ('CCC', 'ETF C', 'OICR_ETF'), ('DDD', 'ETF D', 'OICR_ETF')
+    """)
+    conn.commit()
+    return conn, db_path
+
+
+def _order(symbol, action, qty, price):
+    return {'symbol': symbol, 'action': action, 'qty': qty, 'price': price, 'reason': 'TEST',
+            'recommendation': 'TRADE', 'signal_state': 'RISK_ON', 'risk_scalar': 1.0}
+
+
+def _run(tmp_path, db_path, orders, commit):
+    orders_path = os.path.join(tmp_path, 'orders.json')
+    with open(orders_path, 'w') as f:
+        json.dump({'run_id': 'execute_orders_batch', 'as_of_date': '2025-01-03', 'orders': orders}, f)
+    config_path = os.path.join(tmp_path, 'config.json')
+    with open(config_path, 'w') as f:
+        json.dump({'universe': {}, 'settings': {}}, f)
+
+    fake_pm = type('FakePM', (), {})()
+    fake_pm.etf_universe_path = Path(config_path)
+    fake_pm.db_path = Path(db_path)
+    with patch.object(execute_orders, 'get_path_manager', return_value=fake_pm):
+        return execute_orders.execute_orders(orders_file=orders_path, commit=commit)
+
+
+def test_snapshot_matches_single_checks(tmp_path):
+    conn, _ = _setup_db(tmp_path)
+    try:
+        cash, positions = load_ledger_snapshot(conn, run_type='PRODUCTION')
+        assert abs(cash - check_cash_available(conn, 0, run_type='PRODUCTION')[1]) < 1e-9
+        for symbol in ('AAA', 'BBB', 'ZZZ'):
+            expected = check_position_available(conn, symbol, 0, run_type='PRODUCTION')[1]
+            assert (positions.get(symbol) or 0) == expected
+
+        states = load_position_states(conn, ['AAA', 'BBB', 'ZZZ'], run_type='PRODUCTION')
+        for symbol, state in states.items():
+            single = load_position_state(conn, symbol, run_type='PRODUCTION')
+            assert (state.qty, state.total_cost) == (single.qty, single.total_cost)
+    finally:
+        conn.close()
+
+
+def test_batch_sell_before_buy_and_in_memory_cash(tmp_path):
+    conn, db_path = _setup_db(tmp_path)
+    try:
+        # BUY CCC entra solo grazie al cash della SELL (eseguita prima); BUY DDD poi non ha più cash
+        orders = [_order('CCC', 'BUY', 150, 10.0), _order('AAA', 'SELL', 100, 12.0), _order('DDD', 'BUY', 100, 10.0)]
+        assert _run(str(tmp_path), db_path, orders, commit=True)
+
+        rows = conn.execute("""
+        SELECT id, type, symbol, qty FROM fiscal_ledger WHERE run_id = 'execute_orders_batch' ORDER BY id
+        """).fetchall()
+        assert rows == [(5, 'SELL', 'AAA', 100.0), (6, 'BUY', 'CCC', 150.0)]
+        assert conn.execute("SELECT id, symbol FROM trade_journal ORDER BY id").fetchall() == [(1, 'AAA'), (2, 'CCC')]
+
+        # Il cash residuo corrisponde a quello visto dal controllo in memoria
+        assert check_cash_available(conn, 0, run_type='PRODUCTION')[1] < 100 * 10.0
+    finally:
+        conn.close()
+
+
+def test_batch_dry_run_writes_nothing(tmp_path):
+    conn, db_path = _setup_db(tmp_path)
+    try:
+        before = conn.execute("SELECT COUNT(*) FROM fiscal_ledger").fetchone()[0]
+        assert _run(str(tmp_path), db_path, [_order('AAA', 'SELL', 50, 12.0)], commit=False)
+        assert conn.execute("SELECT COUNT(*) FROM fiscal_ledger").fetchone()[0] == before
+        assert conn.execute("SELECT COUNT(*) FROM trade_journal").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+
+def test_usd_round_trip_converted_to_eur(tmp_path):
+    conn, db_path = _setup_db(tmp_path)
+    try:
+        conn.execute("ALTER TABLE fiscal_ledger ADD COLUMN trade_currency VARCHAR DEFAULT 'EUR'")
+        conn.execute("ALTER TABLE fiscal_ledger ADD COLUMN exchange_rate_used DOUBLE DEFAULT 1.0")
+        conn.execute("ALTER TABLE fiscal_ledger ADD COLUMN price_eur DOUBLE")
+        sync_instruments(conn, {'settings': {'currency': 'EUR'},
+                                'universe': {'satellite': [{'symbol': 'UUU', 'venue': 'ARCX', 'currency': 'USD'},
+                                                           {'symbol': 'VVV', 'venue': 'XETR', 'currency': 'CHF'}]}})
+        upsert_fx_rates(conn, 'USD', {date(2025, 1, 2): 0.92})
+        conn.commit()
+        cash_before = check_cash_available(conn, 0, run_type='PRODUCTION')[1]
+
+        # BUY/SELL in USD: prezzo del ledger in EUR al cambio as-of (fixing del giorno prima)
+        assert _run(str(tmp_path), db_path, [_order('UUU', 'BUY', 10, 50.0)], commit=True)
+        assert _run(str(tmp_path), db_path, [_order('UUU', 'SELL', 10, 50.0)], commit=True)
+        rows = conn.execute("""
+        SELECT type, price, trade_currency, exchange_rate_used, price_eur, fees + tax_paid
+        FROM fiscal_ledger WHERE symbol = 'UUU' ORDER BY id
+        """).fetchall()
+        assert [r[:5] for r in rows] == [('BUY', 46.0, 'USD', 0.92, 46.0), ('SELL', 46.0, 'USD', 0.92, 46.0)]
+        fees = sum(r[5] for r in rows)
+        assert fees > 0
+        assert abs(check_cash_available(conn, 0, run_type='PRODUCTION')[1] - (cash_before - fees)) < 1e-9
+
+        # Valuta senza cambi: ordine respinto, cash invariato
+        cash_before = check_cash_available(conn, 0, run_type='PRODUCTION')[1]
+        assert _run(str(tmp_path), db_path, [_order('VVV', 'BUY', 10, 50.0)], commit=True)
+        assert conn.execute("SELECT COUNT(*) FROM fiscal_ledger WHERE symbol = 'VVV'").fetchone()[0] == 0
+        assert check_cash_available(conn, 0, run_type='PRODUCTION')[1] == cash_before
+    finally:
+        conn.close()
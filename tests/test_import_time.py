@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Test Import Time - ETF Italia Project v10
+Regressione cold-start: dipendenze pesanti differite per gli entry point CLI
+(il budget in ms è un benchmark opt-in: benchmarks/import_budget.py)
+"""
+
+import sys
+import os
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+from utils.import_timing import CLI_IMPORT_BUDGET_MS, DEFERRED_IMPORTS, measure_import, parse_importtime
+
+
+def test_parse_importtime():
+    sample = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   json.decoder\n"
+        "import time:       300 |        420 | json\n"
+    )
+    modules = parse_importtime(sample)
+    assert modules['json']['cumulative_us'] == 420
+    assert modules['json.decoder']['depth'] == 1
+
+
+def test_heavy_dependencies_are_deferred():
+    for module, deferred in DEFERRED_IMPORTS.items():
+        imported = measure_import(module)['imported']
+        leaked = [dep for dep in deferred if dep in imported]
+        assert not leaked, f"{module} importa a livello modulo: {leaked}"
+
+
+def test_cli_entry_points_import_cleanly():
+    # Nessun budget in ms (dipende dalla macchina): ogni entry point si importa a freddo
+    for module in CLI_IMPORT_BUDGET_MS:
+        assert module in measure_import(module)['imported'], module
+
+
+def test_session_manager_construction_does_no_io(tmp_path):
+    from orchestration.session_manager import SessionManager
+
+    sessions_dir = tmp_path / 'reports' / 'sessions'
+    sm = SessionManager(base_reports_dir=str(sessions_dir), script_name='check_guardrails')
+
+    # Nessun file o cartella creati alla costruzione
+    assert not (tmp_path / 'reports').exists()
+
+    # Primo utilizzo: crea sessione e current_session.json
+    session_dir = sm.get_current_session_dir()
+    assert session_dir.exists()
+    assert (tmp_path / 'reports' / 'current_session.json').exists()
+
+    # Un secondo manager riusa la sessione senza riscrivere il file
+    mtime = (tmp_path / 'reports' / 'current_session.json').stat().st_mtime_ns
+    sm2 = SessionManager(base_reports_dir=str(sessions_dir), script_name='risk_management')
+    assert sm2.current_session == sm.current_session
+    assert (tmp_path / 'reports' / 'current_session.json').stat().st_mtime_ns == mtime
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Test KPI Kernels - ETF Italia Project v10
+Golden test dei kernel NumPy contro le implementazioni pandas storiche
+(backtest_engine.calculate_real_kpi, backtest_runner.calculate_kpi/benchmark,
+MonteCarloStressTest.calculate_metrics)
+"""
+
+import sys
+import os
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+from utils.kpi_kernels import benchmark_kernels, equity_kpis, max_drawdown, returns_kpis
+
+
+def _reference_equity_kpi(dates, values, day_count=365.25):
+    """Copia congelata del calcolo pandas di backtest_engine/backtest_runner"""
+    df = pd.DataFrame({'date': pd.to_datetime(dates), 'equity': values}).set_index('date')
+    df['daily_return'] = df['equity'].pct_change(fill_method=None)
+    df = df.dropna()
+    days = (df.index[-1] - df.index[0]).days
+    cagr = (df['equity'].iloc[-1] / df['equity'].iloc[0]) ** (day_count / days) - 1 if days > 0 else 0.0
+    df['cummax'] = df['equity'].cummax()
+    df['drawdown'] = (df['equity'] - df['cummax']) / df['cummax']
+    max_dd = df['drawdown'].min()
+    vol = df['daily_return'].std() * (252 ** 0.5)
+    sharpe = cagr / vol if vol > 0 else 0.0
+    return {'cagr': cagr, 'max_dd': max_dd, 'vol': vol, 'sharpe': sharpe,
+            'final_value': df['equity'].iloc[-1]}
+
+
+def _reference_returns_metrics(returns, initial_equity=10000.0):
+    """Copia congelata di MonteCarloStressTest.calculate_metrics (pre-kernel)"""
+    equity_curve = np.concatenate([[initial_equity], initial_equity * np.cumprod(1 + returns)])
+    final_equity = equity_curve[-1]
+    years = len(returns) / 252.0
+    cagr = (final_equity / initial_equity) ** (1 / years) - 1.0
+    running_max = np.maximum.accumulate(equity_curve)
+    max_dd = abs(((equity_curve - running_max) / running_max).min())
+    mean_return = returns.mean()
+    std_return = returns.std()
+    sharpe = (mean_return / std_return) * np.sqrt(252) if std_return > 0 else 0.0
+    downside = returns[returns < 0]
+    downside_std = downside.std() if len(downside) > 0 else std_return
+    sortino = (mean_return / downside_std) * np.sqrt(252) if downside_std > 0 else 0.0
+    calmar = cagr / max_dd if max_dd > 0 else 0.0
+    return {'cagr': cagr, 'max_dd': max_dd, 'sharpe': sharpe, 'sortino': sortino,
+            'calmar': calmar, 'final_equity': final_equity}
+
+
+def _business_dates(n):
+    return [d.date() for d in pd.bdate_range('2021-01-04', periods=n)]
+
+
+def test_equity_kpis_match_pandas_reference():
+    rng = np.random.default_rng(11)
+    dates = _business_dates(400)
+    for day_count in (365.25, 365.0):
+        for _ in range(5):
+            values = 10000.0 * np.cumprod(1 + rng.normal(0.0004, 0.012, 400))
+            expected = _reference_equity_kpi(dates, values, day_count)
+            got = equity_kpis(values, dates=dates, day_count=day_count)
+            for key, value in expected.items():
+                assert abs(got[key] - value) < 1e-10, key
+
+
+def test_equity_kpis_batch_matches_rows():
+    rng = np.random.default_rng(5)
+    curves = 100.0 * np.cumprod(1 + rng.normal(0, 0.01, (30, 120)), axis=1)
+    batch = equity_kpis(curves, elapsed_days=170)
+    for i, row in enumerate(curves):
+        single = equity_kpis(row, elapsed_days=170)
+        for key, value in single.items():
+            assert abs(batch[key][i] - value) < 1e-12, key
+
+
+def test_returns_kpis_match_monte_carlo_reference():
+    rng = np.random.default_rng(2)
+    for returns in (rng.normal(0.0005, 0.01, 252), np.full(30, -0.02), np.full(30, 0.01)):
+        expected = _reference_returns_metrics(returns)
+        got = returns_kpis(returns, initial_equity=10000.0)
+        got['max_dd'] = abs(got['max_dd'])
+        for key, value in expected.items():
+            assert abs(got[key] - value) < 1e-10, key
+
+
+def test_max_drawdown_edge_cases():
+    assert max_drawdown([100.0, 110.0, 120.0]) == 0.0
+    assert abs(max_drawdown([100.0, 50.0, 100.0]) + 0.5) < 1e-12
+    # start_value incluso nel massimo corrente
+    assert abs(max_drawdown([90.0, 95.0], start_value=100.0) + 0.1) < 1e-12
+    assert max_drawdown([]) == 0.0
+
+
+def test_microbenchmark_batch_faster_than_pandas():
+    result = benchmark_kernels(n_curves=200, n_days=504, repeat=1)
+    assert result['kernel_batch_ms'] < result['pandas_loop_ms']
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Test Latest Prices - ETF Italia Project v10
+Tabella latest_prices e prezzi as-of (ASOF JOIN) vs lookup per simbolo
+"""
+
+import sys
+import os
+from datetime import date, timedelta
+
+import duckdb
+import pytest
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+from risk.implement_risk_controls import calculate_current_weights, calculate_portfolio_value
+from utils.latest_prices import asof_prices, latest_price_map, latest_prices_source, refresh_latest_prices
+
+START = date(2025, 1, 6)
+
+
+def _setup_db(tmp_path):
+    conn = duckdb.connect(os.path.join(tmp_path, 'latest_prices.duckdb'))
+    conn.execute("""
+    CREATE TABLE market_data (symbol VARCHAR, date DATE, close DOUBLE, adj_close DOUBLE)
+    """)
+    conn.execute("""
+    CREATE TABLE fiscal_ledger (id INTEGER, date DATE, type VARCHAR, symbol VARCHAR, qty DOUBLE, price DOUBLE)
+    """)
+    rows = []
+    for k, symbol in enumerate(('AAA', 'BBB', 'CCC')):
+        # CCC sospeso: ultima seduta 5 giorni prima degli altri
+        n_days = 15 if symbol == 'CCC' else 20
+        for i in range(n_days):
+            rows.append([symbol, START + timedelta(days=i), 10.0 * (k + 1) + i, 10.0 * (k + 1) + i - 0.5])
+    conn.executemany("INSERT INTO market_data VALUES (?, ?, ?, ?)", rows)
+    conn.executemany("INSERT INTO fiscal_ledger VALUES (?, ?, ?, ?, ?, ?)", [
+        [1, START, 'DEPOSIT', 'CASH', 10000, 1.0],
+        [2, START, 'BUY', 'AAA', 10, 10.0],
+        [3, START, 'BUY', 'CCC', 20, 30.0],
+        [4, START + timedelta(days=3), 'SELL', 'CCC', 5, 33.0],
+    ])
+    return conn
+
+
+def _naive_latest(conn, symbol):
+    return conn.execute("SELECT close FROM market_data WHERE symbol = ? ORDER BY date DESC LIMIT 1",
+                        [symbol]).fetchone()[0]
+
+
+def test_latest_prices_table_and_fallback(tmp_path):
+    conn = _setup_db(tmp_path)
+    try:
+        # Senza tabella: aggregazione inline, stessi valori del lookup per simbolo
+        assert latest_prices_source(conn) != 'latest_prices'
+        inline = latest_price_map(conn)
+        assert inline == {s: _naive_latest(conn, s) for s in ('AAA', 'BBB', 'CCC')}
+
+        assert refresh_latest_prices(conn) == 3
+        assert latest_prices_source(conn) == 'latest_prices'
+        assert latest_price_map(conn) == inline
+        assert conn.execute("SELECT date FROM latest_prices WHERE symbol = 'CCC'").fetchone()[0] == START + timedelta(days=14)
+
+        # Aggiornamento parziale (ingest di un solo simbolo)
+        conn.execute("INSERT INTO market_data VALUES ('BBB', ?, 99.0, 98.5)", [START + timedelta(days=25)])
+        assert refresh_latest_prices(conn, ['BBB']) == 1
+        assert latest_price_map(conn, ['BBB', 'CCC']) == {'BBB': 99.0, 'CCC': inline['CCC']}
+        assert latest_price_map(conn, ['BBB'], column='adj_close') == {'BBB': 98.5}
+    finally:
+        conn.close()
+
+
+def test_stale_latest_prices_fall_back_to_market_data(tmp_path):
+    conn = _setup_db(tmp_path)
+    try:
+        refresh_latest_prices(conn)
+        assert latest_prices_source(conn) == 'latest_prices'
+
+        # Seduta scritta senza refresh: data massima diversa → aggregazione inline
+        conn.execute("INSERT INTO market_data VALUES ('AAA', ?, 77.0, 76.5)", [START + timedelta(days=30)])
+        assert latest_prices_source(conn) != 'latest_prices'
+        assert latest_price_map(conn, ['AAA']) == {'AAA': 77.0}
+
+        # Nuovo simbolo senza refresh (data massima invariata): insieme simboli diverso
+        refresh_latest_prices(conn)
+        conn.execute("INSERT INTO market_data VALUES ('DDD', ?, 5.0, 5.0)", [START])
+        assert latest_prices_source(conn) != 'latest_prices'
+        assert latest_price_map(conn, ['DDD']) == {'DDD': 5.0}
+
+        refresh_latest_prices(conn)
+        conn.execute("DELETE FROM market_data WHERE symbol = 'DDD'")
+        assert latest_prices_source(conn) != 'latest_prices'
+
+        # Seduta storica aggiunta (simboli e data massima invariati): il marker conta le righe
+        refresh_latest_prices(conn)
+        conn.execute("INSERT INTO market_data VALUES ('BBB', ?, 1.0, 1.0)", [START - timedelta(days=1)])
+        assert latest_prices_source(conn) != 'latest_prices'
+        assert conn.execute("SELECT market_rows FROM latest_prices_meta").fetchone()[0] == 56
+    finally:
+        conn.close()
+
+
+def test_asof_prices_match_lookup(tmp_path):
+    conn = _setup_db(tmp_path)
+    try:
+        for offset in (-1, 0, 7, 17, 30):
+            asof = START + timedelta(days=offset)
+            expected = {}
+            for symbol in ('AAA', 'BBB', 'CCC', 'ZZZ'):
+                row = conn.execute("""
+                SELECT date, close FROM market_data WHERE symbol = ? AND date <= ? ORDER BY date DESC LIMIT 1
+                """, [symbol, asof]).fetchone()
+                if row:
+                    expected[symbol] = (row[0], row[1])
+            assert asof_prices(conn, ['AAA', 'BBB', 'CCC', 'ZZZ'], asof) == expected
+        assert asof_prices(conn, [], START) == {}
+    finally:
+        conn.close()
+
+
+def test_risk_controls_use_latest_prices(tmp_path):
+    conn = _setup_db(tmp_path)
+    try:
+        refresh_latest_prices(conn)
+        # CCC ha l'ultimo prezzo prima della data massima: resta valorizzato
+        positions_value = 10 * _naive_latest(conn, 'AAA') + 15 * _naive_latest(conn, 'CCC')
+        assert calculate_portfolio_value(conn) == pytest.approx(10000 + positions_value)
+
+        weights = calculate_current_weights(conn, 10000 + positions_value)
+        assert set(weights) == {'AAA', 'CCC'}
+        assert weights['CCC'] == pytest.approx(15 * _naive_latest(conn, 'CCC') / (10000 + positions_value))
+    finally:
+        conn.close()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Test Market Cube - ETF Italia Project v10
+Cache date × simboli memory-mapped: coerenza con risk_metrics, append incrementale,
+invalidazione da fingerprint, build concorrenti serializzate dal lock e input
+Monte Carlo / compute_signals equivalenti alle query
+"""
+
+import sys
+import os
+import threading
+from datetime import date, timedelta
+
+import duckdb
+import numpy as np
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+from data.compute_signals import _metrics_from_cube
+from risk.portfolio_monte_carlo import load_portfolio_inputs
+from utils.market_cube import MarketCube, build_market_cube, load_market_cube
+
+
+def _rows(symbol, start, n, seed):
+    rng = np.random.default_rng(seed)
+    prices = 100 * np.cumprod(1 + rng.normal(0.0003, 0.01, n))
+    return [(symbol, start + timedelta(days=i), float(p) * 1.01, float(p), 1000 + i)
+            for i, p in enumerate(prices)]
+
+
+def _setup_db(tmp_path):
+    conn = duckdb.connect(os.path.join(tmp_path, 'market_cube.duckdb'))
+    conn.execute("CREATE TABLE market_data (symbol VARCHAR, date DATE, close DOUBLE, adj_close DOUBLE, volume BIGINT)")
+    conn.execute("""
+    CREATE TABLE fiscal_ledger (
+        id INTEGER, date DATE, type VARCHAR, symbol VARCHAR,
+        qty DOUBLE, price DOUBLE, fees DOUBLE, tax_paid DOUBLE, run_type VARCHAR
+    )
+    """)
+    # Stessa definizione di daily_return/sma_200/volatility_20d della vista di setup_db
+    conn.execute("""
+    CREATE VIEW risk_metrics AS
+    WITH r AS (
+        SELECT symbol, date, adj_close,
+               (adj_close - LAG(adj_close) OVER w) / LAG(adj_close) OVER w AS daily_return
+        FROM market_data WINDOW w AS (PARTITION BY symbol ORDER BY date)
+    )
+    SELECT symbol, date, adj_close, daily_return,
+           AVG(adj_close) OVER (PARTITION BY symbol ORDER BY date ROWS BETWEEN 199 PRECEDING AND CURRENT ROW) AS sma_200,
+           STDDEV_SAMP(daily_return) OVER (PARTITION BY symbol ORDER BY date ROWS BETWEEN 19 PRECEDING AND CURRENT ROW) * SQRT(252) AS volatility_20d
+    FROM r
+    """)
+    # BBB parte più tardi: celle NaN nella cache
+    rows = _rows('AAA', date(2024, 1, 1), 320, 1) + _rows('BBB', date(2024, 3, 1), 260, 2)
+    conn.executemany("INSERT INTO market_data VALUES (?, ?, ?, ?, ?)", rows)
+    conn.execute("INSERT INTO fiscal_ledger VALUES (1,'2024-03-02','BUY','AAA',10,100,0,0,'PRODUCTION')")
+    conn.execute("INSERT INTO fiscal_ledger VALUES (2,'2024-03-02','BUY','BBB',20,100,0,0,'PRODUCTION')")
+    return conn
+
+
+def _assert_matches_view(conn, cube):
+    for field, column in (('adj_close', 'adj_close'), ('returns', 'daily_return'),
+                          ('sma_200', 'sma_200'), ('volatility_20d', 'volatility_20d')):
+        for symbol in cube.symbols:
+            expected = conn.execute(f"SELECT date, {column} FROM risk_metrics WHERE symbol = ? ORDER BY date",
+                                    [symbol]).fetchdf()
+            dates, _, values = cube.matrix(field, [symbol], expected['date'].min(), expected['date'].max())
+            got = np.asarray(values)[:, 0]
+            assert len(got) == len(expected)
+            np.testing.assert_allclose(got, expected[column].to_numpy(dtype=float, na_value=np.nan),
+                                       rtol=1e-12, equal_nan=True)
+
+
+def test_build_open_and_fingerprint(tmp_path):
+    conn = _setup_db(tmp_path)
+    cube_dir = tmp_path / 'cube'
+    try:
+        assert build_market_cube(conn, cube_dir)['action'] == 'rebuild'
+        assert build_market_cube(conn, cube_dir)['action'] == 'fresh'
+
+        cube = MarketCube.open(cube_dir)
+        assert isinstance(cube['close'], np.memmap)
+        assert cube.symbols == ['AAA', 'BBB'] and cube.shape == (320, 2)
+        assert np.isnan(cube['close'][0, 1]) and not np.isnan(cube['close'][0, 0])
+        _assert_matches_view(conn, cube)
+
+        frame = cube.frame('close', ['BBB'], '2024-03-01', '2024-03-10')
+        assert len(frame) == 10 and frame.columns.tolist() == ['BBB']
+    finally:
+        conn.close()
+
+
+def test_incremental_append_and_history_change(tmp_path):
+    conn = _setup_db(tmp_path)
+    cube_dir = tmp_path / 'cube'
+    try:
+        build_market_cube(conn, cube_dir)
+
+        # Nuove date in coda → append
+        new_rows = _rows('AAA', date(2024, 11, 16), 5, 3) + _rows('BBB', date(2024, 11, 16), 5, 4)
+        conn.executemany("INSERT INTO market_data VALUES (?, ?, ?, ?, ?)", new_rows)
+        result = build_market_cube(conn, cube_dir)
+        assert result['action'] == 'append' and result['n_dates'] == 325
+        cube = MarketCube.open(cube_dir)
+        _assert_matches_view(conn, cube)
+
+        # Correzione di un prezzo storico → rebuild completo
+        conn.execute("UPDATE market_data SET adj_close = adj_close * 1.5 WHERE symbol = 'AAA' AND date = '2024-02-01'")
+        assert build_market_cube(conn, cube_dir)['action'] == 'rebuild'
+        _assert_matches_view(conn, MarketCube.open(cube_dir))
+    finally:
+        conn.close()
+
+
+def test_monte_carlo_inputs_from_cube(tmp_path):
+    conn = _setup_db(tmp_path)
+    try:
+        cube = load_market_cube(conn, tmp_path / 'cube')
+        for lookback in (60, 252):
+            expected = load_portfolio_inputs(conn, lookback_days=lookback)
+            got = load_portfolio_inputs(conn, lookback_days=lookback, cube=cube)
+            assert got['symbols'] == expected['symbols']
+            np.testing.assert_allclose(got['prices'], expected['prices'])
+            np.testing.assert_allclose(got['returns'], expected['returns'], equal_nan=True)
+    finally:
+        conn.close()
+
+
+def test_concurrent_builds_are_serialized(tmp_path):
+    db_path = os.path.join(tmp_path, 'market_cube.duckdb')
+    _setup_db(tmp_path).close()
+    cube_dir = tmp_path / 'cube'
+    actions = []
+
+    def build():
+        conn = duckdb.connect(db_path, read_only=True)
+        try:
+            actions.append(build_market_cube(conn, cube_dir)['action'])
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=build) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # Una sola ricostruzione: gli altri trovano la cache già aggiornata sotto lock
+    assert sorted(actions) == ['fresh', 'fresh', 'rebuild']
+    assert not list(cube_dir.glob('*.tmp'))
+    assert MarketCube.open(cube_dir).shape == (320, 2)
+
+
+def test_signal_metrics_from_cube(tmp_path):
+    conn = _setup_db(tmp_path)
+    try:
+        cube = load_market_cube(conn, tmp_path / 'cube')
+        for symbol in ('AAA', 'BBB'):
+            expected = conn.execute("""
+            SELECT date, adj_close, sma_200, volatility_20d,
+                   adj_close / MAX(adj_close) OVER (ORDER BY date ROWS UNBOUNDED PRECEDING) - 1 AS drawdown_pct,
+                   daily_return
+            FROM risk_metrics WHERE symbol = ? ORDER BY date
+            """, [symbol]).fetchdf()
+            got = _metrics_from_cube(cube, symbol)
+            assert list(got['date'].dt.date) == list(expected['date'].dt.date)
+            for column in ('adj_close', 'sma_200', 'volatility_20d', 'drawdown_pct', 'daily_return'):
+                np.testing.assert_allclose(got[column].to_numpy(), expected[column].to_numpy(dtype=float, na_value=np.nan),
+                                           rtol=1e-12, equal_nan=True)
+    finally:
+        conn.close()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Test Market Store - ETF Italia Project v10
+Anagrafica multi-valuta e cambi FX as-of
+"""
+
+import sys
+import os
+import re
+from datetime import date
+
+import duckdb
+import pandas as pd
+import pytest
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+from quality.schema_contract_gate import catalog_snapshot, compile_contract, validate_snapshot
+from utils.market_store import (
+    FxLookup,
+    delete_market_rows,
+    market_data_source,
+    market_partitions,
+    partition_market_data,
+    prices_to_eur,
+    refresh_fx_rates,
+    sync_instruments,
+    upsert_fx_rates,
+    write_market_rows,
+)
+from utils.universe_helper import get_default_venue
+
+CONFIG = {
+    'settings': {'currency': 'EUR', 'venue': 'XMIL'},
+    'universe': {
+        'core': [{'symbol': 'CSSPX.MI'}],
+        'satellite': [{'symbol': 'SPY', 'venue': 'ARCX', 'currency': 'USD'}],
+    },
+}
+
+
+def _setup_db(tmp_path):
+    conn = duckdb.connect(os.path.join(tmp_path, 'market.duckdb'))
+    conn.execute("""
+    CREATE TABLE market_data (
+        symbol VARCHAR NOT NULL, date DATE NOT NULL, adj_close DOUBLE, close DOUBLE,
+        high DOUBLE, low DOUBLE, volume BIGINT, source VARCHAR DEFAULT 'YF',
+        PRIMARY KEY (symbol, date)
+    )
+    """)
+    days = pd.bdate_range('2022-12-01', '2024-01-31')
+    for symbol, base in (('CSSPX.MI', 100.0), ('SPY', 400.0)):
+        conn.execute("""
+        INSERT INTO market_data (symbol, date, adj_close, close, high, low, volume)
+        SELECT ?, d::DATE, ? + i, ? + i, ? + i + 1, ? + i - 1, 1000
+        FROM (SELECT UNNEST(?::DATE[]) AS d, UNNEST(range(?)) AS i)
+        """, [symbol, base, base, base, base, [d.date() for d in days], len(days)])
+    sync_instruments(conn, CONFIG)
+    upsert_fx_rates(conn, 'USD', {date(2023, 1, 2): 0.94, date(2023, 6, 1): 0.92, date(2024, 1, 2): 0.91})
+    return conn
+
+
+def test_instruments_and_fx_asof(tmp_path):
+    conn = _setup_db(tmp_path)
+    try:
+        rows = dict((r[0], r[1:]) for r in conn.execute("SELECT * FROM instruments").fetchall())
+        assert rows['CSSPX.MI'] == ('XMIL', 'EUR', None)
+        assert rows['SPY'] == ('ARCX', 'USD', 'USDEUR=X')
+
+        fx = FxLookup.load(conn, ['CSSPX.MI', 'SPY'], [date(2022, 12, 30), date(2023, 3, 1), date(2023, 12, 31)])
+        assert fx.convert('CSSPX.MI', date(2023, 3, 1), 100.0) == ('EUR', 1.0, 100.0)
+        # As-of: ultima data <= richiesta (nessun cambio prima del primo fixing)
+        assert fx.convert('SPY', date(2023, 3, 1), 100.0) == ('USD', 0.94, pytest.approx(94.0))
+        assert fx.rate('USD', date(2023, 12, 31)) == 0.92
+        assert fx.rate('USD', date(2022, 12, 30)) is None
+        # Data fuori dal batch caricato: nessun cambio inventato
+        assert fx.convert('SPY', date(2024, 1, 5), 100.0) == ('USD', None, None)
+        assert FxLookup.load(conn, dates=[date(2024, 1, 5)]).rate('USD', date(2024, 1, 5)) == 0.91
+
+        prices = pd.DataFrame({'symbol': ['SPY', 'SPY', 'CSSPX.MI'],
+                               'date': [date(2023, 6, 1), date(2022, 12, 30), date(2023, 6, 1)],
+                               'price': [410.0, 400.0, 105.0]})
+        out = prices_to_eur(conn, prices)
+        out = out.assign(date=pd.to_datetime(out['date']).dt.date).set_index(['symbol', 'date'])
+        assert out.loc[('SPY', date(2023, 6, 1)), 'price_eur'] == pytest.approx(410.0 * 0.92)
+        assert pd.isna(out.loc[('SPY', date(2022, 12, 30)), 'exchange_rate'])
+        assert out.loc[('CSSPX.MI', date(2023, 6, 1)), 'price_eur'] == pytest.approx(105.0)
+    finally:
+        conn.close()
+
+
+def _scanned_partitions(conn, sql):
+    plan = '\n'.join(r[1] for r in conn.execute(f"EXPLAIN {sql}").fetchall())
+    return set(re.findall(r'market_data_[a-z0-9_]+_\d{4}', plan))
+
+
+def test_partitioned_market_data(tmp_path):
+    conn = _setup_db(tmp_path)
+    try:
+        before = conn.execute("SELECT symbol, COUNT(*), SUM(close) FROM market_data GROUP BY symbol ORDER BY symbol").fetchall()
+        assert partition_market_data(conn, 'XMIL') == sum(r[1] for r in before)
+        assert partition_market_data(conn, 'XMIL') == 0
+        assert [(v, y) for v, y, _ in market_partitions(conn)] == [
+            ('ARCX', 2022), ('ARCX', 2023), ('ARCX', 2024), ('XMIL', 2022), ('XMIL', 2023), ('XMIL', 2024)]
+        assert conn.execute("SELECT symbol, COUNT(*), SUM(close) FROM market_data GROUP BY symbol ORDER BY symbol").fetchall() == before
+
+        # Filtri venue/date: solo le partizioni coinvolte vengono lette
+        source = market_data_source(conn, venue='ARCX', start=date(2024, 1, 1))
+        assert _scanned_partitions(conn, f"SELECT COUNT(*) FROM {source}") == {'market_data_arcx_2024'}
+        assert _scanned_partitions(conn, "SELECT MAX(close) FROM market_data WHERE date BETWEEN '2023-03-01' AND '2023-03-31'") \
+            == {'market_data_arcx_2023', 'market_data_xmil_2023'}
+        assert conn.execute(f"SELECT COUNT(DISTINCT symbol) FROM {source}").fetchone()[0] == 1
+
+        # Nuovo anno → nuova partizione nella vista; cambio venue → chiave unica
+        write_market_rows(conn, """
+        SELECT 'SPY' AS symbol, DATE '2025-01-02' AS date, 501.0 AS high, 499.0 AS low, 500.0 AS close,
+               500.0 AS adj_close, 10 AS volume, 'YF' AS source
+        """)
+        assert conn.execute("SELECT venue, close FROM market_data WHERE symbol = 'SPY' AND date = '2025-01-02'").fetchone() \
+            == ('ARCX', 500.0)
+        conn.execute("UPDATE instruments SET venue = 'XMIL' WHERE symbol = 'SPY'")
+        write_market_rows(conn, """
+        SELECT 'SPY' AS symbol, DATE '2025-01-02' AS date, 511.0 AS high, 509.0 AS low, 510.0 AS close,
+               510.0 AS adj_close, 10 AS volume, 'YF' AS source
+        """)
+        assert conn.execute("SELECT venue, close FROM market_data WHERE symbol = 'SPY' AND date = '2025-01-02'").fetchall() \
+            == [('XMIL', 510.0)]
+
+        # Lo schema contract vede market_data come tabella, partizioni non sono tabelle extra
+        compiled = compile_contract({'tables': {'market_data': {'columns': {
+            'symbol': {'type': 'VARCHAR', 'pk': True}, 'date': {'type': 'DATE', 'pk': True}, 'close': {'type': 'DOUBLE'}}}}})
+        valid, errors, warnings = validate_snapshot(catalog_snapshot(conn), compiled)
+        assert valid and errors == []
+        assert not any('market_data_' in w for w in warnings)
+
+        delete_market_rows(conn, ['SPY'])
+        assert conn.execute("SELECT COUNT(*) FROM market_data WHERE symbol = 'SPY'").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+
+def test_refresh_fx_rates_fetches_only_delta(tmp_path):
+    conn = _setup_db(tmp_path)
+    try:
+        calls = []
+
+        def fetch(pair, start, end):
+            calls.append((pair, start, end))
+            days = pd.bdate_range(start, end, inclusive='left')
+            return pd.DataFrame({'Close': [0.9] * len(days)}, index=days)
+
+        loaded = refresh_fx_rates(conn, CONFIG, date(2024, 1, 10), fetch, date(2010, 1, 1))
+        assert calls == [('USDEUR=X', date(2024, 1, 3), date(2024, 1, 11))]
+        assert loaded == {'USD': 6}
+        assert refresh_fx_rates(conn, CONFIG, date(2024, 1, 10), fetch, date(2010, 1, 1)) == {'USD': 0}
+        assert len(calls) == 1
+    finally:
+        conn.close()
+
+
+def test_default_venue_resolution(monkeypatch):
+    monkeypatch.delenv('ETF_VENUE', raising=False)
+    assert get_default_venue() == 'XMIL'
+    assert get_default_venue({'settings': {'venue': 'XETR'}}) == 'XETR'
+    monkeypatch.setenv('ETF_VENUE', 'BIT')
+    assert get_default_venue({'settings': {'venue': 'XETR'}}) == 'BIT'
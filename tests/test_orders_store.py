@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Test Orders Store - ETF Italia Project v10
+File ordini + sidecar Parquet + indice run, validazione in streaming e KPI colonnari
+"""
+
+import sys
+import os
+import json
+
+import duckdb
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+from trading.orders_store import (
+    ORDERS_INDEX_NAME,
+    latest_orders_file,
+    load_run_index,
+    normalize_orders,
+    summarize_order_file,
+    summarize_orders_history,
+    validate_orders_data,
+    validate_orders_stream,
+    write_orders_run,
+)
+
+
+def _order(symbol, action, qty, price, fees=1.0, tax=0.5, momentum=0.6, score=0.4):
+    return {'symbol': symbol, 'action': action, 'qty': qty, 'price': price, 'reason': 'TEST',
+            'recommendation': 'TRADE' if action != 'HOLD' else 'HOLD', 'momentum_score': momentum,
+            'fees_est': fees, 'tax_friction_est': tax, 'trade_score': score,
+            'signal_state': 'RISK_ON', 'risk_scalar': 1.0}
+
+
+def _summary(orders, as_of_date, timestamp='2025-01-03T10:00:00'):
+    return {'timestamp': timestamp, 'as_of_date': as_of_date, 'dry_run': True,
+            'orders': orders, 'summary': {'total_orders': len(orders)}}
+
+
+def _reference_stats(orders):
+    """Aggregati come calcolati storicamente in production_kpi (list comprehension)"""
+    buy = [o for o in orders if o['action'] == 'BUY']
+    sell = [o for o in orders if o['action'] == 'SELL']
+    return {
+        'total_orders': len(orders),
+        'buy_orders': len(buy),
+        'sell_orders': len(sell),
+        'hold_orders': len([o for o in orders if o['action'] == 'HOLD']),
+        'total_buy_value': sum(o['qty'] * o['price'] for o in buy),
+        'total_sell_value': sum(o['qty'] * o['price'] for o in sell),
+        'total_costs': sum(o.get('fees_est', 0) + o.get('tax_friction_est', 0) for o in orders),
+        'trade_costs': sum(o.get('fees_est', 0) + o.get('tax_friction_est', 0) for o in buy + sell),
+        'avg_momentum_score': sum(o.get('momentum_score', 0) for o in orders) / len(orders),
+        'avg_trade_score': sum(o.get('trade_score', 0) for o in orders) / len(orders),
+    }
+
+
+ORDERS = [
+    _order('AAA', 'BUY', 10, 25.0),
+    _order('BBB', 'SELL', 4, 51.5, fees=2.0, tax=3.25, momentum=0.2, score=0.1),
+    _order('CCC', 'HOLD', 0, 12.0, fees=0.0, tax=0.0, momentum=0.5, score=0.0),
+    _order('DDD', 'BUY', 7, 101.3, momentum=0.9, score=0.8),
+]
+
+
+def test_write_orders_run_and_summary(tmp_path):
+    orders_file = tmp_path / 'orders_20250103_100000.json'
+    stored = write_orders_run(_summary(ORDERS, '2025-01-03'), orders_file)
+
+    assert orders_file.exists() and stored['parquet_file'].exists()
+    with open(orders_file) as f:
+        assert json.load(f)['orders'] == ORDERS
+    assert (tmp_path / ORDERS_INDEX_NAME).exists()
+    assert stored['orders_plan_rows'] == 0
+
+    stats = summarize_order_file(orders_file)
+    for key, value in _reference_stats(ORDERS).items():
+        assert abs(stats[key] - value) < 1e-9, key
+
+
+def test_legacy_json_without_sidecar(tmp_path):
+    orders_file = tmp_path / 'orders_20241231_090000.json'
+    legacy = [{k: v for k, v in o.items() if k != 'trade_score'} for o in ORDERS]
+    with open(orders_file, 'w') as f:
+        json.dump(_summary(legacy, '2024-12-31'), f)
+
+    stats = summarize_order_file(orders_file)
+    for key, value in _reference_stats(legacy).items():
+        assert abs(stats[key] - value) < 1e-9, key
+    assert latest_orders_file(tmp_path) == orders_file
+    assert load_run_index(tmp_path)[0]['as_of_date'] == '2024-12-31'
+
+
+def test_orders_plan_written_with_connection(tmp_path):
+    conn = duckdb.connect(str(tmp_path / 'orders_plan.duckdb'))
+    conn.execute("""
+    CREATE TABLE orders_plan (
+        id INTEGER PRIMARY KEY, run_id VARCHAR NOT NULL, date DATE NOT NULL, symbol VARCHAR NOT NULL,
+        side VARCHAR NOT NULL, qty DOUBLE NOT NULL, status VARCHAR NOT NULL,
+        execution_price_mode VARCHAR NOT NULL DEFAULT 'CLOSE_SAME_DAY_SLIPPAGE',
+        proposed_price DOUBLE, candidate_score DOUBLE, decision_path VARCHAR NOT NULL,
+        reason_code VARCHAR NOT NULL, reject_reason VARCHAR, config_snapshot_hash VARCHAR,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    try:
+        stored = write_orders_run(_summary(ORDERS, '2025-01-03'), tmp_path / 'orders_20250103_100000.json', conn=conn)
+        assert stored['orders_plan_rows'] == len(ORDERS)
+        rows = conn.execute("SELECT id, run_id, symbol, side, status FROM orders_plan ORDER BY id").fetchall()
+        assert rows[0] == (1, 'orders_20250103_100000', 'AAA', 'BUY', 'TRADE')
+        assert [r[3] for r in rows] == ['BUY', 'SELL', 'HOLD', 'BUY']
+    finally:
+        conn.close()
+
+
+def test_history_and_latest_from_index(tmp_path):
+    for day in ('2025-01-02', '2025-01-03', '2025-01-06'):
+        stamp = day.replace('-', '')
+        write_orders_run(_summary(ORDERS[:2], day, f'{day}T10:00:00'), tmp_path / f'orders_{stamp}_100000.json')
+
+    assert latest_orders_file(tmp_path).name == 'orders_20250106_100000.json'
+
+    history = summarize_orders_history(tmp_path, '2025-01-03', '2025-01-06')
+    assert [h['as_of_date'] for h in history] == ['2025-01-03', '2025-01-06']
+    assert all(h['total_orders'] == 2 and h['buy_orders'] == 1 for h in history)
+
+
+def test_validation_reports_first_error():
+    ok, error, n = validate_orders_data(_summary(ORDERS, '2025-01-03'))
+    assert ok and error is None and n == len(ORDERS)
+
+    ok, error, _ = validate_orders_data({'timestamp': 'x', 'dry_run': True, 'orders': []})
+    assert not ok and error == 'Campo mancante: summary'
+
+    bad = ORDERS[:1] + [dict(ORDERS[1], action='SHORT')] + [{'symbol': 'X'}]
+    ok, error, n = validate_orders_data(_summary(bad, '2025-01-03'))
+    assert not ok and error.startswith('Ordine 1:') and n == 1
+
+    # Stringhe numeriche e reason non stringa (file storici): accettate, qty/price convertiti
+    legacy = dict(ORDERS[0], qty='10', price=' 12.5', reason=None)
+    ok, error, n = validate_orders_stream(iter([legacy, dict(ORDERS[1], reason=3)]))
+    assert ok and n == 2
+    assert legacy['qty'] == 10.0 and legacy['price'] == 12.5
+
+    ok, error, _ = validate_orders_stream(iter([dict(ORDERS[0], qty='dieci')]))
+    assert not ok and 'qty' in error
+
+    orders = normalize_orders([dict(ORDERS[0], qty='3', price='abc')])
+    assert orders[0]['qty'] == 3.0 and orders[0]['price'] == 'abc'
+
+
+def test_latest_falls_back_to_listing_when_index_stale(tmp_path):
+    write_orders_run(_summary(ORDERS[:2], '2025-01-02', '2025-01-02T10:00:00'), tmp_path / 'orders_20250102_100000.json')
+    index_path = tmp_path / ORDERS_INDEX_NAME
+    # File scritto dopo l'indice senza passare da write_orders_run (vecchio strategy_engine, copia manuale)
+    stale = tmp_path / 'orders_20250103_100000.json'
+    with open(stale, 'w') as f:
+        json.dump(_summary(ORDERS[:1], '2025-01-03'), f)
+    mtime = index_path.stat().st_mtime_ns - 1_000_000_000
+    os.utime(index_path, ns=(mtime, mtime))
+
+    assert latest_orders_file(tmp_path) == stale
+    assert [e['run_id'] for e in load_run_index(tmp_path)] == ['orders_20250102_100000', 'orders_20250103_100000']
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test Perf Trace - ETF Italia Project v10
+Span annidati, propagazione contatori, trace nella sessione e profilo opzionale
+"""
+
+import sys
+import os
+import json
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+from orchestration.session_manager import SessionManager
+from utils.perf_trace import PROFILE_ENV, PerfTracer, get_tracer, perf_step, span, traced
+
+
+def test_nested_spans_and_counters():
+    tracer = PerfTracer()
+    with tracer.span('step'):
+        for n in (3, 5):
+            with tracer.span('symbol', sql_calls=1) as t:
+                t.count('rows_read', n)
+        tracer.record('loop', 0.25, 0.2, rows=8)
+        tracer.count('sql_calls')
+
+    spans = {s['path']: s for s in tracer.to_dict('step')['spans']}
+    assert set(spans) == {'step', 'step/symbol', 'step/loop'}
+    assert spans['step/symbol']['calls'] == 2
+    assert spans['step/symbol']['counters'] == {'sql_calls': 2, 'rows_read': 8}
+    assert spans['step/loop']['wall_ms'] == 250.0
+    # I contatori dei figli risalgono allo span radice
+    assert spans['step']['counters'] == {'sql_calls': 3, 'rows_read': 8, 'rows': 8}
+    assert spans['step']['wall_ms'] >= spans['step/symbol']['wall_ms']
+
+    # count() fuori da uno span è ignorato
+    tracer.count('orphan')
+    assert 'orphan' not in str(tracer.to_dict())
+
+
+def test_traced_decorator_and_perf_step_writes_session(tmp_path, monkeypatch):
+    monkeypatch.setenv(PROFILE_ENV, 'cprofile')
+    get_tracer().reset()
+    sm = SessionManager(base_reports_dir=str(tmp_path / 'sessions'), script_name='test_perf_trace')
+
+    @traced()
+    def work(n):
+        with span('inner', rows_read=n):
+            return sum(range(n))
+
+    with perf_step('unit_step', session_manager=sm):
+        assert work(1000) == sum(range(1000))
+
+    analysis_dir = sm.get_subdir_path('analysis')
+    traces = list(analysis_dir.glob('perf_trace_*.json'))
+    assert len(traces) == 1
+    with open(traces[0]) as f:
+        trace = json.load(f)
+    paths = {s['path']: s for s in trace['spans']}
+    assert trace['step'] == 'unit_step'
+    assert paths['unit_step/work/inner']['counters'] == {'rows_read': 1000}
+    assert paths['unit_step']['counters'] == {'rows_read': 1000}
+    assert list(analysis_dir.glob('profile_unit_step_*.prof'))
+    get_tracer().reset()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test Portfolio Construction Batch - ETF Italia Project v10
+Parità esatta tra percorso array (evaluate_candidates) e funzioni scalari
+"""
+
+import sys
+import os
+
+import numpy as np
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+from strategy.portfolio_construction import (
+    calculate_candidate_score,
+    calculate_expected_holding_days,
+    calculate_qty,
+    candidate_arrays,
+    evaluate_candidates,
+    rank_candidates,
+)
+
+CONFIG = {
+    'ranking_weights': {'momentum': 0.45, 'risk_scalar': 0.25, 'volatility': 0.20,
+                        'cost_penalty': 0.05, 'overlap_penalty': 0.05},
+    'holding_period': {'base_holding_days': 15, 'min_holding_days': 5, 'max_holding_days': 30},
+    'portfolio_construction': {'max_open_positions': 4},
+}
+STATES = ['RISK_ON', 'RISK_OFF', 'NEUTRAL', 'HOLD']
+
+
+def _universe(n=400, seed=7):
+    rng = np.random.default_rng(seed)
+    symbols = [f"ETF{i:03d}.MI" for i in range(n)]
+    # Valori sulle soglie (vol 0.18/0.25, momentum 0.55/0.70/0.85) inclusi
+    momentum = np.concatenate([[0.55, 0.70, 0.85, 0.0, 1.0], rng.uniform(0, 1, n - 5)])
+    volatility = np.concatenate([[0.18, 0.25, 0.30, 0.45, 0.0], rng.uniform(0.02, 0.45, n - 5)])
+    signals = {
+        symbol: {
+            'momentum_score': float(momentum[i]),
+            'risk_scalar': float(rng.uniform(0, 1)),
+            'volatility': float(volatility[i]),
+            'ter': float(rng.uniform(0.0001, 0.01)),
+            'slippage_bps': float(rng.integers(1, 40)),
+            'signal_state': STATES[i % len(STATES)],
+            'close': float(rng.uniform(5, 600)),
+        }
+        for i, symbol in enumerate(symbols)
+    }
+    underlying_map = {symbol: f"U{i % 37}" for i, symbol in enumerate(symbols)}
+    positions = {symbols[i]: {'qty': 10} for i in (3, 50, 100)}
+    positions['OUTSIDE.MI'] = {'qty': 5}
+    return symbols, signals, underlying_map, positions
+
+
+def test_evaluate_candidates_matches_scalar():
+    symbols, signals, underlying_map, positions = _universe()
+    arrays = candidate_arrays(symbols, signals)
+    states = np.array([signals[s]['signal_state'] for s in symbols], dtype=object)
+    prices = np.array([signals[s]['close'] for s in symbols])
+    available_cash, portfolio_value = 7_500.0, 52_000.0
+
+    result = evaluate_candidates(
+        arrays['momentum_score'], arrays['risk_scalar'], arrays['volatility'], arrays['ter'],
+        arrays['slippage_bps'], [underlying_map.get(s, s) for s in symbols],
+        [underlying_map.get(s, s) for s in positions], CONFIG,
+        signal_state=states, price=prices, available_cash=available_cash, portfolio_value=portfolio_value,
+    )
+
+    for i, symbol in enumerate(symbols):
+        sig = signals[symbol]
+        score = calculate_candidate_score(sig['momentum_score'], sig['risk_scalar'], sig['volatility'], sig['ter'],
+                                          sig['slippage_bps'], symbol, positions, underlying_map, CONFIG)
+        holding = calculate_expected_holding_days(sig['risk_scalar'], sig['volatility'], sig['momentum_score'],
+                                                  sig['signal_state'], CONFIG)
+        qty = calculate_qty(symbol, sig['close'], available_cash, portfolio_value, sig['risk_scalar'], CONFIG)
+        assert result['score'][i] == score, symbol
+        assert result['holding_days'][i] == holding, symbol
+        assert result['qty'][i] == qty, symbol
+    assert result['overlap_penalty'].sum() > 0
+
+
+def test_rank_candidates_matches_scalar_loop():
+    symbols, signals, underlying_map, positions = _universe(n=120, seed=11)
+    # Simbolo senza segnale: default di rank_candidates
+    candidates = symbols + ['MISSING.MI']
+    expected = [
+        (symbol, calculate_candidate_score(
+            signals.get(symbol, {}).get('momentum_score', 0.0), signals.get(symbol, {}).get('risk_scalar', 0.0),
+            signals.get(symbol, {}).get('volatility', 0.15), signals.get(symbol, {}).get('ter', 0.001),
+            signals.get(symbol, {}).get('slippage_bps', 5), symbol, positions, underlying_map, CONFIG))
+        for symbol in candidates
+    ]
+    expected.sort(key=lambda x: x[1], reverse=True)
+    assert rank_candidates(candidates, signals, positions, underlying_map, CONFIG) == expected
+
+    # Overlap permesso: nessuna penalty
+    config = dict(CONFIG, execution={'forbid_overlap_underlying': False})
+    ranked = dict(rank_candidates(symbols, signals, positions, underlying_map, config))
+    for symbol in positions:
+        if symbol in ranked:
+            assert ranked[symbol] == calculate_candidate_score(
+                signals[symbol]['momentum_score'], signals[symbol]['risk_scalar'], signals[symbol]['volatility'],
+                signals[symbol]['ter'], signals[symbol]['slippage_bps'], symbol, positions, underlying_map, config)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Test Portfolio Monte Carlo - ETF Italia Project v10
+Validazione motore Monte Carlo vettoriale multi-asset (covarianza, Cholesky, VaR/CVaR)
+"""
+
+import sys
+import os
+from datetime import date, timedelta
+
+import duckdb
+import numpy as np
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+from risk.portfolio_monte_carlo import (
+    estimate_covariance,
+    load_portfolio_inputs,
+    run_portfolio_monte_carlo,
+    simulate_portfolio_values,
+    summarize_simulations,
+)
+
+
+def _setup_db(tmp_path):
+    db_path = os.path.join(tmp_path, 'test_portfolio_mc.duckdb')
+    conn = duckdb.connect(db_path)
+
+    conn.execute("""
+    CREATE TABLE fiscal_ledger (
+        id INTEGER, date DATE, type VARCHAR, symbol VARCHAR,
+        qty DOUBLE, price DOUBLE, fees DOUBLE, tax_paid DOUBLE, run_type VARCHAR
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE market_data (symbol VARCHAR, date DATE, close DOUBLE, adj_close DOUBLE, volume BIGINT)
+    """)
+    # Vista minimale compatibile con risk_metrics (daily_return)
+    conn.execute("""
+    CREATE VIEW risk_metrics AS
+    SELECT symbol, date, adj_close,
+           adj_close / LAG(adj_close) OVER (PARTITION BY symbol ORDER BY date) - 1 AS daily_return
+    FROM market_data
+    """)
+
+    rng = np.random.default_rng(7)
+    common = rng.normal(0, 0.01, 300)
+    dates = [date(2024, 1, 1) + timedelta(days=i) for i in range(300)]
+    rows = []
+    for symbol, beta in (('AAA', 1.0), ('BBB', 0.9)):
+        rets = beta * common + rng.normal(0, 0.002, 300)
+        prices = 100 * np.cumprod(1 + rets)
+        rows.extend((symbol, d, float(p), float(p), 1000) for d, p in zip(dates, prices))
+    conn.executemany("INSERT INTO market_data VALUES (?, ?, ?, ?, ?)", rows)
+
+    conn.execute("INSERT INTO fiscal_ledger VALUES (1,'2024-01-02','BUY','AAA',10,100,0,0,'PRODUCTION')")
+    conn.execute("INSERT INTO fiscal_ledger VALUES (2,'2024-01-02','BUY','BBB',20,100,0,0,'PRODUCTION')")
+    conn.commit()
+    return conn
+
+
+def test_load_inputs_and_correlation(tmp_path):
+    conn = _setup_db(tmp_path)
+    try:
+        inputs = load_portfolio_inputs(conn, lookback_days=252)
+        assert inputs['symbols'] == ['AAA', 'BBB']
+        assert inputs['returns'].shape == (252, 2)
+
+        cov = estimate_covariance(inputs['returns'])
+        corr = cov[0, 1] / np.sqrt(cov[0, 0] * cov[1, 1])
+        assert corr > 0.9  # Asset fortemente correlati nel fixture
+    finally:
+        conn.close()
+
+
+def test_run_portfolio_monte_carlo_stats(tmp_path):
+    conn = _setup_db(tmp_path)
+    try:
+        stats = run_portfolio_monte_carlo(conn, num_simulations=5000, seed=42)
+        assert stats['positions_analyzed'] == 2
+        assert stats['worst_case'] <= stats['percentile_5'] <= stats['percentile_95'] <= stats['best_case']
+        assert stats['cvar_95'] >= stats['var_95']
+        assert stats['cvar_99'] >= stats['var_99'] >= stats['var_95'] - 1e-9
+        assert 0.0 <= stats['path_max_dd_p50'] <= stats['path_max_dd_p95'] <= 1.0
+
+        again = run_portfolio_monte_carlo(conn, num_simulations=5000, seed=42)
+        assert again['var_95'] == stats['var_95']
+    finally:
+        conn.close()
+
+
+def test_correlated_paths_increase_tail_risk():
+    prices = np.array([100.0, 100.0])
+    qty = np.array([1.0, 1.0])
+    var = 0.01 ** 2
+    independent = np.array([[var, 0.0], [0.0, var]])
+    correlated = np.array([[var, 0.95 * var], [0.95 * var, var]])
+
+    v_ind, _ = simulate_portfolio_values(prices, qty, independent, num_simulations=20000, seed=1)
+    v_cor, _ = simulate_portfolio_values(prices, qty, correlated, num_simulations=20000, seed=1)
+
+    s_ind = summarize_simulations(200.0, v_ind)
+    s_cor = summarize_simulations(200.0, v_cor)
+    assert s_cor['var_95'] > s_ind['var_95']
+    # GBM a drift zero: media dei valori finali ~ valore corrente
+    assert abs(s_cor['mean_final_value'] - 200.0) / 200.0 < 0.02
+
+
+def test_100k_simulations_shape_and_summary():
+    # Solo forma e coerenza: il budget di tempo è in benchmarks/monte_carlo_budget.py (opt-in)
+    n_assets = 8
+    rng = np.random.default_rng(0)
+    a = rng.normal(0, 0.01, (300, n_assets))
+    cov = np.cov(a, rowvar=False)
+    prices = np.full(n_assets, 100.0)
+    qty = np.ones(n_assets)
+
+    values, dd = simulate_portfolio_values(prices, qty, cov, num_simulations=100000, seed=3)
+    summary = summarize_simulations(float(prices @ qty), values, dd)
+
+    assert values.shape == (100000,) and dd.shape == (100000,)
+    assert np.isfinite(values).all() and (values > 0).all()
+    assert ((dd >= 0) & (dd <= 1)).all()
+    assert summary['worst_case'] <= summary['percentile_5'] <= summary['percentile_95'] <= summary['best_case']
+    assert 0 <= summary['var_95'] <= summary['cvar_95'] <= summary['cvar_99']
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Test Regime Simulator - ETF Italia Project v10
+Golden test della macchina a stati su array contro il loop df.iloc storico
+dei POC regime-adaptive, classificazione vettoriale e sweep multi-simbolo
+"""
+
+import sys
+import os
+from datetime import date, timedelta
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+from analysis.regime_adaptive_poc_real_data import (
+    classify_regime_from_metrics,
+    get_historical_data_with_regime,
+    simulate_strategy_on_real_data,
+)
+from analysis.regime_simulator import (
+    classify_regimes,
+    run_parameter_sweep,
+    simulate_positions,
+    summarize_sweep,
+    sweep_symbol,
+)
+
+
+def _reference_simulate(df, score_entry_min, stop_loss, risk_scalar_by_regime):
+    """Copia congelata del loop df.iloc di simulate_strategy_on_real_data (pre-array)"""
+    trades = []
+    position = None
+    for i in range(len(df)):
+        current = df.iloc[i]
+        momentum_score = min(max(current['momentum'] * 5 + 0.5, 0), 1)
+        if position is None and momentum_score >= score_entry_min:
+            position = {'entry_date': current['date'], 'entry_price': current['close'],
+                        'size': risk_scalar_by_regime.get(current['regime'], 1.0),
+                        'entry_regime': current['regime']}
+        elif position is not None:
+            ret = (current['close'] - position['entry_price']) / position['entry_price']
+            reason = 'STOP_LOSS' if ret <= stop_loss else ('TAKE_PROFIT' if ret >= 0.15 else None)
+            if reason:
+                trades.append((position['entry_date'], current['date'], position['entry_regime'],
+                               ret * position['size'], reason))
+                position = None
+    if position is not None:
+        final = df.iloc[-1]
+        ret = (final['close'] - position['entry_price']) / position['entry_price']
+        trades.append((position['entry_date'], final['date'], position['entry_regime'],
+                       ret * position['size'], 'END_PERIOD'))
+    return trades
+
+
+def _synthetic_df(seed, n=600):
+    rng = np.random.default_rng(seed)
+    close = 100.0 * np.cumprod(1 + rng.normal(0.0003, 0.015, n))
+    momentum = np.zeros(n)
+    momentum[20:] = close[20:] / close[:-20] - 1.0
+    volatility = rng.uniform(0.05, 0.35, n)
+    trend = rng.normal(0.0, 0.08, n)
+    df = pd.DataFrame({
+        'date': pd.to_datetime([date(2021, 1, 1) + timedelta(days=i) for i in range(n)]),
+        'close': close,
+        'volatility': volatility,
+        'trend': trend,
+        'momentum': momentum,
+    })
+    df['regime'] = classify_regimes(volatility, trend)
+    return df
+
+
+def test_classify_regimes_matches_scalar_rule():
+    rng = np.random.default_rng(0)
+    vol = rng.uniform(0.0, 0.4, 2000)
+    trend = rng.normal(0.0, 0.1, 2000)
+    expected = [classify_regime_from_metrics(v, t) for v, t in zip(vol, trend)]
+    assert list(classify_regimes(vol, trend)) == expected
+
+
+def test_simulate_matches_legacy_loop():
+    adaptive = {'bull': 1.0, 'bear': 0.5, 'sideways': 0.8}
+    for seed in range(4):
+        df = _synthetic_df(seed)
+        for score_entry_min, stop_loss in ((0.7, -0.15), (0.6, -0.05), (0.9, -0.10)):
+            expected = _reference_simulate(df, score_entry_min, stop_loss, adaptive)
+            got = simulate_strategy_on_real_data(df, score_entry_min, stop_loss, adaptive)
+            assert len(got) == len(expected)
+            for row, ref in zip(got.itertuples(), expected):
+                assert row.entry_date == ref[0] and row.exit_date == ref[1]
+                assert row.entry_regime == ref[2] and row.exit_reason == ref[4]
+                assert abs(row.trade_return - ref[3]) < 1e-12
+
+
+def test_simulate_positions_edge_cases():
+    # Nessuna re-entry sulla barra di exit, entry sull'ultima barra chiusa a END_PERIOD
+    prices = np.array([100.0, 80.0, 90.0, 95.0])
+    entry, exit_, reason = simulate_positions(prices, np.ones(4, dtype=bool), stop_loss=-0.15)
+    assert entry.tolist() == [0, 2] and exit_.tolist() == [1, 3]
+    assert reason.tolist() == ['STOP_LOSS', 'END_PERIOD']
+
+    entry, _, _ = simulate_positions(prices, np.ones(4, dtype=bool), close_open=False)
+    assert entry.tolist() == [0]
+    assert len(simulate_positions(np.empty(0), np.empty(0, dtype=bool))[0]) == 0
+
+
+def test_sweep_symbol_matches_single_runs():
+    df = _synthetic_df(9)
+    scalars = {'FIXED': {'bull': 1.0, 'bear': 1.0, 'sideways': 1.0},
+               'ADAPTIVE': {'bull': 1.0, 'bear': 0.5, 'sideways': 0.8}}
+    rows = sweep_symbol(df, (0.6, 0.7), (-0.10, -0.15), scalars)
+    assert len(rows) == 8
+    for row in rows:
+        trades = simulate_strategy_on_real_data(df, row['score_entry_min'], row['stop_loss'],
+                                                scalars[row['risk_scalars']])
+        assert row['n_trades'] == len(trades)
+        assert abs(row['total_return'] - trades['trade_return'].sum()) < 1e-12
+
+
+def test_universe_sweep_one_query(tmp_path):
+    conn = duckdb.connect(os.path.join(tmp_path, 'regime_sweep.duckdb'))
+    conn.execute("CREATE TABLE market_data (symbol VARCHAR, date DATE, adj_close DOUBLE, close DOUBLE, volume BIGINT)")
+    rng = np.random.default_rng(3)
+    rows = []
+    for symbol in ('AAA', 'BBB', 'CCC'):
+        prices = 100 * np.cumprod(1 + rng.normal(0.0004, 0.012, 500))
+        rows.extend((symbol, date(2021, 1, 1) + timedelta(days=i), float(p), float(p), 1000)
+                    for i, p in enumerate(prices))
+    conn.executemany("INSERT INTO market_data VALUES (?, ?, ?, ?, ?)", rows)
+
+    try:
+        results = run_parameter_sweep(conn, ['AAA', 'BBB', 'CCC'], '2021-03-01', '2022-05-01',
+                                      score_entry_grid=(0.6, 0.7), stop_loss_grid=(-0.10,))
+        assert sorted(results['symbol'].unique()) == ['AAA', 'BBB', 'CCC']
+        assert len(results) == 3 * 2 * 2
+
+        # Stesse metriche del percorso per simbolo singolo
+        df = get_historical_data_with_regime(conn, 'BBB', '2021-03-01', '2022-05-01')
+        trades = simulate_strategy_on_real_data(df, 0.7, -0.10, {'bull': 1.0, 'bear': 0.5, 'sideways': 0.8})
+        row = results[(results['symbol'] == 'BBB') & (results['score_entry_min'] == 0.7)
+                      & (results['risk_scalars'] == 'ADAPTIVE')].iloc[0]
+        assert row['n_trades'] == len(trades)
+        assert abs(row['total_return'] - trades['trade_return'].sum()) < 1e-12
+
+        summary = summarize_sweep(results)
+        assert len(summary) == 4 and (summary['symbols'] == 3).all()
+    finally:
+        conn.close()
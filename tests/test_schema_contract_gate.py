@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Test Schema Contract Gate - ETF Italia Project v10
+Snapshot del catalogo in una query, contract compilato ed esito in cache per impronta DDL
+"""
+
+import sys
+import os
+
+import duckdb
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+import quality.schema_contract_gate as gate
+from quality.schema_contract_gate import catalog_snapshot, check_database_schema, validate_database_schema
+
+CONTRACT = {
+    'version': 'test',
+    'tables': {
+        'market_data': {'columns': {
+            'symbol': {'type': 'VARCHAR', 'pk': True}, 'date': {'type': 'DATE', 'pk': True},
+            'close': {'type': 'DOUBLE'}, 'volume': {'type': 'BIGINT'}, 'source': {'type': 'TEXT'},
+        }},
+        'signals': {'columns': {'id': {'type': 'INTEGER', 'pk': True}, 'symbol': {'type': 'VARCHAR'}}},
+    },
+    'views': {'risk_metrics': {'guaranteed_columns': ['symbol', 'date', 'close']}},
+}
+
+
+def _create_db(tmp_path):
+    db_path = os.path.join(tmp_path, 'schema.duckdb')
+    conn = duckdb.connect(db_path)
+    conn.execute("""
+    CREATE TABLE market_data (symbol VARCHAR, date DATE, close DOUBLE, volume INTEGER, source VARCHAR,
+                              PRIMARY KEY (symbol, date))
+    """)
+    conn.execute("CREATE TABLE signals (id INTEGER PRIMARY KEY, symbol VARCHAR)")
+    conn.execute("CREATE VIEW risk_metrics AS SELECT symbol, date, close FROM market_data")
+    conn.close()
+    return db_path
+
+
+def test_snapshot_and_validation(tmp_path):
+    db_path = _create_db(tmp_path)
+    conn = duckdb.connect(db_path, read_only=True)
+    try:
+        snapshot = catalog_snapshot(conn)
+    finally:
+        conn.close()
+    assert snapshot['tables']['market_data']['volume'] == 'INTEGER'
+    assert snapshot['views'] == {'risk_metrics': {'symbol': 'VARCHAR', 'date': 'DATE', 'close': 'DOUBLE'}}
+    assert sorted(snapshot['primary_keys']['market_data']) == ['date', 'symbol']
+
+    # Tipi equivalenti (BIGINT/INTEGER, TEXT/VARCHAR): nessun errore, nessun warning
+    assert validate_database_schema(db_path, CONTRACT, use_cache=False) == (True, [], [])
+
+    conn = duckdb.connect(db_path)
+    conn.execute("ALTER TABLE signals ADD COLUMN score DOUBLE")
+    conn.execute("ALTER TABLE signals ALTER symbol TYPE DOUBLE")
+    conn.execute("CREATE TABLE extra_table (x INTEGER)")
+    conn.execute("DROP VIEW risk_metrics")
+    conn.close()
+    valid, errors, warnings = validate_database_schema(db_path, CONTRACT, use_cache=False)
+    assert not valid
+    assert errors == ['Tabella signals.symbol: tipo mismatch (expected VARCHAR, got DOUBLE)']
+    assert warnings == ['Tabelle extra non nel contract: extra_table', 'Vista mancante: risk_metrics']
+
+
+def test_gate_result_cached_until_ddl_changes(tmp_path, monkeypatch):
+    db_path = _create_db(tmp_path)
+    cache_path = tmp_path / 'gate_cache.json'
+    snapshots = []
+    real_snapshot = gate.catalog_snapshot
+    monkeypatch.setattr(gate, 'catalog_snapshot', lambda conn: snapshots.append(1) or real_snapshot(conn))
+
+    first = check_database_schema(db_path, CONTRACT, cache_path=cache_path)
+    assert first['valid'] and not first['cached']
+
+    # Scritture di dati non cambiano il DDL: esito dalla cache, nessuno snapshot
+    conn = duckdb.connect(db_path)
+    conn.execute("INSERT INTO signals VALUES (1, 'AAA')")
+    conn.close()
+    second = check_database_schema(db_path, CONTRACT, cache_path=cache_path)
+    assert second['cached'] and second['catalog_hash'] == first['catalog_hash']
+    assert len(snapshots) == 1
+
+    # DDL cambiato: nuova validazione
+    conn = duckdb.connect(db_path)
+    conn.execute("ALTER TABLE market_data DROP COLUMN volume")
+    conn.close()
+    third = check_database_schema(db_path, CONTRACT, cache_path=cache_path)
+    assert not third['cached'] and not third['valid']
+    assert third['errors'] == ['Tabella market_data: colonne mancanti volume']
+
+    # Contract cambiato: la chiave cambia anche con DDL invariato
+    contract = dict(CONTRACT, tables={'signals': CONTRACT['tables']['signals']})
+    fourth = check_database_schema(db_path, contract, cache_path=cache_path)
+    assert not fourth['cached']
+    assert len(snapshots) == 3
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Test Signal Overlay - ETF Italia Project v10
+Aggiustamenti di enhanced_risk_management in batch su tutto lo storico vs regole per data
+"""
+
+import sys
+import os
+from datetime import date, timedelta
+
+import duckdb
+import pytest
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+from risk.signal_overlay import apply_signal_overlay, compute_signal_overlay, refresh_signal_overlay
+from utils.sql_stats import QueryStats, StatsConnection
+
+START = date(2025, 3, 3)
+CONFIG = {'risk_management': {'volatility_warning': 0.15, 'volatility_critical': 0.20,
+                              'aggressive_scalar_warning': 0.3, 'aggressive_scalar_critical': 0.1}}
+
+
+def _days(n):
+    return [START + timedelta(days=i) for i in range(n * 2) if (START + timedelta(days=i)).weekday() < 5][:n]
+
+
+def _setup_db(tmp_path, n_days=30):
+    conn = duckdb.connect(os.path.join(tmp_path, 'overlay.duckdb'))
+    conn.execute("CREATE TABLE market_data (symbol VARCHAR, date DATE, adj_close DOUBLE, close DOUBLE, volume BIGINT)")
+    conn.execute("CREATE TABLE risk_metrics (symbol VARCHAR, date DATE, volatility_20d DOUBLE, drawdown_pct DOUBLE)")
+    conn.execute("""
+    CREATE TABLE signals (
+        id INTEGER PRIMARY KEY, date DATE NOT NULL, symbol VARCHAR NOT NULL, signal_state VARCHAR NOT NULL,
+        risk_scalar DOUBLE CHECK (risk_scalar >= 0 AND risk_scalar <= 1), explain_code VARCHAR,
+        UNIQUE(date, symbol)
+    )
+    """)
+
+    days = _days(n_days)
+    market, metrics, signals = [], [], []
+    for k, symbol in enumerate(('CSSPX.MI', 'XS2L.MI', 'EIMI.MI')):
+        for i, d in enumerate(days):
+            # CSSPX: prezzo fermo a volume 0 per 5 sedute (zombie) a metà periodo
+            frozen = symbol == 'CSSPX.MI' and 12 <= i <= 16
+            price = 100.0 if frozen else 100.0 + i + k
+            market.append([symbol, d, price, price, 0 if frozen else 1000])
+            # Volatilità a rampa (regimi NORMAL → WARNING → CRITICAL), drawdown crescente
+            metrics.append([symbol, d, 0.10 + 0.005 * i, -0.006 * i])
+            signals.append([len(signals) + 1, d, symbol, 'RISK_ON', 0.8, f"BASE_{i}"])
+    conn.executemany("INSERT INTO market_data VALUES (?, ?, ?, ?, ?)", market)
+    conn.executemany("INSERT INTO risk_metrics VALUES (?, ?, ?, ?)", metrics)
+    conn.executemany("INSERT INTO signals VALUES (?, ?, ?, ?, ?, ?)", signals)
+    return conn, days
+
+
+def _expected(conn, days):
+    """Regole di enhanced_risk_management valutate data per data (riferimento)"""
+    md = {(s, d): (p, v) for s, d, p, v in conn.execute("SELECT symbol, date, adj_close, volume FROM market_data").fetchall()}
+    rm = {(s, d): (v, dd) for s, d, v, dd in conn.execute("SELECT symbol, date, volatility_20d, drawdown_pct FROM risk_metrics").fetchall()}
+    out = {}
+    for symbol in ('CSSPX.MI', 'XS2L.MI', 'EIMI.MI'):
+        for i, d in enumerate(days):
+            scalar, code = 0.8, f"BASE_{i}"
+            if symbol == 'EIMI.MI':
+                out[(d, symbol)] = (scalar, code)
+                continue
+            vol, dd = rm[(symbol, d)]
+            prefix, suffix, caps = '', '', []
+            if vol > 0.15:
+                caps.append(0.1 if vol > 0.20 else 0.3)
+                suffix += '_AGGRESSIVE_VOL'
+            zombie_days = [
+                x for j, x in enumerate(days[:i + 1])
+                if j >= 3 and (d - x).days <= 30
+                and len({md[(symbol, y)][0] for y in days[j - 3:j + 1]}) == 1 and md[(symbol, x)][1] == 0
+            ]
+            if zombie_days:
+                caps.append(0.0)
+                prefix = 'ZOMBIE_PRICE_GUARD_'
+            if symbol == 'XS2L.MI' and dd < -0.10:
+                caps.append(0.0 if dd < -0.15 else 0.2)
+                suffix += '_XS2L_CRITICAL_DD_GUARD' if dd < -0.15 else '_XS2L_WARNING_DD_GUARD'
+            if caps:
+                scalar, code = min(scalar, *caps), prefix + code + suffix
+            out[(d, symbol)] = (scalar, code)
+    return out
+
+
+def _signals(conn):
+    return {(d, s): (r, e) for d, s, r, e in conn.execute("SELECT date, symbol, risk_scalar, explain_code FROM signals").fetchall()}
+
+
+def test_overlay_matches_per_date_rules(tmp_path):
+    conn, days = _setup_db(tmp_path)
+    try:
+        overlay = compute_signal_overlay(conn, CONFIG)
+        assert set(overlay['symbol']) <= {'CSSPX.MI', 'XS2L.MI'}
+        apply_signal_overlay(conn, overlay)
+
+        expected = _expected(conn, days)
+        actual = _signals(conn)
+        assert actual.keys() == expected.keys()
+        for key, (scalar, code) in expected.items():
+            assert actual[key][0] == pytest.approx(scalar), key
+            assert actual[key][1] == code, key
+
+        # Volatilità sintetica nell'overlay (la tabella risk_metrics non cambia)
+        synthetic = overlay[overlay['volatility_override'].notna()]
+        assert set(synthetic['symbol']) == {'CSSPX.MI'}
+        assert (synthetic['drawdown_override'] <= -0.05).all()
+        assert conn.execute("SELECT MAX(volatility_20d) FROM risk_metrics").fetchone()[0] < 0.25
+    finally:
+        conn.close()
+
+
+def test_overlay_idempotent_and_reversible(tmp_path):
+    conn, days = _setup_db(tmp_path)
+    try:
+        refresh_signal_overlay(conn, CONFIG)
+        first = _signals(conn)
+        refresh_signal_overlay(conn, CONFIG)
+        assert _signals(conn) == first
+
+        # Signal ricalcolato da compute_signals: il nuovo valore diventa la base
+        conn.execute("UPDATE signals SET risk_scalar = 0.05, explain_code = 'RECOMPUTED' WHERE symbol = 'XS2L.MI' AND date = ?",
+                     [days[-1]])
+        # Volatilità rientrata e drawdown assente: nessun guardrail, valori base ripristinati
+        conn.execute("UPDATE risk_metrics SET volatility_20d = 0.05, drawdown_pct = 0.0")
+        conn.execute("UPDATE market_data SET volume = 1000")
+        overlay, applied = refresh_signal_overlay(conn, CONFIG)
+        assert applied['capped'] == 0 and len(overlay) == 0
+
+        restored = _signals(conn)
+        for (d, symbol), (scalar, code) in restored.items():
+            if symbol == 'XS2L.MI' and d == days[-1]:
+                assert (scalar, code) == (0.05, 'RECOMPUTED')
+            else:
+                assert (scalar, code) == (0.8, f"BASE_{days.index(d)}")
+    finally:
+        conn.close()
+
+
+def test_overlay_statement_count_independent_of_history(tmp_path):
+    counts = []
+    for n_days in (10, 40):
+        conn, _ = _setup_db(tmp_path, n_days)
+        stats = QueryStats()
+        proxy = StatsConnection(conn, stats)
+        try:
+            refresh_signal_overlay(proxy, CONFIG)
+            refresh_signal_overlay(proxy, CONFIG)
+            counts.append((stats.calls_for('UPDATE signals'), stats.total_calls))
+        finally:
+            proxy.close()
+        os.remove(os.path.join(tmp_path, 'overlay.duckdb'))
+    # Ripristino + applicazione per refresh, indipendente dal numero di date
+    assert counts[0] == counts[1]
+    assert counts[0][0] == 4
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Test SQL Stats - ETF Italia Project v10
+Proxy statistiche query DuckDB e budget di query su un backtest fixture
+"""
+
+import sys
+import os
+import json
+from datetime import date, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+import duckdb
+import numpy as np
+
+# Aggiungi root al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if scripts_dir not in sys.path:
+    sys.path.append(scripts_dir)
+
+import setup.setup_db as setup_db
+from backtest.backtest_engine import BacktestEngine
+from orchestration.session_manager import SessionManager
+from utils.market_store import write_market_rows
+from utils.path_manager import get_path_manager
+from utils.sql_stats import (
+    QueryStats,
+    StatsConnection,
+    assert_query_budget,
+    normalize_sql,
+    summarize_session_sql_stats,
+    write_sql_stats_report,
+)
+
+BACKTEST_DAYS = 15
+
+
+def _fixture_db(tmp_path):
+    """DB con schema setup_db, prezzi sintetici per l'universo e segnali RISK_ON"""
+    pm = get_path_manager()
+    fake_pm = type('FakePM', (), {})()
+    fake_pm.db_path = Path(tmp_path) / 'sql_stats_backtest.duckdb'
+    fake_pm.etf_universe_path = pm.etf_universe_path
+    with patch.object(setup_db, 'get_path_manager', return_value=fake_pm):
+        assert setup_db.setup_database()
+
+    with open(pm.etf_universe_path) as f:
+        config = json.load(f)
+    symbols = [etf['symbol'] for group in config['universe'].values() for etf in group]
+    # Segnali solo sugli strumenti negoziabili (il benchmark USD non è eseguibile)
+    tradable = [etf['symbol'] for name, group in config['universe'].items() if name != 'benchmark' for etf in group]
+
+    days = [d for d in (date(2023, 1, 2) + timedelta(days=i) for i in range(400)) if d.weekday() < 5][:260]
+    rng = np.random.default_rng(0)
+    rows = []
+    for symbol in symbols:
+        prices = 100 * np.cumprod(1 + rng.normal(0.0008, 0.01, len(days)))
+        rows.extend((symbol, d, float(p), float(p), float(p) * 1.01, float(p) * 0.99, 100000, 'YF')
+                    for d, p in zip(days, prices))
+
+    conn = duckdb.connect(str(fake_pm.db_path))
+    # market_data partizionata (setup_db): scrittura via market_store
+    conn.execute("""
+    CREATE TEMP TABLE fixture_prices (
+        symbol VARCHAR, date DATE, adj_close DOUBLE, close DOUBLE, high DOUBLE, low DOUBLE, volume BIGINT, source VARCHAR
+    )
+    """)
+    conn.executemany("INSERT INTO fixture_prices VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    write_market_rows(conn, "SELECT symbol, date, high, low, close, adj_close, volume, source FROM fixture_prices")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS signals (
+        id INTEGER PRIMARY KEY, date DATE NOT NULL, symbol VARCHAR NOT NULL, signal_state VARCHAR NOT NULL,
+        risk_scalar DOUBLE, explain_code VARCHAR, sma_200 DOUBLE, volatility_20d DOUBLE,
+        spy_guard BOOLEAN DEFAULT FALSE, regime_filter VARCHAR DEFAULT 'NEUTRAL',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, UNIQUE(date, symbol)
+    )
+    """)
+    signal_days = days[-BACKTEST_DAYS:]
+    conn.executemany("""
+    INSERT INTO signals (id, date, symbol, signal_state, risk_scalar, explain_code, volatility_20d)
+    VALUES (?, ?, ?, 'RISK_ON', 0.8, 'TREND_UP', 0.15)
+    """, [[i * len(tradable) + j + 1, d, s] for i, d in enumerate(signal_days) for j, s in enumerate(tradable)])
+    conn.commit()
+    conn.close()
+    return str(fake_pm.db_path), str(pm.etf_universe_path), signal_days[0], signal_days[-1]
+
+
+def test_normalize_and_proxy_counts(tmp_path):
+    assert normalize_sql("INSERT INTO t VALUES (?, ?),\n (?, ?), (?, ?)") == "INSERT INTO t VALUES (?, ?), ..."
+    assert normalize_sql("SELECT  *\n  FROM t\tWHERE x = ?") == "SELECT * FROM t WHERE x = ?"
+
+    stats = QueryStats()
+    conn = StatsConnection(duckdb.connect(), stats)
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.executemany("INSERT INTO t VALUES (?)", [[i] for i in range(10)])
+    for i in range(3):
+        assert conn.execute("SELECT x FROM t WHERE x >= ?", [i]).fetchall()
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone() == (10,)
+
+    ranked = {r['sql']: r for r in stats.ranked()}
+    assert ranked['SELECT x FROM t WHERE x >= ?']['calls'] == 3
+    assert ranked['SELECT x FROM t WHERE x >= ?']['rows'] == 10 + 9 + 8
+    assert stats.total_calls == 6 and stats.calls_for('from t') == 4
+
+    report = stats.report(conn=conn, explain_top=1)
+    explained = [q for q in report['queries'] if 'explain_analyze' in q]
+    # Solo la query di lettura più costosa, mai INSERT/CREATE
+    assert len(explained) == 1 and explained[0]['sql'].startswith('SELECT')
+    conn.close()
+
+
+def test_session_report_and_summary(tmp_path):
+    sm = SessionManager(base_reports_dir=str(tmp_path / 'sessions'), script_name='test_sql_stats')
+    stats = QueryStats()
+    conn = StatsConnection(duckdb.connect(), stats)
+    for _ in range(3):
+        conn.execute("SELECT 42").fetchall()
+    report_file = write_sql_stats_report(stats, 'step_a', conn=conn, session_manager=sm)
+    conn.close()
+    assert report_file.name.startswith('sql_stats_')
+
+    # Il riepilogo di sessione già scritto non viene riconteggiato
+    sm.add_report_to_session('sql_stats_summary', summarize_session_sql_stats(sm), 'json')
+    summary = summarize_session_sql_stats(sm)
+    assert [s['step'] for s in summary['steps']] == ['step_a']
+    assert summary['queries'][0]['calls'] == 3
+    assert summary['queries'][0]['steps'] == ['step_a']
+
+
+def test_sequence_sql_stats_flag_not_leaked(tmp_path, monkeypatch):
+    import orchestration.sequence_runner as sequence_runner
+    from types import SimpleNamespace
+    from utils.sql_stats import SQL_STATS_ENV
+
+    monkeypatch.delenv(SQL_STATS_ENV, raising=False)
+    pm = SimpleNamespace(db_path=tmp_path / 'missing.duckdb', etf_universe_path=tmp_path / 'etf_universe.json',
+                         sequence_state_path=tmp_path / 'sequence_state.json')
+    sm = SessionManager(base_reports_dir=str(tmp_path / 'sessions'), script_name='test_sql_stats')
+    child_envs = []
+
+    def fake_run(script_path, root_dir, label=None, extra_env=None):
+        child_envs.append(dict(extra_env or {}))
+        return 0
+
+    with patch.object(sequence_runner, 'get_path_manager', return_value=pm), \
+            patch.object(sequence_runner, 'get_session_manager', return_value=sm), \
+            patch.object(sequence_runner, '_run_script_with_progress', side_effect=fake_run):
+        assert sequence_runner.run_sequence_from('analyze_schema_drift', include_current=True,
+                                                 skip_unchanged=False, sql_stats=True)
+
+    # Il proxy è attivo negli step, non nel processo che ha lanciato la sequenza
+    assert child_envs == [{SQL_STATS_ENV: '1'}]
+    assert SQL_STATS_ENV not in os.environ
+
+
+def test_backtest_query_budget(tmp_path):
+    db_path, config_path, start, end = _fixture_db(tmp_path)
+    stats = QueryStats()
+    engine = BacktestEngine(db_path, config_path, sql_stats=stats)
+    engine.connect()
+    try:
+        engine.initialize_portfolio(20000.0, start)
+        stats.reset()
+        engine.run_simulation(start, end)
+
+        executed = engine.conn.execute(
+            "SELECT COUNT(*) FROM fiscal_ledger WHERE run_type = 'BACKTEST' AND type IN ('BUY', 'SELL')"
+        ).fetchone()[0]
+        assert executed > 0
+
+        # Nessuna query per simbolo nel loop giornaliero: al massimo una volta al giorno,
+        # poche query fisse per giorno e un costo limitato per ordine eseguito
+        assert_query_budget(stats, max_per_query=BACKTEST_DAYS,
+                            max_total=5 * BACKTEST_DAYS + 12 * executed + 5)
+    finally:
+        engine.close()
@@ -14,7 +14,12 @@ from datetime import datetime, timedelta
 import tempfile
 import shutil
 
-from scripts.analysis.monte_carlo_stress_test import MonteCarloStressTest
+from scripts.analysis.monte_carlo_stress_test import (
+    MonteCarloStressTest,
+    circular_block_bootstrap_indices,
+    regime_bootstrap_indices,
+    stationary_bootstrap_indices,
+)
 
 
 class TestMonteCarloStressTest:
@@ -348,6 +353,68 @@ class TestMonteCarloStressTest:
         assert metrics['final_equity'] > 10000.0
 
 
+class TestResamplingMethods:
+    """Test ricampionamento a blocchi / regime e metriche in batch"""
+
+    def test_batch_metrics_match_scalar(self):
+        rng = np.random.default_rng(1)
+        matrix = rng.normal(0.0003, 0.012, (20, 252))
+        matrix[0] = np.abs(matrix[0])  # Nessun return negativo: fallback Sortino
+        stress_test = MonteCarloStressTest(n_simulations=20)
+
+        batch = stress_test.calculate_metrics_batch(matrix, initial_equity=10000.0)
+        for i, row in enumerate(matrix):
+            scalar = stress_test.calculate_metrics(row, initial_equity=10000.0)
+            for key, value in scalar.items():
+                assert abs(batch[key][i] - value) < 1e-9, key
+
+    def test_block_indices_are_contiguous(self):
+        rng = np.random.default_rng(0)
+        circ = circular_block_bootstrap_indices(100, 50, rng, block_size=10)
+        assert circ.shape == (50, 100)
+        assert circ.min() >= 0 and circ.max() < 100
+        # Dentro ogni blocco gli indici avanzano di 1 (circolare)
+        steps = (np.diff(circ.reshape(50, 10, 10), axis=2)) % 100
+        assert np.all(steps == 1)
+
+        stat = stationary_bootstrap_indices(100, 200, rng, mean_block_size=10)
+        continued = (np.diff(stat, axis=1) % 100) == 1
+        assert 0.85 < continued.mean() < 0.95  # ~1 - 1/10
+
+    def test_regime_indices_respect_regime(self):
+        rng = np.random.default_rng(0)
+        regimes = np.array(['bull'] * 40 + ['bear'] * 20 + ['sideways'] * 40)
+        idx = regime_bootstrap_indices(regimes, 100, rng, mean_block_size=5)
+        assert np.all(regimes[idx] == regimes[None, :])
+
+    def test_block_bootstrap_preserves_autocorrelation(self):
+        # Returns autocorrelati (trend persistenti): lo shuffle sottostima il drawdown
+        rng = np.random.default_rng(3)
+        noise = rng.normal(0, 0.01, 504)
+        returns = np.empty(504)
+        returns[0] = noise[0]
+        for t in range(1, 504):
+            returns[t] = 0.5 * returns[t - 1] + noise[t]
+
+        shuffle = MonteCarloStressTest(n_simulations=500)
+        shuffle.run_shuffle_test(returns, seed=1, method='shuffle')
+        block = MonteCarloStressTest(n_simulations=500)
+        block.run_shuffle_test(returns, seed=1, method='stationary', block_size=20)
+
+        dd_shuffle = np.median([r['max_dd'] for r in shuffle.results])
+        dd_block = np.median([r['max_dd'] for r in block.results])
+        assert dd_block > dd_shuffle
+
+        analysis = block.analyze_results()
+        assert analysis['method'] == 'stationary'
+        assert analysis['block_size'] == 20
+
+    def test_regime_method_requires_regimes(self):
+        stress_test = MonteCarloStressTest(n_simulations=10)
+        with pytest.raises(ValueError):
+            stress_test.run_shuffle_test(np.zeros(50), method='regime')
+
+
 def test_monte_carlo_integration():
     """Test integrazione completa Monte Carlo"""
     np.random.seed(42)
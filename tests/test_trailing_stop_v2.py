@@ -24,7 +24,8 @@ from risk.trailing_stop_v2 import (
     initialize_position_peak,
     update_position_peak,
     check_trailing_stop_v2,
-    sync_position_peaks_from_ledger
+    sync_position_peaks_from_ledger,
+    PositionPeakTracker
 )
 
 def create_test_scenario(conn):
@@ -192,6 +193,84 @@ def _run_trailing_stop_logic():
         conn.close()
         shutil.rmtree(temp_dir, ignore_errors=True)
 
+def _peak_tracker_db():
+    conn = duckdb.connect(':memory:')
+    conn.execute("""
+    CREATE TABLE fiscal_ledger (
+        id INTEGER, date DATE, type VARCHAR, symbol VARCHAR, qty DOUBLE, price DOUBLE, run_type VARCHAR
+    )
+    """)
+    conn.execute("CREATE TABLE market_data (symbol VARCHAR, date DATE, adj_close DOUBLE, close DOUBLE)")
+    return conn
+
+
+def test_peak_tracker_matches_max_close():
+    """Running max incrementale == MAX(close) da entry_date per ogni barra"""
+    import random
+    conn = _peak_tracker_db()
+    rnd = random.Random(4)
+    start = datetime(2024, 1, 1).date()
+    days = [start + timedelta(days=i) for i in range(120)]
+    for symbol in ('AAA', 'BBB'):
+        price = 100.0
+        for d in days:
+            price *= 1 + rnd.gauss(0, 0.02)
+            conn.execute("INSERT INTO market_data VALUES (?, ?, ?, ?)", [symbol, d, price, price])
+
+    tracker = PositionPeakTracker(conn)
+    positions = {'AAA': {'entry_date': days[5], 'entry_price': 100.0}}
+    for i, d in enumerate(days[5:], start=5):
+        if i == 40:
+            positions['BBB'] = {'entry_date': days[30], 'entry_price': 100.0}
+        if i == 80:
+            positions.pop('AAA')
+        closes = dict(conn.execute("SELECT symbol, close FROM market_data WHERE date = ?", [d]).fetchall())
+        tracker.observe(positions, closes, d)
+        for symbol, pos in positions.items():
+            expected = conn.execute(
+                "SELECT MAX(close) FROM market_data WHERE symbol = ? AND date BETWEEN ? AND ?",
+                [symbol, pos['entry_date'], d]
+            ).fetchone()[0]
+            assert abs(tracker.peak_price(symbol) - expected) < 1e-12
+    assert 'AAA' not in tracker
+    conn.close()
+
+
+def test_sync_position_peaks_rebuild_and_persist():
+    conn = _peak_tracker_db()
+    d0 = datetime(2024, 3, 1).date()
+    conn.executemany("INSERT INTO market_data VALUES (?, ?, ?, ?)", [
+        ('AAA', d0, 10.0, 10.0), ('AAA', d0 + timedelta(days=1), 12.0, 12.0),
+        ('AAA', d0 + timedelta(days=2), 11.0, 11.0), ('BBB', d0, 50.0, 50.0),
+    ])
+    conn.execute("INSERT INTO fiscal_ledger VALUES (1, ?, 'BUY', 'AAA', 10, 10.0, 'PRODUCTION')", [d0])
+    conn.execute("INSERT INTO fiscal_ledger VALUES (2, ?, 'BUY', 'BBB', 5, 50.0, 'PRODUCTION')", [d0])
+    conn.execute("INSERT INTO fiscal_ledger VALUES (3, ?, 'SELL', 'BBB', 5, 50.0, 'PRODUCTION')",
+                 [d0 + timedelta(days=1)])
+    initialize_position_peak(conn, 'BBB', d0, 50.0)
+
+    sync_position_peaks_from_ledger(conn)
+    active = conn.execute(
+        "SELECT symbol, peak_price, peak_date FROM position_peaks WHERE is_active ORDER BY symbol"
+    ).fetchall()
+    assert active == [('AAA', 12.0, d0 + timedelta(days=1))]
+
+    # Idempotente: nessuna riga duplicata
+    sync_position_peaks_from_ledger(conn)
+    assert conn.execute("SELECT COUNT(*) FROM position_peaks WHERE symbol = 'AAA'").fetchone()[0] == 1
+
+    # Tracker persistito: riprende il peak salvato e scrive solo i nuovi massimi
+    tracker = PositionPeakTracker(conn, persist=True)
+    positions = {'AAA': {'entry_date': d0, 'entry_price': 10.0}}
+    tracker.observe(positions, {'AAA': 11.5}, d0 + timedelta(days=3))
+    assert tracker.peak_price('AAA') == 12.0
+    tracker.observe(positions, {'AAA': 13.0}, d0 + timedelta(days=4))
+    assert conn.execute(
+        "SELECT peak_price FROM position_peaks WHERE symbol = 'AAA' AND is_active"
+    ).fetchone()[0] == 13.0
+    conn.close()
+
+
 def test_vs_legacy_comparison():
     """Test comparativo trailing stop v2 vs legacy"""
     